@@ -13,7 +13,10 @@ using namespace Sync;
 using namespace std;
 
 // Constructor for ChatRoom class
-ChatRoom::ChatRoom(const string &roomName) : name(roomName) {}
+ChatRoom::ChatRoom(const string &roomName) : name(roomName)
+{
+    Start(); // Run the room's thread now that the room is complete
+}
 
 // Destructor for ChatRoom class
 ChatRoom::~ChatRoom()
@@ -49,7 +52,6 @@ bool ChatRoom::existingUser(const string &username)
         {
             return true;
         }
-        return false;
     }
     return false;
 }
@@ -125,17 +127,6 @@ size_t ChatRoom::getClientCount() const
     return clients.size();
 }
 
-// Method to add a message to a specific client's message list
-void ChatRoom::addToClientMessages(const string &clientName, const string &message)
-{
-    auto it = find_if(clients.begin(), clients.end(), [&clientName](const ClientInfo &info)
-                      { return info.name == clientName; });
-    if (it != clients.end())
-    {
-        it->messages.push_back(message);
-    }
-}
-
 // Method to get the name of the chatroom
 string ChatRoom::getRoomName() const
 {
@@ -167,18 +158,6 @@ string ChatRoom::getClientNameBySocket(const Socket &clientSocket) const
     return ""; // Return empty string if socket is not found
 }
 
-// Method to get messages by client name
-vector<string> ChatRoom::getMessagesByClientName(const string &clientName) const
-{
-    auto it = find_if(clients.begin(), clients.end(), [&clientName](const ClientInfo &info)
-                      { return info.name == clientName; });
-    if (it != clients.end())
-    {
-        return it->messages;
-    }
-    return {}; // Return empty vector if client not found
-}
-
 // Method to get the mutex for thread synchronization
 std::mutex &ChatRoom::getMutex()
 {
@@ -18,7 +18,6 @@ private:
     {
         string name;
         Socket *socket;
-        vector<string> messages;
 
         ClientInfo(const string &n, Socket *s) : name(n), socket(s) {}
     };
@@ -49,16 +48,12 @@ public:
 
     size_t getClientCount() const;
 
-    void addToClientMessages(const string &clientName, const string &message);
-
     string getRoomName() const;
 
     Socket getClientSocketByName(const string &clientName) const;
 
     string getClientNameBySocket(const Sync::Socket &clientSocket) const;
 
-    vector<string> getMessagesByClientName(const string &clientName) const;
-
     std::mutex &getMutex();
 };
 
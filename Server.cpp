@@ -2,9 +2,11 @@
 #include "thread.h"
 #include "socketserver.h"
 #include "ChatRoom.h"
+#include "framereader.h"
 
 // Including standard library headers
 #include <stdlib.h>
+#include <signal.h>
 #include <time.h>
 #include <list>
 #include <vector>
@@ -12,6 +14,8 @@
 #include <string>
 #include <iostream>
 #include <sstream>
+#include <map>
+#include <set>
 
 // Using namespaces
 using namespace Sync; // Sync namespace for synchronization primitives
@@ -38,10 +42,10 @@ std::vector<char> chatroomDataToByteArray(const ChatRoomStructure &room)
     data.insert(data.end(), room.name.begin(), room.name.end());
     data.push_back(';'); // Add delimiter
 
-    // Converts password to bytes and append to data if the room is locked
+    // Append a locked flag if the room has a password, the password itself never leaves the server
     if (room.password != "")
     {
-        data.insert(data.end(), room.password.begin(), room.password.end());
+        data.push_back('1');
     }
     data.push_back(';'); // Add delimiter
 
@@ -88,22 +92,81 @@ std::vector<ChatRoomStructure> room_data{}; // Vector to store chat room data
 // Get chatroom data as byte array
 std::vector<char> chatroomBytes = getAllChatroomDataAsByteArray(room_data); // Byte array containing chat room data
 
-// Function to send updated data to all clients
-void sendUpdatedDataToAllClients(const Sync::ByteArray &updatedData, const Socket &clientSocket, const bool sendClient = false)
+// Optional protocol features this server understands
+const std::set<std::string> supportedCapabilities{"deflate", "deltas", "ids"};
+
+// Features each client agreed to with a HELLO message
+std::map<Socket *, std::set<std::string>> clientCapabilities;
+
+// Function to check whether a client agreed to an optional feature
+bool hasCapability(Socket *clientSocket, const std::string &capability)
+{
+    auto it = clientCapabilities.find(clientSocket);
+    return it != clientCapabilities.end() && it->second.count(capability) > 0;
+}
+
+// Function to build the full room list message
+std::string roomSnapshotMessage(const Sync::ByteArray &updatedData)
+{
+    std::ostringstream os; // String stream for constructing update message
+    os << "UPDATE_DATA;";  // Append update command to message
+    if (!room_data.empty()) // Check if there is chat room data available
+    {
+        os << updatedData.ToString() << endl; // Append updated data to message
+    }
+    return os.str();
+}
+
+// Functions to build room list deltas, rooms only carry a locked flag instead of the password
+std::string roomAddedDelta(const ChatRoomStructure &room)
 {
+    return "ROOM_ADDED;" + room.name + ";" + (room.password.empty() ? "" : "1") + ";" +
+           std::to_string(room.current_users) + ";" + std::to_string(room.max_users);
+}
+
+std::string roomRemovedDelta(const std::string &roomName)
+{
+    return "ROOM_REMOVED;" + roomName;
+}
+
+std::string roomUsersDelta(const ChatRoomStructure &room)
+{
+    return "ROOM_USERS;" + room.name + ";" + std::to_string(room.current_users);
+}
+
+// Function to send updated data to all clients. Clients that agreed to deltas get the
+// small delta message, everyone else gets the full snapshot. The snapshot is compressed
+// once and the same frame goes to every client that agreed to compression.
+void sendUpdatedDataToAllClients(const Sync::ByteArray &updatedData, const std::string &delta, const Socket &clientSocket, const bool sendClient = false)
+{
+    std::string snapshot;          // Full snapshot, only built if a client needs it
+    Sync::ByteArray packedSnapshot; // Compressed snapshot frame, only built if a client needs it
     // Iterate through all connected clients
     for (const auto &socket : connectedClients)
     {
         if (*socket != clientSocket || sendClient) // Check if current socket is not the client that initiated update
         {
-            std::ostringstream os; // String stream for constructing update message
-            os << "UPDATE_DATA;";  // Append update command to message
-            // Send the updated data to the current connected client
-            if (!room_data.empty()) // Check if there is chat room data available
+            // A client returning to the lobby missed the deltas sent while it was in a room
+            if (*socket != clientSocket && hasCapability(socket, "deltas"))
+            {
+                Sync::ByteArray sendData = Sync::ByteArray(delta); // Create byte array from delta
+                (*socket).Write(sendData);                         // Write delta to client socket
+                continue;
+            }
+            if (snapshot.empty())
             {
-                os << updatedData.ToString() << endl; // Append updated data to message
+                snapshot = roomSnapshotMessage(updatedData);
             }
-            Sync::ByteArray sendData = Sync::ByteArray(os.str()); // Create byte array from message
+            if ((*socket).IsFramed() && (*socket).IsCompressed())
+            {
+                if (packedSnapshot.v.empty())
+                {
+                    packedSnapshot = EncodeCompressedFrame(Sync::ByteArray(snapshot));
+                }
+                (*socket).WriteEncoded(packedSnapshot); // Write the shared compressed frame
+                continue;
+            }
+            Sync::ByteArray sendData = Sync::ByteArray(snapshot); // Create byte array from message
             (*socket).Write(sendData);                            // Write data to client socket
         }
     }
@@ -121,6 +184,7 @@ class SocketThreadIndividually : public Thread
 private:
     Socket &clientSocket;            // Reference to client socket
     Sync::ByteArray incomingData;    // Buffer for incoming data
+    FrameReader reader;              // Splits incoming data into whole messages
     std::vector<char> &chatroomData; // Reference to chat room data
 
 public:
@@ -128,6 +192,7 @@ public:
     SocketThreadIndividually(Socket &socket, std::vector<char> &chatroomData)
         : clientSocket(socket), chatroomData(chatroomData) // Constructor
     {
+        Start(); // Run the client's thread now that it is complete
     }
 
     ~SocketThreadIndividually() // Destructor
@@ -135,6 +200,30 @@ public:
         // Destructor
     }
 
+    // Take the request id a framed client with the ids feature appends to a create/join request
+    string takeRequestId(std::vector<std::string> &segments)
+    {
+        if (!reader.IsFramed() || !hasCapability(&clientSocket, "ids") || segments.size() < 2)
+        {
+            return "";
+        }
+        const string &last = segments.back();
+        if (last.empty() || !std::all_of(last.begin(), last.end(), ::isdigit))
+        {
+            return "";
+        }
+        string requestId = last;
+        segments.pop_back();
+        return requestId;
+    }
+
+    // Answer a create/join request, echoing its request id
+    void reply(const string &status, const string &requestId)
+    {
+        Sync::ByteArray sendData = Sync::ByteArray(requestId.empty() ? status : status + ";" + requestId); // Create reply message
+        clientSocket.Write(sendData);                                                                       // Send reply to client
+    }
+
     // Get the chat room of the client
     ChatRoom *getRoom(string &roomName)
     {
@@ -148,6 +237,46 @@ public:
         return nullptr; // Return nullptr if room not found
     }
 
+    // Remove a user from a chat room and update the room list, the room goes away with its
+    // last user. The caller holds the global locks.
+    void leaveRoom(ChatRoom *clientRoom, const string &username, const bool sendClient)
+    {
+        string roomName = clientRoom->getRoomName(); // Name of the room being left
+
+        std::mutex &roomMutex = clientRoom->getMutex(); // Get mutex of client's chat room
+        std::lock_guard<std::mutex> lock(roomMutex);    // Lock the mutex
+
+        clientRoom->removeClientByName(username);  // Remove client from chat room
+        int num = clientRoom->getClientCount();    // Get number of clients in the chat room
+        string delta = roomRemovedDelta(roomName); // Delta for lobby clients
+        if (num == 0)                              // If no clients left in the chat room
+        {
+            auto it = std::find(rooms.begin(), rooms.end(), clientRoom); // Find chat room in rooms vector
+
+            if (it != rooms.end()) // If chat room found
+            {
+                // Erase the chat room from the vector
+                rooms.erase(it);
+            }
+            // Erase chat room data from room_data vector
+            room_data.erase(std::remove_if(room_data.begin(), room_data.end(), [&](const ChatRoomStructure &obj)
+                                           { return obj.name == roomName; }),
+                            room_data.end());
+            clientRoom->isActive = false; // Set chat room to inactive
+        }
+        for (auto &room : room_data) // Loop through room data vector
+        {
+            if (room.name == roomName) // Check if room name matches
+            {
+                room.current_users--;         // Decrement current_users by one
+                delta = roomUsersDelta(room); // Room still exists, only occupancy changed
+            }
+        }
+        chatroomBytes = getAllChatroomDataAsByteArray(room_data);                        // Update chat room data byte array
+        Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size());     // Create byte array from chat room data
+        sendUpdatedDataToAllClients(chatroomByteArray, delta, clientSocket, sendClient); // Send updated data to all clients
+    }
+
     virtual long ThreadMain() // Main thread function
     {
         ChatRoom *clientRoom = nullptr; // Pointer to client's chat room
@@ -156,8 +285,23 @@ public:
         {
             try
             {
-                clientSocket.Read(incomingData);              // Read data from client
-                string receivedMsg = incomingData.ToString(); // Convert incoming data to string
+                string receivedMsg;             // Next complete message from the client
+                if (!reader.Next(receivedMsg))  // Nothing buffered, wait for more data
+                {
+                    if (clientSocket.Read(incomingData) <= 0) // Read data from client
+                    {
+                        break; // The connection closed or dropped, or the server is stopping
+                    }
+                    reader.Feed(incomingData);       // Buffer data until whole messages are available
+                    if (!reader.Next(receivedMsg))   // Frame still incomplete
+                    {
+                        continue;
+                    }
+                }
+                if (reader.IsFramed()) // Reply with frames once the client sends them
+                {
+                    clientSocket.SetFramed(true);
+                }
 
                 std::lock_guard<std::mutex> roomsLocks(roomsMutex);                    // Lock mutex to access rooms vector
                 std::lock_guard<std::mutex> roomDataLock(roomDataMutex);               // Lock mutex to access room_data vector
@@ -166,8 +310,7 @@ public:
 
                 if (receivedMsg == "DISCONNECT") // Check if client wants to disconnect
                 {
-                    removeClient(&clientSocket); // Remove client from chat room
-                    break;                       // Exit the loop
+                    break; // Exit the loop, the client is forgotten below
                 }
 
                 // Separate received messages
@@ -180,59 +323,103 @@ public:
                 {
                     segments.push_back(segment); // Add segment to vector
                 }
+                if (segments.empty()) // Nothing to act on in an empty message
+                {
+                    continue;
+                }
 
                 if (segments[0] == "DISCONNECT_ROOM") // Check if client wants to disconnect from a room
                 {
-                    connectedClients.push_back(&clientSocket); // Add client to connected clients list
-                    string roomName = segments[1];             // Get room name from message
-                    string sender = segments[2];               // Get sender's name from message
+                    if (std::find(connectedClients.begin(), connectedClients.end(), &clientSocket) == connectedClients.end())
+                    {
+                        connectedClients.push_back(&clientSocket); // Add client to connected clients list
+                    }
+                    if (segments.size() < 3) // Room name and sender are both needed
+                    {
+                        continue;
+                    }
+                    string roomName = segments[1]; // Get room name from message
+                    string sender = segments[2];   // Get sender's name from message
 
                     clientRoom = this->getRoom(roomName); // Get pointer to client's chat room
-
-                    std::mutex &roomMutex = clientRoom->getMutex(); // Get mutex of client's chat room
-                    std::lock_guard<std::mutex> lock(roomMutex);    // Lock the mutex
-
-                    clientRoom->removeClientByName(sender); // Remove client from chat room
-                    int num = clientRoom->getClientCount(); // Get number of clients in the chat room
-                    if (num == 0)                           // If no clients left in the chat room
+                    if (clientRoom == nullptr || clientRoom->getClientNameBySocket(clientSocket) != sender) // Only the user itself leaves
                     {
-                        auto it = std::find(rooms.begin(), rooms.end(), clientRoom); // Find chat room in rooms vector
-
-                        if (it != rooms.end()) // If chat room found
-                        {
-                            // Erase the chat room from the vector
-                            rooms.erase(it);
-                        }
-                        // Erase chat room data from room_data vector
-                        room_data.erase(std::remove_if(room_data.begin(), room_data.end(), [&](const ChatRoomStructure &obj)
-                                                       { return obj.name == roomName; }),
-                                        room_data.end());
-                        clientRoom->isActive = false; // Set chat room to inactive
+                        continue;
                     }
-                    for (auto &room : room_data) // Loop through room data vector
+                    leaveRoom(clientRoom, sender, true); // Remove the client and tell the lobby
+                }
+                else if (segments[0] == "MESSAGE_ROOM") // Check if message is intended for a room
+                {
+                    if (segments.size() < 4) // Room name, text and sender are all needed
+                    {
+                        continue;
+                    }
+                    string roomName = segments[1];    // Get room name from message
+                    string sender = segments.back();  // Sender's name is the last segment, names never hold ';'
+                    string message = segments[2];     // Get message content from message
+                    for (size_t i = 3; i + 1 < segments.size(); i++) // Text may hold ';', put it back together
+                    {
+                        message += ";" + segments[i];
+                    }
+                    string final = "MESSAGE;" + sender + ";" + message; // Construct final message
+                    clientRoom = this->getRoom(roomName);               // Get pointer to client's chat room
+                    if (clientRoom == nullptr) // Room is gone, the message has nowhere to go
                     {
-                        if (room.name == roomName) // Check if room name matches
+                        continue;
+                    }
+                    std::mutex &roomMutex = clientRoom->getMutex();        // Get mutex of client's chat room
+                    std::lock_guard<std::mutex> lock(roomMutex);           // Lock the mutex
+                    if (clientRoom->getClientNameBySocket(clientSocket) != sender) // Only members post, under their own name
+                    {
+                        continue;
+                    }
+                    clientRoom->broadcastMessage(final, sender); // Broadcast the message to all other users in the chat room
+                }
+                else if (segments[0] == "HELLO") // Client announces the optional features it understands
+                {
+                    std::istringstream offered(segments.size() > 1 ? segments[1] : ""); // Comma separated feature list
+                    std::set<std::string> agreed;                                         // Features both sides support
+                    std::string capability;                                               // Temporary string for each feature
+                    string reply;                                                         // Agreed features for the reply
+                    while (std::getline(offered, capability, ','))
+                    {
+                        if (supportedCapabilities.count(capability) > 0 && agreed.insert(capability).second)
                         {
-                            room.current_users--; // Decrement current_users by one
+                            reply += (reply.empty() ? "" : ",") + capability;
                         }
                     }
-                    chatroomBytes = getAllChatroomDataAsByteArray(room_data);                    // Update chat room data byte array
-                    Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size()); // Create byte array from chat room data
-                    sendUpdatedDataToAllClients(chatroomByteArray, clientSocket, true);          // Send updated data to all clients
+                    clientCapabilities[&clientSocket] = agreed;                 // Remember the client's features
+                    Sync::ByteArray sendData = Sync::ByteArray("HELLO;" + reply); // Create hello reply
+                    clientSocket.Write(sendData);                                // Send hello reply to client
+                    clientSocket.SetCompressed(reader.IsFramed() && agreed.count("deflate") > 0); // Compress large frames from now on
                 }
-                else if (segments[0] == "MESSAGE_ROOM") // Check if message is intended for a room
+                else if (segments[0] == "RESYNC") // Client wants a fresh full room list
                 {
-                    string roomName = segments[1];                      // Get room name from message
-                    string message = segments[2];                       // Get message content from message
-                    string sender = segments[3];                        // Get sender's name from message
-                    string final = "MESSAGE;" + sender + ";" + message; // Construct final message
-                    clientRoom = this->getRoom(roomName);               // Get pointer to client's chat room
-                    std::mutex &roomMutex = clientRoom->getMutex();     // Get mutex of client's chat room
-                    std::lock_guard<std::mutex> lock(roomMutex);        // Lock the mutex
-                    clientRoom->broadcastMessage(final, sender);        // Broadcast the message to all other users in the chat room
+                    Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size());  // Create byte array from chat room data
+                    Sync::ByteArray sendData = Sync::ByteArray(roomSnapshotMessage(chatroomByteArray)); // Create snapshot message
+                    clientSocket.Write(sendData);                                                 // Send snapshot to client
                 }
-                else if (!segments.empty() && segments[0] == "CREATE_ROOM" && segments.size() == 6) // Check if client wants to create a new room
+                else if (!segments.empty() && segments[0] == "CREATE_ROOM") // Check if client wants to create a new room
                 {
+                    string requestId = takeRequestId(segments); // Id echoed in the reply
+                    int currentUsers = 0, maxUsers = 0;         // Parsed occupancy of the new room
+                    try
+                    {
+                        if (segments.size() == 6)
+                        {
+                            currentUsers = std::stoi(segments[3]);
+                            maxUsers = std::stoi(segments[4]);
+                        }
+                    }
+                    catch (...) // Not a number, answered below
+                    {
+                        segments.clear();
+                    }
+                    if (segments.size() != 6) // Malformed requests are answered so later replies stay matched
+                    {
+                        reply("BAD_REQUEST", requestId);
+                        continue;
+                    }
                     removeClient(&clientSocket);                    // Remove client from current chat room
                     string roomName = segments[1];                  // Get room name from message
                     string clientName = segments[5];                // Get client's name from message
@@ -241,24 +428,32 @@ public:
                     std::mutex &roomMutex = clientRoom->getMutex(); // Get mutex of new chat room
                     std::lock_guard<std::mutex> lock(roomMutex);    // Lock the mutex
                     // Add new room data to room_data vector
-                    room_data.emplace_back(ChatRoomStructure{segments[1], segments[2], std::stoi(segments[3]), std::stoi(segments[4])});
+                    room_data.emplace_back(ChatRoomStructure{segments[1], segments[2], currentUsers, maxUsers});
                     // Update chatroomBytes vector with new room data
                     chatroomBytes = getAllChatroomDataAsByteArray(room_data);
-                    Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size()); // Create byte array from chat room data
-                    sendUpdatedDataToAllClients(chatroomByteArray, clientSocket);                // Send updated data to all clients
+                    Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size());          // Create byte array from chat room data
+                    sendUpdatedDataToAllClients(chatroomByteArray, roomAddedDelta(room_data.back()), clientSocket); // Send updated data to all clients
                     clientRoom->addClient(clientName, &clientSocket);                            // Add client to new chat room
-                    Sync::ByteArray sendData = Sync::ByteArray("CREATE_SUCCESS");                // Create success message
-                    clientSocket.Write(sendData);                                                // Send success message to client
+                    reply("CREATE_SUCCESS", requestId);                                          // Send success message to client
                 }
                 // Existing JOIN_ROOM handling inside ThreadMain
 
-                else if (!segments.empty() && segments[0] == "JOIN_ROOM" && segments.size() == 4) // Check if client wants to join a room
+                else if (!segments.empty() && segments[0] == "JOIN_ROOM") // Check if client wants to join a room
                 {
+                    string requestId = takeRequestId(segments); // Id echoed in the reply
+                    if (segments.size() != 4)                   // Malformed requests are answered so later replies stay matched
+                    {
+                        reply("BAD_REQUEST", requestId);
+                        continue;
+                    }
+                    bool roomFound = false;      // Every request gets a reply, even for unknown rooms
                     for (auto &room : room_data) // Loop through room data vector
                     {
                         if (room.name == segments[1]) // Check if room name matches
                         {
-                            if ((segments[2] == "NO_PASSWORD" || room.password == segments[2]) && room.current_users < room.max_users) // Check if password is correct and room is not full
+                            roomFound = true;
+                            bool passwordOk = room.password == (segments[2] == "NO_PASSWORD" ? std::string() : segments[2]); // NO_PASSWORD only opens rooms without one
+                            if (passwordOk && room.current_users < room.max_users) // Check if password is correct and room is not full
                             {
                                 string roomName = segments[1];   // Get room name from message
                                 string clientName = segments[3]; // Get client's name from message
@@ -270,51 +465,66 @@ public:
 
                                 if (clientRoom->existingUser(clientName)) // Check if client already exists in the chat room
                                 {
-                                    Sync::ByteArray sendData = Sync::ByteArray("EXISTING_USER"); // Create existing user message
-                                    clientSocket.Write(sendData);                                // Send existing user message to client
+                                    reply("EXISTING_USER", requestId); // Send existing user message to client
                                 }
                                 else
                                 {
                                     removeClient(&clientSocket); // Remove client from current chat room
-                                    for (auto &room : room_data) // Loop through room data vector
-                                    {
-                                        if (room.name == roomName) // Check if room name matches
-                                        {
-                                            room.current_users++; // Increment current_users by one
-                                        }
-                                    }
+                                    room.current_users++;        // Increment current_users by one
                                     // Join room logic here (not detailed, as your focus is on password validation)
                                     chatroomBytes = getAllChatroomDataAsByteArray(room_data);                    // Update chat room data byte array
                                     Sync::ByteArray chatroomByteArray(chatroomData.data(), chatroomData.size()); // Create byte array from chat room data
-                                    sendUpdatedDataToAllClients(chatroomByteArray, clientSocket);                // Send updated data to all clients
+                                    sendUpdatedDataToAllClients(chatroomByteArray, roomUsersDelta(room), clientSocket); // Send updated data to all clients
                                     clientRoom->addClient(clientName, &clientSocket);                            // Add client to chat room
-                                    Sync::ByteArray sendData = Sync::ByteArray("JOIN_SUCCESS");                  // Create join success message
-                                    clientSocket.Write(sendData);                                                // Send join success message to client
+                                    reply("JOIN_SUCCESS", requestId); // Send join success message to client
                                 }
                             }
                             else if (room.max_users <= room.current_users) // Check if room is full
                             {
-                                Sync::ByteArray sendData = Sync::ByteArray("ROOM_FULL"); // Create room full message
-                                clientSocket.Write(sendData);                            // Send room full message to client
+                                reply("ROOM_FULL", requestId); // Send room full message to client
                             }
-                            else if (room.password != segments[2]) // Check if password is incorrect
+                            else if (!passwordOk) // Check if password is incorrect
                             {
-                                Sync::ByteArray sendData = Sync::ByteArray("INVALID_PASSWORD"); // Create invalid password message
-                                clientSocket.Write(sendData);                                   // Send invalid password message to client
+                                reply("INVALID_PASSWORD", requestId); // Send invalid password message to client
                             }
                             else
                             {
-                                Sync::ByteArray sendData = Sync::ByteArray("NO_ROOM"); // Create no room message
-                                clientSocket.Write(sendData);                          // Send no room message to client
+                                reply("NO_ROOM", requestId); // Send no room message to client
                             }
+                            break; // Room names are unique, stop after the first match
                         }
                     }
+                    if (!roomFound) // Room was removed before the request arrived
+                    {
+                        reply("NO_ROOM", requestId); // Send no room message to client
+                    }
                 }
             }
             catch (...) // Catch all exceptions
             {
             }
         }
+
+        // However the connection ended, forget the client. A socket allocated later at the
+        // same address must not inherit its features.
+        std::lock_guard<std::mutex> roomsLock(roomsMutex);                     // Lock mutex to access rooms vector
+        std::lock_guard<std::mutex> roomDataLock(roomDataMutex);               // Lock mutex to access room_data vector
+        std::lock_guard<std::mutex> chatroomBytesLock(chatroomBytesMutex);     // Lock mutex to access chatroomBytes vector
+        std::lock_guard<std::mutex> connectClientsLock(connectedClientsMutex); // Lock mutex to access connectedClients vector
+        removeClient(&clientSocket);                                           // Remove client from connected clients list
+        clientCapabilities.erase(&clientSocket);                               // Forget the client's features
+
+        // A dropped user leaves its room as if it had sent DISCONNECT_ROOM, so the name is free
+        // when it reconnects. Leaving the last seat erases the room, hence the copy.
+        vector<ChatRoom *> joinedRooms(rooms);
+        for (auto &room : joinedRooms)
+        {
+            string username = room->getClientNameBySocket(clientSocket); // Name the client used in the room, if any
+            if (!username.empty())
+            {
+                leaveRoom(room, username, false);
+            }
+        }
         return 0;
     }
 
@@ -350,6 +560,7 @@ public:
     ServerThread(SocketServer &server, std::vector<char> &chatroomData)
         : server(server), chatroomData(chatroomData) // Constructor
     {
+        Start(); // Accept connections now that the thread is complete
     }
 
     ~ServerThread() // Destructor
@@ -405,10 +616,12 @@ public:
     }
 };
 
-int main(void)
+int main(int argc, char *argv[])
 {
     cout << "I am a server." << endl;                           // Output initial server message
-    SocketServer server(2004);                                  // Create server socket listening on port 2004
+    signal(SIGPIPE, SIG_IGN);                                   // A peer that reset fails the write instead of killing the server
+    int port = argc > 1 ? std::atoi(argv[1]) : 2004;            // Port given on the command line, 2004 by default
+    SocketServer server(port);                                  // Create server socket listening on the port
     ServerThread serverOpThread(server, chatroomBytes);         // Create server operation thread
     cout << "Type 'SHUTDOWN' to shut down the server." << endl; // Output shutdown instruction
     // Wait for 'SHUTDOWN' keyword to shutdown
@@ -0,0 +1,27 @@
+# Imports
+import random
+
+# Upper bound of the first retry delay in seconds, doubled on every failed attempt
+BASE_DELAY = 0.05
+
+# Longest delay between attempts in seconds
+MAX_DELAY = 30
+
+
+# Exponential backoff with full jitter. Each delay is drawn uniformly below an
+# exponentially growing bound, so clients dropped together do not retry together.
+class Backoff:
+    def __init__(self, base=BASE_DELAY, cap=MAX_DELAY):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+    # Method to get the delay before the next attempt
+    def next_delay(self):
+        bound = min(self.cap, self.base * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return random.uniform(0, bound)
+
+    # Method to start over after a successful attempt
+    def reset(self):
+        self.attempts = 0
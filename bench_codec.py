@@ -0,0 +1,100 @@
+# Micro-benchmark for the text and binary message codecs
+#
+# Usage: python bench_codec.py [--rooms 100] [--repeat 20000]
+#
+# Decodes the same chat messages and room lists from the old split-based parsing,
+# the text protocol parser and the binary codec, and reports the time per message
+# and the payload size of each form. Encoding time is reported for both protocols.
+
+# Imports
+import argparse, random, time
+from protocol import (
+    ChatMessage,
+    Room,
+    RoomList,
+    RoomUsers,
+    format_message,
+    pack_message,
+    parse_command,
+    unpack_message,
+)
+
+
+# Function to parse a room list the way populate_room_info used to
+def split_rooms(text):
+    rooms = []
+    for line in text.split("UPDATE_DATA;")[1].strip().splitlines():
+        parts = line.split(";")
+        rooms.append((parts[0], parts[1] != "", int(parts[2]), int(parts[3])))
+    return rooms
+
+
+# Function to parse a chat message the way receive_messages used to
+def split_chat(text):
+    parts = text.split("MESSAGE;")[1].split(";")
+    return parts[0], parts[1]
+
+
+# Function to time a callable over each sample, returning microseconds per call
+def time_calls(function, samples, repeat):
+    rounds = max(1, repeat // len(samples))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            function(sample)
+    return (time.perf_counter() - start) / (rounds * len(samples)) * 1e6
+
+
+# Function to print one codec comparison
+def report(name, messages, decoders, repeat):
+    texts = [format_message(message).encode() for message in messages]
+    packed = [pack_message(message) for message in messages]
+    assert [unpack_message(data) for data in packed] == [parse_command(text.decode()) for text in texts]
+    text_size = sum(len(text) for text in texts) / len(texts)
+    packed_size = sum(len(data) for data in packed) / len(packed)
+    print(f"{name}: text {text_size:.0f} B, binary {packed_size:.0f} B per message")
+    for label, function, binary in decoders:
+        samples = packed if binary else texts
+        print(f"  decode {label:<14} {time_calls(function, samples, repeat):8.2f} us")
+    print(f"  encode {'text':<14} {time_calls(format_message, messages, repeat):8.2f} us")
+    print(f"  encode {'binary':<14} {time_calls(pack_message, messages, repeat):8.2f} us")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the text and binary message codecs")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    chats = [
+        ChatMessage(f"user{i % 50}", " ".join(random.choice(("hello", "there", "ok", "meeting", "at", "noon")) for _ in range(8)))
+        for i in range(200)
+    ]
+    report("chat message", chats, [
+        ("split", lambda data: split_chat(data.decode()), False),
+        ("text parser", lambda data: parse_command(data.decode()), False),
+        ("binary", unpack_message, True),
+    ], args.repeat)
+
+    rooms = [
+        RoomList([Room(f"room-{i}", i % 7 == 0, random.randint(0, 10), 10) for i in range(args.rooms)])
+        for _ in range(5)
+    ]
+    report(f"room list of {args.rooms}", rooms, [
+        ("split", lambda data: split_rooms(data.decode()), False),
+        ("text parser", lambda data: parse_command(data.decode()), False),
+        ("binary", unpack_message, True),
+    ], max(1, args.repeat // args.rooms))
+
+    users = [RoomUsers(f"room-{i}", i % 10) for i in range(200)]
+    report("room users delta", users, [
+        ("text parser", lambda data: parse_command(data.decode()), False),
+        ("binary", unpack_message, True),
+    ], args.repeat)
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
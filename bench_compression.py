@@ -0,0 +1,108 @@
+# Benchmark for negotiated frame compression
+#
+# Usage: python bench_compression.py [--repeat 2000]
+#
+# Encodes typical server payloads as plain frames and as compressed frames, with and
+# without the preset dictionary, and reports the bytes on the wire and the CPU time
+# to compress and to decode each one. Payloads below COMPRESS_THRESHOLD are sent
+# uncompressed by the protocol, so their rows show why the threshold exists.
+
+# Imports
+import argparse, random, time, zlib
+from protocol import (
+    COMPRESS_LEVEL,
+    COMPRESS_WINDOW_BITS,
+    COMPRESS_MEMORY_LEVEL,
+    COMPRESS_THRESHOLD,
+    FLAG_COMPRESSED,
+    FrameDecoder,
+    encode_frame,
+    compress_payload,
+)
+
+# Words for generated chat text
+WORDS = "the a to and of you it is in that for on hey ok lol yes no what when meeting tonight server room chat".split()
+
+
+# Function to build a room list snapshot like the servers send to lobby clients
+def room_snapshot(count):
+    lines = []
+    for i in range(count):
+        locked = "1" if i % 7 == 0 else ""
+        lines.append(f"room-{i};{locked};{random.randint(0, 10)};10\n")
+    return "UPDATE_DATA;" + "".join(lines)
+
+
+# Function to build one chat broadcast of roughly the given length
+def chat_message(length):
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(random.choice(WORDS))
+    return f"MESSAGE;user{random.randint(0, 99)};{' '.join(words)}"
+
+
+# Function to compress without the preset dictionary, for comparison
+def compress_plain(payload):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -COMPRESS_WINDOW_BITS, COMPRESS_MEMORY_LEVEL)
+    return compressor.compress(payload) + compressor.flush()
+
+
+# Function to time a callable, returning microseconds per call
+def time_call(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+# Function to measure one payload
+def measure(name, text, repeat):
+    payload = text.encode()
+    plain = encode_frame(payload)
+    packed = encode_frame(compress_payload(payload), FLAG_COMPRESSED)
+    packed_plain = encode_frame(compress_plain(payload), FLAG_COMPRESSED)
+    decoder = FrameDecoder()
+    assert decoder.feed(packed) == FrameDecoder().feed(plain)
+    return {
+        "name": name,
+        "raw": len(plain),
+        "deflate": len(packed_plain),
+        "dictionary": len(packed),
+        "compress_us": time_call(lambda: compress_payload(payload), repeat),
+        "decode_plain_us": time_call(lambda: decoder.feed(plain), repeat),
+        "decode_packed_us": time_call(lambda: decoder.feed(packed), repeat),
+    }
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark negotiated frame compression")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    cases = [
+        ("chat 40 B", chat_message(40)),
+        ("chat 200 B", chat_message(200)),
+        ("chat 4 KB paste", chat_message(4096)),
+        ("join notice", "MESSAGE;Server;someone has joined the chatroom."),
+        ("rooms 5", room_snapshot(5)),
+        ("rooms 20", room_snapshot(20)),
+        ("rooms 100", room_snapshot(100)),
+        ("rooms 1000", room_snapshot(1000)),
+    ]
+    print(f"threshold {COMPRESS_THRESHOLD} B, level {COMPRESS_LEVEL}, {args.repeat} runs per payload")
+    print(f"{'payload':<16} {'raw':>8} {'deflate':>8} {'+dict':>8} {'ratio':>6} {'compress':>10} {'decode':>9} {'decode z':>9}")
+    for name, text in cases:
+        result = measure(name, text, args.repeat)
+        sent = "" if result["raw"] - 6 >= COMPRESS_THRESHOLD else "  (sent raw)"
+        print(
+            f"{result['name']:<16} {result['raw']:>8} {result['deflate']:>8} {result['dictionary']:>8} "
+            f"{result['dictionary'] / result['raw']:>6.2f} {result['compress_us']:>8.1f}us "
+            f"{result['decode_plain_us']:>7.1f}us {result['decode_packed_us']:>7.1f}us{sent}"
+        )
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
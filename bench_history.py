@@ -0,0 +1,97 @@
+# Benchmark for the chat history view under a message burst
+#
+# Usage: QT_QPA_PLATFORM=offscreen python bench_history.py [--messages 100000] [--rate 20000]
+#
+# Messages are delivered at a fixed rate into either the old QTextEdit history (one
+# append() per message) or the ring buffer backed QListView model, while the window is
+# shown. The time spent inside the event loop handlers, the longest stall and the
+# resident memory growth are reported for each.
+
+# Imports
+import argparse, resource, sys, time
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QListView, QTextEdit
+from message_model import ChatMessageModel
+
+
+# Function to get the peak resident memory in MB
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Function to build the old QTextEdit history, returns the widget and its append function
+def text_edit_history():
+    display = QTextEdit()
+    display.setReadOnly(True)
+    return display, display.append
+
+
+# Function to build the model/view history, returns the widget and its append function
+def list_view_history(scrollback):
+    model = ChatMessageModel(scrollback)
+    display = QListView()
+    display.setModel(model)
+    display.setUniformItemSizes(True)
+    display.setLayoutMode(QListView.Batched)
+    display.model_ref = model
+    model.rowsInserted.connect(display.scrollToBottom)
+    return display, model.append_line
+
+
+# Function running one history widget and printing its results
+def run(app, name, build, args):
+    memory_before = peak_rss()
+    display, append = build()
+    display.resize(450, 400)
+    display.show()
+
+    # Deliver messages in 1 ms ticks, timing every pass through the event loop
+    per_tick = max(1, args.rate // 1000)
+    sent = [0]
+    stalls = []
+    last = [time.perf_counter()]
+    def tick():
+        now = time.perf_counter()
+        stalls.append(now - last[0])
+        last[0] = now
+        for _ in range(per_tick):
+            append(f"user{sent[0] % 50}: message number {sent[0]} in a busy room")
+            sent[0] += 1
+        if sent[0] >= args.messages:
+            timer.stop()
+            QTimer.singleShot(100, app.quit)
+    timer = QTimer()
+    timer.timeout.connect(tick)
+    start = time.perf_counter()
+    timer.start(1)
+    app.exec_()
+    elapsed = time.perf_counter() - start - 0.1
+
+    stalls.sort()
+    print(
+        f"{name:<10} {sent[0] / elapsed:9.0f} msg/s  "
+        f"tick p99 {stalls[int(len(stalls) * 0.99)] * 1000:7.2f} ms  max {stalls[-1] * 1000:8.2f} ms  "
+        f"peak rss +{peak_rss() - memory_before:6.1f} MB"
+    )
+    display.close()
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat history rendering under load")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rate", type=int, default=20000)
+    parser.add_argument("--scrollback", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    print(f"{args.messages} messages at {args.rate}/s, scrollback {args.scrollback}")
+
+    # The model runs first so the QTextEdit's memory does not hide its growth
+    run(app, "listview", lambda: list_view_history(args.scrollback), args)
+    run(app, "textedit", text_edit_history, args)
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Benchmark for message delivery latency into the Qt event loop
+#
+# Usage: QT_QPA_PLATFORM=offscreen python bench_latency.py [--messages 20] [--idle 3]
+#
+# A feeder thread writes timestamped chat frames into one end of a socket pair at
+# random intervals. The other end is read either by the old lobby path (a 1000 ms
+# QTimer calling select() and recv()) or by QtConnection's QSocketNotifier, and the
+# delay from write to delivery is reported together with idle wakeups per second.
+
+# Imports
+import argparse, random, select, socket, statistics, sys, threading, time
+from PyQt5.QtCore import QCoreApplication, QTimer
+from protocol import FrameDecoder, ChatMessage, encode_frame
+from qt_connection import QtConnection
+
+
+# Function writing timestamped messages from a background thread
+def feed(sock, count, max_gap):
+    for i in range(count):
+        time.sleep(random.uniform(0, max_gap))
+        sock.sendall(encode_frame(f"MESSAGE;bench;{time.perf_counter()}"))
+
+
+# Function recording the delivery latency of one message
+def record(message, latencies):
+    if isinstance(message, ChatMessage):
+        latencies.append(time.perf_counter() - float(message.text))
+
+
+# Function reading with the old polling timer, returns the timer and its wakeup counter
+def start_polling(sock, latencies):
+    decoder = FrameDecoder()
+    wakeups = [0]
+    def check_for_messages():
+        wakeups[0] += 1
+        readable, _, _ = select.select([sock], [], [], 0)
+        if readable:
+            for message in decoder.feed(sock.recv(65536)):
+                record(message, latencies)
+    timer = QTimer()
+    timer.timeout.connect(check_for_messages)
+    timer.start(1000)
+    return timer, wakeups
+
+
+# Function reading through QSocketNotifier, returns the connection and its wakeup counter
+def start_notifier(sock, latencies):
+    connection = QtConnection(sock)
+    wakeups = [0]
+    def count_wakeup():
+        wakeups[0] += 1
+    connection.read_notifier.activated.connect(count_wakeup)
+    connection.message_received.connect(lambda message: record(message, latencies))
+    return connection, wakeups
+
+
+# Function running one mode and printing its results
+def run(app, name, start, args):
+    reader, writer = socket.socketpair()
+    latencies = []
+    handle, wakeups = start(reader, latencies)
+
+    # Idle phase: nothing is sent, every wakeup is wasted work
+    QTimer.singleShot(int(args.idle * 1000), app.quit)
+    app.exec_()
+    idle_wakeups = wakeups[0]
+
+    # Traffic phase: run until every message has been delivered
+    feeder = threading.Thread(target=feed, args=(writer, args.messages, args.max_gap))
+    feeder.start()
+    check = QTimer()
+    check.timeout.connect(lambda: len(latencies) >= args.messages and app.quit())
+    check.start(10)
+    app.exec_()
+    check.stop()
+    feeder.join()
+    del handle
+    writer.close()
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:<9} idle wakeups {idle_wakeups / args.idle:5.2f}/s  "
+        f"latency p50 {statistics.median(latencies) * 1000:8.3f} ms  "
+        f"p95 {p95 * 1000:8.3f} ms  max {latencies[-1] * 1000:8.3f} ms"
+    )
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qt socket delivery latency")
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--max-gap", type=float, default=0.25)
+    parser.add_argument("--idle", type=float, default=3)
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    print(f"{args.messages} messages, up to {args.max_gap * 1000:.0f} ms apart, {args.idle:.0f} s idle")
+    run(app, "polling", start_polling, args)
+    run(app, "notifier", start_notifier, args)
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
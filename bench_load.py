@@ -0,0 +1,266 @@
+# Load generator and fan-out latency benchmark for a chat server
+#
+# Usage: python bench_load.py [--host 127.0.0.1] [--port 2004] [--users 50] [--rooms 5]
+#                             [--rate 200] [--churn 1] [--duration 10] [--output results.json]
+#
+# Simulated users connect with the headless ChatClient, create or join their room
+# (user i goes to room i % rooms) and send chat messages at a combined rate of
+# --rate messages per second. With --churn, that many users per second leave their
+# room and join it again. Every message carries its send time, so each receiver
+# records the end-to-end broadcast latency. Connect time, join time, latency
+# percentiles and throughput are printed and written as JSON for comparing builds.
+
+# Imports
+import argparse, asyncio, json, math, random, resource, sys, time
+from protocol import ChatMessage
+from chat_client import ChatClient
+
+# Prefix marking messages sent by this tool
+MARKER = "load"
+
+
+# Function to get a percentile of sorted samples, in milliseconds
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, math.ceil(len(samples) * fraction) - 1)] * 1000
+
+
+# Function to summarise a list of durations in seconds
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.50),
+        "p95_ms": percentile(samples, 0.95),
+        "p99_ms": percentile(samples, 0.99),
+        "max_ms": samples[-1] * 1000 if samples else None,
+    }
+
+
+# Function to raise the open file limit so thousands of sockets fit in one process
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# One simulated user and the connection it drives
+class LoadUser:
+    def __init__(self, index, room_name, run):
+        self.index = index
+        self.name = f"{MARKER}{index}"
+        self.room_name = room_name
+        self.run = run
+        self.client = ChatClient(run.args.host, run.args.port, not run.args.legacy)
+        self.listener = None
+
+    # Method to connect and enter the room, creating it when this user is the first one
+    async def start(self, creator):
+        started = time.perf_counter()
+        await self.client.connect()
+        self.run.connect_times.append(time.perf_counter() - started)
+        self.listener = asyncio.ensure_future(self.listen())
+        if creator:
+            await self.enter(lambda: self.client.create_room(self.room_name, self.name, "", self.run.room_capacity))
+        else:
+            await self.enter(lambda: self.client.join_room(self.room_name, self.name))
+
+    # Method to run a create/join request, recording its time and outcome
+    async def enter(self, request):
+        started = time.perf_counter()
+        status = await request()
+        if status in ("CREATE_SUCCESS", "JOIN_SUCCESS"):
+            self.run.join_times.append(time.perf_counter() - started)
+            self.run.members[self.room_name] += 1
+        else:
+            self.run.errors[status] = self.run.errors.get(status, 0) + 1
+
+    # Method to send one timestamped message to the room
+    async def send(self):
+        if not self.client.session.in_room() or self.client.closed:
+            return
+        sequence = self.run.sent
+        self.run.sent += 1
+
+        # Every other member of the room should receive this message
+        self.run.expected += self.run.members[self.room_name] - 1
+        await self.client.send(f"{MARKER}:{self.index}:{sequence}:{time.perf_counter()!r}")
+
+    # Method to leave the room and join it again
+    async def churn(self):
+        if not self.client.session.in_room() or self.client.closed:
+            return
+        await self.client.leave()
+        self.run.members[self.room_name] -= 1
+        self.run.churns += 1
+        await self.enter(lambda: self.client.join_room(self.room_name, self.name))
+
+    # Task recording the latency of every load message this user receives
+    async def listen(self):
+        async for message in self.client.events():
+            if isinstance(message, ChatMessage) and message.text.startswith(MARKER + ":"):
+                self.run.latencies.append(time.perf_counter() - float(message.text.rsplit(":", 1)[1]))
+                self.run.received += 1
+
+    # Method to disconnect and wait for the listener to finish
+    async def stop(self):
+        await self.client.close()
+        if self.listener is not None:
+            await self.listener
+
+
+# State and results of one load run
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.room_names = [f"{MARKER}-room{i}" for i in range(args.rooms)]
+        self.room_capacity = math.ceil(args.users / args.rooms) + 1
+        self.members = {name: 0 for name in self.room_names}
+        self.users = []
+
+        # Measurements
+        self.connect_times = []
+        self.join_times = []
+        self.latencies = []
+        self.errors = {}
+        self.sent = 0
+        self.expected = 0
+        self.received = 0
+        self.churns = 0
+
+    # Method to connect every user, the first user of each room creates it
+    async def start_users(self):
+        limit = asyncio.Semaphore(self.args.connect_concurrency)
+        async def start(user, creator):
+            async with limit:
+                try:
+                    await user.start(creator)
+                except OSError as e:
+                    self.errors[type(e).__name__] = self.errors.get(type(e).__name__, 0) + 1
+        self.users = [LoadUser(i, self.room_names[i % self.args.rooms], self) for i in range(self.args.users)]
+        creators = self.users[:self.args.rooms]
+        await asyncio.gather(*(start(user, True) for user in creators))
+        await asyncio.gather(*(start(user, False) for user in self.users[self.args.rooms:]))
+
+    # Method to send messages and churn users until the duration is over
+    async def drive(self):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + self.args.duration
+        next_send = next_churn = loop.time()
+        send_interval = 1 / self.args.rate if self.args.rate > 0 else None
+        churn_interval = 1 / self.args.churn if self.args.churn > 0 else None
+        tasks = set()
+
+        # Fire sends and churns on schedule without waiting for each to finish
+        while loop.time() < end:
+            now = loop.time()
+            while send_interval is not None and next_send <= now:
+                tasks.add(asyncio.ensure_future(random.choice(self.users).send()))
+                next_send += send_interval
+            while churn_interval is not None and next_churn <= now:
+                tasks.add(asyncio.ensure_future(random.choice(self.users).churn()))
+                next_churn += churn_interval
+            tasks = {task for task in tasks if not task.done()}
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Method to run the whole benchmark and return its results
+    async def execute(self):
+        started = time.perf_counter()
+        await self.start_users()
+        connected = time.perf_counter()
+
+        self.latencies.clear()
+        await self.drive()
+        driven = time.perf_counter()
+
+        # Give in-flight broadcasts time to arrive before disconnecting
+        await asyncio.sleep(self.args.settle)
+        await asyncio.gather(*(user.stop() for user in self.users), return_exceptions=True)
+        return self.results(connected - started, driven - connected)
+
+    # Method to build the machine-readable results
+    def results(self, setup_time, drive_time):
+        return {
+            "label": self.args.label,
+            "config": {
+                "host": self.args.host,
+                "port": self.args.port,
+                "users": self.args.users,
+                "rooms": self.args.rooms,
+                "rate": self.args.rate,
+                "churn": self.args.churn,
+                "duration": self.args.duration,
+                "framed": not self.args.legacy,
+            },
+            "setup_seconds": setup_time,
+            "connect": summary(self.connect_times),
+            "join": summary(self.join_times),
+            "latency": summary(self.latencies),
+            "sent": self.sent,
+            "expected_deliveries": self.expected,
+            "deliveries": self.received,
+            "send_rate": self.sent / drive_time,
+            "delivery_rate": self.received / drive_time,
+            "churns": self.churns,
+            "errors": self.errors,
+        }
+
+
+# Function to print a short human readable report
+def report(results, out):
+    def line(name, stats):
+        if stats["count"] == 0:
+            print(f"{name:<8} no samples", file=out)
+        else:
+            print(
+                f"{name:<8} n={stats['count']:<7} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                f"p99 {stats['p99_ms']:8.3f} ms  max {stats['max_ms']:8.3f} ms",
+                file=out,
+            )
+    config = results["config"]
+    print(f"{config['users']} users in {config['rooms']} rooms, {config['rate']} msg/s, churn {config['churn']}/s", file=out)
+    line("connect", results["connect"])
+    line("join", results["join"])
+    line("latency", results["latency"])
+    print(
+        f"sent {results['sent']} ({results['send_rate']:.0f}/s), delivered {results['deliveries']}"
+        f"/{results['expected_deliveries']} ({results['delivery_rate']:.0f}/s), errors {results['errors'] or 'none'}",
+        file=out,
+    )
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Load generator and fan-out latency benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2004)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=200, help="messages per second across all users")
+    parser.add_argument("--churn", type=float, default=0, help="users per second that leave and rejoin")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--settle", type=float, default=1, help="seconds to wait for in-flight messages")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--legacy", action="store_true", help="send unframed legacy text")
+    parser.add_argument("--label", default="", help="build name stored with the results")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    if args.users < args.rooms:
+        parser.error("--users must be at least --rooms")
+
+    raise_file_limit()
+    results = asyncio.run(LoadRun(args).execute())
+    report(results, sys.stderr)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
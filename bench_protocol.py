@@ -0,0 +1,99 @@
+# Benchmark for the client wire protocol decoder
+#
+# Usage: python bench_protocol.py [--messages 100000] [--chunk 1024]
+#
+# Feeds a burst of chat broadcasts and room updates to the decoder in recv-sized
+# chunks and reports decode throughput for framed and legacy streams, next to the
+# old split-based parsing that treated every recv() as exactly one message.
+
+# Imports
+import argparse, time
+from protocol import FrameDecoder, ChatMessage, RoomList, encode_frame
+
+# Room update pushed to lobby clients
+ROOM_UPDATE = "UPDATE_DATA;general;;3;5\nprivate;secret;1;2\n"
+
+
+# Function to build the burst of server messages
+def build_messages(count):
+    messages = []
+    for i in range(count):
+        if i % 10 == 9:
+            messages.append(ROOM_UPDATE)
+        else:
+            messages.append(f"MESSAGE;user{i % 50};message number {i} with some text")
+    return messages
+
+
+# Function to split a byte stream into recv-sized chunks
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# Function to time the streaming decoder over a list of chunks
+def run_decoder(chunks):
+    decoder = FrameDecoder()
+    decoded = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        decoded += len(decoder.feed(chunk))
+    return decoded, time.perf_counter() - start
+
+
+# Function to time the old split-chain parser, one message per recv() chunk
+def run_split_chain(chunks):
+    decoded = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        message = chunk.decode(errors="replace")
+        if len(message.split("MESSAGE;")) == 1:
+            if len(message.split("UPDATE_DATA;")) > 1:
+                message.split("UPDATE_DATA;")[1].strip().splitlines()
+                decoded += 1
+            continue
+        message = message.split("MESSAGE;")[1]
+        if len(message.split("UPDATE_DATA")) > 1:
+            message = message.split("UPDATE_DATA")[0]
+        parts = message.split(";")
+        if len(parts) > 1:
+            decoded += 1
+    return decoded, time.perf_counter() - start
+
+
+# Function to print one result line
+def report(name, expected, decoded, elapsed, size):
+    rate = decoded / elapsed if elapsed else float("inf")
+    print(
+        f"{name:<12} decoded {decoded:>7}/{expected} messages "
+        f"in {elapsed * 1000:8.1f} ms  {rate:>12,.0f} msg/s  {size / elapsed / 1e6:8.1f} MB/s"
+    )
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wire protocol decoder")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--chunk", type=int, default=1024)
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages)
+    framed = b"".join(encode_frame(message) for message in messages)
+    legacy = "".join(messages).encode()
+
+    # Sanity check that the framed stream decodes to the expected message types
+    decoder = FrameDecoder()
+    sample = decoder.feed(framed[:4096])
+    assert all(isinstance(message, (ChatMessage, RoomList)) for message in sample)
+
+    print(f"{args.messages} messages, {args.chunk} byte reads")
+    decoded, elapsed = run_decoder(chunked(framed, args.chunk))
+    report("framed", args.messages, decoded, elapsed, len(framed))
+    decoded, elapsed = run_decoder(chunked(legacy, args.chunk))
+    report("legacy", args.messages, decoded, elapsed, len(legacy))
+    decoded, elapsed = run_split_chain(chunked(legacy, args.chunk))
+    report("split-chain", args.messages, decoded, elapsed, len(legacy))
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
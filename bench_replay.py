@@ -0,0 +1,444 @@
+# Replay of recorded client traffic for catching performance regressions
+#
+# Usage: python bench_replay.py RECORDING [--target decoder] [--speed 1] [--output results.json]
+#        QT_QPA_PLATFORM=offscreen python bench_replay.py RECORDING --target qt [--speed 10]
+#        python bench_replay.py RECORDING --target server [--host 127.0.0.1] [--port 2004] [--speed max]
+#
+# Recordings are made with `client.py --record FILE` (or `--cli --record FILE`). The
+# decoder target feeds the received bytes to a ClientSession in the chunks the socket
+# returned them, at the recorded pace (--speed 1), N times faster (--speed N) or with
+# no pauses (--speed max). The qt target writes them into a socket pair read by a
+# QtConnection whose messages update the lobby and chat models, as in the client. The
+# server target sends the recorded commands to a local server instead, reconnecting
+# where the client did, and decodes the answers. Each run reports parse throughput,
+# UI updates and how far the replay fell behind the recorded timing, and the results
+# are written as JSON for comparing builds.
+
+# Imports
+import argparse, json, select, socket, sys, threading, time
+from collections import Counter
+from protocol import FrameDecoder, ChatMessage, RoomList, RoomPage, RoomAdded, RoomRemoved, RoomUsers
+from session import ClientSession, Response, RoundTrip, RoomEvent
+from recorder import read_recording, RECEIVED, SENT, CONNECTED
+from bench_load import summary
+
+# Bytes requested per recv() call on the server target
+READ_SIZE = 65536
+
+# Room list messages the qt target applies to the lobby model
+ROOM_MESSAGES = (RoomList, RoomPage, RoomAdded, RoomRemoved, RoomUsers)
+
+# Client commands whose replies move a session into a room
+ROOM_REQUESTS = ("CREATE_ROOM", "JOIN_ROOM", "REJOIN_ROOM")
+
+# Fields of each request before the request id a client with the ids feature appends
+REQUEST_FIELDS = {"CREATE_ROOM": 5, "JOIN_ROOM": 3, "REJOIN_ROOM": 4}
+
+# Seconds replayed requests wait for their replies, long enough never to expire
+REQUEST_WAIT = 1e9
+
+
+# Function to parse --speed: a factor of the recorded pace, or max for no pauses (0)
+def replay_speed(text):
+    if text == "max":
+        return 0.0
+    try:
+        value = float(text)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise argparse.ArgumentTypeError("expected a positive factor or max")
+    return value
+
+
+# Decoder for the recorded client bytes, yielding command strings
+class CommandDecoder(FrameDecoder):
+    def decode_legacy(self, text):
+        return [text] if text else []
+
+    def parse(self, text):
+        return text
+
+
+# Function to register the create/join requests among recorded client bytes with a session,
+# so the replies that follow enter the rooms the client entered and their messages are kept
+def replay_requests(session, decoder, data):
+    for command in decoder.feed(data):
+        if not isinstance(command, str):
+            continue
+        kind, _, rest = command.partition(";")
+        fields = rest.split(";")
+        if kind not in ROOM_REQUESTS:
+            continue
+        request_id = None
+        if len(fields) == REQUEST_FIELDS[kind] + 1 and fields[-1].isdigit():
+            request_id = int(fields.pop())
+        if kind == "CREATE_ROOM" and len(fields) == 5:
+            session.requests.begin(kind, fields[0], fields[4], REQUEST_WAIT, fields[1], request_id)
+        elif kind in ("JOIN_ROOM", "REJOIN_ROOM") and len(fields) >= 3:
+            password = "" if fields[1] == "NO_PASSWORD" else fields[1]
+            session.requests.begin(kind, fields[0], fields[2], REQUEST_WAIT, password, request_id)
+
+
+# Clock placing recorded times on the replay timeline, recording how late each step ran
+class ReplayClock:
+    def __init__(self, speed):
+        self.speed = speed
+        self.started = time.perf_counter()
+        self.lateness = []
+
+    # Method to start the timeline now, once the target is set up
+    def start(self):
+        self.started = time.perf_counter()
+
+    # Method to get the replay time of a recorded time, now when replaying without pauses
+    def due(self, recorded):
+        return self.started + recorded / self.speed if self.speed else time.perf_counter()
+
+    # Method to wait for a recorded time, idle(deadline) may do work until then instead of sleeping
+    def wait(self, recorded, idle=None):
+        if not self.speed:
+            return
+        due = self.due(recorded)
+        if idle is not None:
+            idle(due)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.lateness.append(time.perf_counter() - due)
+
+
+# Decode time and message counts of the bytes fed to sessions
+class ParseStats:
+    def __init__(self):
+        self.chunks = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.types = Counter()
+
+    # Method to feed one chunk to a session, returns its messages
+    def feed(self, session, data):
+        started = time.perf_counter()
+        messages = session.receive(data)
+        self.seconds += time.perf_counter() - started
+        self.chunks += 1
+        self.bytes += len(data)
+        self.types.update(type(message).__name__ for message in messages)
+        return messages
+
+    # Method to build the machine-readable results
+    def results(self):
+        messages = sum(self.types.values())
+        return {
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "messages": messages,
+            "seconds": self.seconds,
+            "mb_per_second": self.bytes / self.seconds / 1e6 if self.seconds else None,
+            "messages_per_second": messages / self.seconds if self.seconds else None,
+            "types": dict(self.types.most_common()),
+        }
+
+
+# Function to replay the received bytes into a ClientSession, a fresh one for each
+# connection. The recorded commands register their requests as they come.
+def replay_decoder(records, clock):
+    stats = ParseStats()
+    session = ClientSession()
+    decoder = CommandDecoder()
+    clock.start()
+    for record in records:
+        if record.kind == CONNECTED:
+            session = ClientSession()
+            decoder = CommandDecoder()
+        elif record.kind == SENT:
+            replay_requests(session, decoder, record.data)
+        elif record.kind == RECEIVED:
+            clock.wait(record.time)
+            stats.feed(session, record.data)
+    return {"parse": stats.results()}
+
+
+# Function to join the received bytes of every connection into one stream as (time, data)
+# chunks, the sent bytes are kept as (time, None, data). The partial frame a dropped
+# connection left behind is cut, so it cannot corrupt the next connection's frames.
+def replay_stream(records):
+    chunks = []
+    segment = []
+    def end_segment():
+        decoder = FrameDecoder()
+        for chunk in segment:
+            if len(chunk) == 2:
+                decoder.feed(chunk[1])
+        cut = decoder.pending()
+        position = len(segment) - 1
+        while cut and position >= 0:
+            if len(segment[position]) == 2:
+                recorded, data = segment[position]
+                if len(data) <= cut:
+                    del segment[position]
+                    cut -= len(data)
+                else:
+                    segment[position] = (recorded, data[:-cut])
+                    cut = 0
+            position -= 1
+        chunks.extend(segment)
+        segment.clear()
+    for record in records:
+        if record.kind == CONNECTED:
+            end_segment()
+        elif record.kind == RECEIVED:
+            segment.append((record.time, record.data))
+        elif record.kind == SENT:
+            segment.append((record.time, None, record.data))
+    end_segment()
+    return chunks
+
+
+# Function to replay the received bytes through a QtConnection into the lobby and chat models.
+# A feeder thread writes each chunk when it is due, and every delivered message is timed
+# against the due time of the chunk it came in, found by decoding the stream beforehand.
+# That decode also measures the parse throughput. The connection's session has every
+# recorded request registered up front, and answers them in order.
+def replay_qt(records, clock, timeout):
+
+    # PyQt5 is only needed for this target
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication, QListView
+    from qt_connection import QtConnection
+    from room_model import RoomListModel
+    from message_model import ChatMessageModel
+
+    stream = replay_stream(records)
+    chunks = [chunk for chunk in stream if len(chunk) == 2]
+    stats = ParseStats()
+    owners = []
+    session = ClientSession()
+    decoder = CommandDecoder()
+    index = 0
+    for chunk in stream:
+        if len(chunk) == 3:
+            replay_requests(session, decoder, chunk[2])
+            continue
+        messages = stats.feed(session, chunk[1])
+
+        # Replies and pongs are consumed by the connection instead of being delivered
+        delivered = [message for message in messages if not isinstance(message, (Response, RoundTrip))]
+        owners.extend([index] * len(delivered))
+        index += 1
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    reader, writer = socket.socketpair()
+    connection = QtConnection(reader)
+    decoder = CommandDecoder()
+    for chunk in stream:
+        if len(chunk) == 3:
+            replay_requests(connection.session, decoder, chunk[2])
+
+    # Lobby and chat views as the client shows them, counting every model change
+    rooms = RoomListModel()
+    chat = ChatMessageModel()
+    views = []
+    updates = Counter()
+    for name, model in (("rooms", rooms), ("chat", chat)):
+        view = QListView()
+        view.setUniformItemSizes(True)
+        view.setModel(model)
+        view.show()
+        views.append(view)
+        for signal in (model.rowsInserted, model.rowsRemoved, model.dataChanged, model.modelReset):
+            signal.connect(lambda *args, name=name: updates.update([name]))
+    chat.rowsInserted.connect(views[1].scrollToBottom)
+
+    # Due time of each chunk, set by the feeder just before writing it
+    due = [None] * len(chunks)
+    latencies = []
+    def deliver(message):
+        now = time.perf_counter()
+        chunk = owners[min(len(latencies), len(owners) - 1)] if owners else 0
+        latencies.append(now - due[chunk] if due[chunk] is not None else 0.0)
+        if isinstance(message, RoomEvent):
+            message = message.message
+        if isinstance(message, ROOM_MESSAGES):
+            rooms.apply(message)
+        elif isinstance(message, ChatMessage):
+            for line in f"{message.sender}: {message.text}".split("\n"):
+                chat.append_line(line, save=False)
+    connection.message_received.connect(deliver)
+
+    # Lines still waiting for the chat model's flush timer are shown before quitting
+    def finish():
+        chat.flush()
+        app.quit()
+    connection.connection_closed.connect(finish)
+
+    # The end of the stream closes the connection, which flushes the inbox and quits
+    def feed():
+        for index, (recorded, data) in enumerate(chunks):
+            clock.wait(recorded)
+            due[index] = clock.due(recorded)
+            writer.sendall(data)
+        writer.close()
+    feeder = threading.Thread(target=feed, name="feeder", daemon=True)
+    clock.start()
+    feeder.start()
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec_()
+    return {
+        "parse": stats.results(),
+        "ui": {
+            "deliveries": len(latencies),
+            "expected": len(owners),
+            "drains": connection.inbox.drains,
+            "room_model_updates": updates["rooms"],
+            "chat_model_updates": updates["chat"],
+        },
+        "latency": summary(latencies),
+    }
+
+
+# Connection replaying recorded commands to a server and decoding its answers
+class ServerReplay:
+    def __init__(self, host, port, stats):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.sock = None
+        self.session = None
+        self.commands = None
+        self.connections = 0
+
+    # Method to open a new connection, closing the previous one
+    def connect(self):
+        self.close()
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.session = ClientSession()
+        self.commands = CommandDecoder()
+        self.connections += 1
+
+    # Method to read and decode answers until the deadline, or what is waiting when there is none
+    def pump(self, deadline=None):
+        while self.sock is not None:
+            timeout = 0 if deadline is None else deadline - time.perf_counter()
+            readable, _, _ = select.select([self.sock], [], [], max(0, timeout))
+            if not readable:
+                if timeout <= 0:
+                    return
+                continue
+            data = self.sock.recv(READ_SIZE)
+            if not data:
+                self.close()
+                return
+            self.stats.feed(self.session, data)
+
+    # Method to send recorded bytes, reconnecting if the server closed the connection
+    def send(self, data):
+        if self.sock is None:
+            self.connect()
+        replay_requests(self.session, self.commands, data)
+        self.sock.sendall(data)
+        self.pump()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+# Function to replay the sent bytes against a server, reading its answers while waiting
+def replay_server(records, clock, host, port, settle):
+    stats = ParseStats()
+    replay = ServerReplay(host, port, stats)
+    try:
+        for record in records:
+            if record.kind == CONNECTED:
+                replay.connect()
+            elif record.kind == SENT:
+                clock.wait(record.time, replay.pump)
+                replay.send(record.data)
+        replay.pump(time.perf_counter() + settle)
+    finally:
+        replay.close()
+    return {"parse": stats.results(), "connections": replay.connections}
+
+
+# Function to print a short human readable report
+def report(results, out):
+    config = results["config"]
+    speed = f"{config['speed']:g}x" if config["speed"] else "max speed"
+    print(
+        f"{config['recording']}: {config['target']} target at {speed}, "
+        f"{results['recorded_seconds']:.2f} s recorded, replayed in {results['replay_seconds']:.2f} s",
+        file=out,
+    )
+    parse = results.get("parse", {})
+    if parse.get("seconds"):
+        print(
+            f"parse    {parse['chunks']} chunks, {parse['bytes']} bytes, {parse['messages']} messages in "
+            f"{parse['seconds'] * 1000:.1f} ms: {parse['mb_per_second']:.1f} MB/s, "
+            f"{parse['messages_per_second']:.0f} messages/s",
+            file=out,
+        )
+    ui = results.get("ui")
+    if ui:
+        print(
+            f"ui       {ui['deliveries']}/{ui['expected']} messages delivered in {ui['drains']} drains, "
+            f"{ui['room_model_updates']} lobby and {ui['chat_model_updates']} chat model updates",
+            file=out,
+        )
+    for name in ("lateness", "latency"):
+        stats = results.get(name)
+        if stats and stats["count"]:
+            print(
+                f"{name:<8} n={stats['count']:<7} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                f"p99 {stats['p99_ms']:8.3f} ms  max {stats['max_ms']:8.3f} ms",
+                file=out,
+            )
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Replay a wire recording for performance regressions")
+    parser.add_argument("recording", help="file written by the client with --record")
+    parser.add_argument("--target", choices=("decoder", "qt", "server"), default="decoder")
+    parser.add_argument("--speed", type=replay_speed, default=1.0, help="factor of the recorded pace, or max")
+    parser.add_argument("--host", default="127.0.0.1", help="server for the server target")
+    parser.add_argument("--port", type=int, default=2004)
+    parser.add_argument("--settle", type=float, default=1, help="seconds to read answers after the last command")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds the qt target may run")
+    parser.add_argument("--label", default="", help="build name stored with the results")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        records = read_recording(args.recording)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    clock = ReplayClock(args.speed)
+    if args.target == "decoder":
+        results = replay_decoder(records, clock)
+    elif args.target == "qt":
+        results = replay_qt(records, clock, args.timeout)
+    else:
+        results = replay_server(records, clock, args.host, args.port, args.settle)
+    results.update({
+        "label": args.label,
+        "config": {"recording": args.recording, "target": args.target, "speed": args.speed},
+        "recorded_seconds": records[-1].time if records else 0.0,
+        "replay_seconds": time.perf_counter() - clock.started,
+        "lateness": summary(clock.lateness),
+    })
+
+    report(results, sys.stderr)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
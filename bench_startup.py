@@ -0,0 +1,92 @@
+# Benchmark for client startup time
+#
+# Usage: python bench_startup.py [--repeat 10]
+#
+# Starts fresh interpreters and reports the median and best wall time of each step:
+# an empty interpreter, importing the terminal client, reaching the lobby with
+# `client.py --cli` against a local server.py, and importing the Qt client and creating
+# its QApplication (offscreen). Files are in the page cache after the first run, so the
+# numbers are process startup and import costs rather than disk reads.
+
+# Imports
+import argparse, os, socket, statistics, subprocess, sys, time
+
+# Directory holding the client sources
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function to time a command until it exits, returning milliseconds
+def time_exit(command, env=None):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+# Function to time the terminal client until it prints the lobby line, returning milliseconds
+def time_lobby(port):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "client.py", "--cli", "--host", "127.0.0.1", "--port", str(port), "--user", "bench"],
+        cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = (time.perf_counter() - start) * 1000
+    process.communicate("/quit\n")
+    if not line.startswith("Connected"):
+        raise RuntimeError(f"Unexpected output from the terminal client: {line!r}")
+    return elapsed
+
+
+# Function to start server.py on a free port and wait until it accepts connections
+def start_server():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--port", str(port)],
+        cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("server.py did not start")
+
+
+# Function to print one row of results
+def report(name, samples):
+    print(f"{name:<36} median {statistics.median(samples):7.1f} ms   best {min(samples):7.1f} ms")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark client startup time")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    offscreen = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+
+    report("python (empty interpreter)", [time_exit([sys.executable, "-c", "pass"]) for _ in range(args.repeat)])
+    report("import cli", [time_exit([sys.executable, "-c", "import cli"]) for _ in range(args.repeat)])
+
+    server, port = start_server()
+    try:
+        report("client.py --cli to lobby", [time_lobby(port) for _ in range(args.repeat)])
+    finally:
+        server.communicate(b"SHUTDOWN\n", timeout=10)
+
+    try:
+        report("import client + QApplication", [
+            time_exit([sys.executable, "-c", "import client; from PyQt5.QtWidgets import QApplication; QApplication([])"], offscreen)
+            for _ in range(args.repeat)
+        ])
+    except subprocess.CalledProcessError:
+        print("import client + QApplication        skipped, PyQt5 is not available")
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
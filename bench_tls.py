@@ -0,0 +1,190 @@
+# Benchmark for connect latency over plaintext and TLS
+#
+# Usage: QT_QPA_PLATFORM=offscreen python bench_tls.py [--repeat 20] [--tls-version 1.3] [--latency 0]
+#
+# Starts server.py twice on free ports, once plain and once with a throwaway self-signed
+# certificate made by the openssl command, and times QtConnection from the connect until
+# the answer to HELLO arrives: over plaintext, over TLS with a full handshake on every
+# connect, and over TLS resuming the session of the previous connect as a reconnect does.
+# --latency adds that many milliseconds of round trip through a local proxy. A resumed
+# TLS 1.2 handshake saves a round trip, a resumed TLS 1.3 handshake takes as many as a
+# full one but skips the certificate and its signature checks.
+
+# Imports
+import argparse, asyncio, contextlib, io, os, socket, statistics, subprocess, sys, tempfile, threading, time
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+from protocol import Hello
+from qt_connection import QtConnection
+from tls import TlsClient, client_context, parse_version
+
+# Directory holding the client sources
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds one connect may take before the benchmark gives up
+CONNECT_LIMIT = 10
+
+# Bytes the proxy reads at once
+PROXY_READ_SIZE = 65536
+
+
+# Function to make a self-signed certificate for localhost, returning the certificate and key paths
+def make_certificate(directory):
+    cert_file, key_file = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1", "-keyout", key_file, "-out", cert_file],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return cert_file, key_file
+
+
+# Function to pick a free port
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+# Function to start server.py on a free port and wait until it accepts connections
+def start_server(*options):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(port), *options],
+        cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("server.py did not start")
+
+
+# Coroutine copying one direction of a proxied connection, each chunk leaves delay seconds after it arrived
+async def forward(reader, writer, delay):
+    queue = asyncio.Queue()
+
+    async def send():
+        while True:
+            due, data = await queue.get()
+            await asyncio.sleep(due - time.monotonic())
+            if data is None:
+                break
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    sender = asyncio.ensure_future(send())
+    try:
+        while True:
+            data = await reader.read(PROXY_READ_SIZE)
+            queue.put_nowait((time.monotonic() + delay, data or None))
+            if not data:
+                break
+        await sender
+    except OSError:
+        sender.cancel()
+    writer.close()
+
+
+# Function to start a proxy in front of a port on a background thread, adding round_trip
+# seconds to every exchange. The first bytes wait one round trip more, standing in for
+# the TCP connect the local connect does not pay. Returns the proxy's port.
+def start_proxy(port, round_trip):
+    loop = asyncio.new_event_loop()
+    proxy_port = free_port()
+
+    async def relay(client_reader, client_writer):
+        await asyncio.sleep(round_trip)
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.gather(
+            forward(client_reader, server_writer, round_trip / 2),
+            forward(server_reader, client_writer, round_trip / 2),
+        )
+
+    loop.run_until_complete(asyncio.start_server(relay, "127.0.0.1", proxy_port))
+    threading.Thread(target=loop.run_forever, name="proxy", daemon=True).start()
+    return proxy_port
+
+
+# Function to time one connect until the answer to HELLO, returning seconds and whether TLS resumed
+def time_connect(port, tls):
+    loop = QEventLoop()
+    answered = []
+    started = time.perf_counter()
+    connection = QtConnection.connect_to("127.0.0.1", port, timeout=CONNECT_LIMIT, reconnect=False, tls=tls)
+
+    def received(message):
+        if isinstance(message, Hello) and not answered:
+            answered.append(time.perf_counter() - started)
+            loop.quit()
+    connection.message_received.connect(received)
+    connection.connection_closed.connect(loop.quit)
+    QTimer.singleShot(CONNECT_LIMIT * 1000, loop.quit)
+    loop.exec_()
+    if not answered:
+        raise RuntimeError(f"No answer to HELLO from port {port}")
+    resumed = tls is not None and connection.sock.session_reused
+    connection.connection_closed.disconnect()
+    connection.close()
+    connection.deleteLater()
+    return answered[0], resumed
+
+
+# Function to time repeated connects and print one row of results, the connections' own log lines are dropped
+def run(name, port, tls, repeat):
+    samples, resumed = [], 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            elapsed, reused = time_connect(port, tls)
+            samples.append(elapsed * 1000)
+            resumed += reused
+    p90 = statistics.quantiles(samples, n=10)[-1] if len(samples) > 1 else samples[0]
+    print(f"{name:<20} median {statistics.median(samples):7.2f} ms   p90 {p90:7.2f} ms   "
+          f"best {min(samples):7.2f} ms   resumed {resumed}/{repeat}")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark connect latency over plaintext and TLS")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tls-version", default="1.3", choices=["1.2", "1.3"])
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds of round trip added by a local proxy")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            cert_file, key_file = make_certificate(directory)
+        except (OSError, subprocess.CalledProcessError):
+            print("The openssl command is needed to make the test certificate", file=sys.stderr)
+            return 1
+        plain, plain_port = start_server()
+        secure, secure_port = start_server("--tls-cert", cert_file, "--tls-key", key_file)
+        try:
+            if args.latency:
+                plain_port = start_proxy(plain_port, args.latency / 1000)
+                secure_port = start_proxy(secure_port, args.latency / 1000)
+            context = client_context(cert_file, parse_version(args.tls_version))
+            print(f"{args.repeat} connects each, TLS {args.tls_version}, {args.latency:g} ms added round trip")
+
+            # The resumed run starts from the session of a first connect, like a reconnect
+            resuming = TlsClient(context)
+            run("TLS first connect", secure_port, resuming, 1)
+            run("plaintext", plain_port, None, args.repeat)
+            run("TLS full handshake", secure_port, TlsClient(context, resume=False), args.repeat)
+            run("TLS resumed", secure_port, resuming, args.repeat)
+        finally:
+            for server in (plain, secure):
+                server.communicate(b"SHUTDOWN\n", timeout=10)
+    app.processEvents()
+    return 0
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# Imports
+import asyncio, time
+from protocol import RoomList, Hello, ServerShutdown, ProtocolError
+from session import (
+    ClientSession,
+    Response,
+    RoundTrip,
+    REQUEST_TIMEOUT,
+    SUCCESS_STATUSES,
+    TIMEOUT,
+    DISCONNECTED,
+)
+
+# Bytes requested from the stream per read
+READ_SIZE = 65536
+
+
+# Headless asyncio chat client, one instance per connection.
+# Many instances can share a single event loop.
+class ChatClient:
+    def __init__(self, host, port, framed=True, read_size=READ_SIZE):
+        self.host = host
+        self.port = port
+        self.read_size = read_size
+        self.session = ClientSession(framed)
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.heartbeat_task = None
+
+        # Futures waiting for create/join replies, keyed by request id
+        self.pending = {}
+
+        # Unsolicited server messages for the events() iterator
+        self.event_queue = asyncio.Queue()
+
+        # Set when the first room list arrives or the connection ends
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.finished = False
+
+    # Method to open the connection and wait for the initial room list
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.read_task = asyncio.ensure_future(self.read_loop())
+        await self.write(self.session.hello())
+        await self.ready.wait()
+        if self.closed:
+            raise ConnectionError("Connection closed before the room list arrived")
+        return list(self.session.rooms.values())
+
+    # Method to create a room, returns the server reply status
+    async def create_room(self, room_name, username, password="", max_users=2, timeout=REQUEST_TIMEOUT):
+        return await self.request(*self.session.create_room(room_name, username, password, max_users, timeout))
+
+    # Method to join a room, returns the server reply status
+    async def join_room(self, room_name, username, password="", timeout=REQUEST_TIMEOUT):
+        return await self.request(*self.session.join_room(room_name, username, password, timeout))
+
+    # Method to send a chat message to a room, the only one when no name is given
+    async def send(self, text, room_name=None):
+        await self.write(self.session.send_message(text, room_name))
+
+    # Method to leave a room, the last room left returns the client to the lobby
+    async def leave(self, room_name=None):
+        await self.write(self.session.leave_room(room_name))
+
+    # Method to disconnect from the server and close the connection
+    async def close(self):
+        if self.writer is None or self.closed:
+            return
+        try:
+            if self.session.in_room():
+                self.writer.write(self.session.leave_all())
+            self.writer.write(self.session.disconnect())
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.writer.close()
+            self.read_task.cancel()
+            self.finish()
+
+    # Async iterator over pushed messages (chat messages, room lists, shutdown)
+    async def events(self):
+        while True:
+            message = await self.event_queue.get()
+            if message is None:
+                return
+            yield message
+
+    # Method to send a request and wait for the matching reply or its deadline
+    async def request(self, request, data):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request.request_id] = future
+        try:
+            await self.write(data)
+            return await asyncio.wait_for(future, max(0, request.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.session.requests.cancel(request)
+            return TIMEOUT
+        finally:
+            self.pending.pop(request.request_id, None)
+
+    # Method to write bytes and wait until the transport buffer drains
+    async def write(self, data):
+        if self.closed:
+            raise ConnectionError("Not connected")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    # Task reading the stream and routing decoded messages
+    async def read_loop(self):
+        try:
+            while True:
+                data = await self.reader.read(self.read_size)
+                if not data:
+                    break
+                for message in self.session.receive(data):
+                    self.route(message)
+                if self.session.resync_needed:
+                    self.writer.write(self.session.resync())
+        except (ConnectionError, ProtocolError) as e:
+            print("Connection lost:", e)
+        finally:
+            self.finish()
+
+    # Task sending a ping whenever one is due, it closes the connection once the server stopped answering
+    async def heartbeat_loop(self):
+        heartbeat = self.session.heartbeat
+        try:
+            while not self.closed:
+                await asyncio.sleep(max(0, heartbeat.next_deadline() - time.monotonic()))
+                if heartbeat.dead():
+                    print(f"Connection lost: no answer to the last {len(heartbeat.sent)} pings")
+                    self.writer.close()
+                    return
+                await self.write(self.session.ping())
+        except ConnectionError:
+            pass
+
+    # Method to route a decoded message to a waiting request or the event queue
+    def route(self, message):
+        if isinstance(message, Response):
+            request = message.request
+            future = self.pending.get(request.request_id)
+            if future is not None and not future.done():
+                future.set_result(message.status)
+
+            # The server accepted a request we gave up on, leave that room again
+            elif request.expired and message.status in SUCCESS_STATUSES:
+                self.writer.write(self.session.abandon(request))
+            return
+        if isinstance(message, RoundTrip):
+            return
+        if isinstance(message, Hello) and self.heartbeat_task is None and self.session.start_heartbeat():
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat_loop())
+        if isinstance(message, RoomList):
+            self.ready.set()
+        self.event_queue.put_nowait(message)
+        if isinstance(message, ServerShutdown):
+            self.closed = True
+
+    # Method to fail outstanding requests and end the event stream once
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.closed = True
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        self.session.requests.fail_all()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result(DISCONNECTED)
+        self.event_queue.put_nowait(None)
+        self.ready.set()
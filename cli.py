@@ -0,0 +1,465 @@
+# Imports
+import argparse, selectors, shlex, socket, sys, threading, time
+from protocol import RoomList, ChatMessage, Hello, ServerShutdown, ProtocolError
+from send_queue import SendQueue
+from heartbeat import PING_INTERVAL, MAX_MISSED_PINGS, enable_keepalive
+from ratelimit import ChatPacer, RATE, BURST, BATCH_LINES
+from recorder import WireRecorder
+from endpoints import Endpoint, DEFAULT_PORT, format_endpoint, load_endpoints, probe_endpoints
+from session import (
+    ClientSession,
+    Response,
+    SessionError,
+    REQUEST_TIMEOUT,
+    SUCCESS_STATUSES,
+    TIMEOUT,
+    DISCONNECTED,
+)
+
+# Bytes requested per recv() call
+READ_SIZE = 65536
+
+# Seconds input must pause before queued chat lines are sent, so the lines of a paste leave together
+PASTE_DELAY = 0.01
+
+# Seconds a connection attempt may take, and quitting may spend flushing queued messages
+CONNECT_TIMEOUT = 5
+CLOSE_TIMEOUT = 1
+
+# Text shown for each reply to a create/join request
+STATUS_TEXT = {
+    "INVALID_PASSWORD": "The password is incorrect.",
+    "ROOM_FULL": "The room is full.",
+    "NO_ROOM": "There is no room with that name.",
+    "EXISTING_USER": "This username already exists in this chatroom.",
+    "ROOM_EXISTS": "A room with that name already exists.",
+    "BAD_REQUEST": "The server could not read the request.",
+    TIMEOUT: "The server did not answer.",
+    DISCONNECTED: "The connection was lost.",
+}
+
+HELP = """Commands:
+  /rooms                              list the rooms
+  /create <room> [max users] [password]  create a room and enter it
+  /join <room> [password]             join a room
+  /leave                              return to the lobby
+  /nick <name>                        set the username for the next create/join
+  /ping                               show the round trip time to the server
+  /quit                               leave and exit
+Other lines are sent to the current room, lines pasted together go out as one message.
+Quote names with spaces: /join "my room"."""
+
+
+# Terminal chat client without Qt. A selector waits on the socket and on a wakeup
+# socket the stdin thread writes to, and the shared ClientSession does the protocol,
+# so only the standard library and the protocol modules are loaded at startup.
+# Input is held until the server answered HELLO and sent its room list, then handled
+# one line at a time, and a create/join holds the following lines until its reply
+# arrives, so a piped script runs in order.
+class TerminalClient:
+    def __init__(self, host, port, username="", framed=True, output=sys.stdout):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.output = output
+        self.session = ClientSession(framed)
+        self.outgoing = SendQueue()
+        self.pacer = ChatPacer()
+        self.last_chat_line = 0.0
+        self.selector = selectors.DefaultSelector()
+        self.sock = None
+
+        # Optional WireRecorder logging every byte sent and received
+        self.recorder = None
+
+        # Lines read by the stdin thread, None marks the end of input
+        self.lines = []
+        self.lines_lock = threading.Lock()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+
+        # Create/join request whose reply the next input line waits for
+        self.waiting = None
+
+        # Set once HELLO was answered and the first room list arrived, input waits until then
+        # and the connection is given up on when that takes past the deadline
+        self.room_list_seen = False
+        self.ready = False
+        self.ready_deadline = None
+        self.running = False
+        self.exit_status = 0
+
+    # Method to print one line of output
+    def show(self, text):
+        print(text, file=self.output, flush=True)
+
+    # Method to connect, send HELLO and start reading standard input
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), CONNECT_TIMEOUT)
+        if self.recorder is not None:
+            self.recorder.connected(format_endpoint(Endpoint(self.host, self.port)))
+        enable_keepalive(self.sock, self.session.heartbeat.interval, self.session.heartbeat.max_missed)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ, self.socket_ready)
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self.input_ready)
+        self.write(self.session.hello())
+        self.ready_deadline = time.monotonic() + CONNECT_TIMEOUT
+        threading.Thread(target=self.read_input, name="stdin", daemon=True).start()
+
+    # Thread reading standard input line by line
+    def read_input(self):
+        for line in sys.stdin:
+            self.post_line(line.rstrip("\r\n"))
+        self.post_line(None)
+
+    # Method to hand a line to the event loop
+    def post_line(self, line):
+        with self.lines_lock:
+            self.lines.append(line)
+        self.wakeup_writer.send(b"\0")
+
+    # Method to run until /quit, the end of input or the end of the connection.
+    # The selector sleeps until input, a request deadline or the next ping is due.
+    def run(self):
+        self.running = True
+        while self.running:
+            deadlines = [
+                deadline for deadline in (
+                    self.session.requests.next_deadline(),
+                    self.session.heartbeat.next_deadline(),
+                    self.chat_deadline(),
+                    None if self.ready else self.ready_deadline,
+                )
+                if deadline is not None
+            ]
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            for key, events in self.selector.select(timeout):
+                key.data(events)
+            if self.running and not self.ready and time.monotonic() >= self.ready_deadline:
+                self.connection_lost(TimeoutError("No answer to HELLO"))
+            for request in self.session.requests.expire():
+                self.finish_request(request, TIMEOUT)
+            self.check_heartbeat()
+            self.release_chat()
+        self.close()
+        return self.exit_status
+
+    # Method to get the time queued chat may leave: once input paused and the rate limit allows it
+    def chat_deadline(self):
+        deadline = self.pacer.next_deadline()
+        return None if deadline is None else max(deadline, self.last_chat_line + PASTE_DELAY)
+
+    # Method to send the chat messages the rate limit lets out, lines queued together leave as one
+    def release_chat(self):
+        if time.monotonic() < self.last_chat_line + PASTE_DELAY:
+            return
+        for room_name, text in self.pacer.release():
+            if self.running and self.session.in_room(room_name):
+                self.write(self.session.send_message(text, room_name))
+
+    # Method to send the ping that is due, or end the session when the server stopped answering
+    def check_heartbeat(self):
+        heartbeat = self.session.heartbeat
+        deadline = heartbeat.next_deadline()
+        if not self.running or deadline is None or deadline > time.monotonic():
+            return
+        if heartbeat.dead():
+            self.connection_lost(TimeoutError(f"No answer to the last {len(heartbeat.sent)} pings"))
+            return
+        self.write(self.session.ping())
+
+    # Method to queue bytes for the server
+    def write(self, data):
+        self.outgoing.push(data)
+        self.flush()
+
+    # Method to send the next part of the send queue, returns the bytes the socket took
+    def send_next(self):
+        data = self.outgoing.next_write()
+        sent = self.sock.send(data)
+        self.outgoing.advance(sent)
+        if self.recorder is not None:
+            self.recorder.sent(bytes(data[:sent]))
+        return sent
+
+    # Method to send what the socket accepts now, the rest waits for it to become writable
+    def flush(self):
+        try:
+            while self.outgoing:
+                self.send_next()
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self.connection_lost(e)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.outgoing else 0)
+        self.selector.modify(self.sock, events, self.socket_ready)
+
+    # Callback for socket events
+    def socket_ready(self, events):
+        if events & selectors.EVENT_WRITE:
+            self.flush()
+        if events & selectors.EVENT_READ and self.running:
+            self.read_ready(events)
+
+    # Callback reading and handling server messages
+    def read_ready(self, events):
+        try:
+            data = self.sock.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.connection_lost(e)
+            return
+        if not data:
+            self.connection_lost(None)
+            return
+        if self.recorder is not None:
+            self.recorder.received(data)
+        try:
+            messages = self.session.receive(data)
+        except ProtocolError as e:
+            self.connection_lost(e)
+            return
+        for message in messages:
+            self.handle_message(message)
+        if self.session.resync_needed:
+            self.write(self.session.resync())
+
+    # Method to show one server message
+    def handle_message(self, message):
+        if isinstance(message, Response):
+            self.handle_response(message)
+        elif isinstance(message, ChatMessage):
+            self.show(f"{message.sender}: {message.text}")
+        elif isinstance(message, Hello):
+            self.session.start_heartbeat()
+            self.check_ready()
+        elif isinstance(message, RoomList) and not self.room_list_seen:
+            self.room_list_seen = True
+            self.check_ready()
+        elif isinstance(message, ServerShutdown):
+            self.show("The server has been shutdown.")
+            self.running = False
+
+    # Method to greet the user once the features are agreed and the rooms known, then replay the held input
+    def check_ready(self):
+        if self.ready or not (self.session.hello_received and self.room_list_seen):
+            return
+        self.ready = True
+        self.show(f"Connected to {self.host}:{self.port}, {len(self.session.rooms)} rooms. Type /help for commands.")
+        self.input_ready(0)
+
+    # Method to report the reply to a create/join request
+    def handle_response(self, response):
+        request = response.request
+        if request.expired:
+
+            # The server accepted a request we gave up on, leave that room again
+            if response.status in SUCCESS_STATUSES:
+                self.write(self.session.abandon(request))
+            return
+        self.finish_request(request, response.status)
+
+    # Method to report a finished request and continue with the input that waited for it
+    def finish_request(self, request, status):
+        if status in SUCCESS_STATUSES:
+            self.show(f"Entered {request.room_name} as {request.username}. /leave returns to the lobby.")
+        else:
+            self.show(STATUS_TEXT.get(status, f"Request failed: {status}"))
+        if request is self.waiting:
+            self.waiting = None
+            self.input_ready(0)
+
+    # Callback handling the input lines received so far
+    def input_ready(self, events):
+        try:
+            self.wakeup_reader.recv(4096)
+        except BlockingIOError:
+            pass
+        while self.running and self.ready and self.waiting is None:
+            with self.lines_lock:
+                if not self.lines:
+                    return
+                line = self.lines.pop(0)
+            if line is None:
+                self.running = False
+            else:
+                self.handle_line(line)
+
+    # Method to run a command or send a chat line
+    def handle_line(self, line):
+        if not line.startswith("/"):
+            if not line:
+                return
+            if not self.session.in_room():
+                self.show("Not in a chatroom, /rooms lists them and /join enters one.")
+                return
+            if not self.pacer.push(self.session.require_room().name, line):
+                self.show("Message not sent, too many messages are waiting.")
+            self.last_chat_line = time.monotonic()
+            return
+        try:
+            words = shlex.split(line[1:])
+        except ValueError as e:
+            self.show(f"Invalid command: {e}")
+            return
+        command, arguments = (words[0].lower(), words[1:]) if words else ("", [])
+        handler = getattr(self, "command_" + command, None)
+        if handler is None:
+            self.show(f"Unknown command /{command}, /help lists the commands.")
+            return
+        try:
+            handler(*arguments)
+        except TypeError:
+            self.show(f"Wrong arguments for /{command}, /help lists the commands.")
+        except (SessionError, ValueError) as e:
+            self.show(str(e))
+
+    # Commands, each one is /<name> followed by its arguments
+    def command_help(self):
+        self.show(HELP)
+
+    def command_rooms(self):
+        if not self.session.rooms:
+            self.show("No rooms, /create makes one.")
+        for room in sorted(self.session.rooms.values()):
+            locked = " (locked)" if room.locked else ""
+            self.show(f"  {room.name}  {room.current_users}/{room.max_users}{locked}")
+
+    def command_nick(self, name):
+        self.username = name
+
+    def command_ping(self):
+        heartbeat = self.session.heartbeat
+        if heartbeat.srtt is None:
+            self.show("No round trip measured yet." if heartbeat.next_deadline() else "The server does not answer pings.")
+        else:
+            self.show(f"Round trip {heartbeat.rtt * 1000:.1f} ms, smoothed {heartbeat.srtt * 1000:.1f} ms.")
+
+    def command_create(self, room_name, max_users="2", password=""):
+        if not max_users.isdigit():
+            raise ValueError("The max users must be a number.")
+        self.enter(lambda: self.session.create_room(
+            room_name, self.require_username(), password, int(max_users), REQUEST_TIMEOUT))
+
+    def command_join(self, room_name, password=""):
+        room = self.session.rooms.get(room_name)
+        if room is not None and room.locked and not password:
+            raise ValueError(f"{room_name} is locked, use /join {shlex.quote(room_name)} <password>.")
+        self.enter(lambda: self.session.join_room(room_name, self.require_username(), password, REQUEST_TIMEOUT))
+
+    def command_leave(self):
+        joined = self.session.require_room()
+        for room_name, text in self.pacer.drain(joined.name):
+            self.write(self.session.send_message(text, room_name))
+        self.write(self.session.leave_room())
+        self.show("Back in the lobby.")
+
+    def command_quit(self):
+        self.running = False
+
+    # Method to send the create/join request made by start and hold input until it is answered
+    def enter(self, start):
+        if self.session.in_room():
+            raise SessionError("Already in a chatroom, /leave first.")
+        request, data = start()
+        self.waiting = request
+        self.write(data)
+
+    # Method to get the username, which create and join need
+    def require_username(self):
+        if not self.username:
+            raise ValueError("Set a username first with /nick <name>, or start with --user.")
+        return self.username
+
+    # Method to end the session when the link drops
+    def connection_lost(self, error):
+        if self.running:
+            self.show("Connection lost." if error is None else f"Connection lost: {error}")
+            self.exit_status = 1
+        self.running = False
+        for request in self.session.requests.fail_all():
+            if request is self.waiting:
+                self.waiting = None
+
+    # Method to leave the room, say goodbye and close, spending at most CLOSE_TIMEOUT on the flush
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            if self.exit_status == 0:
+                for room_name, text in self.pacer.drain():
+                    if self.session.in_room(room_name):
+                        self.outgoing.push(self.session.send_message(text, room_name))
+                if self.session.in_room():
+                    self.outgoing.push(self.session.leave_all())
+                self.outgoing.push(self.session.disconnect())
+                self.sock.setblocking(True)
+                self.sock.settimeout(CLOSE_TIMEOUT)
+                while self.outgoing:
+                    self.send_next()
+        except OSError:
+            pass
+        finally:
+            self.selector.close()
+            self.sock.close()
+            self.sock = None
+
+
+# Main function, argv excludes the program name
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chatroom Whisperers terminal client")
+    parser.add_argument("--cli", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--server", action="append", metavar="HOST:PORT",
+                        help="server to connect to, repeat it to choose the fastest of several")
+    parser.add_argument("--host", help="connect to this server only")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--user", default="", help="username for creating and joining rooms")
+    parser.add_argument("--ping-interval", type=float, default=PING_INTERVAL,
+                        help="seconds between pings to the server, 0 to disable them")
+    parser.add_argument("--ping-misses", type=int, default=MAX_MISSED_PINGS,
+                        help="unanswered pings in a row after which the server is considered gone")
+    parser.add_argument("--rate", type=float, default=RATE, help="chat messages per second, 0 for no limit")
+    parser.add_argument("--burst", type=int, default=BURST, help="chat messages sent back to back before the rate applies")
+    parser.add_argument("--batch-lines", type=int, default=BATCH_LINES,
+                        help="most lines merged into one message from queued lines, 1 to send each on its own")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the traffic with the server to FILE, for replay with bench_replay.py")
+    args = parser.parse_args(argv)
+    try:
+        endpoints = [Endpoint(args.host, args.port)] if args.host else load_endpoints(args.server)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # With several servers the fastest is tried first and the others follow in the probe's order
+    if len(endpoints) > 1:
+        endpoints = [probe.endpoint for probe in probe_endpoints(endpoints)]
+    client = TerminalClient(endpoints[0].host, endpoints[0].port, args.user)
+    client.session.heartbeat.interval = args.ping_interval
+    client.session.heartbeat.max_missed = args.ping_misses
+    client.pacer = ChatPacer(args.rate, args.burst, args.batch_lines)
+    client.recorder = WireRecorder(args.record) if args.record else None
+    try:
+        for endpoint in endpoints:
+            client.host, client.port = endpoint
+            try:
+                client.connect()
+                break
+            except OSError as e:
+                print(f"Could not connect to {format_endpoint(endpoint)}: {e}", file=sys.stderr)
+        else:
+            return 1
+        try:
+            return client.run()
+        except KeyboardInterrupt:
+            client.close()
+            return 0
+    finally:
+        if client.recorder is not None:
+            client.recorder.close()
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    sys.exit(main())
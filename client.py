@@ -1,21 +1,62 @@
 # Imports
-import sys, socket, threading, time, select
+import sys
+
+# The terminal client needs neither PyQt5 nor a display, so it starts before they are loaded
+if __name__ == "__main__" and "--cli" in sys.argv[1:]:
+    from cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:]))
+
+import argparse, cProfile, pstats, sqlite3
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
     QSlider,
     QVBoxLayout,
     QWidget,
-    QTextEdit,
+    QListView,
     QPushButton,
     QLabel,
     QLineEdit,
-    QComboBox,
+    QProgressBar,
     QMessageBox,
     QDesktopWidget,
 )
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import QTimer, pyqtSignal, Qt
+from protocol import FIELD_SEPARATORS, RoomList, RoomPage, RoomAdded, RoomRemoved, RoomUsers, ChatMessage, ServerShutdown
+from qt_connection import QtConnection
+from session import CAPABILITIES, MUX, PAGES, SUCCESS_STATUSES, RoomEvent
+from room_model import RoomListModel, RoomFilterModel
+from message_model import ChatMessageModel
+from message_store import MessageStore
+from metrics import METRICS, MetricsServer
+from endpoints import load_endpoints, format_endpoint
+from heartbeat import PING_INTERVAL, MAX_MISSED_PINGS
+from ratelimit import ChatPacer, RATE, BURST, BATCH_LINES
+from transfer import MAX_TRANSFER_SIZE, TransferProgress
+from recorder import WireRecorder
+from tls import TlsClient, client_context
+
+# Send length-prefixed frames (the decoder accepts both frames and legacy text)
+USE_FRAMING = True
+
+# Seconds to wait for the server to answer a request
+REQUEST_TIMEOUT = 5
+
+# Rooms fetched per page while a search runs over rooms that are not loaded yet
+SEARCH_PAGE_SIZE = 500
+
+# Messages kept in a chat window before the oldest are dropped
+CHAT_SCROLLBACK = 5000
+
+# Messages saved per room on disk, and the days they are kept for
+HISTORY_RETENTION = 5000
+HISTORY_MAX_AGE_DAYS = 30
+
+# Default seconds between metrics log lines, and the number of functions listed by --profile
+METRICS_INTERVAL = 60
+PROFILE_LINES = 30
+
 
 # Main window class
 class ChatRoomGUI(QMainWindow):
@@ -23,21 +64,45 @@ class ChatRoomGUI(QMainWindow):
     # Define a signal for server shutdown
     server_shutdown_signal = pyqtSignal()
 
-    # Initialization for main UI
-    def __init__(self):
+    # Initialization for main UI, endpoints are the servers to choose from (the configured ones by default).
+    # Chat goes out at rate messages per second after a burst, messages queued together are batched.
+    # Given a TlsClient, the links to the servers run TLS.
+    def __init__(self, endpoints=None, ping_interval=PING_INTERVAL, max_missed_pings=MAX_MISSED_PINGS,
+                 rate=RATE, burst=BURST, batch_lines=BATCH_LINES, tls=None):
 
         # Initialize the main UI
         super().__init__()
         self.initUI()
+        self.endpoints = endpoints or load_endpoints()
+        self.ping_interval = ping_interval
+        self.max_missed_pings = max_missed_pings
+        self.pacing = (rate, burst, batch_lines)
+        self.tls = tls
+        
+        # Handlers for each decoded server message type
+        self.message_handlers = {
+            RoomList: self.populate_room_info,
+            RoomPage: self.populate_room_info,
+            RoomAdded: self.populate_room_info,
+            RoomRemoved: self.populate_room_info,
+            RoomUsers: self.populate_room_info,
+            ChatMessage: self.process_received_message,
+            RoomEvent: self.process_room_event,
+            TransferProgress: self.process_transfer,
+            ServerShutdown: self.handle_shutdown_message,
+        }
+        
+        # Open chat windows by room name, several share the connection when the server allows it
+        self.chat_windows = {}
         
         # Flag to send disconnect message on close
         self.send_disconnect_on_close = True
         
-        # Initialize client socket connection
-        self.client_socket = self.connect_to_server()
+        # Saved chat history, the client works without it if the database cannot be opened
+        self.message_store = self.open_message_store()
         
-        # Flag to control thread running state
-        self.running = True
+        # Initialize client connection
+        self.connection = self.connect_to_server()
         
         # Connect the server shutdown signal to its handler
         self.server_shutdown_signal.connect(self.handle_server_shutdown)
@@ -50,9 +115,9 @@ class ChatRoomGUI(QMainWindow):
             self, "Server Shutdown", "The server has been shutdown. Now exiting..."
         )
         
-        # Close the chat window if it exists
-        if hasattr(self, 'chat_window'):
-            self.chat_window.close()
+        # Close the chat windows
+        for window in list(self.chat_windows.values()):
+            window.close()
             
         # Close the main window
         self.close()
@@ -64,7 +129,7 @@ class ChatRoomGUI(QMainWindow):
         self.setWindowTitle("Chatroom Whisperers")
         
         # Set window size
-        self.setGeometry(100, 100, 500, 500)
+        self.setGeometry(100, 100, 500, 630)
         
         # Set window icon
         self.setWindowIcon(QIcon("logo.png"))
@@ -131,9 +196,26 @@ class ChatRoomGUI(QMainWindow):
         self.available_rooms_label = QLabel("Available Chatrooms:")
         layout.addWidget(self.available_rooms_label)
         
-        # Combo box to select chatroom
-        self.room_combo_box = QComboBox()
-        layout.addWidget(self.room_combo_box)
+        # Search field filtering the chatrooms as it is typed
+        self.room_search_field = QLineEdit()
+        self.room_search_field.setPlaceholderText("Search chatrooms")
+        self.room_search_field.setClearButtonEnabled(True)
+        self.room_search_field.textChanged.connect(self.search_rooms)
+        layout.addWidget(self.room_search_field)
+        
+        # List to select chatroom, backed by an indexed room model that loads more rooms
+        # as it is scrolled, and a model of the rooms matching the search
+        self.room_model = RoomListModel(self)
+        self.room_filter = RoomFilterModel(self.room_model, self)
+        self.room_list_view = QListView()
+        self.room_list_view.setUniformItemSizes(True)
+        self.room_list_view.setFixedHeight(120)
+        self.room_list_view.setModel(self.room_model)
+        layout.addWidget(self.room_list_view)
+        
+        # Number of chatrooms loaded and found
+        self.room_count_label = QLabel()
+        layout.addWidget(self.room_count_label)
         
         # Password field
         self.password_label = QLabel("Password:")
@@ -150,9 +232,10 @@ class ChatRoomGUI(QMainWindow):
         layout.addWidget(self.connect_button)
         
         # Connect signals
-        self.room_combo_box.currentIndexChanged.connect(
+        self.room_list_view.selectionModel().currentChanged.connect(
             self.update_connect_button_state
         )
+        self.room_list_view.doubleClicked.connect(self.connect_to_room)
         
         # Center the window
         centerWindow(self)
@@ -165,67 +248,26 @@ class ChatRoomGUI(QMainWindow):
     # Method to handle window close event
     def closeEvent(self, event):
         try:
-            # Client socket exists and we want to send a disconnect message to server
-            if self.client_socket and self.send_disconnect_on_close:
+            # Leave the rooms still open next to the lobby
+            for window in list(self.chat_windows.values()):
+                window.close()
+
+            # Client is connected and we want to send a disconnect message to server
+            if self.connection and self.send_disconnect_on_close and not self.connection.closed:
                 
-                # Sending disconnect message
+                # Send disconnect message, the connection closes once it has been flushed
                 print("Sending disconnect message...")
-                self.client_socket.send("DISCONNECT".encode())
-                
-                # Wait for a brief moment to ensure the message is sent
-                time.sleep(0.1)
-                
-                # Close socket
-                print("Closing socket...")
-                self.client_socket.close()
+                self.connection.close()
+
+                # Stay alive but hidden until the flush ends, then close again
+                if not self.connection.closed:
+                    self.hide()
+                    self.connection.connection_closed.connect(self.close)
+                    event.ignore()
+                    return
         except Exception as e:
             print("Error disconnecting from room:", e)
-        finally:
-            event.accept()
-
-    # Method to start the message check timer
-    def start_message_check_timer(self):
-        
-        # Creating and connecting timer
-        self.message_check_timer = QTimer()
-        self.message_check_timer.timeout.connect(self.check_for_messages)
-        
-        # Check for data messages every second
-        self.message_check_timer.start(1000)  
-
-    # Method to check for incoming data messages
-    def check_for_messages(self):
-        try:
-            # Select content from client socket
-            sockets_to_check = [self.client_socket]
-            readable, _, _ = select.select(sockets_to_check, [], [], 0)
-            
-            # Socket has content
-            for sock in readable:
-                
-                # Socket is the client socket
-                if sock == self.client_socket:
-                    
-                    # Recieve and decode message
-                    message = self.client_socket.recv(1024).decode()
-                    
-                    # Message exists
-                    if message:
-                        
-                        # Update data message recieved
-                        if (message.split(";")[0] == "UPDATE_DATA"):
-                            
-                            # Update data
-                            message = message.split("UPDATE_DATA;")[1].strip()
-                            self.populate_room_info(message)
-                            
-                        # Server shutdown received
-                        elif (message == "SERVER_SHUTDOWN"):
-                            
-                            # Emit shutdown signal
-                            self.server_shutdown_signal.emit()
-        except Exception as e:
-            print("Error checking for messages:", e)
+        event.accept()
 
     # Method to create chatroom
     def create_button_execute(self):
@@ -247,79 +289,146 @@ class ChatRoomGUI(QMainWindow):
                     self, "Invalid Room Name", "Please enter a room name."
                 )
                 return
+            if not self.fields_valid(room_name, username, room_password):
+                return
             
-            # Send create room message to server
-            message = f"CREATE_ROOM;{room_name};{room_password};1;{lobby_size};{username}".encode(
+            # Send create room message to server, the reply is handled without blocking
+            self.set_requests_enabled(False)
+            self.connection.create_room(
+                room_name, username, room_password, lobby_size,
+                lambda status: self.create_room_finished(status, room_name, username),
+                REQUEST_TIMEOUT,
             )
-            self.client_socket.send(message)
-            
-            # Response from server
-            server_response = self.client_socket.recv(1024).decode()
-            
-            # Chatroom creation success
-            if server_response == "CREATE_SUCCESS":
-                
-                # Dont send messages on window close (not disconnecting)
-                self.send_disconnect_on_close = False
-                
-                # Close main window and open chatroom window
-                self.close()  
-                self.open_chat_window(room_name, username)
-                
-                # Start a new thread for message listening
-                if (not hasattr(self, "listening")):
-                    self.listening = threading.Thread(
-                        target=self.receive_messages).start()
-                elif (self.running == False):
-                    self.running = True
-                    self.listening = threading.Thread(
-                        target=self.receive_messages).start()
-            
-            # Handle other server responses (connection error)
-            else:
-                QMessageBox.warning(
-                    self,
-                    "Connection Error",
-                    "Failed to connect to the chat room. Please try again later.",
-                )
         except Exception as e:
             print("Error creating chat room:", e)
+            self.set_requests_enabled(True)
             QMessageBox.critical(
                 self, "Error", "Failed to create chat room. Please try again."
             )
 
-    # Method to connect to the server
+    # Method to handle the server response to a create room request
+    def create_room_finished(self, server_response, room_name, username):
+        self.set_requests_enabled(True)
+        
+        # Chatroom creation success, open chatroom window
+        if server_response == "CREATE_SUCCESS":
+            self.open_chat_window(room_name, username)
+        
+        # Handle other server responses (connection error)
+        else:
+            QMessageBox.warning(
+                self,
+                "Connection Error",
+                "Failed to connect to the chat room. Please try again later.",
+            )
+
+    # Method to check that names and passwords hold no field separator, warning about the first that does
+    def fields_valid(self, *values):
+        for value in values:
+            if any(separator in value for separator in FIELD_SEPARATORS):
+                QMessageBox.warning(
+                    self, "Invalid Input", "Names and passwords may not contain ';' or line breaks."
+                )
+                return False
+        return True
+
+    # Method to block new create/join requests while one is waiting for its reply
+    def set_requests_enabled(self, enabled):
+        self.create_button.setEnabled(enabled)
+        self.connect_button.setEnabled(enabled)
+
+    # Method to connect to the server, the connection keeps retrying in the background
     def connect_to_server(self):
-        try:
-            # Establish a socket connection to the server
-            server_address = "3.89.83.172"  
-            server_port = 3000  
-            self.client_socket = socket.socket(
-                socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((server_address, server_port))
-            print("Connected to the server.")
-            
-            # Decode room data on server connection
-            room_data = self.client_socket.recv(1024).decode()
-            
-            # Populate room data and start timer for dynamic update message checking
-            self.populate_room_info(room_data)
-            self.start_message_check_timer()
-            
-            # Return socket object
-            return self.client_socket
-        except Exception as e:
-            print("Error connecting to the server:", e)
-            exit(0)
+        # Establish a connection to the fastest configured server, failing over to the others
+        connection = QtConnection.connect_to_any(
+            self.endpoints, USE_FRAMING, REQUEST_TIMEOUT, self, capabilities=CAPABILITIES | {MUX, PAGES}, tls=self.tls)
+        
+        # Servers with the pages feature send the room list a page at a time, the next
+        # one is fetched when the list is scrolled to its end
+        self.room_model.fetch = connection.fetch_rooms
+        
+        # Ping servers that answer pings, a link missing several pongs in a row is reconnected
+        connection.session.heartbeat.interval = self.ping_interval
+        connection.session.heartbeat.max_missed = self.max_missed_pings
+        connection.rtt_changed.connect(self.show_rtt)
+        
+        # Limit the chat rate so a paste or a loop cannot flood the room
+        connection.pacer = ChatPacer(*self.pacing)
+        
+        # Pushed messages (room data updates, chat, shutdown) are read as soon as they arrive
+        connection.message_received.connect(self.dispatch_message)
+        
+        # Show when the link drops and comes back, and when the room could not be rejoined
+        connection.link_changed.connect(self.show_link_state)
+        connection.rejoin_finished.connect(self.rejoin_finished)
+        
+        # Report how much is waiting on each side of the connection
+        METRICS.gauge("chat_send_queue_bytes", "Bytes queued for the server", lambda: len(connection.outgoing))
+        METRICS.gauge("chat_inbox_depth", "Decoded messages waiting for the GUI", connection.inbox.depth)
+        METRICS.gauge("chat_inbox_wait_seconds", "Smoothed time messages wait for the GUI", lambda: connection.inbox.drain_latency)
+        METRICS.gauge("chat_rtt_seconds", "Smoothed round trip time to the server", lambda: connection.session.heartbeat.srtt or 0)
+        METRICS.gauge("chat_pending_messages", "Chat messages held back by the rate limit", lambda: len(connection.pacer))
+        
+        # Return connection object
+        return connection
+
+    # Slot showing whether the server is reachable
+    def show_link_state(self, online):
+        self.setWindowTitle("Chatroom Whisperers" if online else "Chatroom Whisperers (reconnecting...)")
+        if online:
+            self.statusBar().showMessage(f"Connected to {format_endpoint(self.connection.address)}")
+        else:
+            self.statusBar().showMessage("Reconnecting...")
+        for window in self.chat_windows.values():
+            window.add_message("Reconnected." if online else "Connection lost, reconnecting...", save=False)
+
+    # Slot closing a chat window when its room could not be rejoined after a reconnect
+    def rejoin_finished(self, room_name, status):
+        window = self.chat_windows.get(room_name)
+        if status in SUCCESS_STATUSES or window is None:
+            return
+        QMessageBox.warning(
+            self,
+            "Connection Error",
+            f"Could not rejoin {room_name} after reconnecting.",
+        )
+        window.close()
+
+    # Slot showing the smoothed round trip time to the server
+    def show_rtt(self, srtt):
+        self.statusBar().showMessage(f"Connected to {format_endpoint(self.connection.address)}, ping {srtt * 1000:.1f} ms")
 
-    # Method to populate available rooms in the GUI
-    def populate_room_info(self, room_data):
+    # Method to open the chat history database
+    def open_message_store(self):
+        try:
+            return MessageStore(retention=HISTORY_RETENTION, max_age=HISTORY_MAX_AGE_DAYS * 24 * 60 * 60)
+        except (sqlite3.Error, OSError) as e:
+            print("Error opening chat history:", e)
+            return None
+
+    # Method to route a decoded server message to its handler
+    def dispatch_message(self, message):
+        handler = self.message_handlers.get(type(message))
+        if handler is not None:
+            handler(message)
+
+    # Method to apply a room list snapshot, page or delta to the available rooms
+    def populate_room_info(self, message):
         try:
+            # Remember the selected room so the update does not reset the selection
+            selected = self.selected_room()
+            self.room_model.apply(message)
+            self.select_room(selected)
+            self.fetch_search_pages()
+            self.show_room_count()
+            
             # No current rooms, hide join existing room information
-            if (room_data == "NO_ROOMS" or room_data == ""):
+            if self.room_model.rowCount() == 0:
                 self.available_rooms_label.hide()
                 self.join_rooms_label.hide()
-                self.room_combo_box.hide()
+                self.room_search_field.hide()
+                self.room_list_view.hide()
+                self.room_count_label.hide()
                 self.password_field.hide()
                 self.password_field.clear()
                 self.password_label.hide()
@@ -328,64 +437,97 @@ class ChatRoomGUI(QMainWindow):
             # Show join room data
             self.available_rooms_label.show()
             self.join_rooms_label.show()
-            self.room_combo_box.show()
-            self.room_combo_box.clear()
-            room_data = room_data.splitlines()
-            
-            # Add rooms to the combo box
-            for line in room_data:
-                
-                # Split each line by the delimiter
-                room_info = line.split(";")
-                
-                # Extract values from the split line
-                name = room_info[0]
-                password = room_info[1]
-                current_users = int(room_info[2])
-                max_users = int(room_info[3])
-                
-                # Add room information to the combo box
-                room_display = f"{name} - {'Locked' if password else 'Unlocked'}, {current_users}/{max_users} users"
-                self.room_combo_box.addItem(room_display)
+            self.room_search_field.show()
+            self.room_list_view.show()
+            self.room_count_label.show()
                 
             # Check initial room selection
-            initial_index = self.room_combo_box.currentIndex()
-            self.update_connect_button_state(initial_index)
+            self.update_connect_button_state(self.room_list_view.currentIndex())
             
         except Exception as e:
             print("Error populating room information:", e)
 
+    # Slot showing the rooms whose names contain the search text, or every room when it is empty
+    def search_rooms(self, text):
+        selected = self.selected_room()
+        self.room_filter.set_query(text.strip())
+        model = self.room_filter if self.room_filter.query else self.room_model
+        if self.room_list_view.model() is not model:
+            self.room_list_view.setModel(model)
+            self.room_list_view.selectionModel().currentChanged.connect(self.update_connect_button_state)
+        self.select_room(selected)
+        self.fetch_search_pages()
+        self.show_room_count()
+
+    # Method to keep loading pages while a search runs, so it covers every room on the server
+    def fetch_search_pages(self):
+        if self.room_filter.query and self.room_model.more and self.connection:
+            self.connection.fetch_rooms(SEARCH_PAGE_SIZE)
+
+    # Method to show how many rooms are loaded, or how many match the search
+    def show_room_count(self):
+        total = self.connection.session.room_total if self.connection else 0
+        loaded = self.room_model.rowCount()
+        if self.room_filter.query:
+            text = f"Chatrooms found: {self.room_filter.rowCount()}"
+            if self.room_model.more:
+                text += f", searched {loaded} of {total}..."
+        elif self.room_model.more:
+            text = f"Showing {loaded} of {total} chatrooms, scroll for more"
+        else:
+            text = f"Chatrooms: {loaded}"
+        self.room_count_label.setText(text)
+
+    # Method to get the selected room, None when no room is selected
+    def selected_room(self):
+        index = self.room_list_view.currentIndex()
+        return index.data(Qt.UserRole) if index.isValid() else None
+
+    # Method to select a room again after the list changed, if it is still shown
+    def select_room(self, room):
+        if room is None:
+            return
+        model = self.room_list_view.model()
+        row = model.row_of(room.name)
+        if row != -1 and row != self.room_list_view.currentIndex().row():
+            self.room_list_view.setCurrentIndex(model.index(row))
+
     # Method to update connect button state based on room selection
-    def update_connect_button_state(self, index):
+    def update_connect_button_state(self, index, previous=None):
         
         # Show password field if a locked server is selected
-        if index != -1:
-            if self.client_socket:
+        if index.isValid():
+            if self.connection:
                 try:
-                    room_data = self.room_combo_box.currentText()
-                    is_locked = room_data.split(" - ")[1].startswith("Locked")
-                    if is_locked:
+                    room = index.data(Qt.UserRole)
+                    if room.locked:
                         self.password_label.show()
                         self.password_field.show()
-                        self.setFixedHeight(500)
+                        self.setFixedHeight(680)
                     else:
                         self.password_label.hide()
                         self.password_field.hide()
                         self.password_field.clear()
-                        self.setFixedHeight(450)
+                        self.setFixedHeight(630)
                 except Exception as e:
                     print("Error fetching room information:", e)
 
     # Method to connect to a room
     def connect_to_room(self):
         
-        # Getting selected combo box room data
-        selected_index = self.room_combo_box.currentIndex()
-        selected_room_info = self.room_combo_box.itemText(selected_index)
+        # Getting selected list room data
+        selected_room_info = self.room_list_view.currentIndex().data()
+        room = self.selected_room()
         password = self.password_field.text()
         username = self.username_field.text()
-        locked = selected_room_info.split(" - ")[1].startswith("Locked")
-        room_name = selected_room_info.split(" - ")[0]
+        
+        # Validate a room is selected
+        if room is None:
+            QMessageBox.warning(self, "Invalid Room",
+                                "Please select a room to join.")
+            return
+        locked = room.locked
+        room_name = room.name
         
         # Validate username and password are filled
         if username == "":
@@ -396,148 +538,147 @@ class ChatRoomGUI(QMainWindow):
             QMessageBox.warning(self, "Invalid Password",
                                 "Please enter a password.")
             return
-        print(f"Connecting to: {selected_room_info} with password: {password}")
+        if not self.fields_valid(username, password):
+            return
+        print(f"Connecting to: {selected_room_info}")
         
-        # Client socket is connected
-        if self.client_socket:
+        # Bring an open room to the front instead of joining it twice
+        if room_name in self.chat_windows:
+            self.chat_windows[room_name].activateWindow()
+            return
+        
+        # Client is connected
+        if self.connection:
             try:
-                # Send room name and password to server for validation
-                message = f"JOIN_ROOM;{room_name};{password if password else 'NO_PASSWORD'};{username}".encode(
+                # Send room name and password to server for validation, the reply is handled without blocking
+                self.set_requests_enabled(False)
+                self.connection.join_room(
+                    room_name, username, password,
+                    lambda status: self.join_room_finished(status, room_name, username),
+                    REQUEST_TIMEOUT,
                 )
-                self.client_socket.send(message)
-                
-                # Wait for server response
-                server_response = self.client_socket.recv(1024).decode()
-                
-                # Join chatroom success
-                if server_response == "JOIN_SUCCESS":
-                    
-                    # Dont send messages on window close (not disconnecting)
-                    self.send_disconnect_on_close = False
-                    
-                    # Close main GUI and open chatroom GUI
-                    self.close() 
-                    self.open_chat_window(room_name, username)
-                    
-                    # Start a new thread for message listening
-                    if (not hasattr(self, "listening")):
-                        self.listening = threading.Thread(
-                            target=self.receive_messages).start()
-                    elif (self.running == False):
-                        self.running = True
-                        self.listening = threading.Thread(
-                            target=self.receive_messages).start()
-                        
-                # Handle invalid password scenario
-                elif server_response == "INVALID_PASSWORD":
-                    QMessageBox.warning(
-                        self,
-                        "Invalid Password",
-                        "The password you entered is incorrect. Please try again.",
-                    )
-                    
-                # Handle room full scenario
-                elif server_response == "ROOM_FULL":
-                    QMessageBox.warning(
-                        self,
-                        "Connection Error",
-                        "The room you are joining is full. Please create or join another room.",
-                    )
-                    
-                # Handle no room scenario
-                elif server_response == "NO_ROOM":
-                    QMessageBox.warning(
-                        self,
-                        "Connection Error",
-                        "There are no rooms available. Create your own room or wait for others to create a room.",
-                    )
-                    
-                # Handle existing username  scenario
-                elif server_response == "EXISTING_USER":
-                    QMessageBox.warning(
-                        self,
-                        "Connection Error",
-                        "This username already exists in this chatroom. Please select a new username.",
-                    )
-                    
-                # Handle other server responses
-                else:
-                    QMessageBox.warning(
-                        self,
-                        "Connection Error",
-                        "Failed to connect to the chat room. Please try again later.",
-                    )
             except Exception as e:
                 print("Error connecting to the room:", e)
+                self.set_requests_enabled(True)
                 QMessageBox.critical(
                     self,
                     "Error",
                     "Failed to connect to the chat room. Please try again.",
                 )
 
-    # Method to open the chat window
-    def open_chat_window(self, room_name, username):
-        self.chat_window = ChatWindow(
-            room_name, self.client_socket, username, self)
-        self.chat_window.show()
-
-    # Method to receive messages from chatroom
-    def receive_messages(self):
-        while self.running:
-            try:
-                # Receive message from server
-                self.client_socket.settimeout(1)
-                message = self.client_socket.recv(
-                    1024).decode() 
+    # Method to handle the server response to a join room request
+    def join_room_finished(self, server_response, room_name, username):
+        self.set_requests_enabled(True)
+        
+        # Join chatroom success, open chatroom GUI
+        if server_response == "JOIN_SUCCESS":
+            self.open_chat_window(room_name, username)
                 
-                # Message exists
-                if message: 
-                    
-                    # Server shutdown, emit shutdown signal
-                    if (message == "SERVER_SHUTDOWN"):
-                        self.server_shutdown_signal.emit()
-                        
-                    # Update message recieved on leaving, update room data
-                    if (len(message.split("MESSAGE;")) == 1):
-                        if (len(message.split("UPDATE_DATA;")) > 1):
-                            message = message.split("UPDATE_DATA;")[1].strip()
-                            self.populate_room_info(message)
-                            continue
-                        continue
-                    
-                    # Extract message from server message
-                    message = message.split("MESSAGE;")[1]
-                    if (len(message.split("UPDATE_DATA")) > 1):
-                        message = message.split("UPDATE_DATA")[0]
-                        
-                    # Split message into parts
-                    parts = message.split(';')
-                    
-                    # Removing leading & trailing spaces
-                    username = parts[0].strip()
-                    message = parts[1].strip()
-                    
-                    # Call a method to handle received messages
-                    self.process_received_message(f"{username}: {message}")
-            except socket.timeout:
-                pass
-            except Exception as e:
-                print(e)
-                break
+        # Handle invalid password scenario
+        elif server_response == "INVALID_PASSWORD":
+            QMessageBox.warning(
+                self,
+                "Invalid Password",
+                "The password you entered is incorrect. Please try again.",
+            )
+            
+        # Handle room full scenario
+        elif server_response == "ROOM_FULL":
+            QMessageBox.warning(
+                self,
+                "Connection Error",
+                "The room you are joining is full. Please create or join another room.",
+            )
+            
+        # Handle no room scenario
+        elif server_response == "NO_ROOM":
+            QMessageBox.warning(
+                self,
+                "Connection Error",
+                "There are no rooms available. Create your own room or wait for others to create a room.",
+            )
+            
+        # Handle existing username  scenario
+        elif server_response == "EXISTING_USER":
+            QMessageBox.warning(
+                self,
+                "Connection Error",
+                "This username already exists in this chatroom. Please select a new username.",
+            )
+            
+        # Handle other server responses
+        else:
+            QMessageBox.warning(
+                self,
+                "Connection Error",
+                "Failed to connect to the chat room. Please try again later.",
+            )
+
+    # Method to open the chat window of a room. Without the mux feature the connection
+    # is in one room at a time, so the lobby is hidden until the room is left.
+    def open_chat_window(self, room_name, username):
+        if not self.connection.session.multiplexed():
+            
+            # Dont send messages on window close (not disconnecting)
+            self.send_disconnect_on_close = False
+            self.close()
+        window = self.chat_windows[room_name] = ChatWindow(
+            room_name, self.connection, username, self, self.message_store)
+        window.show()
 
-    # Method to process received messages
-    def process_received_message(self, message):
-        self.chat_window.messages_display.append(message)
+    # Method to forget a closed chat window, the lobby comes back when the connection was in that room alone
+    def chat_window_closed(self, window):
+        if self.chat_windows.get(window.room_name) is not window:
+            return
+        del self.chat_windows[window.room_name]
+        if self.isVisible():
+            return
+        self.send_disconnect_on_close = True
+        self.show()
+        self.create_server_name.clear()
+        self.create_server_password.clear()
+        self.password_field.clear()
+        self.slider.setValue(2)
+
+    # Method to process received messages, messages without a room belong to the only open room
+    def process_received_message(self, message, room_name=None):
+        if room_name is None:
+            window = next(iter(self.chat_windows.values()), None)
+        else:
+            window = self.chat_windows.get(room_name)
+        if window is not None:
+            window.add_message(f"{message.sender}: {message.text}")
+
+    # Method to show the progress of a long message streamed to or from a room, messages without a room belong to the only open room
+    def process_transfer(self, progress, room_name=None):
+        if room_name is None:
+            window = next(iter(self.chat_windows.values()), None)
+        else:
+            window = self.chat_windows.get(room_name)
+        if window is not None:
+            window.show_transfer(progress)
+
+    # Method to process a message for one room, of a multiplexed connection or sent by this client
+    def process_room_event(self, event):
+        if isinstance(event.message, ChatMessage):
+            self.process_received_message(event.message, event.room_name)
+        elif isinstance(event.message, TransferProgress):
+            self.process_transfer(event.message, event.room_name)
+
+    # Method to handle server shutdown messages
+    def handle_shutdown_message(self, message):
+        self.server_shutdown_signal.emit()
 
 
 # Class for Chat Window
 class ChatWindow(QWidget):
-    def __init__(self, room_name, client_socket, username, parent=None):
+    def __init__(self, room_name, connection, username, parent=None, store=None):
         super().__init__()
         self.room_name = room_name
         self.username = username
-        self.client_socket = client_socket
+        self.connection = connection
         self.parent = parent
+        self.store = store
         self.initUI()
 
     # Initialize the UI for chat window
@@ -556,13 +697,25 @@ class ChatWindow(QWidget):
         layout = QVBoxLayout()
         self.setLayout(layout)
 
-        # Text display for messages
-        self.messages_display = QTextEdit()
-        self.messages_display.setReadOnly(True)
+        # Message history, the view only lays out the rows that are visible.
+        # Saved messages are kept per server and room, older ones load when scrolling to the top.
+        host, port = self.connection.address or ("", 0)
+        self.messages_model = ChatMessageModel(
+            CHAT_SCROLLBACK, parent=self, store=self.store, room=f"{host}:{port}/{self.room_name}")
+        self.messages_display = QListView()
+        self.messages_display.setModel(self.messages_model)
+        self.messages_display.setUniformItemSizes(True)
+        self.messages_display.setLayoutMode(QListView.Batched)
+        self.messages_display.setEditTriggers(QListView.NoEditTriggers)
+        self.follow_bottom = True
+        self.loaded_rows = 0
+        self.messages_display.verticalScrollBar().valueChanged.connect(self.track_scroll_position)
+        self.messages_display.verticalScrollBar().rangeChanged.connect(self.follow_new_messages)
         layout.addWidget(self.messages_display)
 
-        # Text input field
+        # Text input field, long enough for a paste that is streamed
         self.text_input = QLineEdit()
+        self.text_input.setMaxLength(MAX_TRANSFER_SIZE)
         self.text_input.returnPressed.connect(self.send_message) 
         layout.addWidget(self.text_input)
 
@@ -571,11 +724,29 @@ class ChatWindow(QWidget):
         self.send_button.clicked.connect(self.send_message)
         layout.addWidget(self.send_button)
 
+        # Notice shown while messages wait for the rate limit
+        self.pending_label = QLabel()
+        self.pending_label.hide()
+        layout.addWidget(self.pending_label)
+
+        # Progress of the long messages being streamed to and from the room, by direction and transfer id
+        self.transfers = {}
+        self.transfer_label = QLabel()
+        self.transfer_label.hide()
+        layout.addWidget(self.transfer_label)
+        self.transfer_bar = QProgressBar()
+        self.transfer_bar.hide()
+        layout.addWidget(self.transfer_bar)
+
         # Disconnect button
         self.disconnect_button = QPushButton("Disconnect")
         self.disconnect_button.clicked.connect(self.disconnect_from_room)
         layout.addWidget(self.disconnect_button)
 
+        # Hold the send button while the server is not keeping up, and show messages held by the rate limit
+        self.connection.backpressure_changed.connect(self.set_throttled)
+        self.connection.chat_pending_changed.connect(self.show_pending)
+
         # Center window
         centerWindow(self)
 
@@ -587,21 +758,45 @@ class ChatWindow(QWidget):
     # Method to handle window close event
     def closeEvent(self, event):
         try:
-            # Socket is connected
-            if self.client_socket:
-                
-                # Stop loop for messages
-                self.parent.running = False
+            # Client is connected and still in the room
+            if self.connection and self.connection.session.in_room(self.room_name):
                 
                 # Send disconnect message
                 print("Sending disconnect room message...")
-                self.client_socket.send(
-                    f"DISCONNECT_ROOM;{self.room_name};{self.username}".encode())
+                self.connection.leave(self.room_name)
         except Exception as e:
             print("Error disconnecting from room:", e)
         finally:
+            # Save lines still waiting for the next batch
+            self.messages_model.flush()
             self.disconnect_from_room()
 
+    # Method to queue a message for the message history, notices that are not chat pass save=False.
+    # Each line of a multi-line message is a row, the lines after the first are indented.
+    def add_message(self, text, save=True):
+        first, *rest = text.split("\n")
+        self.messages_model.append_line(first, save)
+        for line in rest:
+            self.messages_model.append_line("    " + line, save)
+
+    # Slot remembering whether the user is reading the newest messages, and loading
+    # older saved messages when the user reaches the top
+    def track_scroll_position(self, value):
+        scroll_bar = self.messages_display.verticalScrollBar()
+        self.follow_bottom = value == scroll_bar.maximum()
+        if value == scroll_bar.minimum() and not self.follow_bottom and not self.loaded_rows:
+            self.loaded_rows = self.messages_model.load_older()
+
+    # Slot keeping the newest messages in view unless the user scrolled up,
+    # and the same messages in view after older ones were loaded above them
+    def follow_new_messages(self, minimum, maximum):
+        scroll_bar = self.messages_display.verticalScrollBar()
+        if self.loaded_rows:
+            scroll_bar.setValue(scroll_bar.value() + self.loaded_rows)
+            self.loaded_rows = 0
+        elif self.follow_bottom:
+            scroll_bar.setValue(maximum)
+
     # Method to send message to the room
     def send_message(self):
         
@@ -612,24 +807,61 @@ class ChatWindow(QWidget):
         if (message == ""):  
             return
         
-        # Append message to screen
-        self.messages_display.append(f"{self.username}: {message}")
-        
-        # Send message to server for chatroom
-        message = f"MESSAGE_ROOM;{self.room_name};{message};{self.username}"
+        # Send message to server for chatroom, it waits for the rate limit if needed
         print("Sending message:", message)
-        self.client_socket.send(message.encode())
+        if not self.connection.send(message, self.room_name):
+            self.add_message("Message not sent, too many messages are waiting.", save=False)
+            return
+        
+        # Append message to screen
+        self.add_message(f"{self.username}: {message}")
         self.text_input.clear()
 
+    # Slot showing how many of this room's messages wait for the rate limit
+    def show_pending(self, total):
+        pending = self.connection.pacer.pending(self.room_name) if total else 0
+        self.pending_label.setVisible(pending > 0)
+        if pending:
+            rate = self.connection.pacer.bucket.rate
+            self.pending_label.setText(
+                f"{pending} message{'s' if pending != 1 else ''} queued, sending at most {rate:g} per second")
+
+    # Method to show how far the long messages being streamed have got, one bar covers them all.
+    # A message leaves the bar once it is complete or cut off.
+    def show_transfer(self, progress):
+        key = (progress.outgoing, progress.transfer_id)
+        if progress.failed or progress.received >= progress.size:
+            self.transfers.pop(key, None)
+            if progress.failed and not progress.outgoing:
+                self.add_message(f"A long message from {progress.sender} was cut off.", save=False)
+        else:
+            self.transfers[key] = progress
+        self.transfer_label.setVisible(bool(self.transfers))
+        self.transfer_bar.setVisible(bool(self.transfers))
+        if not self.transfers:
+            return
+        received = sum(transfer.received for transfer in self.transfers.values())
+        size = sum(transfer.size for transfer in self.transfers.values())
+        senders = sorted({transfer.sender for transfer in self.transfers.values() if not transfer.outgoing})
+        parts = []
+        if any(transfer.outgoing for transfer in self.transfers.values()):
+            parts.append("sending")
+        if senders:
+            parts.append("receiving from " + ", ".join(senders))
+        text = " and ".join(parts)
+        self.transfer_label.setText(f"{text[0].upper()}{text[1:]}, {received // 1024} of {size // 1024} KB")
+        self.transfer_bar.setRange(0, size)
+        self.transfer_bar.setValue(received)
+
+    # Slot showing that messages are waiting for a slow connection
+    def set_throttled(self, throttled):
+        self.send_button.setEnabled(not throttled)
+        self.send_button.setText("Sending..." if throttled else "Send")
+
     # Method to disconnect from the room
     def disconnect_from_room(self):
-        self.parent.send_disconnect_on_close = True
         self.close()
-        self.parent.show()
-        self.parent.create_server_name.clear()
-        self.parent.create_server_password.clear()
-        self.parent.password_field.clear()
-        self.parent.slider.setValue(2)
+        self.parent.chat_window_closed(self)
 
 # Function to center the window on the screen
 def centerWindow(GUI):
@@ -644,12 +876,77 @@ def centerWindow(GUI):
     # Move the window to the center of the screen
     GUI.move(x, y)
 
+# Function to serve the metrics on localhost and print them periodically
+def start_metrics(app, port, interval):
+    server = None
+    if port is not None:
+        try:
+            server = MetricsServer(METRICS, port)
+            print(f"Serving metrics on http://127.0.0.1:{server.port}/metrics and /metrics.json")
+        except OSError as e:
+            print("Error starting the metrics endpoint:", e)
+    if interval > 0:
+        timer = QTimer(app)
+        timer.timeout.connect(lambda: print(METRICS.summary()))
+        timer.start(int(interval * 1000))
+    return server
+
+# Function to run the event loop under cProfile, writing the stats to path on exit
+def run_profiled(app, path):
+    profiler = cProfile.Profile()
+    status = profiler.runcall(app.exec_)
+    profiler.dump_stats(path)
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    print(f"Profile written to {path}")
+    return status
+
 # Main function
 def main():
-    app = QApplication(sys.argv)
-    chatroom = ChatRoomGUI()
+    parser = argparse.ArgumentParser(description="Chatroom Whisperers client")
+    parser.add_argument("--server", action="append", metavar="HOST:PORT",
+                        help="server to connect to, repeat it to choose the fastest of several")
+    parser.add_argument("--metrics-port", type=int, help="serve metrics on this localhost port (0 picks a free one)")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="seconds between metrics log lines, 0 to disable")
+    parser.add_argument("--profile", nargs="?", const="client.prof", metavar="FILE",
+                        help="profile the session with cProfile and write the stats to FILE on exit")
+    parser.add_argument("--ping-interval", type=float, default=PING_INTERVAL,
+                        help="seconds between pings to the server, 0 to disable them")
+    parser.add_argument("--ping-misses", type=int, default=MAX_MISSED_PINGS,
+                        help="unanswered pings in a row after which the link is reconnected")
+    parser.add_argument("--rate", type=float, default=RATE, help="chat messages per second, 0 for no limit")
+    parser.add_argument("--burst", type=int, default=BURST, help="chat messages sent back to back before the rate applies")
+    parser.add_argument("--batch-lines", type=int, default=BATCH_LINES,
+                        help="most lines merged into one message from queued messages, 1 to send each on its own")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the traffic with the server to FILE, for replay with bench_replay.py")
+    parser.add_argument("--tls", action="store_true", help="connect over TLS, checking the server against the system certificates")
+    parser.add_argument("--tls-ca", metavar="FILE", help="connect over TLS, checking the server against the certificates in FILE")
+    args, qt_args = parser.parse_known_args()
+    try:
+        endpoints = load_endpoints(args.server)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        tls = TlsClient(client_context(args.tls_ca)) if args.tls or args.tls_ca else None
+    except OSError as e:
+        parser.error(f"Cannot load the TLS certificates: {e}")
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    metrics_server = start_metrics(app, args.metrics_port, args.metrics_interval)
+    chatroom = ChatRoomGUI(endpoints, args.ping_interval, args.ping_misses, args.rate, args.burst, args.batch_lines, tls)
+
+    # The connect runs in the event loop, so a recorder attached now sees all the traffic
+    recorder = WireRecorder(args.record) if args.record else None
+    chatroom.connection.recorder = recorder
     chatroom.show()
-    sys.exit(app.exec_())
+    status = run_profiled(app, args.profile) if args.profile else app.exec_()
+    if metrics_server is not None:
+        metrics_server.close()
+    if recorder is not None:
+        recorder.close()
+        print(f"Recording written to {args.record}")
+    sys.exit(status)
 
 # Entry point of the program
 if __name__ == "__main__":
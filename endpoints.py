@@ -0,0 +1,271 @@
+# Server addresses of the client and the probe choosing between them
+#
+# Usage: python endpoints.py [HOST:PORT ...]
+#
+# Probes each configured server (or the given ones) and prints the results, fastest first.
+
+# Imports
+import errno, os, selectors, socket, sys, time
+from collections import namedtuple
+from protocol import encode, disconnect_command, hello_command
+from session import PAGES
+
+# Port the servers listen on when an address does not name one
+DEFAULT_PORT = 2004
+
+# Servers used when none are configured
+DEFAULT_ENDPOINTS = "3.89.83.172:3000 54.163.37.13:2004"
+
+# Environment variable and file listing the servers, as host:port separated by commas, spaces or lines
+ENDPOINTS_VARIABLE = "CHATROOM_SERVERS"
+ENDPOINTS_PATH = os.path.join(os.path.expanduser("~"), ".chatroom_whisperers", "servers")
+
+# Seconds the probes of all servers may take together
+PROBE_TIMEOUT = 3
+
+# Bytes read from a server's answer before the probe hangs up
+PROBE_READ_SIZE = 4096
+
+# Address of one server
+Endpoint = namedtuple("Endpoint", "host port")
+
+# Probe result of one server: seconds until its first answer arrived, or the error,
+# both None when the probe stopped before the server answered
+Probe = namedtuple("Probe", "endpoint latency error")
+
+
+# Function to parse one host:port address, IPv6 hosts are written in brackets
+def parse_endpoint(text):
+    host, port = text, DEFAULT_PORT
+    if text.startswith("["):
+        host, _, rest = text[1:].partition("]")
+        if rest:
+            if not rest.startswith(":"):
+                raise ValueError(f"Invalid server address {text!r}, expected host:port")
+            port = rest[1:]
+    elif text.count(":") == 1:
+        host, port = text.split(":")
+    if not host or not str(port).isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"Invalid server address {text!r}, expected host:port")
+    return Endpoint(host, int(port))
+
+
+# Function to parse a list of addresses, '#' starts a comment running to the end of the line
+def parse_endpoints(text):
+    endpoints = []
+    for line in text.splitlines():
+        for item in line.split("#", 1)[0].replace(",", " ").split():
+            endpoint = parse_endpoint(item)
+            if endpoint not in endpoints:
+                endpoints.append(endpoint)
+    return endpoints
+
+
+# Function to format an address the way parse_endpoint reads it
+def format_endpoint(endpoint):
+    host = f"[{endpoint.host}]" if ":" in endpoint.host else endpoint.host
+    return f"{host}:{endpoint.port}"
+
+
+# Function to get the configured servers. Addresses given on the command line come
+# first, then the CHATROOM_SERVERS variable, the servers file and the defaults.
+def load_endpoints(addresses=None, environ=os.environ, path=ENDPOINTS_PATH):
+    if addresses:
+        return parse_endpoints(" ".join(addresses))
+    if environ.get(ENDPOINTS_VARIABLE, "").strip():
+        return parse_endpoints(environ[ENDPOINTS_VARIABLE])
+    try:
+        with open(path, encoding="utf-8") as file:
+            endpoints = parse_endpoints(file.read())
+        if endpoints:
+            return endpoints
+    except FileNotFoundError:
+        pass
+    return parse_endpoints(DEFAULT_ENDPOINTS)
+
+
+# Function to start a non-blocking connect, returning the socket
+def open_socket(endpoint):
+    family, kind, proto, _, sockaddr = socket.getaddrinfo(endpoint.host, endpoint.port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setblocking(False)
+    error = sock.connect_ex(sockaddr)
+    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+        sock.close()
+        raise OSError(error, os.strerror(error))
+    return sock
+
+
+# Function to hang up on a server that answered, saying goodbye and reading what
+# it already sent so the close does not reset the connection
+def close_probe(sock):
+    try:
+        sock.send(encode(disconnect_command()))
+        sock.shutdown(socket.SHUT_WR)
+        while sock.recv(PROBE_READ_SIZE):
+            pass
+    except OSError:
+        pass
+    sock.close()
+
+
+# Function to order probe results: the servers that answered by latency, then the
+# ones the probe stopped waiting for and the failed ones, each in configured order
+def rank(probes):
+    def key(item):
+        index, probe = item
+        if probe.latency is not None:
+            return (0, probe.latency)
+        return (1 if probe.error is None else 2, index)
+    return [probe for _, probe in sorted(enumerate(probes), key=key)]
+
+
+# Function to probe every server at once and return the results ranked, fastest first.
+# A probe connects, says HELLO and waits for the first byte of the answer, so it measures
+# the connect and the server's response time. Offering the pages feature keeps servers
+# that have it from sending their whole room list to a probe. The
+# first server to answer is the fastest one, the probes still running then are stopped
+# unless every server should be measured. Given a TlsClient, the probe does the TLS
+# handshake the connection will do and keeps the session, so the connect after it resumes.
+def probe_endpoints(endpoints, timeout=PROBE_TIMEOUT, measure_all=False, tls=None):
+    selector = selectors.DefaultSelector()
+    started = time.monotonic()
+    results = {endpoint: Probe(endpoint, None, None) for endpoint in endpoints}
+    answered = False
+
+    # Servers being connected to, the ones in the TLS handshake and the ones sent HELLO
+    connecting = set(endpoints)
+    handshaking = set()
+    greeted = set()
+    try:
+        for endpoint in endpoints:
+            try:
+                selector.register(open_socket(endpoint), selectors.EVENT_WRITE, endpoint)
+            except OSError as e:
+                results[endpoint] = Probe(endpoint, None, e)
+        while selector.get_map() and (measure_all or not answered):
+            remaining = started + timeout - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, events in selector.select(remaining):
+                sock, endpoint = key.fileobj, key.data
+                error = None
+                try:
+                    if endpoint in connecting:
+                        code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                        if code:
+                            raise OSError(code, os.strerror(code))
+                        connecting.discard(endpoint)
+                        if tls is not None:
+                            wrapped = tls.wrap(sock, endpoint)
+                            selector.unregister(sock)
+                            sock = wrapped
+                            selector.register(sock, selectors.EVENT_WRITE, endpoint)
+                            handshaking.add(endpoint)
+                    if endpoint in handshaking:
+                        step = tls.handshake(sock)
+                        if step is not None:
+                            selector.modify(sock, selectors.EVENT_READ if step == "read" else selectors.EVENT_WRITE, endpoint)
+                            continue
+                        handshaking.discard(endpoint)
+                    if endpoint not in greeted:
+
+                        # Connected, the answer to HELLO is next
+                        sock.send(encode(hello_command({PAGES})))
+                        greeted.add(endpoint)
+                        selector.modify(sock, selectors.EVENT_READ, endpoint)
+                        continue
+                    if not sock.recv(PROBE_READ_SIZE):
+                        raise ConnectionError("Connection closed before the server answered")
+                    if tls is not None:
+                        tls.save(sock, endpoint)
+                except OSError as e:
+                    if tls is not None and tls.would_block(e):
+                        continue
+                    error = e
+                selector.unregister(sock)
+                if error is None:
+                    results[endpoint] = Probe(endpoint, time.monotonic() - started, None)
+                    answered = True
+                    close_probe(sock)
+                else:
+                    results[endpoint] = Probe(endpoint, None, error)
+                    sock.close()
+
+        # Servers still silent after the timeout count as failed
+        for key in list(selector.get_map().values()):
+            if measure_all or not answered:
+                results[key.data] = Probe(key.data, None, TimeoutError("No answer within the probe timeout"))
+            key.fileobj.close()
+    finally:
+        selector.close()
+    return rank([results[endpoint] for endpoint in endpoints])
+
+
+# Function to describe one probe result
+def describe(probe):
+    if probe.latency is not None:
+        return f"{format_endpoint(probe.endpoint)} answered in {probe.latency * 1000:.1f} ms"
+    if probe.error is not None:
+        return f"{format_endpoint(probe.endpoint)} failed: {probe.error}"
+    return f"{format_endpoint(probe.endpoint)} not probed to the end"
+
+
+# Servers of one connection in the order they are tried. A failed connect moves on to
+# the next server, and once every server failed in a row, or an established link
+# dropped, the list is stale and the servers are probed again before the next connect.
+class EndpointPool:
+    def __init__(self, endpoints):
+        self.endpoints = list(endpoints)
+        self.ranked = list(self.endpoints)
+        self.index = 0
+        self.failures = 0
+
+        # A single server is never probed, there is nothing to choose
+        self.stale = len(self.endpoints) > 1
+
+    # Method to get the server to connect to next
+    def current(self):
+        return self.ranked[self.index]
+
+    # Method to check whether the servers should be probed before the next connect
+    def needs_probe(self):
+        return self.stale and len(self.endpoints) > 1
+
+    # Method to take the order of a probe, starting over with the fastest server
+    def update(self, probes):
+        self.ranked = [probe.endpoint for probe in probes]
+        self.index = 0
+        self.failures = 0
+        self.stale = False
+
+    # Method to move on after a failed connect, returning whether an untried server is left
+    def failed(self):
+        self.failures += 1
+        self.index = (self.index + 1) % len(self.ranked)
+        if self.failures < len(self.ranked):
+            return True
+        self.failures = 0
+        self.stale = True
+        return False
+
+    # Method to note a successful connect
+    def connected(self):
+        self.failures = 0
+
+
+# Main function
+def main():
+    try:
+        endpoints = load_endpoints(sys.argv[1:])
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for probe in probe_endpoints(endpoints, measure_all=True):
+        print(describe(probe))
+    return 0
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#include <algorithm>
+#include <zlib.h>
+
+#include "framereader.h"
+namespace Sync{
+
+// Preset dictionary shared with protocol.py, it must stay byte for byte the same on both sides
+static const std::string PRESET_DICTIONARY =
+    "CREATE_ROOM;JOIN_ROOM;REJOIN_ROOM;NO_PASSWORD;DISCONNECT_ROOM;DISCONNECT;RESYNC;"
+    "HELLO;deflate,deltas,resume;CREATE_SUCCESS;JOIN_SUCCESS;INVALID_PASSWORD;ROOM_FULL;"
+    "NO_ROOM;EXISTING_USER;ROOM_EXISTS;NO_ROOMS;SERVER_SHUTDOWN;ROOM_ADDED;ROOM_REMOVED;"
+    "ROOM_USERS;ROOM_SEQ;MESSAGE;Server; has left the chatroom.MESSAGE;Server; has joined the chatroom."
+    "UPDATE_DATA;;1;0;2\n;;1;2\n;1;1;2\n;;2;2\n;;1;10\n;;2;10\n;;3;10\n;;1;5\n;;2;5\n"
+    "MESSAGE_ROOM;MESSAGE_SEQ;MESSAGE;";
+
+bool CompressPayload(ByteArray const & payload, ByteArray & packed)
+{
+    z_stream stream = {};
+    // Small window and memory level as in protocol.py, inflate always accepts the full window
+    if (deflateInit2(&stream, 6, Z_DEFLATED, -13, 6, Z_DEFAULT_STRATEGY) != Z_OK)
+        return false;
+    deflateSetDictionary(&stream, (Bytef const *)PRESET_DICTIONARY.data(), PRESET_DICTIONARY.size());
+    packed.v.resize(deflateBound(&stream, payload.v.size()));
+    stream.next_in = (Bytef *)payload.v.data();
+    stream.avail_in = payload.v.size();
+    stream.next_out = (Bytef *)packed.v.data();
+    stream.avail_out = packed.v.size();
+    int result = deflate(&stream, Z_FINISH);
+    packed.v.resize(stream.total_out);
+    deflateEnd(&stream);
+    return result == Z_STREAM_END;
+}
+
+bool DecompressPayload(char const * data, unsigned int size, std::string & message)
+{
+    z_stream stream = {};
+    if (inflateInit2(&stream, -MAX_WBITS) != Z_OK)
+        return false;
+    inflateSetDictionary(&stream, (Bytef const *)PRESET_DICTIONARY.data(), PRESET_DICTIONARY.size());
+    stream.next_in = (Bytef *)data;
+    stream.avail_in = size;
+    message.clear();
+    char chunk[16384];
+    int result = Z_OK;
+    while (result == Z_OK && message.size() <= MAX_FRAME_SIZE)
+    {
+        stream.next_out = (Bytef *)chunk;
+        stream.avail_out = sizeof(chunk);
+        result = inflate(&stream, Z_NO_FLUSH);
+        message.append(chunk, sizeof(chunk) - stream.avail_out);
+    }
+    inflateEnd(&stream);
+    return result == Z_STREAM_END && message.size() <= MAX_FRAME_SIZE;
+}
+
+ByteArray EncodeCompressedFrame(ByteArray const & payload)
+{
+    ByteArray packed;
+    if (payload.v.size() >= COMPRESS_THRESHOLD && CompressPayload(payload, packed) && packed.v.size() < payload.v.size())
+        return EncodeFrame(packed, FLAG_COMPRESSED);
+    return EncodeFrame(payload);
+}
+
+ByteArray EncodeFrame(ByteArray const & payload, unsigned char flags)
+{
+    ByteArray frame;
+    unsigned int length = payload.v.size();
+    frame.v.reserve(FRAME_HEADER_SIZE + length);
+    frame.v.push_back((char)FRAME_MARKER);
+    frame.v.push_back((char)flags);
+    frame.v.push_back((char)((length >> 24) & 0xFF));
+    frame.v.push_back((char)((length >> 16) & 0xFF));
+    frame.v.push_back((char)((length >> 8) & 0xFF));
+    frame.v.push_back((char)(length & 0xFF));
+    frame.v.insert(frame.v.end(), payload.v.begin(), payload.v.end());
+    return frame;
+}
+
+FrameReader::FrameReader(void)
+    : framed(false)
+{
+    ;
+}
+
+void FrameReader::Feed(ByteArray const & data)
+{
+    buffer.insert(buffer.end(), data.v.begin(), data.v.end());
+}
+
+bool FrameReader::Next(std::string & message)
+{
+    if (buffer.empty())
+        return false;
+
+    // Legacy text: everything up to the next frame marker is one message
+    if ((unsigned char)buffer[0] != FRAME_MARKER)
+    {
+        std::vector<char>::iterator stop = std::find(buffer.begin(), buffer.end(), (char)FRAME_MARKER);
+        message.assign(buffer.begin(), stop);
+        buffer.erase(buffer.begin(), stop);
+        return true;
+    }
+
+    // Wait for the rest of the header
+    if (buffer.size() < FRAME_HEADER_SIZE)
+        return false;
+    unsigned int length = ((unsigned int)(unsigned char)buffer[2] << 24) |
+                          ((unsigned int)(unsigned char)buffer[3] << 16) |
+                          ((unsigned int)(unsigned char)buffer[4] << 8) |
+                          (unsigned int)(unsigned char)buffer[5];
+    if (length > MAX_FRAME_SIZE)
+    {
+        // A corrupt header cannot be resynchronised, so drop everything buffered
+        buffer.clear();
+        throw std::string("Frame payload too large");
+    }
+
+    // Wait for the rest of the payload
+    if (buffer.size() < FRAME_HEADER_SIZE + length)
+        return false;
+    bool valid = true;
+    if ((unsigned char)buffer[1] & FLAG_COMPRESSED)
+        valid = DecompressPayload(buffer.data() + FRAME_HEADER_SIZE, length, message);
+    else
+        message.assign(buffer.begin() + FRAME_HEADER_SIZE, buffer.begin() + FRAME_HEADER_SIZE + length);
+    buffer.erase(buffer.begin(), buffer.begin() + FRAME_HEADER_SIZE + length);
+    framed = true;
+    if (!valid)
+        throw std::string("Invalid compressed frame");
+    return true;
+}
+
+bool FrameReader::IsFramed(void) const
+{
+    return framed;
+}
+};
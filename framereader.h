@@ -0,0 +1,46 @@
+#ifndef FRAMEREADER_H
+#define FRAMEREADER_H
+#include <string>
+#include <vector>
+
+#include "socket.h"
+namespace Sync{
+
+// Marker byte that starts a length-prefixed frame (never valid in UTF-8 text)
+static const unsigned char FRAME_MARKER = 0xFF;
+// Frame header: marker, flags, 4 byte big-endian payload length
+static const int FRAME_HEADER_SIZE = 6;
+// Largest frame payload accepted from a client
+static const unsigned int MAX_FRAME_SIZE = 1 << 20;
+// Frame flag for a payload compressed with raw deflate and the preset dictionary
+static const unsigned char FLAG_COMPRESSED = 0x01;
+// Payloads shorter than this are not worth compressing
+static const unsigned int COMPRESS_THRESHOLD = 256;
+
+// Wraps a payload in a frame header
+ByteArray EncodeFrame(ByteArray const & payload, unsigned char flags = 0);
+
+// Wraps a payload in a frame, compressed if that makes it smaller
+ByteArray EncodeCompressedFrame(ByteArray const & payload);
+
+// Raw deflate with the preset dictionary shared with protocol.py
+bool CompressPayload(ByteArray const & payload, ByteArray & packed);
+bool DecompressPayload(char const * data, unsigned int size, std::string & message);
+
+// Reassembles messages from the bytes returned by successive Socket::Read calls.
+// Frames may be split across or merged within reads, and compressed frames are
+// inflated.  Anything that does not start with the frame marker is legacy text
+// and is treated as one message per read.
+class FrameReader
+{
+private:
+    std::vector<char> buffer;
+    bool framed;
+public:
+    FrameReader(void);
+    void Feed(ByteArray const & data);
+    bool Next(std::string & message);
+    bool IsFramed(void) const;
+};
+};
+#endif // FRAMEREADER_H
@@ -0,0 +1,91 @@
+# Imports
+import socket, time
+
+# Seconds between pings, 0 disables them
+PING_INTERVAL = 15
+
+# Pings left unanswered in a row after which the server is considered dead
+MAX_MISSED_PINGS = 3
+
+# Gains of the smoothed round trip time and of its mean deviation, as TCP uses them (RFC 6298)
+RTT_GAIN = 1 / 8
+RTT_VARIANCE_GAIN = 1 / 4
+
+
+# Application level keepalive of one connection. A ping goes out every interval and
+# the server echoes its token in a pong, each pong updating a smoothed round trip
+# time. Once max_missed pings in a row are unanswered the server is declared dead,
+# which catches half-open connections that would otherwise never report an error.
+# The owner arms a timer for next_deadline(), nothing polls.
+class Heartbeat:
+    def __init__(self, interval=PING_INTERVAL, max_missed=MAX_MISSED_PINGS):
+        self.interval = interval
+        self.max_missed = max_missed
+        self.next_token = 1
+
+        # Send times of the unanswered pings by token, and the time the next one is due
+        self.sent = {}
+        self.next_ping = None
+
+        # Latest round trip, its smoothed value and mean deviation in seconds, None until the first pong
+        self.rtt = None
+        self.srtt = None
+        self.rttvar = None
+
+    # Method to start pinging on a connection whose server answers pings
+    def start(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.sent.clear()
+        self.next_ping = now + self.interval if self.interval > 0 else None
+
+    # Method to stop pinging when the connection ends
+    def stop(self):
+        self.sent.clear()
+        self.next_ping = None
+
+    # Method to get the time the next ping is due, None while stopped
+    def next_deadline(self):
+        return self.next_ping
+
+    # Method to check whether the server missed too many pings to be considered alive
+    def dead(self):
+        return len(self.sent) >= self.max_missed
+
+    # Method to record a ping being sent, returns its token
+    def ping(self, now=None):
+        now = time.monotonic() if now is None else now
+        token = self.next_token
+        self.next_token += 1
+        self.sent[token] = now
+        self.next_ping = now + self.interval
+        return token
+
+    # Method to record a pong, returns the round trip or None for a token that is not outstanding.
+    # Pongs come back in the order of the pings, so older unanswered pings were lost with the link.
+    def pong(self, token, now=None):
+        sent = self.sent.pop(token, None)
+        if sent is None:
+            return None
+        for older in [older for older in self.sent if older < token]:
+            del self.sent[older]
+        self.rtt = (time.monotonic() if now is None else now) - sent
+        if self.srtt is None:
+            self.srtt = self.rtt
+            self.rttvar = self.rtt / 2
+        else:
+            self.rttvar += RTT_VARIANCE_GAIN * (abs(self.srtt - self.rtt) - self.rttvar)
+            self.srtt += RTT_GAIN * (self.rtt - self.srtt)
+        return self.rtt
+
+
+# Function to turn on TCP keepalive with the heartbeat's timing, so the kernel also
+# detects a vanished peer on servers that do not answer pings. Options the platform
+# lacks are skipped.
+def enable_keepalive(sock, interval=PING_INTERVAL, max_missed=MAX_MISSED_PINGS):
+    if interval <= 0:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", interval), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", max_missed)):
+        option = getattr(socket, name, None)
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, max(1, int(value)))
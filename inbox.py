@@ -0,0 +1,123 @@
+# Imports
+import time
+from collections import deque
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+
+# Seconds of handler work allowed per drain before yielding to the event loop
+DRAIN_BUDGET = 0.008
+
+# Smallest and largest number of messages handled per drain
+MIN_BATCH = 16
+MAX_BATCH = 4096
+
+# Weight of the newest sample in the moving averages
+SMOOTHING = 0.2
+
+
+# Handoff stage between the socket reader and the GUI. post() may be called from any
+# thread, it only appends to a deque and emits a queued signal when the inbox was idle.
+# Messages are delivered on the inbox's thread in batches sized so that one drain
+# stays within DRAIN_BUDGET, and the rest wait for the next event loop pass.
+class Inbox(QObject):
+
+    # Internal signal waking the drain on the inbox's thread
+    wake = pyqtSignal()
+
+    def __init__(self, deliver, parent=None):
+        super().__init__(parent)
+        self.deliver = deliver
+
+        # Posted messages with the time they arrived
+        self.queue = deque()
+
+        # Set while a wake signal is in flight, so a burst schedules a single drain
+        self.scheduled = False
+        self.wake.connect(self.drain, Qt.QueuedConnection)
+
+        # Zero timer continuing a backlog after timers, sockets and input had their turn
+        self.continue_timer = QTimer(self)
+        self.continue_timer.setSingleShot(True)
+        self.continue_timer.setInterval(0)
+        self.continue_timer.timeout.connect(self.drain)
+
+        # Messages handled per drain, adapted to the measured cost of one message
+        self.batch_size = MIN_BATCH
+        self.message_cost = 0.0
+
+        # Counters
+        self.posted = 0
+        self.delivered = 0
+        self.drains = 0
+        self.max_depth = 0
+        self.drain_latency = 0.0
+        self.max_drain_latency = 0.0
+
+    # Method to queue a message for delivery, safe to call from any thread
+    def post(self, message):
+        self.queue.append((time.perf_counter(), message))
+        self.posted += 1
+        if not self.scheduled:
+            self.scheduled = True
+            self.wake.emit()
+
+    # Method to get the number of messages waiting
+    def depth(self):
+        return len(self.queue)
+
+    # Slot delivering one batch of messages
+    def drain(self):
+        self.scheduled = False
+        depth = len(self.queue)
+        self.max_depth = max(self.max_depth, depth)
+        count = min(depth, self.batch_size)
+        if count == 0:
+            return
+        self.drains += 1
+
+        # A handler may flush the inbox while the batch runs, so stop when it is empty
+        start = time.perf_counter()
+        handled = 0
+        while handled < count and self.queue:
+            posted_at, message = self.queue.popleft()
+            self.record_latency(start - posted_at)
+            self.delivered += 1
+            handled += 1
+            self.deliver(message)
+        self.adapt(handled, time.perf_counter() - start)
+
+        # Leave the rest for the next pass so input and painting are not starved
+        if self.queue and not self.scheduled:
+            self.scheduled = True
+            self.continue_timer.start()
+
+    # Method to deliver everything still queued, used when the connection closes
+    def flush(self):
+        while self.queue:
+            posted_at, message = self.queue.popleft()
+            self.record_latency(time.perf_counter() - posted_at)
+            self.delivered += 1
+            self.deliver(message)
+
+    # Method to track how long messages waited in the inbox
+    def record_latency(self, latency):
+        self.drain_latency += SMOOTHING * (latency - self.drain_latency)
+        self.max_drain_latency = max(self.max_drain_latency, latency)
+
+    # Method to size the next batch from the cost of the last one
+    def adapt(self, count, elapsed):
+        self.message_cost += SMOOTHING * (elapsed / count - self.message_cost)
+        if self.message_cost > 0:
+            self.batch_size = int(min(MAX_BATCH, max(MIN_BATCH, DRAIN_BUDGET / self.message_cost)))
+
+    # Method to get a snapshot of the counters
+    def stats(self):
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "posted": self.posted,
+            "delivered": self.delivered,
+            "drains": self.drains,
+            "batch_size": self.batch_size,
+            "drain_latency_ms": self.drain_latency * 1000,
+            "max_drain_latency_ms": self.max_drain_latency * 1000,
+        }
@@ -0,0 +1,171 @@
+# Imports
+import sqlite3, time
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QTimer, Qt
+from message_store import PAGE_SIZE
+from metrics import UI_APPEND_SECONDS
+
+# Default number of messages kept in a chat window
+SCROLLBACK = 5000
+
+# Milliseconds between model updates while messages are arriving (about one frame)
+FLUSH_INTERVAL = 16
+
+
+# Fixed capacity buffer that overwrites its oldest item when full
+class RingBuffer:
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1")
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # Method to get the item at a position, 0 being the oldest
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise IndexError("Ring buffer index out of range")
+        return self.items[(self.start + position) % self.capacity]
+
+    # Method to add an item, dropping the oldest one when full
+    def append(self, item):
+        end = (self.start + self.size) % self.capacity
+        self.items[end] = item
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.size += 1
+
+    # Method to add an item before the oldest one, the buffer must have room for it
+    def prepend(self, item):
+        if self.size == self.capacity:
+            raise IndexError("Ring buffer is full")
+        self.start = (self.start - 1) % self.capacity
+        self.items[self.start] = item
+        self.size += 1
+
+    # Method to drop the oldest items
+    def drop_oldest(self, count):
+        count = min(count, self.size)
+        for offset in range(count):
+            self.items[(self.start + offset) % self.capacity] = None
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+
+    # Method to remove every item
+    def clear(self):
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+
+
+# List model of chat lines with bounded scrollback. Appends are queued and applied
+# to the model in one batch per frame, so bursts cost one layout pass instead of one per line.
+# With a message store, each batch is also written to the room's log in one transaction,
+# the newest page of the log is shown on open and older pages are loaded on request.
+class ChatMessageModel(QAbstractListModel):
+    def __init__(self, scrollback=SCROLLBACK, flush_interval=FLUSH_INTERVAL, parent=None, store=None, room=None):
+        super().__init__(parent)
+        self.lines = RingBuffer(scrollback)
+        self.pending = []
+
+        # Room log and the sequence number of the oldest line loaded from it
+        self.store = store
+        self.room = room
+        self.oldest_seq = None
+        self.has_older = store is not None
+
+        # Single-shot timer applying queued lines
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(flush_interval)
+        self.flush_timer.timeout.connect(self.flush)
+
+        # Show the end of the saved history straight away
+        self.load_older()
+
+    # Model interface: number of lines
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    # Model interface: text of a line, also used as the tooltip for lines cut off by the view
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in (Qt.DisplayRole, Qt.ToolTipRole) or not index.isValid() or index.row() >= len(self.lines):
+            return None
+        return self.lines[index.row()]
+
+    # Method to queue a line for the next batched update, lines that are not saved are only shown
+    def append_line(self, text, save=True):
+        self.pending.append((text, save))
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    # Method to apply every queued line in one model update
+    def flush(self):
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        capacity = self.lines.capacity
+        self.save([text for text, save in self.pending if save])
+        incoming = [text for text, _ in self.pending[-capacity:]]
+        self.pending = []
+
+        # Evict the oldest lines that no longer fit
+        overflow = len(self.lines) + len(incoming) - capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            self.lines.drop_oldest(overflow)
+            self.endRemoveRows()
+
+        # Append the batch
+        first = len(self.lines)
+        self.beginInsertRows(QModelIndex(), first, first + len(incoming) - 1)
+        for text in incoming:
+            self.lines.append(text)
+        self.endInsertRows()
+        UI_APPEND_SECONDS.observe(time.perf_counter() - started)
+
+    # Method to write a batch of lines to the room's log
+    def save(self, lines):
+        if self.store is None or not lines:
+            return
+        try:
+            first = self.store.append(self.room, lines)
+        except sqlite3.Error as e:
+            print("Error saving chat history:", e)
+            self.store = None
+            return
+        if self.oldest_seq is None:
+            self.oldest_seq = first
+
+    # Method to load the page of saved lines before the oldest one shown, returns the number of lines added.
+    # Loading stops once the scrollback is full.
+    def load_older(self, page_size=PAGE_SIZE):
+        room = min(page_size, self.lines.capacity - len(self.lines))
+        if not self.has_older or room <= 0:
+            return 0
+        try:
+            rows = self.store.page(self.room, self.oldest_seq, room)
+        except sqlite3.Error as e:
+            print("Error loading chat history:", e)
+            rows = []
+        self.has_older = len(rows) == room
+        if not rows:
+            return 0
+        self.oldest_seq = rows[0][0]
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        for _, text in reversed(rows):
+            self.lines.prepend(text)
+        self.endInsertRows()
+        return len(rows)
+
+    # Method to remove every line
+    def clear(self):
+        self.beginResetModel()
+        self.lines.clear()
+        self.pending = []
+        self.has_older = False
+        self.endResetModel()
@@ -0,0 +1,111 @@
+# Imports
+import os, sqlite3, time
+
+# Default location of the chat history database
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".chatroom_whisperers", "history.sqlite3")
+
+# Messages kept per room, and the age in seconds after which messages are removed (None keeps them)
+RETENTION = 5000
+MAX_AGE = 30 * 24 * 60 * 60
+
+# Messages loaded per page of scrollback
+PAGE_SIZE = 200
+
+# Appends to a room between two retention passes, so pruning costs a fraction of a write
+PRUNE_INTERVAL = 500
+
+
+# Append-only per-room message log kept in SQLite. The database runs in WAL mode,
+# so a batch of appends is one sequential write to the log without an fsync, and
+# messages are clustered by (room, seq), so the newest page of a room and each older
+# page are a single range read. Retention trims rooms in the background of appends.
+class MessageStore:
+    def __init__(self, path=HISTORY_PATH, retention=RETENTION, max_age=MAX_AGE):
+        self.path = path
+        self.retention = retention
+        self.max_age = max_age
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+
+        # Free pages are returned to the file system when old messages are pruned,
+        # which only takes effect on a new database, so it is set before the tables exist
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS rooms (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "room INTEGER NOT NULL, seq INTEGER NOT NULL, time REAL NOT NULL, text TEXT NOT NULL, "
+                "PRIMARY KEY (room, seq)) WITHOUT ROWID"
+            )
+
+        # Room ids and the next sequence number of each room, and appends since its last prune
+        self.room_ids = {}
+        self.next_seq = {}
+        self.unpruned = {}
+
+    # Method to get the id of a room, adding the room on first use
+    def room_id(self, room):
+        room_id = self.room_ids.get(room)
+        if room_id is None:
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO rooms (name) VALUES (?)", (room,))
+            room_id = self.room_ids[room] = self.db.execute("SELECT id FROM rooms WHERE name = ?", (room,)).fetchone()[0]
+            last = self.db.execute("SELECT MAX(seq) FROM messages WHERE room = ?", (room_id,)).fetchone()[0]
+            self.next_seq[room_id] = 0 if last is None else last + 1
+            self.unpruned[room_id] = 0
+            self.prune(room)
+        return room_id
+
+    # Method to append a batch of lines in one transaction, returns the sequence number of the first
+    def append(self, room, lines):
+        room_id = self.room_id(room)
+        first = self.next_seq[room_id]
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO messages (room, seq, time, text) VALUES (?, ?, ?, ?)",
+                ((room_id, first + offset, now, text) for offset, text in enumerate(lines)),
+            )
+        self.next_seq[room_id] = first + len(lines)
+        self.unpruned[room_id] += len(lines)
+        if self.unpruned[room_id] >= PRUNE_INTERVAL:
+            self.prune(room)
+        return first
+
+    # Method to get up to limit messages older than the sequence number before, as
+    # (seq, text) pairs oldest first. Without before the newest page is returned.
+    def page(self, room, before=None, limit=PAGE_SIZE):
+        room_id = self.room_id(room)
+        if before is None:
+            before = self.next_seq[room_id]
+        rows = self.db.execute(
+            "SELECT seq, text FROM messages WHERE room = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (room_id, before, limit),
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    # Method to remove the messages of a room that fall outside the retention limits
+    def prune(self, room):
+        room_id = self.room_id(room)
+        self.unpruned[room_id] = 0
+        with self.db:
+            if self.retention is not None:
+                self.db.execute(
+                    "DELETE FROM messages WHERE room = ? AND seq < ?",
+                    (room_id, self.next_seq[room_id] - self.retention),
+                )
+            if self.max_age is not None:
+                self.db.execute(
+                    "DELETE FROM messages WHERE room = ? AND seq < "
+                    "(SELECT COALESCE(MIN(seq), ?) FROM messages WHERE room = ? AND time >= ?)",
+                    (room_id, self.next_seq[room_id], room_id, time.time() - self.max_age),
+                )
+        self.db.execute("PRAGMA incremental_vacuum")
+
+    # Method to close the database, folding the write-ahead log back into it
+    def close(self):
+        self.db.close()
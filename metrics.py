@@ -0,0 +1,230 @@
+# Imports
+import bisect, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from 50 us to 5 s
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Monotonically increasing count
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    # Method to add to the count
+    def inc(self, amount=1):
+        self.value += amount
+
+    # Method to get the value for the JSON snapshot
+    def read(self):
+        return self.value
+
+    # Method to get the Prometheus samples as (name, labels, value)
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+
+# Value read from the instrumented object whenever the metrics are collected
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def read(self):
+        return self.function()
+
+    def samples(self):
+        return [(self.name, "", self.function())]
+
+
+# Distribution of observed values over fixed buckets. Observing is one bisect and
+# three additions, so it is cheap enough for every socket read.
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    # Method to record one value, bucket i holds the values up to buckets[i]
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Method to estimate a quantile as the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    def read(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], list(self.counts))),
+        }
+
+    def samples(self):
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), list(self.counts)):
+            total += count
+            samples.append((self.name + "_bucket", '{le="%s"}' % ("+Inf" if bound == float("inf") else repr(bound)), total))
+        samples.append((self.name + "_sum", "", self.sum))
+        samples.append((self.name + "_count", "", self.count))
+        return samples
+
+
+# Registry of the client's metrics. Metrics are updated on the Qt thread and read by
+# the endpoint thread without locking, so a reading may be one observation behind.
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.metrics = {}
+
+        # Counter values at the last rate update, and the per second rates since the one before
+        self.last_update = self.started
+        self.last_values = {}
+        self.rates = {}
+
+    # Methods to register a metric, an existing counter or histogram of the same name is reused
+    def counter(self, name, help):
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    # A gauge re-registered with the same name reads from the newest object
+    def gauge(self, name, help, function):
+        self.metrics[name] = Gauge(name, help, function)
+        return self.metrics[name]
+
+    # Method to compute the per second rate of every counter since the previous update
+    def update_rates(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_update, 1e-9)
+        values = {name: metric.value for name, metric in self.metrics.items() if metric.kind == "counter"}
+        self.rates = {name: (value - self.last_values.get(name, 0)) / elapsed for name, value in values.items()}
+        self.last_update = now
+        self.last_values = values
+        return self.rates
+
+    # Method to get every metric as a JSON serialisable dictionary
+    def snapshot(self):
+        return {
+            "uptime_seconds": time.monotonic() - self.started,
+            "metrics": {name: metric.read() for name, metric in list(self.metrics.items())},
+            "rates_per_second": dict(self.rates),
+        }
+
+    # Method to render every metric in the Prometheus text format
+    def prometheus(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Method to build the periodic log line, updating the rates
+    def summary(self):
+        rates = self.update_rates()
+        parse = self.metrics["chat_parse_seconds"]
+        append = self.metrics["chat_ui_append_seconds"]
+        request = self.metrics["chat_request_seconds"]
+        ping = self.metrics["chat_ping_seconds"]
+        parts = [
+            f"in {rates['chat_bytes_received_total'] / 1024:.1f} KB/s {rates['chat_frames_received_total']:.0f} frames/s",
+            f"out {rates['chat_bytes_sent_total'] / 1024:.1f} KB/s",
+            f"parse p50 {parse.quantile(0.5) * 1000:g} ms p99 {parse.quantile(0.99) * 1000:g} ms",
+            f"ui append p99 {append.quantile(0.99) * 1000:g} ms",
+            f"requests {request.count} p99 {request.quantile(0.99) * 1000:g} ms",
+            f"ping p50 {ping.quantile(0.5) * 1000:g} ms p99 {ping.quantile(0.99) * 1000:g} ms",
+        ]
+        for name in ("chat_send_queue_bytes", "chat_inbox_depth"):
+            if name in self.metrics:
+                parts.append(f"{name[5:]} {self.metrics[name].read()}")
+        if "chat_rtt_seconds" in self.metrics:
+            parts.append(f"rtt {self.metrics['chat_rtt_seconds'].read() * 1000:.1f} ms")
+        return "Metrics: " + ", ".join(parts)
+
+
+# Request handler serving /metrics in the Prometheus format and /metrics.json
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, content_type = self.metrics.prometheus().encode(), PROMETHEUS_CONTENT_TYPE
+        elif path == "/metrics.json":
+            body, content_type = json.dumps(self.metrics.snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are not logged to the console
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP endpoint on localhost serving a metrics registry from a background thread
+class MetricsServer:
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        handler = type("Handler", (MetricsHandler,), {"metrics": metrics})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+
+    # Method to stop serving
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Metrics of the chat client
+METRICS = Metrics()
+BYTES_RECEIVED = METRICS.counter("chat_bytes_received_total", "Bytes read from the server")
+BYTES_SENT = METRICS.counter("chat_bytes_sent_total", "Bytes written to the server")
+FRAMES_RECEIVED = METRICS.counter("chat_frames_received_total", "Messages decoded from the server")
+PARSE_SECONDS = METRICS.histogram("chat_parse_seconds", "Time to decode the data of one socket read")
+UI_APPEND_SECONDS = METRICS.histogram("chat_ui_append_seconds", "Time to apply one batch of lines to the chat view")
+REQUEST_SECONDS = METRICS.histogram("chat_request_seconds", "Round trip of create/join requests until their reply")
+REQUEST_FAILURES = METRICS.counter("chat_request_failures_total", "Create/join requests that timed out or lost the link")
+PING_SECONDS = METRICS.histogram("chat_ping_seconds", "Round trip of pings until their pong")
+PINGS_MISSED = METRICS.counter("chat_pings_missed_total", "Unanswered pings of links dropped as dead")
+CHAT_BATCHED = METRICS.counter("chat_messages_batched_total", "Chat messages merged into the message before them")
+CHAT_STREAMED = METRICS.counter("chat_messages_streamed_total", "Long chat messages sent in chunks")
+TLS_HANDSHAKES = METRICS.counter("chat_tls_handshakes_total", "TLS handshakes of links to the server")
+TLS_RESUMED = METRICS.counter("chat_tls_resumed_total", "TLS handshakes that resumed the session of an earlier link")
@@ -0,0 +1,707 @@
+# Imports
+import re, struct, zlib
+from collections import namedtuple
+
+# Marker byte that starts every length-prefixed frame (0xFF never appears in UTF-8 text)
+FRAME_MARKER = 0xFF
+
+# Frame header layout: marker, flags, payload length (network byte order)
+FRAME_HEADER = struct.Struct("!BBI")
+
+# Largest frame payload accepted from the wire
+MAX_FRAME_SIZE = 1 << 20
+
+# Frame flag marking a payload compressed with raw deflate and the preset dictionary
+FLAG_COMPRESSED = 0x01
+
+# Frame flag marking a payload in the binary encoding instead of command text
+FLAG_BINARY = 0x02
+
+# Frame flag marking a payload that starts with the varint channel of a room, on
+# multiplexed connections. The channel comes before any compressed data, so a
+# message encoded once can be tagged for each member.
+FLAG_CHANNEL = 0x04
+
+# Record types of binary payloads, the first byte of the payload
+BINARY_CHAT = 0x01
+BINARY_ROOM_LIST = 0x02
+BINARY_ROOM_ADDED = 0x03
+BINARY_ROOM_REMOVED = 0x04
+BINARY_ROOM_USERS = 0x05
+BINARY_CHUNK = 0x06
+BINARY_ROOM_MESSAGE = 0x10
+
+# Flag bits of a binary room record
+ROOM_LOCKED = 0x01
+
+# Payloads shorter than this are sent as they are once compression is agreed
+COMPRESS_THRESHOLD = 256
+
+# Compressor settings. A small window and memory level make setting up a compressor
+# for each frame about five times cheaper and cost nothing on frames this size.
+# Decompression always uses the full window, so either side may change them.
+COMPRESS_LEVEL = 6
+COMPRESS_WINDOW_BITS = 13
+COMPRESS_MEMORY_LEVEL = 6
+
+# Preset dictionary shared with the C++ server (framereader.cpp), it must stay byte for
+# byte the same on both sides. Deflate finds the strings at the end most cheaply,
+# so the most frequent ones come last.
+PRESET_DICTIONARY = (
+    b"CREATE_ROOM;JOIN_ROOM;REJOIN_ROOM;NO_PASSWORD;DISCONNECT_ROOM;DISCONNECT;RESYNC;"
+    b"HELLO;deflate,deltas,resume;CREATE_SUCCESS;JOIN_SUCCESS;INVALID_PASSWORD;ROOM_FULL;"
+    b"NO_ROOM;EXISTING_USER;ROOM_EXISTS;NO_ROOMS;SERVER_SHUTDOWN;ROOM_ADDED;ROOM_REMOVED;"
+    b"ROOM_USERS;ROOM_SEQ;MESSAGE;Server; has left the chatroom.MESSAGE;Server; has joined the chatroom."
+    b"UPDATE_DATA;;1;0;2\n;;1;2\n;1;1;2\n;;2;2\n;;1;10\n;;2;10\n;;3;10\n;;1;5\n;;2;5\n"
+    b"MESSAGE_ROOM;MESSAGE_SEQ;MESSAGE;"
+)
+
+# Typed messages produced by the decoder
+Room = namedtuple("Room", "name locked current_users max_users")
+RoomList = namedtuple("RoomList", "rooms")
+ChatMessage = namedtuple("ChatMessage", "sender text seq", defaults=(None,))
+Reply = namedtuple("Reply", "status request_id", defaults=(None,))
+ServerShutdown = namedtuple("ServerShutdown", "")
+Hello = namedtuple("Hello", "capabilities")
+RoomAdded = namedtuple("RoomAdded", "room")
+RoomRemoved = namedtuple("RoomRemoved", "name")
+RoomUsers = namedtuple("RoomUsers", "name current_users")
+RoomSeq = namedtuple("RoomSeq", "seq")
+RoomMessage = namedtuple("RoomMessage", "room_name text sender")
+Channel = namedtuple("Channel", "channel room_name")
+ChannelMessage = namedtuple("ChannelMessage", "channel message")
+Pong = namedtuple("Pong", "token")
+RoomPage = namedtuple("RoomPage", "after rooms more total")
+TransferStart = namedtuple("TransferStart", "transfer_id size sender")
+TransferChunk = namedtuple("TransferChunk", "transfer_id offset data")
+TransferEnd = namedtuple("TransferEnd", "transfer_id seq")
+TransferAbort = namedtuple("TransferAbort", "transfer_id")
+UploadEnd = namedtuple("UploadEnd", "transfer_id")
+UploadAbort = namedtuple("UploadAbort", "transfer_id")
+Unknown = namedtuple("Unknown", "text")
+
+# Replies the server sends in answer to CREATE_ROOM / JOIN_ROOM
+REPLY_STATUSES = (
+    "CREATE_SUCCESS",
+    "JOIN_SUCCESS",
+    "INVALID_PASSWORD",
+    "ROOM_FULL",
+    "NO_ROOM",
+    "EXISTING_USER",
+    "ROOM_EXISTS",
+    "BAD_REQUEST",
+)
+
+# Characters that separate command fields and room list records, so names and passwords may not contain them
+FIELD_SEPARATORS = (";", "\n")
+
+
+# Error raised when the byte stream cannot be decoded
+class ProtocolError(Exception):
+    pass
+
+
+# Function to parse one "name;locked;current;max" room record, None if malformed
+def parse_room(line):
+    parts = line.rsplit(";", 3)
+    if len(parts) != 4:
+        return None
+    name, password, current_users, max_users = parts
+    try:
+        return Room(name, password != "", int(current_users), int(max_users))
+    except ValueError:
+        return None
+
+
+# Function to parse a newline separated room list into Room records
+def parse_rooms(room_data):
+    rooms = []
+    for line in room_data.splitlines():
+
+        # Skip blank or truncated lines instead of failing the whole list
+        room = parse_room(line)
+        if room is not None:
+            rooms.append(room)
+    return rooms
+
+
+# Parsers for each server command, keyed by command name
+def _parse_message(rest):
+    sender, _, text = rest.partition(";")
+    return ChatMessage(sender.strip(), text.strip())
+
+
+def _parse_message_seq(rest):
+    seq, _, message = rest.partition(";")
+    sender, _, text = message.partition(";")
+    try:
+        return ChatMessage(sender.strip(), text.strip(), int(seq))
+    except ValueError:
+        return Unknown("MESSAGE_SEQ;" + rest)
+
+
+def _parse_room_seq(rest):
+    try:
+        return RoomSeq(int(rest))
+    except ValueError:
+        return Unknown("ROOM_SEQ;" + rest)
+
+
+def _parse_update_data(rest):
+    return RoomList(parse_rooms(rest))
+
+
+def _parse_shutdown(rest):
+    return ServerShutdown()
+
+
+def _parse_no_rooms(rest):
+    return RoomList([])
+
+
+def _parse_hello(rest):
+    return Hello(frozenset(capability for capability in rest.split(",") if capability))
+
+
+def _parse_room_added(rest):
+    room = parse_room(rest)
+    return RoomAdded(room) if room is not None else Unknown("ROOM_ADDED;" + rest)
+
+
+def _parse_room_removed(rest):
+    return RoomRemoved(rest)
+
+
+def _parse_channel(rest):
+    channel, _, room_name = rest.partition(";")
+    try:
+        return Channel(int(channel), room_name)
+    except ValueError:
+        return Unknown("CHANNEL;" + rest)
+
+
+def _parse_pong(rest):
+    try:
+        return Pong(int(rest))
+    except ValueError:
+        return Unknown("PONG;" + rest)
+
+
+def _parse_room_page(rest):
+    header, _, room_data = rest.partition("\n")
+    fields = header.split(";", 2)
+    if len(fields) != 3 or not fields[0].isdigit():
+        return Unknown("ROOM_PAGE;" + rest)
+    total, more, after = fields
+    return RoomPage(after, parse_rooms(room_data), more == "1", int(total))
+
+
+def _parse_transfer(rest):
+    fields = rest.split(";", 2)
+    try:
+        return TransferStart(int(fields[0]), int(fields[1]), fields[2])
+    except (IndexError, ValueError):
+        return Unknown("TRANSFER;" + rest)
+
+
+def _parse_transfer_end(rest):
+    transfer_id, _, seq = rest.partition(";")
+    try:
+        return TransferEnd(int(transfer_id), int(seq))
+    except ValueError:
+        return Unknown("TRANSFER_END;" + rest)
+
+
+def _parse_transfer_abort(rest):
+    try:
+        return TransferAbort(int(rest))
+    except ValueError:
+        return Unknown("TRANSFER_ABORT;" + rest)
+
+
+def _parse_upload_end(rest):
+    try:
+        return UploadEnd(int(rest))
+    except ValueError:
+        return Unknown("UPLOAD_END;" + rest)
+
+
+def _parse_upload_abort(rest):
+    try:
+        return UploadAbort(int(rest))
+    except ValueError:
+        return Unknown("UPLOAD_ABORT;" + rest)
+
+
+def _parse_room_users(rest):
+    name, _, current_users = rest.rpartition(";")
+    try:
+        return RoomUsers(name, int(current_users))
+    except ValueError:
+        return Unknown("ROOM_USERS;" + rest)
+
+
+# Pre-built dispatch table from command name to parser
+DISPATCH = {
+    "MESSAGE": _parse_message,
+    "MESSAGE_SEQ": _parse_message_seq,
+    "ROOM_SEQ": _parse_room_seq,
+    "UPDATE_DATA": _parse_update_data,
+    "SERVER_SHUTDOWN": _parse_shutdown,
+    "NO_ROOMS": _parse_no_rooms,
+    "HELLO": _parse_hello,
+    "ROOM_ADDED": _parse_room_added,
+    "ROOM_REMOVED": _parse_room_removed,
+    "ROOM_USERS": _parse_room_users,
+    "CHANNEL": _parse_channel,
+    "PONG": _parse_pong,
+    "ROOM_PAGE": _parse_room_page,
+    "TRANSFER": _parse_transfer,
+    "TRANSFER_END": _parse_transfer_end,
+    "TRANSFER_ABORT": _parse_transfer_abort,
+    "UPLOAD_END": _parse_upload_end,
+    "UPLOAD_ABORT": _parse_upload_abort,
+}
+for _status in REPLY_STATUSES:
+    DISPATCH[_status] = lambda rest, status=_status: Reply(status, int(rest) if rest.isdigit() else None)
+
+# Legacy streams have no delimiters, so merged writes are split wherever a known command starts
+_LEGACY_SPLIT = re.compile(
+    "(?=" + "|".join(
+        re.escape(command) if command in REPLY_STATUSES or command in ("SERVER_SHUTDOWN", "NO_ROOMS") else re.escape(command + ";")
+        for command in sorted(DISPATCH, key=len, reverse=True)
+    ) + ")"
+)
+
+
+# Function to turn one complete command string into a typed message
+def parse_command(text):
+    command, _, rest = text.partition(";")
+    handler = DISPATCH.get(command)
+    if handler is not None:
+        return handler(rest)
+
+    # The initial room list on connect is the only message without a command keyword
+    rooms = parse_rooms(text)
+    if rooms:
+        return RoomList(rooms)
+    return Unknown(text)
+
+
+# Function to compress a frame payload as raw deflate primed with the preset dictionary
+def compress_payload(payload):
+    compressor = zlib.compressobj(
+        COMPRESS_LEVEL, zlib.DEFLATED, -COMPRESS_WINDOW_BITS, COMPRESS_MEMORY_LEVEL, zdict=PRESET_DICTIONARY)
+    return compressor.compress(payload) + compressor.flush()
+
+
+# Function to restore a compressed frame payload, refusing output larger than limit
+def decompress_payload(payload, limit=MAX_FRAME_SIZE):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=PRESET_DICTIONARY)
+    try:
+        data = decompressor.decompress(payload, limit)
+    except zlib.error as e:
+        raise ProtocolError("Invalid compressed frame: %s" % e)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ProtocolError("Compressed frame is truncated or expands past %d bytes" % limit)
+    return data
+
+
+# Function to wrap a command string in a length-prefixed frame
+def encode_frame(text, flags=0):
+    payload = text.encode() if isinstance(text, str) else bytes(text)
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError("Frame payload too large: %d bytes" % len(payload))
+    return FRAME_HEADER.pack(FRAME_MARKER, flags, len(payload)) + payload
+
+
+# Function to frame a payload. With compress, payloads above COMPRESS_THRESHOLD are
+# deflated when that makes them smaller.
+def pack_frame(payload, flags=0, compress=False):
+    if compress and len(payload) >= COMPRESS_THRESHOLD:
+        packed = compress_payload(payload)
+        if len(packed) < len(payload):
+            return encode_frame(packed, flags | FLAG_COMPRESSED)
+    return encode_frame(payload, flags)
+
+
+# Function to tag an encoded frame with the channel of a room
+def with_channel(frame, channel):
+    _, flags, length = FRAME_HEADER.unpack_from(frame)
+    prefix = bytearray()
+    _put_varint(prefix, channel)
+    return FRAME_HEADER.pack(FRAME_MARKER, flags | FLAG_CHANNEL, length + len(prefix)) + prefix + frame[FRAME_HEADER.size:]
+
+
+# Function to encode a command for the wire, framed or as legacy text
+def encode(text, framed=True, compress=False):
+    if not framed:
+        return text.encode()
+    return pack_frame(text.encode(), 0, compress)
+
+
+# Function to check the names and password of a create/join request, a separator in
+# one would shift the fields the server reads
+def check_fields(*values):
+    for value in values:
+        if any(separator in value for separator in FIELD_SEPARATORS):
+            raise ValueError(f"{value!r} may not contain ';' or a line break")
+
+
+# Function to append the request id servers with the ids feature echo in their reply
+def with_request_id(command, request_id):
+    return command if request_id is None else f"{command};{request_id}"
+
+
+# Functions to build the client commands understood by the server. Create/join requests
+# raise ValueError for a field the server could not split back out.
+def create_room_command(room_name, password, max_users, username, request_id=None):
+    check_fields(room_name, password, username)
+    return with_request_id(f"CREATE_ROOM;{room_name};{password};1;{max_users};{username}", request_id)
+
+
+def join_room_command(room_name, password, username, request_id=None):
+    check_fields(room_name, password, username)
+    return with_request_id(f"JOIN_ROOM;{room_name};{password if password else 'NO_PASSWORD'};{username}", request_id)
+
+
+def rejoin_room_command(room_name, password, username, last_seq, request_id=None):
+    check_fields(room_name, password, username)
+    return with_request_id(
+        f"REJOIN_ROOM;{room_name};{password if password else 'NO_PASSWORD'};{username};{last_seq}", request_id)
+
+
+def message_room_command(room_name, message, username):
+    return f"MESSAGE_ROOM;{room_name};{message};{username}"
+
+
+def transfer_room_command(room_name, transfer_id, size, username):
+    return f"TRANSFER_ROOM;{room_name};{transfer_id};{size};{username}"
+
+
+def disconnect_room_command(room_name, username):
+    return f"DISCONNECT_ROOM;{room_name};{username}"
+
+
+def disconnect_command():
+    return "DISCONNECT"
+
+
+def hello_command(capabilities):
+    return "HELLO;" + ",".join(sorted(capabilities))
+
+
+def resync_command():
+    return "RESYNC"
+
+
+def ping_command(token):
+    return f"PING;{token}"
+
+
+def list_rooms_command(after, count):
+    return f"LIST_ROOMS;{count};{after}"
+
+
+# Binary payloads start with a record type byte. Numbers are unsigned LEB128 varints
+# and strings are UTF-8 with a varint byte length, except the last string of a record,
+# which runs to the end of the frame. That lets the decoder turn all the strings of a
+# record into text with a single decode. A room list is stored column by column, so
+# each column decodes in one pass. Counts below 128 take one byte, which is the fast path.
+# A chunk of a streamed message carries raw bytes after its transfer id and offset.
+
+# Functions to write binary fields
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _put_strings(out, strings):
+    encoded = [string.encode() for string in strings]
+    for data in encoded[:-1]:
+        _put_varint(out, len(data))
+    for data in encoded:
+        out += data
+
+
+# Function to pack a message into a binary payload, None for messages without a binary form
+def pack_message(message):
+    out = bytearray()
+    kind = type(message)
+    if kind is ChatMessage:
+        out.append(BINARY_CHAT)
+        _put_varint(out, 0 if message.seq is None else message.seq + 1)
+        _put_strings(out, (message.sender, message.text))
+    elif kind is RoomList:
+        rooms = message.rooms
+        out.append(BINARY_ROOM_LIST)
+        _put_varint(out, len(rooms))
+        out += bytes(ROOM_LOCKED if room.locked else 0 for room in rooms)
+        for room in rooms:
+            _put_varint(out, room.current_users)
+        for room in rooms:
+            _put_varint(out, room.max_users)
+        _put_strings(out, [room.name for room in rooms] + [""])
+    elif kind is RoomAdded:
+        room = message.room
+        out.append(BINARY_ROOM_ADDED)
+        out.append(ROOM_LOCKED if room.locked else 0)
+        _put_varint(out, room.current_users)
+        _put_varint(out, room.max_users)
+        out += room.name.encode()
+    elif kind is RoomRemoved:
+        out.append(BINARY_ROOM_REMOVED)
+        out += message.name.encode()
+    elif kind is RoomUsers:
+        out.append(BINARY_ROOM_USERS)
+        _put_varint(out, message.current_users)
+        out += message.name.encode()
+    elif kind is RoomMessage:
+        out.append(BINARY_ROOM_MESSAGE)
+        _put_strings(out, (message.room_name, message.sender, message.text))
+    elif kind is TransferChunk:
+        out.append(BINARY_CHUNK)
+        _put_varint(out, message.transfer_id)
+        _put_varint(out, message.offset)
+        out += message.data
+    else:
+        return None
+    return bytes(out)
+
+
+# Functions to read binary fields from a memoryview, returning the values and the next offset
+def _get_varint(view, offset):
+    byte = view[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    value = 0
+    shift = 0
+    while byte & 0x80:
+        if shift > 56:
+            raise ProtocolError("Varint too long")
+        byte = view[offset]
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        offset += 1
+    return value, offset
+
+
+def _get_varints(view, offset, count):
+    column = view[offset:offset + count]
+    if len(column) == count and max(column, default=0) < 0x80:
+        return list(column), offset + count
+    values = []
+    for _ in range(count):
+        value, offset = _get_varint(view, offset)
+        values.append(value)
+    return values, offset
+
+
+# Function to decode the strings ending a record, given the byte lengths of all but the
+# last one. When every byte became one character, byte offsets are character offsets
+# and the text decoded in one go is simply sliced.
+def _get_strings(view, offset, lengths):
+    text = str(view[offset:], "utf-8", "replace")
+    if len(text) != len(view) - offset:
+        strings = []
+        for length in lengths:
+            if offset + length > len(view):
+                raise ProtocolError("Binary field runs past the end of the frame")
+            strings.append(str(view[offset:offset + length], "utf-8", "replace"))
+            offset += length
+        strings.append(str(view[offset:], "utf-8", "replace"))
+        return strings
+    strings = []
+    start = 0
+    for length in lengths:
+        strings.append(text[start:start + length])
+        start += length
+    if start > len(text):
+        raise ProtocolError("Binary field runs past the end of the frame")
+    strings.append(text[start:])
+    return strings
+
+
+# Function to decode a binary payload. Fields are read straight from a memoryview of the
+# receive buffer, so the frame is never copied and no intermediate strings are built.
+def unpack_message(payload):
+    view = memoryview(payload)
+    try:
+        kind = view[0]
+        if kind == BINARY_CHAT:
+            seq, offset = _get_varint(view, 1)
+            length, offset = _get_varint(view, offset)
+            text = str(view[offset:], "utf-8", "replace")
+            if len(text) == len(view) - offset and length <= len(text):
+                return ChatMessage(text[:length], text[length:], seq - 1 if seq else None)
+            sender, text = _get_strings(view, offset, (length,))
+            return ChatMessage(sender, text, seq - 1 if seq else None)
+        if kind == BINARY_ROOM_LIST:
+            count, offset = _get_varint(view, 1)
+            flags = view[offset:offset + count]
+            current_users, offset = _get_varints(view, offset + count, count)
+            max_users, offset = _get_varints(view, offset, count)
+            lengths, offset = _get_varints(view, offset, count)
+            names = _get_strings(view, offset, lengths)
+            if len(flags) != count:
+                raise ProtocolError("Truncated binary frame")
+            locked = [bool(flag & ROOM_LOCKED) for flag in flags]
+            return RoomList(list(map(Room._make, zip(names, locked, current_users, max_users))))
+        if kind == BINARY_ROOM_ADDED:
+            locked = bool(view[1] & ROOM_LOCKED)
+            current_users, offset = _get_varint(view, 2)
+            max_users, offset = _get_varint(view, offset)
+            return RoomAdded(Room(str(view[offset:], "utf-8", "replace"), locked, current_users, max_users))
+        if kind == BINARY_ROOM_REMOVED:
+            return RoomRemoved(str(view[1:], "utf-8", "replace"))
+        if kind == BINARY_ROOM_USERS:
+            current_users, offset = _get_varint(view, 1)
+            return RoomUsers(str(view[offset:], "utf-8", "replace"), current_users)
+        if kind == BINARY_ROOM_MESSAGE:
+            room_length, offset = _get_varint(view, 1)
+            sender_length, offset = _get_varint(view, offset)
+            room_name, sender, text = _get_strings(view, offset, (room_length, sender_length))
+            return RoomMessage(room_name, text, sender)
+        if kind == BINARY_CHUNK:
+            transfer_id, offset = _get_varint(view, 1)
+            position, offset = _get_varint(view, offset)
+            return TransferChunk(transfer_id, position, bytes(view[offset:]))
+    except IndexError:
+        raise ProtocolError("Truncated binary frame")
+    raise ProtocolError("Unknown binary record type %d" % kind)
+
+
+# Function to format a pushed message as command text, the inverse of parse_command
+def format_message(message):
+    kind = type(message)
+    if kind is ChatMessage:
+        if message.seq is None:
+            return f"MESSAGE;{message.sender};{message.text}"
+        return f"MESSAGE_SEQ;{message.seq};{message.sender};{message.text}"
+    if kind is RoomList:
+        return "UPDATE_DATA;" + "".join(format_room(room) + "\n" for room in message.rooms)
+    if kind is RoomAdded:
+        return "ROOM_ADDED;" + format_room(message.room)
+    if kind is RoomRemoved:
+        return "ROOM_REMOVED;" + message.name
+    if kind is RoomUsers:
+        return f"ROOM_USERS;{message.name};{message.current_users}"
+    if kind is RoomMessage:
+        return message_room_command(message.room_name, message.text, message.sender)
+    if kind is RoomSeq:
+        return f"ROOM_SEQ;{message.seq}"
+    if kind is Channel:
+        return f"CHANNEL;{message.channel};{message.room_name}"
+    if kind is RoomPage:
+        return (f"ROOM_PAGE;{message.total};{'1' if message.more else '0'};{message.after}\n"
+                + "".join(format_room(room) + "\n" for room in message.rooms))
+    if kind is TransferStart:
+        return f"TRANSFER;{message.transfer_id};{message.size};{message.sender}"
+    if kind is TransferEnd:
+        return f"TRANSFER_END;{message.transfer_id};{message.seq}"
+    if kind is TransferAbort:
+        return f"TRANSFER_ABORT;{message.transfer_id}"
+    if kind is UploadEnd:
+        return f"UPLOAD_END;{message.transfer_id}"
+    if kind is UploadAbort:
+        return f"UPLOAD_ABORT;{message.transfer_id}"
+    raise ValueError("No text form for %s" % kind.__name__)
+
+
+# Function to format one room record, rooms carry a locked flag instead of the password
+def format_room(room):
+    return f"{room.name};{'1' if room.locked else ''};{room.current_users};{room.max_users}"
+
+
+# Function to encode a typed message for a peer, binary when it agreed to it and text otherwise
+def encode_message(message, framed=True, compress=False, binary=False):
+    if framed and binary:
+        payload = pack_message(message)
+        if payload is not None:
+            return pack_frame(payload, FLAG_BINARY, compress)
+    return encode(format_message(message), framed, compress)
+
+
+# Incremental decoder for the server byte stream
+class FrameDecoder:
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+
+        # Reusable receive buffer and the offset of the first unread byte
+        self.buffer = bytearray()
+        self.offset = 0
+
+        # Set once the peer has sent at least one length-prefixed frame
+        self.framed = False
+
+    # Method to add received bytes and return every complete message
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        with memoryview(self.buffer) as view:
+            end = len(view)
+            offset = self.offset
+            while offset < end:
+
+                # Length-prefixed frame
+                if view[offset] == FRAME_MARKER:
+                    if end - offset < FRAME_HEADER.size:
+                        break
+                    _, flags, length = FRAME_HEADER.unpack_from(view, offset)
+                    if length > self.max_frame_size:
+                        raise ProtocolError("Frame payload too large: %d bytes" % length)
+                    start = offset + FRAME_HEADER.size
+                    if end - start < length:
+                        break
+                    self.framed = True
+                    messages.append(self.decode_payload(view[start:start + length], flags))
+                    offset = start + length
+
+                # Legacy text runs until the next frame marker or the end of the buffer
+                else:
+                    stop = self.buffer.find(FRAME_MARKER, offset)
+                    if stop == -1:
+                        stop = end
+                    messages.extend(self.decode_legacy(str(view[offset:stop], "utf-8", "replace")))
+                    offset = stop
+        self.consume(offset)
+        return messages
+
+    # Method to decode the payload of one frame
+    def decode_payload(self, payload, flags):
+        if flags & FLAG_CHANNEL:
+            try:
+                channel, offset = _get_varint(payload, 0)
+            except IndexError:
+                raise ProtocolError("Truncated channel frame")
+            return ChannelMessage(channel, self.decode_payload(payload[offset:], flags & ~FLAG_CHANNEL))
+        if flags & FLAG_COMPRESSED:
+            payload = decompress_payload(payload, self.max_frame_size)
+        if flags & FLAG_BINARY:
+            return unpack_message(payload)
+        return self.parse(str(payload, "utf-8", "replace"))
+
+    # Method to split a run of legacy text into messages
+    def decode_legacy(self, text):
+        return [self.parse(segment.rstrip("\r\n")) for segment in _LEGACY_SPLIT.split(text) if segment]
+
+    # Method to turn one command string into a message
+    def parse(self, text):
+        return parse_command(text)
+
+    # Method to drop consumed bytes, compacting the buffer only once half of it is stale
+    def consume(self, offset):
+        if offset >= len(self.buffer):
+            self.buffer.clear()
+            self.offset = 0
+        elif offset > len(self.buffer) // 2:
+            del self.buffer[:offset]
+            self.offset = 0
+        else:
+            self.offset = offset
+
+    # Method to report how many bytes are waiting for the rest of a frame
+    def pending(self):
+        return len(self.buffer) - self.offset
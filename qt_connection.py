@@ -0,0 +1,747 @@
+# Imports
+import os, socket, threading, time
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal
+from protocol import ProtocolError, UploadAbort
+from inbox import Inbox
+from send_queue import SendQueue
+from backoff import Backoff
+from endpoints import Endpoint, EndpointPool, describe, format_endpoint, open_socket, probe_endpoints
+from heartbeat import enable_keepalive
+from ratelimit import ChatPacer, split_message
+from transfer import SEND_WINDOW
+from tls import WOULD_BLOCK
+from metrics import (
+    BYTES_RECEIVED,
+    BYTES_SENT,
+    FRAMES_RECEIVED,
+    PARSE_SECONDS,
+    REQUEST_SECONDS,
+    REQUEST_FAILURES,
+    PING_SECONDS,
+    PINGS_MISSED,
+    CHAT_BATCHED,
+    CHAT_STREAMED,
+    TLS_HANDSHAKES,
+    TLS_RESUMED,
+)
+from session import (
+    CAPABILITIES,
+    PAGE_SIZE,
+    ClientSession,
+    Response,
+    RoomEvent,
+    RoundTrip,
+    REQUEST_TIMEOUT,
+    SUCCESS_STATUSES,
+    TIMEOUT,
+    DISCONNECTED,
+)
+
+# Bytes requested per recv() call
+READ_SIZE = 65536
+
+# Reads performed per readiness notification before yielding back to the event loop
+MAX_READS_PER_WAKEUP = 16
+
+# Seconds of reading and decoding per readiness notification, the rest waits in the kernel
+READ_BUDGET = 0.004
+
+# Seconds close() keeps trying to flush queued messages before dropping them
+CLOSE_TIMEOUT = 1
+
+# Seconds a connection attempt may take
+CONNECT_TIMEOUT = 5
+
+
+# Connection to the chat server driven by the Qt event loop.
+# The socket is non-blocking and only touched when QSocketNotifier reports it
+# readable or writable, so an idle client never wakes up. Connections opened with
+# connect_to() reconnect on their own when the link drops: chat messages stay
+# queued while offline and every room is rejoined once the link is back.
+# Given several servers, the connection probes them all and connects to the fastest,
+# moving on to the next one when a connect fails. Servers that answer pings are pinged
+# on a timer, which measures the round trip and drops a link that stopped answering.
+# Long messages go out as chunked streams when the server takes them, fed to the socket
+# a window at a time, and their progress comes through message_received as RoomEvents.
+# Given a TlsClient, each link runs TLS and resumes the session of the previous link to
+# the same server, so a reconnect skips the full handshake.
+class QtConnection(QObject):
+
+    # Signal carrying each pushed server message (room lists, chat, shutdown)
+    message_received = pyqtSignal(object)
+
+    # Signal emitted once the connection has ended for good
+    connection_closed = pyqtSignal()
+
+    # Signal emitted when the send queue fills up (True) and drains again (False)
+    backpressure_changed = pyqtSignal(bool)
+
+    # Signal emitted when the link to the server comes up (True) or drops (False)
+    link_changed = pyqtSignal(bool)
+
+    # Signal carrying the room name and reply status of each automatic rejoin after a reconnect
+    rejoin_finished = pyqtSignal(str, str)
+
+    # Signal carrying the ranked results of a server probe from the probing thread
+    probe_finished = pyqtSignal(list)
+
+    # Signal carrying the smoothed round trip time in seconds after each pong
+    rtt_changed = pyqtSignal(float)
+
+    # Signal carrying the number of chat messages held back by the rate limit whenever it changes
+    chat_pending_changed = pyqtSignal(int)
+
+    def __init__(self, sock=None, framed=True, parent=None, address=None, reconnect=None, capabilities=CAPABILITIES,
+                 tls=None):
+        super().__init__(parent)
+        self.session = ClientSession(framed, capabilities)
+
+        # Optional TlsClient every link is wrapped with
+        self.tls = tls
+
+        # Decoded messages wait here so a burst never holds up reading the socket
+        self.inbox = Inbox(self.deliver, self)
+
+        # Messages accepted by write() that the kernel has not taken yet
+        self.outgoing = SendQueue()
+        self.throttled = False
+
+        # Optional WireRecorder logging every byte sent and received
+        self.recorder = None
+
+        # Chat messages waiting for the rate limit, and the timer letting the next ones out
+        self.pacer = ChatPacer()
+        self.pace_timer = QTimer(self)
+        self.pace_timer.setSingleShot(True)
+        self.pace_timer.timeout.connect(self.release_chat)
+
+        # Streamed messages cut off by a dropped link, as (room name, text), sent again once the rooms are rejoined
+        self.restarts = []
+
+        # Servers to connect and reconnect to, one (host, port) address or a list of them,
+        # and the delay policy between attempts
+        addresses = [] if address is None else [address] if isinstance(address, tuple) else address
+        self.pool = EndpointPool([Endpoint(*address) for address in addresses])
+        self.reconnect = address is not None if reconnect is None else reconnect
+        self.connect_timeout = CONNECT_TIMEOUT
+        self.backoff = Backoff()
+        self.probing = False
+        self.probe_finished.connect(self.use_probe)
+
+        # Chat messages held back after a reconnect until the rooms have been rejoined
+        self.held = None
+        self.awaiting_hello = False
+        self.rejoining = 0
+        self.rejoined = False
+
+        # Rooms joined before the current link came up, rooms entered on it need no rejoin
+        self.rejoin_rooms = []
+
+        # Socket and readiness notifiers of the current link
+        self.sock = None
+        self.read_notifier = None
+        self.write_notifier = None
+        self.connecting = False
+        self.handshaking = False
+        self.online = False
+
+        # Single-shot timer armed for the earliest request deadline
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.timeout.connect(self.check_timeouts)
+
+        # Single-shot timers for the next reconnect attempt and a stuck connect
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.start_connect)
+        self.connect_timer = QTimer(self)
+        self.connect_timer.setSingleShot(True)
+        self.connect_timer.timeout.connect(lambda: self.link_lost(TimeoutError("The server did not answer in time")))
+
+        # Single-shot timer for the next ping
+        self.ping_timer = QTimer(self)
+        self.ping_timer.setSingleShot(True)
+        self.ping_timer.timeout.connect(self.send_ping)
+
+        # Single-shot timer giving up on a flush started by close()
+        self.close_timer = QTimer(self)
+        self.close_timer.setSingleShot(True)
+        self.close_timer.timeout.connect(self.shutdown)
+        self.closing = False
+        self.closed = False
+
+        if sock is not None:
+            self.attach(sock)
+            self.online = True
+
+    # Method to open a connection to the server, connecting and reconnecting in the background
+    @classmethod
+    def connect_to(cls, host, port, framed=True, timeout=CONNECT_TIMEOUT, parent=None, reconnect=True,
+                   capabilities=CAPABILITIES, tls=None):
+        return cls.connect_to_any([(host, port)], framed, timeout, parent, reconnect, capabilities, tls)
+
+    # Method to open a connection to the fastest of several servers, failing over to the others
+    @classmethod
+    def connect_to_any(cls, addresses, framed=True, timeout=CONNECT_TIMEOUT, parent=None, reconnect=True,
+                       capabilities=CAPABILITIES, tls=None):
+        connection = cls(None, framed, parent, list(addresses), reconnect, capabilities, tls)
+        connection.connect_timeout = timeout
+        connection.start_connect()
+        return connection
+
+    # Property with the address of the server connected or being connected to
+    @property
+    def address(self):
+        return self.pool.current() if self.pool.endpoints else None
+
+    # Method to create a room, callback receives the reply status
+    def create_room(self, room_name, username, password="", max_users=2, callback=None, timeout=REQUEST_TIMEOUT):
+        request, data = self.session.create_room(room_name, username, password, max_users, timeout)
+        return self.start_request(request, data, callback)
+
+    # Method to join a room, callback receives the reply status
+    def join_room(self, room_name, username, password="", callback=None, timeout=REQUEST_TIMEOUT):
+        request, data = self.session.join_room(room_name, username, password, timeout)
+        return self.start_request(request, data, callback)
+
+    # Method to send a chat message to a room, the only one when no name is given.
+    # It waits for the rate limit if needed, returns False if too many messages are waiting.
+    # A message that will be streamed waits whole instead of split.
+    def send(self, text, room_name=None):
+        joined = self.session.require_room(room_name)
+        if not self.pacer.push(joined.name, text, not self.session.can_stream(len(text.encode()))):
+            return False
+        self.release_chat()
+        return True
+
+    # Slot writing the chat messages the rate limit lets out and arming the timer for the rest
+    def release_chat(self):
+        if self.closed or self.closing:
+            return
+        before = self.pacer.batched
+        for room_name, text in self.pacer.release():
+            self.write_chat(room_name, text)
+        CHAT_BATCHED.inc(self.pacer.batched - before)
+        deadline = self.pacer.next_deadline()
+        if deadline is not None:
+            self.pace_timer.start(max(1, int((deadline - time.monotonic()) * 1000)))
+        self.chat_pending_changed.emit(len(self.pacer))
+
+    # Method to write one chat message, rooms left while it waited are skipped. A long
+    # message is streamed while the link is up and the server takes streams, otherwise
+    # it goes out split into plain messages.
+    def write_chat(self, room_name, text):
+        if not self.session.in_room(room_name):
+            return
+        if self.online and self.held is None and self.session.can_stream(len(text.encode())):
+            transfer, data = self.session.start_transfer(text, room_name)
+            CHAT_STREAMED.inc()
+            self.write(data)
+            self.report_upload(transfer)
+            return
+        for data in self.plain_chat(room_name, text):
+            self.write(data, droppable=True)
+
+    # Method to encode a chat message as plain messages no longer than the rate limit's batches
+    def plain_chat(self, room_name, text):
+        return [self.session.send_message(piece, room_name) for piece in split_message(text, self.pacer.batch_bytes)]
+
+    # Method to take the chat not sent yet for a room, or every room: streams cut short,
+    # which the server drops when the room is left, and messages waiting for the rate limit
+    def unsent_chat(self, room_name=None):
+        chat = [(transfer.room_name, transfer.text()) for transfer in self.session.uploads.cancel(room_name)]
+        chat += self.pacer.drain(room_name)
+        self.chat_pending_changed.emit(len(self.pacer))
+        return chat
+
+    # Method to report how far a streamed message got
+    def report_upload(self, transfer, failed=False):
+        self.message_received.emit(RoomEvent(transfer.room_name, transfer.progress(failed)))
+
+    # Method to feed the chunks of the running streams to the send queue, keeping at most
+    # SEND_WINDOW bytes queued so other messages get through in between
+    def pump_transfers(self):
+        while len(self.outgoing) < SEND_WINDOW:
+            item = self.session.next_chunk()
+            if item is None:
+                return
+            transfer, data = item
+            self.outgoing.push(data)
+            self.report_upload(transfer)
+
+    # Method to leave a room, the last room left returns the connection to the lobby.
+    # Messages still waiting for the room are sent first, as plain messages.
+    def leave(self, room_name=None):
+        joined = self.session.require_room(room_name)
+        for name, text in self.unsent_chat(joined.name):
+            for data in self.plain_chat(name, text):
+                self.write(data, droppable=True)
+        self.write(self.session.leave_room(joined.name))
+
+    # Method to request the next page of the room list, returns whether a request went out.
+    # The page arrives through message_received, nothing is asked for while offline.
+    def fetch_rooms(self, count=PAGE_SIZE):
+        if not self.online or self.connecting:
+            return False
+        data = self.session.next_page(count)
+        if data is None:
+            return False
+        self.write(data)
+        return True
+
+    # Method to send a request without waiting, its callback runs on reply or timeout
+    def start_request(self, request, data, callback):
+        request.callback = callback
+
+        # Requests are not kept while offline, the caller learns that on the next pass
+        if not self.online:
+            self.session.requests.remove(request)
+            QTimer.singleShot(0, lambda: self.complete(request, DISCONNECTED))
+            return request
+        self.write(data)
+        self.schedule_timeout()
+        return request
+
+    # Method to arm the timeout timer for the earliest outstanding deadline
+    def schedule_timeout(self):
+        deadline = self.session.requests.next_deadline()
+        if deadline is None:
+            self.timeout_timer.stop()
+        else:
+            self.timeout_timer.start(max(0, int((deadline - time.monotonic()) * 1000) + 1))
+
+    # Slot called when a request deadline passes
+    def check_timeouts(self):
+        for request in self.session.requests.expire():
+            self.complete(request, TIMEOUT)
+        self.schedule_timeout()
+
+    # Method to deliver a reply to the matching request
+    def handle_response(self, response):
+        request = response.request
+        if request.expired:
+
+            # The server accepted a request we gave up on, leave that room again
+            if response.status in SUCCESS_STATUSES and not (self.closed or self.closing):
+                self.write(self.session.abandon(request))
+            return
+        self.complete(request, response.status)
+        self.schedule_timeout()
+
+    # Method to run a request's completion callback, recording its round trip
+    def complete(self, request, status):
+        if status in (TIMEOUT, DISCONNECTED):
+            REQUEST_FAILURES.inc()
+        else:
+            REQUEST_SECONDS.observe(time.monotonic() - request.started)
+        if request.callback is not None:
+            request.callback(status)
+
+    # Method to queue a message for the server, returns False if the send queue dropped it.
+    # Writing waits for the next event loop pass, so messages queued together share one send().
+    # While offline only chat messages are kept, everything else is rebuilt after reconnecting.
+    def write(self, data, droppable=False):
+        if self.closed or self.closing:
+            raise ConnectionError("Not connected")
+        if not self.online and not droppable:
+            return False
+        if droppable and self.held is not None:
+            self.held.append(data)
+            return True
+        accepted = self.outgoing.push(data, droppable)
+        self.update_backpressure()
+        if self.online:
+            self.write_notifier.setEnabled(True)
+        return accepted
+
+    # Slot called when the socket can accept more data, or when a connect attempt finished
+    def write_ready(self):
+        if self.handshaking:
+            self.continue_handshake()
+            return
+        if self.connecting:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.link_lost(OSError(error, os.strerror(error)))
+                return
+            if self.tls is not None:
+                self.start_handshake()
+                return
+            self.link_up()
+        try:
+            self.pump_transfers()
+            while self.outgoing:
+                data = self.outgoing.next_write()
+                sent = self.sock.send(data)
+                self.outgoing.advance(sent)
+                BYTES_SENT.inc(sent)
+                if self.recorder is not None:
+                    self.recorder.sent(bytes(data[:sent]))
+                self.pump_transfers()
+        except WOULD_BLOCK:
+            pass
+        except OSError as e:
+            self.handle_error(e)
+            return
+        self.update_backpressure()
+        self.write_notifier.setEnabled(bool(self.outgoing))
+        if self.closing and not self.outgoing:
+            self.finish_close()
+
+    # Method to report the send queue crossing its high or low water mark
+    def update_backpressure(self):
+        if self.outgoing.throttled != self.throttled:
+            self.throttled = self.outgoing.throttled
+            self.backpressure_changed.emit(self.throttled)
+
+    # Slot called when the socket has data to read
+    def read_ready(self):
+        if self.handshaking:
+            self.continue_handshake()
+            return
+        deadline = time.perf_counter() + READ_BUDGET
+        try:
+            for _ in range(MAX_READS_PER_WAKEUP):
+                data = self.sock.recv(READ_SIZE)
+                if not data:
+                    self.link_lost(None)
+                    return
+                BYTES_RECEIVED.inc(len(data))
+                if self.recorder is not None:
+                    self.recorder.received(data)
+                started = time.perf_counter()
+                messages = self.session.receive(data)
+                PARSE_SECONDS.observe(time.perf_counter() - started)
+                FRAMES_RECEIVED.inc(len(messages))
+                for message in messages:
+                    self.inbox.post(message)
+                if self.session.resync_needed:
+                    self.write(self.session.resync())
+                if self.awaiting_hello and self.session.hello_received:
+                    if self.tls is not None:
+                        self.tls.save(self.sock, self.address)
+                    self.connect_timer.stop()
+                    self.backoff.reset()
+                    self.pool.connected()
+                    self.resume_room()
+                    if self.session.start_heartbeat():
+                        self.schedule_ping()
+                if self.closed or self.closing:
+                    return
+                if time.perf_counter() >= deadline:
+                    break
+        except WOULD_BLOCK:
+            return
+        except (OSError, ProtocolError) as e:
+            self.handle_error(e)
+            return
+
+        # TLS keeps the rest of a record it decrypted, which the read notifier does not see
+        if self.tls is not None and self.sock.pending():
+            QTimer.singleShot(0, self.read_pending)
+
+    # Slot reading what TLS still holds after the read budget ran out
+    def read_pending(self):
+        if self.sock is not None and self.read_notifier.isEnabled():
+            self.read_ready()
+
+    # Method to hand one message from the inbox to its reply callback or to listeners.
+    # A stream the server refused or cut off is sent again as plain messages.
+    def deliver(self, message):
+        if isinstance(message, Response):
+            self.handle_response(message)
+        elif isinstance(message, UploadAbort):
+            transfer = self.session.uploads.cancel_id(message.transfer_id)
+            if transfer is not None and not (self.closed or self.closing):
+                self.report_upload(transfer, failed=True)
+                if self.session.in_room(transfer.room_name):
+                    for data in self.plain_chat(transfer.room_name, transfer.text()):
+                        self.write(data, droppable=True)
+        elif isinstance(message, RoundTrip):
+            PING_SECONDS.observe(message.rtt)
+            self.rtt_changed.emit(message.srtt)
+        else:
+            self.message_received.emit(message)
+
+    # Method to report a socket error and drop the link
+    def handle_error(self, error):
+        self.link_lost(error)
+
+    # Method to start a non-blocking connect to the current server, probing the servers first when due
+    def start_connect(self):
+        if self.closed or self.closing or self.probing:
+            return
+        if self.pool.needs_probe():
+            self.start_probe()
+            return
+        try:
+            sock = open_socket(self.address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            enable_keepalive(sock, self.session.heartbeat.interval, self.session.heartbeat.max_missed)
+        except OSError as e:
+            self.link_lost(e)
+            return
+        self.attach(sock, connecting=True)
+        self.connect_timer.start(int(self.connect_timeout * 1000))
+
+    # Method to probe every server on a background thread, the result comes back through probe_finished
+    def start_probe(self):
+        self.probing = True
+        endpoints = list(self.pool.endpoints)
+        timeout = self.connect_timeout
+        tls = self.tls
+        threading.Thread(
+            target=lambda: self.probe_finished.emit(probe_endpoints(endpoints, timeout, tls=tls)), name="probe", daemon=True
+        ).start()
+
+    # Slot connecting to the fastest server that answered the probe
+    def use_probe(self, probes):
+        self.probing = False
+        if self.closed or self.closing:
+            return
+        for probe in probes:
+            if probe.latency is not None or probe.error is not None:
+                print("Server", describe(probe))
+        if probes[0].latency is None:
+            self.link_lost(ConnectionError("No server answered"))
+            return
+        self.pool.update(probes)
+        self.start_connect()
+
+    # Method to take over a socket and watch it with readiness notifiers.
+    # While connecting only the write notifier runs, it fires once the connect completes.
+    def attach(self, sock, connecting=False):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.connecting = connecting
+        self.read_notifier = QSocketNotifier(sock.fileno(), QSocketNotifier.Read, self)
+        self.read_notifier.activated.connect(self.read_ready)
+        self.read_notifier.setEnabled(not connecting)
+        self.write_notifier = QSocketNotifier(sock.fileno(), QSocketNotifier.Write, self)
+        self.write_notifier.activated.connect(self.write_ready)
+        self.write_notifier.setEnabled(connecting or bool(self.outgoing))
+
+    # Method to wrap a connected socket in TLS and start the handshake. The notifiers keep
+    # watching it, the wrapped socket takes over the same file descriptor.
+    def start_handshake(self):
+        self.connecting = False
+        self.handshaking = True
+        try:
+            self.sock = self.tls.wrap(self.sock, self.address)
+        except (OSError, ValueError) as e:
+            self.link_lost(e)
+            return
+        self.continue_handshake()
+
+    # Method to advance the handshake, waiting for whichever readiness it needs next
+    def continue_handshake(self):
+        try:
+            step = self.tls.handshake(self.sock)
+        except OSError as e:
+            self.link_lost(e)
+            return
+        if step is not None:
+            self.read_notifier.setEnabled(step == "read")
+            self.write_notifier.setEnabled(step == "write")
+            return
+        self.handshaking = False
+        TLS_HANDSHAKES.inc()
+        if self.sock.session_reused:
+            TLS_RESUMED.inc()
+        self.link_up()
+
+    # Method to stop the notifiers and close the socket of the current link
+    def detach(self):
+        if self.sock is None:
+            return
+        for notifier in (self.read_notifier, self.write_notifier):
+            notifier.setEnabled(False)
+            notifier.deleteLater()
+        self.read_notifier = self.write_notifier = None
+        self.sock.close()
+        self.sock = None
+        self.connecting = False
+        self.handshaking = False
+
+    # Method called once a connect attempt succeeded
+    def link_up(self):
+        self.connecting = False
+        self.online = True
+        self.read_notifier.setEnabled(True)
+
+        # Chat typed while offline waits for the rejoin, which waits for the HELLO reply.
+        # A server that accepted the connect but does not answer HELLO in time is given up on.
+        self.connect_timer.start(int(self.connect_timeout * 1000))
+        self.session.reset_stream()
+        if self.recorder is not None:
+            self.recorder.connected(format_endpoint(self.address))
+        self.held = self.outgoing.take()
+        self.rejoin_rooms = list(self.session.joined)
+        self.awaiting_hello = True
+        self.write(self.session.hello())
+        if self.tls is not None:
+            print(f"Connected to the server at {format_endpoint(self.address)} ({self.tls.describe(self.sock)}).")
+        else:
+            print(f"Connected to the server at {format_endpoint(self.address)}.")
+        self.link_changed.emit(True)
+
+    # Method to arm the ping timer for the heartbeat's next deadline
+    def schedule_ping(self):
+        deadline = self.session.heartbeat.next_deadline()
+        if deadline is not None:
+            self.ping_timer.start(max(0, int((deadline - time.monotonic()) * 1000)))
+
+    # Slot sending the next ping, or dropping the link when the server stopped answering
+    def send_ping(self):
+        if not self.online or self.closing:
+            return
+        heartbeat = self.session.heartbeat
+        if heartbeat.dead():
+            PINGS_MISSED.inc(len(heartbeat.sent))
+            self.link_lost(TimeoutError(f"No answer to the last {len(heartbeat.sent)} pings"))
+            return
+        self.write(self.session.ping())
+        self.schedule_ping()
+
+    # Method to rejoin every room once the server's features are known
+    def resume_room(self):
+        self.awaiting_hello = False
+        rooms = [room_name for room_name in self.rejoin_rooms if room_name in self.session.joined]
+        if not rooms:
+            self.release_held(True)
+            return
+        self.rejoining = len(rooms)
+        self.rejoined = False
+        for room_name in rooms:
+            request, data = self.session.rejoin_room(room_name)
+            self.start_request(request, data, lambda status, room_name=room_name: self.rejoin_done(room_name, status))
+
+    # Callback receiving the reply to one automatic rejoin, a dropped link retries it on the next reconnect.
+    # Held chat is sent once every rejoin has finished, unless no room could be rejoined.
+    def rejoin_done(self, room_name, status):
+        if status == DISCONNECTED:
+            return
+        if status in SUCCESS_STATUSES:
+            self.rejoined = True
+        else:
+            self.session.forget_room(room_name)
+        self.rejoining -= 1
+        if self.rejoining == 0:
+            self.release_held(self.rejoined)
+        self.rejoin_finished.emit(room_name, status)
+
+    # Method to send the chat held during a rejoin, or drop it when the room is gone.
+    # Streams cut off by the drop start over first, they were sent before the held chat.
+    def release_held(self, send):
+        held, self.held = self.held or [], None
+        restarts, self.restarts = self.restarts, []
+        if send:
+            for room_name, text in restarts:
+                self.write_chat(room_name, text)
+            for data in held:
+                self.outgoing.push(data, True)
+        self.update_backpressure()
+        if self.online and self.outgoing:
+            self.write_notifier.setEnabled(True)
+
+    # Method to handle a dropped link or failed connect, retrying after a backoff delay
+    def link_lost(self, error):
+        if error is not None:
+            print("Connection error:", error)
+        if not self.reconnect or self.closing or self.session.server_closed:
+            self.shutdown()
+            return
+        self.detach()
+        self.connect_timer.stop()
+        self.timeout_timer.stop()
+        self.ping_timer.stop()
+
+        # Replies already received complete their requests, the rest fail
+        self.inbox.flush()
+        for request in self.session.requests.fail_all():
+            self.complete(request, DISCONNECTED)
+        if self.closed:
+            return
+
+        # Only chat messages survive, requests and control messages are rebuilt on reconnect
+        for data in self.outgoing.take(droppable_only=True) + (self.held or []):
+            self.outgoing.push(data, True)
+        self.held = None
+        self.awaiting_hello = False
+        self.update_backpressure()
+
+        # Streams cut off by the drop start over once their rooms are rejoined
+        for transfer in self.session.uploads.cancel():
+            self.restarts.append((transfer.room_name, transfer.text()))
+            self.report_upload(transfer, failed=True)
+
+        # A failed connect moves straight on to the next server. A dropped link, or a
+        # round in which every server failed, backs off and probes the servers again.
+        if self.online:
+            self.pool.stale = True
+        if not self.pool.stale and self.pool.failed():
+            delay = 0
+        else:
+            delay = self.backoff.next_delay()
+        if self.online:
+            self.online = False
+            self.link_changed.emit(False)
+        if delay:
+            print(f"Reconnecting in {delay:.2f} s")
+        else:
+            print(f"Trying {format_endpoint(self.address)}")
+        self.retry_timer.start(int(delay * 1000))
+
+    # Method to queue the disconnect message and close once everything queued is sent.
+    # It never blocks: connection_closed is emitted when the flush ends or the timeout passes.
+    def close(self, timeout=CLOSE_TIMEOUT):
+        if self.closed or self.closing:
+            return
+        if not self.online:
+            self.shutdown()
+            return
+        for room_name, text in self.unsent_chat():
+            if self.session.in_room(room_name):
+                for data in self.plain_chat(room_name, text):
+                    self.outgoing.push(data, True)
+        if self.session.in_room():
+            self.outgoing.push(self.session.leave_all())
+        self.outgoing.push(self.session.disconnect())
+        self.closing = True
+        self.read_notifier.setEnabled(False)
+        self.close_timer.start(int(timeout * 1000))
+        self.write_ready()
+
+    # Method to end the connection after the final flush. Unread input is discarded
+    # first, closing a socket with unread data would reset the connection and lose
+    # the bytes still in flight.
+    def finish_close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+            while self.sock.recv(READ_SIZE):
+                pass
+        except OSError:
+            pass
+        self.shutdown()
+
+    # Method to stop the notifiers and release the socket for good
+    def shutdown(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.online = False
+        self.detach()
+        self.timeout_timer.stop()
+        self.retry_timer.stop()
+        self.connect_timer.stop()
+        self.ping_timer.stop()
+        self.pace_timer.stop()
+        self.close_timer.stop()
+        self.outgoing.clear()
+        self.restarts.clear()
+
+        # Replies already received still complete their requests before the rest fail
+        self.inbox.flush()
+        for request in self.session.requests.fail_all():
+            self.complete(request, DISCONNECTED)
+        self.connection_closed.emit()
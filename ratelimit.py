@@ -0,0 +1,153 @@
+# Imports
+import time
+from collections import deque
+
+# Chat messages per second once the burst is spent, 0 turns the limit off
+RATE = 5
+
+# Messages that may go out back to back before the rate applies
+BURST = 10
+
+# Most lines and bytes of text sent as one message, longer pastes are split and queued messages
+# are merged up to these sizes (BATCH_LINES = 1 turns merging off)
+BATCH_LINES = 50
+BATCH_BYTES = 4096
+
+# Messages that may wait for the limit before new ones are refused
+MAX_PENDING = 1000
+
+
+# Token bucket holding up to burst tokens and gaining rate tokens per second. Each message spends one.
+class TokenBucket:
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    # Method to add the tokens gained since the last update
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Method to spend a token, returns False when none is left
+    def take(self, now=None):
+        if self.rate <= 0:
+            return True
+        self.refill(time.monotonic() if now is None else now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    # Method to get the time the next token is available
+    def next_token(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.rate <= 0:
+            return now
+        self.refill(now)
+        return now + max(0.0, (1 - self.tokens) / self.rate)
+
+
+# Function to split text into messages of at most max_bytes UTF-8 bytes, between lines where possible
+def split_message(text, max_bytes=BATCH_BYTES):
+    pieces, current, size = [], [], 0
+    for line in text.split("\n"):
+        encoded = len(line.encode())
+
+        # A line too long for one message is cut, at a character boundary
+        while encoded > max_bytes:
+            head = line.encode()[:max_bytes].decode("utf-8", "ignore")
+            if current:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            pieces.append(head)
+            line = line[len(head):]
+            encoded = len(line.encode())
+        if current and size + 1 + encoded > max_bytes:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        size += encoded + (1 if current else 0)
+        current.append(line)
+    pieces.append("\n".join(current))
+    return pieces
+
+
+# Outbound chat messages waiting for the rate limit. Messages leave in order and each one
+# spends a token. Messages for the same room that queued up together leave as one
+# multi-line message, so a paste or a burst costs the server one broadcast instead of
+# one per line. The owner arms a timer for next_deadline() and calls release().
+class ChatPacer:
+    def __init__(self, rate=RATE, burst=BURST, batch_lines=BATCH_LINES, batch_bytes=BATCH_BYTES, limit=MAX_PENDING):
+        self.bucket = TokenBucket(rate, burst)
+        self.batch_lines = batch_lines
+        self.batch_bytes = batch_bytes
+        self.limit = limit
+
+        # Messages waiting as (room name, text)
+        self.queue = deque()
+
+        # Counters: messages let out, and messages merged into another one
+        self.released = 0
+        self.batched = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    # Method to count the messages waiting for one room, or for all of them
+    def pending(self, room_name=None):
+        if room_name is None:
+            return len(self.queue)
+        return sum(1 for queued_room, _ in self.queue if queued_room == room_name)
+
+    # Method to queue a message, split when it is too long unless it will be streamed.
+    # Returns False if the queue is full.
+    def push(self, room_name, text, split=True):
+        pieces = split_message(text, self.batch_bytes) if split else [text]
+        if len(self.queue) + len(pieces) > self.limit:
+            return False
+        self.queue.extend((room_name, piece) for piece in pieces)
+        return True
+
+    # Method to take the messages the limit lets out now, as (room name, text) in order
+    def release(self, now=None):
+        released = []
+        while self.queue and self.bucket.take(now):
+            released.append(self.next_batch())
+        return released
+
+    # Method to take every waiting message of a room, or of all rooms, regardless of the limit.
+    # Used when a room is left or the connection closes, so nothing typed is lost.
+    def drain(self, room_name=None):
+        kept = deque()
+        if room_name is not None:
+            kept.extend(item for item in self.queue if item[0] != room_name)
+            self.queue = deque(item for item in self.queue if item[0] == room_name)
+        drained = []
+        while self.queue:
+            drained.append(self.next_batch())
+        self.queue = kept
+        return drained
+
+    # Method to take the oldest message merged with the ones behind it for the same room
+    def next_batch(self):
+        room_name, text = self.queue.popleft()
+        lines = text.count("\n") + 1
+        size = len(text.encode())
+        while self.queue and self.queue[0][0] == room_name:
+            following = self.queue[0][1]
+            following_lines = following.count("\n") + 1
+            following_size = len(following.encode())
+            if lines + following_lines > self.batch_lines or size + 1 + following_size > self.batch_bytes:
+                break
+            self.queue.popleft()
+            text += "\n" + following
+            lines += following_lines
+            size += 1 + following_size
+            self.batched += 1
+        self.released += 1
+        return room_name, text
+
+    # Method to get the time the next waiting message may leave, None when nothing waits
+    def next_deadline(self, now=None):
+        return self.bucket.next_token(now) if self.queue else None
@@ -0,0 +1,89 @@
+# Imports
+import gzip, struct, time, zlib
+from collections import namedtuple
+
+# First bytes of a recording, after decompression
+MAGIC = b"CWREC1\n"
+
+# Record header: kind, seconds since the recording started, data length (network byte order)
+RECORD_HEADER = struct.Struct("!BdI")
+
+# Record kinds: bytes as one recv() returned them, bytes one send() took, and a new
+# connection to the server named in the data
+RECEIVED = 0
+SENT = 1
+CONNECTED = 2
+
+# Seconds between flushes of the file, so a crash loses little of the recording
+FLUSH_INTERVAL = 1
+
+# One record of a recording
+Record = namedtuple("Record", "time kind data")
+
+
+# Recorder of the bytes a client exchanges with its servers. Data is stored exactly as
+# the socket calls moved it, with monotonic timestamps, so a replay reproduces the read
+# sizes and bursts of the original traffic. The file is gzip compressed at a low level,
+# which keeps recording cheap and shrinks the chat text several times.
+class WireRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "wb", compresslevel=1)
+        self.file.write(MAGIC)
+        self.started = time.monotonic()
+        self.flushed = self.started
+
+        # Counters
+        self.records = 0
+        self.bytes = 0
+
+    # Method to append one record
+    def record(self, kind, data, now=None):
+        if self.file is None:
+            return
+        now = time.monotonic() if now is None else now
+        self.file.write(RECORD_HEADER.pack(kind, now - self.started, len(data)))
+        self.file.write(data)
+        self.records += 1
+        self.bytes += len(data)
+        if now - self.flushed >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.flushed = now
+
+    # Methods recording each kind of event
+    def received(self, data):
+        self.record(RECEIVED, data)
+
+    def sent(self, data):
+        self.record(SENT, data)
+
+    def connected(self, address):
+        self.record(CONNECTED, address.encode())
+
+    # Method to finish the file
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# Function to read a recording. A file cut short by a crash yields the complete
+# records before the cut.
+def read_recording(path):
+    records = []
+    with gzip.open(path, "rb") as file:
+        try:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a wire recording")
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                kind, timestamp, length = RECORD_HEADER.unpack(header)
+                data = file.read(length)
+                if len(data) < length:
+                    break
+                records.append(Record(timestamp, kind, data))
+        except (EOFError, zlib.error):
+            pass
+    return records
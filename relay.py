@@ -0,0 +1,541 @@
+# Edge relay terminating client connections close to the users
+#
+# Usage: python relay.py --upstream HOST:PORT [--host 0.0.0.0] [--port 2005] [--links 2]
+#
+# Clients connect to the relay exactly as they would to the server. The relay brings
+# their users into the upstream server's rooms over a small pool of connections, each
+# room always on the same one, with the mux and relay features: the server sees every
+# user as a member of its room, but sends each broadcast once per relay, and the relay
+# hands it to its users in the room. The room list is kept from the first link's
+# snapshot and deltas, so a client is greeted, paged and sent deltas from the relay's
+# copy without a round trip upstream. Pings are answered locally too.
+# The upstream server must support mux and relay (server.py does, the C++ server does
+# not). The relay does not offer resume: a client that reconnects joins again, and
+# clients in rooms on a link that drops are disconnected to do so once it is back.
+# Type SHUTDOWN (or press Ctrl+C) to notify clients and stop.
+
+# Imports
+import argparse, asyncio, signal, zlib
+from collections import deque
+from protocol import (
+    FrameDecoder,
+    ProtocolError,
+    Room,
+    RoomList,
+    RoomAdded,
+    RoomRemoved,
+    RoomUsers,
+    RoomMessage,
+    Reply,
+    Hello,
+    Channel,
+    ChannelMessage,
+    ChatMessage,
+    ServerShutdown,
+    encode,
+    encode_message,
+    hello_command,
+    create_room_command,
+    join_room_command,
+    disconnect_room_command,
+    with_request_id,
+)
+from session import IDS, RequestTracker, SUCCESS_STATUSES
+from backoff import Backoff
+from heartbeat import enable_keepalive
+from endpoints import parse_endpoint, format_endpoint
+from server import ChatServer, ClientConnection, SUPPORTED_CAPABILITIES, raise_file_limit, watch_console
+
+# Port the relay listens on, next to a local server on 2004
+PORT = 2005
+
+# Upstream connections the users are spread over
+LINKS = 2
+
+# Features the relay asks the upstream server for, mux and relay are required
+UPSTREAM_CAPABILITIES = frozenset({"binary", "deflate", "deltas", "ids", "mux", "relay"})
+REQUIRED_CAPABILITIES = frozenset({"mux", "relay"})
+
+# Features offered to clients: everything but seat resume, which needs the server's history,
+# and streamed messages, which clients then send split into plain messages
+LOCAL_CAPABILITIES = SUPPORTED_CAPABILITIES - {"chunks", "relay", "resume"}
+
+# Seconds to wait for the upstream room list before clients are accepted anyway
+STARTUP_WAIT = 5
+
+
+# Upstream room as the relay knows it: its room list record and the relay's users in it
+class RelayRoom:
+    def __init__(self, record):
+        self.name = record.name
+        self.room = record
+        self.members = {}
+
+        # Channel the upstream link tags the room's messages with
+        self.channel = None
+
+    # Method to get the room's record for the room list
+    def record(self):
+        return self.room
+
+    # Method to hand a message to every local user in the room except the excluded one,
+    # each encoding is built once. Returns the number of users it went to.
+    def deliver(self, message, excluded=None):
+        encoded = {}
+        delivered = 0
+        for name, connection in self.members.items():
+            if name != excluded:
+                connection.write_room(self, connection.encode(message, encoded))
+                delivered += 1
+        return delivered
+
+
+# One upstream connection carrying the users of the rooms assigned to it. It reconnects
+# with backoff when it drops, the first link of the pool also keeps the room list.
+class UpstreamLink(asyncio.Protocol):
+    def __init__(self, relay, endpoint, lobby=False):
+        self.relay = relay
+        self.endpoint = endpoint
+        self.lobby = lobby
+        self.transport = None
+        self.decoder = FrameDecoder()
+        self.capabilities = frozenset()
+        self.backoff = Backoff()
+
+        # Set once the server agreed to relaying, cleared when the connection drops
+        self.ready = False
+
+        # Set when the relay shuts down, the link is then not reconnected
+        self.closing = False
+
+        # Create/join requests waiting for their reply
+        self.requests = RequestTracker()
+
+        # Rooms with local users by name, and by channel
+        self.rooms = {}
+        self.channels = {}
+
+        # Counters: room messages received, and bytes in each direction
+        self.messages = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+        # Handlers for each upstream message type
+        self.handlers = {
+            Hello: self.apply_hello,
+            RoomList: self.apply_room_change,
+            RoomAdded: self.apply_room_change,
+            RoomRemoved: self.apply_room_change,
+            RoomUsers: self.apply_room_change,
+            Reply: self.apply_reply,
+            Channel: self.apply_channel,
+            ChannelMessage: self.apply_channel_message,
+            ServerShutdown: self.apply_shutdown,
+        }
+
+    # Method to connect, retrying with backoff until it succeeds or the relay shuts down
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        while not self.closing:
+            try:
+                await loop.create_connection(lambda: self, self.endpoint.host, self.endpoint.port)
+                return
+            except OSError as e:
+                delay = self.backoff.next_delay()
+                print(f"Upstream {format_endpoint(self.endpoint)} unreachable ({e}), retrying in {delay:.1f} s")
+                await asyncio.sleep(delay)
+
+    # Protocol interface: offer the relay features on a new connection
+    def connection_made(self, transport):
+        self.transport = transport
+        self.decoder = FrameDecoder()
+        self.capabilities = frozenset()
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            enable_keepalive(sock)
+        self.write(encode(hello_command(UPSTREAM_CAPABILITIES)))
+
+    # Protocol interface: handle every complete upstream message
+    def data_received(self, data):
+        self.bytes_received += len(data)
+        try:
+            messages = self.decoder.feed(data)
+        except ProtocolError as e:
+            print("Dropping upstream link:", e)
+            self.transport.close()
+            return
+        for message in messages:
+            handler = self.handlers.get(type(message))
+            if handler is not None:
+                handler(message)
+
+    # Protocol interface: fail what waited on the link and reconnect. The users in its
+    # rooms are no longer members upstream, so their clients are disconnected to rejoin.
+    def connection_lost(self, error):
+        self.transport = None
+        self.ready = False
+        for request in self.requests.fail_all():
+            request.callback(None)
+        rooms, self.rooms = self.rooms, {}
+        self.channels.clear()
+        for room in rooms.values():
+            room.channel = None
+            for connection in list(room.members.values()):
+                connection.transport.close()
+        if not self.closing:
+            print(f"Lost upstream {format_endpoint(self.endpoint)}, reconnecting")
+            asyncio.ensure_future(self.reconnect())
+
+    # Coroutine waiting out the backoff before connecting again
+    async def reconnect(self):
+        await asyncio.sleep(self.backoff.next_delay())
+        await self.connect()
+
+    # Method to write bytes upstream while connected
+    def write(self, data):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data)
+            self.bytes_sent += len(data)
+
+    # Method to send one command, compressed once the server agreed to it
+    def send(self, text):
+        self.write(encode(text, True, "deflate" in self.capabilities))
+
+    # Method to send a user's chat message to a room, binary once the server agreed to it
+    def send_message(self, room_name, text, sender):
+        self.write(encode_message(
+            RoomMessage(room_name, text, sender), True, "deflate" in self.capabilities, "binary" in self.capabilities))
+
+    # Method to send a create/join request, callback(status) gets the reply, None if the link drops first.
+    # The request is numbered when the server agreed to ids.
+    def request(self, kind, room_name, username, password, command, callback):
+        request = self.requests.begin(kind, room_name, username, password=password)
+        request.callback = callback
+        self.send(with_request_id(command, request.request_id if IDS in self.capabilities else None))
+
+    # Method to get the room a local user entered, tracking it on this link
+    def enter(self, name):
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = self.relay.room_object(name)
+        return room
+
+    # Method to stop tracking a room once its last local user left
+    def forget(self, room):
+        if room.members or self.rooms.get(room.name) is not room:
+            return
+        del self.rooms[room.name]
+        if room.channel is not None:
+            self.channels.pop(room.channel, None)
+            room.channel = None
+
+    # HELLO reply, a server without the relay features cannot take the users
+    def apply_hello(self, message):
+        self.capabilities = message.capabilities
+        if not REQUIRED_CAPABILITIES <= self.capabilities:
+            print(f"Upstream {format_endpoint(self.endpoint)} does not support the mux and relay features")
+            self.relay.stop.set()
+            return
+        self.ready = True
+        self.backoff.reset()
+
+    # Room list snapshot or delta, applied by the link keeping the room list
+    def apply_room_change(self, message):
+        if self.lobby:
+            self.relay.apply_room_change(message)
+
+    # Reply to the request with its id, or to the oldest outstanding request
+    def apply_reply(self, message):
+        request = self.requests.resolve(message.request_id)
+        if request is not None:
+            request.callback(message.status)
+
+    # CHANNEL follows each successful create/join and names the room's channel on this link
+    def apply_channel(self, message):
+        room = self.rooms.get(message.room_name)
+        if room is None:
+            return
+        if room.channel is not None:
+            self.channels.pop(room.channel, None)
+        room.channel = message.channel
+        self.channels[message.channel] = room
+
+    # A room's chat, sent once for all local users. The server left out the sender, so
+    # its own user is skipped here.
+    def apply_channel_message(self, message):
+        room = self.channels.get(message.channel)
+        if room is None or not isinstance(message.message, ChatMessage):
+            return
+        self.messages += 1
+        self.relay.deliveries += room.deliver(message.message, message.message.sender)
+
+    def apply_shutdown(self, message):
+        print(f"Upstream {format_endpoint(self.endpoint)} is shutting down")
+
+    # Method to close the link for good
+    def close(self):
+        self.closing = True
+        if self.transport is not None:
+            self.transport.close()
+
+
+# Relay state shared by the local connections: the room list copy, the upstream links
+# and the rooms local users are in
+class RelayServer(ChatServer):
+    def __init__(self, upstream, links=LINKS):
+        super().__init__()
+        self.upstream = upstream
+        self.links = [UpstreamLink(self, upstream, index == 0) for index in range(max(1, links))]
+
+        # Set once the first room list arrived, and when the relay has to stop
+        self.lobby_ready = asyncio.Event()
+        self.stop = asyncio.Event()
+
+        # Room messages handed to local users
+        self.deliveries = 0
+
+    # Method to get the link carrying a room, the same one for all its users
+    def link_for(self, name):
+        return self.links[zlib.crc32(name.encode()) % len(self.links)]
+
+    # Method to get the relay's object for a room, shared by the room list and its link.
+    # A room entered before the room list showed it starts with a blank record.
+    def room_object(self, name, record=None):
+        room = self.link_for(name).rooms.get(name) or self.rooms.get(name)
+        if room is None:
+            room = RelayRoom(record or Room(name, False, 0, 0))
+        return room
+
+    # Method to apply an upstream room list snapshot or delta and pass it on to the lobby
+    def apply_room_change(self, message):
+        if isinstance(message, RoomList):
+            rooms = {}
+            for record in message.rooms:
+                room = rooms[record.name] = self.room_object(record.name, record)
+                room.room = record
+            self.rooms = rooms
+            self.room_list_changed(None)
+            self.lobby_ready.set()
+            return
+        if isinstance(message, RoomAdded):
+            room = self.rooms[message.room.name] = self.room_object(message.room.name, message.room)
+            room.room = message.room
+        elif isinstance(message, RoomRemoved):
+            self.rooms.pop(message.name, None)
+        else:
+            room = self.rooms.get(message.name)
+            if room is None:
+                return
+            room.room = room.room._replace(current_users=message.current_users)
+        self.room_list_changed(message)
+
+    # Method to take a local user out of a room, upstream as well
+    def leave_room(self, room, username, returning=None):
+        if room.members.pop(username, None) is None:
+            return
+        link = self.link_for(room.name)
+        link.send(disconnect_room_command(room.name, username))
+        link.forget(room)
+
+    # Method to notify every client and close the connections and links
+    def shutdown(self):
+        super().shutdown()
+        for link in self.links:
+            link.close()
+
+
+# One local client connection. Room requests are answered by the upstream server,
+# everything else by the relay. A client's create/join requests are handled one at a
+# time, so a reply the relay gives itself cannot overtake one still upstream and every
+# reply goes out in the order the requests came.
+class RelayConnection(ClientConnection):
+    supported = LOCAL_CAPABILITIES
+
+    def __init__(self, server):
+        super().__init__(server)
+
+        # Create/join requests waiting for the one upstream to be answered, as handler and request text
+        self.queued = deque()
+        self.busy = False
+
+    # CREATE_ROOM;name;password;current;max;username
+    def handle_create_room(self, rest):
+        self.queue_request(self.create_room, rest)
+
+    # JOIN_ROOM;name;password or NO_PASSWORD;username
+    def handle_join_room(self, rest):
+        self.queue_request(self.join_room, rest)
+
+    # REJOIN_ROOM needs the resume feature the relay does not offer, it is handled as a join
+    def handle_rejoin_room(self, rest):
+        self.queue_request(self.rejoin_room, rest)
+
+    # Method to queue a create/join request behind the one waiting upstream
+    def queue_request(self, handler, rest):
+        self.queued.append((handler, rest))
+        self.next_request()
+
+    # Method to handle queued requests until one has to wait for the upstream server
+    def next_request(self):
+        while self.queued and not self.busy and not self.transport.is_closing():
+            handler, rest = self.queued.popleft()
+            handler(rest)
+
+    # Method to create a room upstream, a malformed request is answered with BAD_REQUEST
+    def create_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 5:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        name, password, _, max_users, username = fields
+        try:
+            max_users = int(max_users)
+            command = create_room_command(name, password, max_users, username)
+        except ValueError:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        if name in self.server.rooms:
+            self.reply("ROOM_EXISTS", request_id)
+            return
+        self.forward("CREATE_ROOM", name, username, password, command, request_id)
+
+    # Method to join a room upstream
+    def join_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 3:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        self.join(*fields, request_id)
+
+    # Method to join a room upstream for a rejoin, the last seen sequence number is not needed
+    def rejoin_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 4:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        self.join(*fields[:3], request_id)
+
+    # Method to send a join request up the room's link
+    def join(self, name, password, username, request_id):
+        if self.multiplexed and name in self.memberships:
+            self.reply("EXISTING_USER", request_id)
+            return
+        password = "" if password == "NO_PASSWORD" else password
+        try:
+            command = join_room_command(name, password, username)
+        except ValueError:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        self.forward("JOIN_ROOM", name, username, password, command, request_id)
+
+    # Method to send a create/join request up the room's link. A client whose room is on
+    # a link that is down is disconnected, it retries like after any dropped connection.
+    def forward(self, kind, name, username, password, command, request_id):
+        link = self.server.link_for(name)
+        if not link.ready:
+            print("Upstream link down, dropping client:", self.transport.get_extra_info("peername"))
+            self.transport.close()
+            return
+        self.busy = True
+        link.request(kind, name, username, password, command,
+                     lambda status: self.request_answered(link, name, username, status, request_id))
+
+    # Method to pass the upstream reply on, entering the room on success, then handle the
+    # next queued request. A client gone before the reply came leaves the room again.
+    def request_answered(self, link, name, username, status, request_id):
+        self.busy = False
+        entered = status in SUCCESS_STATUSES
+        if status is None or self.transport.is_closing():
+            if entered:
+                link.send(disconnect_room_command(name, username))
+            self.transport.close()
+            return
+        if entered:
+            self.leave_current_room()
+        self.reply(status, request_id)
+        if entered:
+            room = link.enter(name)
+            room.members[username] = self
+            self.enter(room, username)
+        self.next_request()
+
+    # Method to pass a chat message from the client up to one of its rooms
+    def room_message(self, name, text, sender):
+        membership = self.memberships.get(name)
+        if membership is not None and membership.username == sender:
+            self.server.link_for(name).send_message(name, text, sender)
+
+    # DISCONNECT_ROOM;room;username, the client goes back to the lobby. The relay's
+    # room list answers a client without mux, the delta comes from upstream.
+    def handle_disconnect_room(self, rest):
+        name, _, username = rest.partition(";")
+        membership = self.memberships.get(name)
+        if membership is not None and membership.username == username:
+            self.drop_membership(name, username)
+            self.server.leave_room(membership.room, username)
+        self.server.lobby.add(self)
+        if not self.multiplexed or membership is None:
+            self.write(self.encode(self.room_list()))
+
+
+# Coroutine running the relay until it is told to stop
+async def serve(host, port, upstream, links):
+    loop = asyncio.get_running_loop()
+    relay = RelayServer(upstream, links)
+    for link in relay.links:
+        asyncio.ensure_future(link.connect())
+
+    # Clients are accepted once the room list arrived, unless the upstream server turned the relay down
+    waits = [asyncio.ensure_future(relay.lobby_ready.wait()), asyncio.ensure_future(relay.stop.wait())]
+    await asyncio.wait(waits, timeout=STARTUP_WAIT, return_when=asyncio.FIRST_COMPLETED)
+    for wait in waits:
+        wait.cancel()
+    if relay.stop.is_set():
+        relay.shutdown()
+        return
+    if not relay.lobby_ready.is_set():
+        print(f"No room list from {format_endpoint(upstream)} yet, accepting clients anyway")
+    server = await loop.create_server(lambda: RelayConnection(relay), host, port, backlog=4096)
+    print(f"Relaying {host}:{port} to {format_endpoint(upstream)} over {len(relay.links)} links")
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, relay.stop.set)
+    watch_console(loop, relay.stop)
+    await relay.stop.wait()
+
+    print("Shutting down the relay...")
+    server.close()
+    relay.shutdown()
+    await server.wait_closed()
+
+    # Let the transports flush the shutdown message
+    await asyncio.sleep(0.1)
+    messages = sum(link.messages for link in relay.links)
+    received = sum(link.bytes_received for link in relay.links)
+    sent = sum(link.bytes_sent for link in relay.links)
+    print(f"{messages} room messages from upstream handed to local users {relay.deliveries} times, "
+          f"{received} bytes received and {sent} bytes sent upstream")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Edge relay for the chat server")
+    parser.add_argument("--upstream", required=True, help="server to relay to, as host:port")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--links", type=int, default=LINKS, help="upstream connections the users are spread over")
+    args = parser.parse_args()
+    try:
+        upstream = parse_endpoint(args.upstream)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print("I am a relay.")
+    print("Type 'SHUTDOWN' to shut down the relay.")
+    raise_file_limit()
+    asyncio.run(serve(args.host, args.port, upstream, args.links))
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
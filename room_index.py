@@ -0,0 +1,113 @@
+# Imports
+from bisect import bisect_left, insort
+
+# Length of the name substrings filed in the index
+GRAM_SIZE = 3
+
+
+# Function to get the distinct substrings of GRAM_SIZE characters of a folded name
+def grams(text):
+    return {text[start:start + GRAM_SIZE] for start in range(len(text) - GRAM_SIZE + 1)}
+
+
+# Index of room names answering prefix and substring searches, ignoring case, without
+# scanning every name. A sorted list of the folded names finds the names starting with
+# the query by bisection, and each name is filed under every three letter substring it
+# contains, so a longer query only checks the names sharing its rarest substring. A
+# keystroke usually extends the previous query, and its matches are then only narrowed.
+class RoomIndex:
+    def __init__(self, names=()):
+
+        # Folded form of each name, the (folded, name) pairs in order and the names filed under each substring
+        self.folded = {}
+        self.ordered = []
+        self.grams = {}
+
+        # Previous query and its matches, reused while the query grows
+        self.last_query = None
+        self.last_matches = None
+        self.update(names)
+
+    def __len__(self):
+        return len(self.folded)
+
+    def __contains__(self, name):
+        return name in self.folded
+
+    # Method to add a name
+    def add(self, name):
+        if name in self.folded:
+            return
+        folded = self.folded[name] = name.casefold()
+        insort(self.ordered, (folded, name))
+        for gram in grams(folded):
+            self.grams.setdefault(gram, set()).add(name)
+        self.last_query = None
+
+    # Method to add many names, sorting once instead of inserting each one
+    def update(self, names):
+        added = [name for name in dict.fromkeys(names) if name not in self.folded]
+        if not added:
+            return
+        for name in added:
+            folded = self.folded[name] = name.casefold()
+            self.ordered.append((folded, name))
+            for gram in grams(folded):
+                self.grams.setdefault(gram, set()).add(name)
+        self.ordered.sort()
+        self.last_query = None
+
+    # Method to remove a name
+    def remove(self, name):
+        folded = self.folded.pop(name, None)
+        if folded is None:
+            return
+        del self.ordered[bisect_left(self.ordered, (folded, name))]
+        for gram in grams(folded):
+            filed = self.grams[gram]
+            filed.discard(name)
+            if not filed:
+                del self.grams[gram]
+        self.last_query = None
+
+    # Method to replace every name
+    def reset(self, names=()):
+        self.folded.clear()
+        self.ordered.clear()
+        self.grams.clear()
+        self.last_query = None
+        self.update(names)
+
+    # Method to find the names containing the query, names starting with it first, each group in name order
+    def search(self, query):
+        query = query.casefold()
+        if not query:
+            return [name for _, name in self.ordered]
+
+        # Candidates: the previous matches when the query grew, otherwise the names
+        # filed under the query's rarest substring, or every name for a short query
+        if self.last_query is not None and self.last_query in query:
+            candidates = self.last_matches
+        elif len(query) >= GRAM_SIZE:
+            candidates = min((self.grams.get(gram, ()) for gram in grams(query)), key=len)
+        else:
+            candidates = self.folded
+        folded = self.folded
+        matches = [name for name in candidates if query in folded[name]]
+        self.last_query, self.last_matches = query, matches
+
+        # Names starting with the query sit together in the sorted list
+        prefixed = []
+        for position in range(bisect_left(self.ordered, (query,)), len(self.ordered)):
+            text, name = self.ordered[position]
+            if not text.startswith(query):
+                break
+            prefixed.append(name)
+        if len(prefixed) == len(matches):
+            return prefixed
+        inside = sorted((folded[name], name) for name in matches if not folded[name].startswith(query))
+        return prefixed + [name for _, name in inside]
+
+    # Method to check whether a name matches a query the way search() does
+    def matches(self, name, query):
+        return query.casefold() in self.folded.get(name, name.casefold())
@@ -0,0 +1,234 @@
+# Imports
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from bisect import bisect_left
+from protocol import RoomList, RoomPage, RoomAdded, RoomRemoved, RoomUsers
+from room_index import RoomIndex
+
+
+# Function to format a room for display in the lobby
+def room_display(room):
+    return f"{room.name} - {'Locked' if room.locked else 'Unlocked'}, {room.current_users}/{room.max_users} users"
+
+
+# List model of the lobby rooms with a name index, so added rooms and occupancy changes
+# are applied in O(1). A removed room's row is really removed, the rows after it move up
+# and views keep their selection on the room the user picked. On servers sending the
+# room list in pages, the view asks for the next page through fetchMore() when it is
+# scrolled to the end, and fetch is called to request it.
+class RoomListModel(QAbstractListModel):
+    def __init__(self, parent=None, fetch=None):
+        super().__init__(parent)
+
+        # Rooms in display order and the row of each room name
+        self.rooms = []
+        self.rows = {}
+
+        # Search index over the room names
+        self.search_index = RoomIndex()
+
+        # Set while the server has rooms past the loaded pages, and the callback requesting the next page
+        self.more = False
+        self.fetch = fetch
+
+        # Handlers for each room list message type
+        self.handlers = {
+            RoomList: lambda message: self.reset_rooms(message.rooms),
+            RoomPage: self.add_page,
+            RoomAdded: lambda message: self.add_room(message.room),
+            RoomRemoved: lambda message: self.remove_room(message.name),
+            RoomUsers: lambda message: self.set_current_users(message.name, message.current_users),
+        }
+
+    # Method to apply a snapshot or delta message
+    def apply(self, message):
+        self.handlers[type(message)](message)
+
+    # Model interface: number of rooms
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rooms)
+
+    # Model interface: display text, or the Room record for Qt.UserRole
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rooms):
+            return None
+        room = self.rooms[index.row()]
+        if role == Qt.DisplayRole:
+            return room_display(room)
+        if role == Qt.UserRole:
+            return room
+        return None
+
+    # Model interface: whether more rooms can be loaded
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.more and self.fetch is not None
+
+    # Model interface: request the next page, it is added once it arrives
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.fetch()
+
+    # Method to get the row of a room by name, -1 if it is not listed
+    def row_of(self, name):
+        return self.rows.get(name, -1)
+
+    # Method to get the room at a row, None if the row is out of range
+    def room_at(self, row):
+        return self.rooms[row] if 0 <= row < len(self.rooms) else None
+
+    # Method to replace every room from a full snapshot
+    def reset_rooms(self, rooms, more=False):
+        self.beginResetModel()
+        self.rooms = list(rooms)
+        self.rows = {room.name: row for row, room in enumerate(self.rooms)}
+        self.search_index.reset(self.rows)
+        self.more = more
+        self.endResetModel()
+
+    # Method to apply a room list page, the first page replaces every room and the others are appended
+    def add_page(self, message):
+        if not message.after:
+            self.reset_rooms(message.rooms, message.more)
+            return
+        self.more = message.more
+        new = []
+        for room in message.rooms:
+            row = self.rows.get(room.name)
+            if row is None:
+                new.append(room)
+            else:
+                self.replace_room(row, room)
+        if not new:
+            return
+        first = len(self.rooms)
+        self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+        self.rooms.extend(new)
+        for row, room in enumerate(new, first):
+            self.rows[room.name] = row
+        self.search_index.update(room.name for room in new)
+        self.endInsertRows()
+
+    # Method to add a room at the end, or update it if the name is already listed
+    def add_room(self, room):
+        row = self.rows.get(room.name)
+        if row is not None:
+            self.replace_room(row, room)
+            return
+        row = len(self.rooms)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rooms.append(room)
+        self.rows[room.name] = row
+        self.search_index.add(room.name)
+        self.endInsertRows()
+
+    # Method to remove a room, renumbering the rooms after it
+    def remove_room(self, name):
+        row = self.rows.get(name)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rooms[row]
+        del self.rows[name]
+        for later in range(row, len(self.rooms)):
+            self.rows[self.rooms[later].name] = later
+        self.search_index.remove(name)
+        self.endRemoveRows()
+
+    # Method to update the occupancy of a room
+    def set_current_users(self, name, current_users):
+        row = self.rows.get(name)
+        if row is not None:
+            self.replace_room(row, self.rooms[row]._replace(current_users=current_users))
+
+    # Method to replace the room stored at a row
+    def replace_room(self, row, room):
+        self.rooms[row] = room
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+
+# List model showing the rooms of a RoomListModel whose names contain a search query,
+# names starting with it first. Matches come from the source's search index, so a
+# keystroke does not test every room, and rooms added or removed while a query is set
+# update the matches in place instead of searching again.
+class RoomFilterModel(QAbstractListModel):
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.query = ""
+
+        # Names of the matching rooms in display order, and their sort keys
+        self.names = []
+        self.keys = []
+
+        source.modelReset.connect(self.refresh)
+        source.rowsInserted.connect(self.rooms_inserted)
+        source.rowsRemoved.connect(self.rooms_removed)
+        source.dataChanged.connect(self.rooms_changed)
+
+    # Method to set the search query and find its matches
+    def set_query(self, query):
+        self.query = query
+        self.refresh()
+
+    # Method to search again from scratch
+    def refresh(self):
+        self.beginResetModel()
+        self.names = self.source.search_index.search(self.query) if self.query else []
+        self.keys = [self.sort_key(name) for name in self.names]
+        self.endResetModel()
+
+    # Method to get the sort key of a matching name
+    def sort_key(self, name):
+        folded = name.casefold()
+        return (not folded.startswith(self.query.casefold()), folded, name)
+
+    # Model interface: number of matches
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    # Model interface: the source's data for the matching room
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.names):
+            return None
+        return self.source.data(self.source.index(self.source.row_of(self.names[index.row()])), role)
+
+    # Model interface: fetching more rooms is left to the source
+    def canFetchMore(self, parent=QModelIndex()):
+        return self.source.canFetchMore(parent)
+
+    def fetchMore(self, parent=QModelIndex()):
+        self.source.fetchMore(parent)
+
+    # Method to get the row of a matching room by name, -1 if it does not match
+    def row_of(self, name):
+        if name not in self.source.rows:
+            return -1
+        row = bisect_left(self.keys, self.sort_key(name))
+        return row if row < len(self.names) and self.names[row] == name else -1
+
+    # Slot placing rooms added to the source among the matches
+    def rooms_inserted(self, parent, first, last):
+        if not self.query:
+            return
+        for room in self.source.rooms[first:last + 1]:
+            if self.source.search_index.matches(room.name, self.query):
+                key = self.sort_key(room.name)
+                row = bisect_left(self.keys, key)
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.names.insert(row, room.name)
+                self.keys.insert(row, key)
+                self.endInsertRows()
+
+    # Slot dropping the matches whose rooms were removed from the source
+    def rooms_removed(self, parent, first, last):
+        for row in reversed(range(len(self.names))):
+            if self.names[row] not in self.source.rows:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.names[row]
+                del self.keys[row]
+                self.endRemoveRows()
+
+    # Slot repainting the matches when rooms of the source changed
+    def rooms_changed(self, top_left, bottom_right):
+        if self.names:
+            self.dataChanged.emit(self.index(0), self.index(len(self.names) - 1))
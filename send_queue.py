@@ -0,0 +1,124 @@
+# Imports
+from collections import deque
+from itertools import islice
+
+# Bytes of chat messages that may wait for the socket before the drop policy applies
+MAX_QUEUED = 1024 * 1024
+
+# Queue sizes where backpressure switches on and off again
+HIGH_WATER = 256 * 1024
+LOW_WATER = 64 * 1024
+
+# Most bytes handed to a single send() call
+MAX_WRITE = 64 * 1024
+
+# What happens to a chat message that does not fit: refuse it, or drop the oldest queued ones
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+
+# Bounded queue of encoded messages waiting for the socket. Small messages are
+# coalesced into one write, partial writes resume where they stopped, and only
+# messages pushed as droppable (chat lines) are ever discarded, so requests and
+# the disconnect sequence always reach the server.
+class SendQueue:
+    def __init__(self, limit=MAX_QUEUED, policy=DROP_NEWEST, high_water=HIGH_WATER, low_water=LOW_WATER):
+        self.limit = limit
+        self.policy = policy
+        self.high_water = high_water
+        self.low_water = low_water
+
+        # Queued messages as (bytes, droppable) and the bytes of the first one already sent
+        self.chunks = deque()
+        self.head_sent = 0
+        self.size = 0
+        self.droppable_size = 0
+
+        # Set between crossing the high water mark and draining below the low one
+        self.throttled = False
+
+        # Counters
+        self.dropped = 0
+        self.writes = 0
+        self.messages_written = 0
+
+    def __len__(self):
+        return self.size
+
+    # Method to add a message, returns False if it was dropped
+    def push(self, data, droppable=False):
+        if droppable and self.droppable_size + len(data) > self.limit:
+            if self.policy != DROP_OLDEST or not self.drop_oldest(len(data)):
+                self.dropped += 1
+                return False
+        self.chunks.append((data, droppable))
+        self.size += len(data)
+        if droppable:
+            self.droppable_size += len(data)
+        if self.size >= self.high_water:
+            self.throttled = True
+        return True
+
+    # Method to make room for a new message by discarding the oldest unsent chat messages
+    def drop_oldest(self, needed):
+        kept = deque()
+        for index, (data, droppable) in enumerate(self.chunks):
+            if self.droppable_size + needed <= self.limit:
+                kept.extend(islice(self.chunks, index, None))
+                break
+
+            # The first message may be partly on the wire already and must be finished
+            if droppable and not (index == 0 and self.head_sent):
+                self.size -= len(data)
+                self.droppable_size -= len(data)
+                self.dropped += 1
+            else:
+                kept.append((data, droppable))
+        self.chunks = kept
+        return self.droppable_size + needed <= self.limit
+
+    # Method to get the next bytes to send, joining queued messages up to MAX_WRITE
+    def next_write(self, max_bytes=MAX_WRITE):
+        if not self.chunks:
+            return b""
+        first = self.chunks[0][0]
+        if len(self.chunks) == 1 or len(first) - self.head_sent >= max_bytes:
+            return memoryview(first)[self.head_sent:]
+        parts = [memoryview(first)[self.head_sent:]]
+        total = len(parts[0])
+        for data, _ in islice(self.chunks, 1, None):
+            if total + len(data) > max_bytes:
+                break
+            parts.append(data)
+            total += len(data)
+        return b"".join(parts)
+
+    # Method to drop the bytes a send() call accepted
+    def advance(self, sent):
+        self.writes += 1
+        self.size -= sent
+        sent += self.head_sent
+        while self.chunks and sent >= len(self.chunks[0][0]):
+            data, droppable = self.chunks.popleft()
+            sent -= len(data)
+            self.messages_written += 1
+            if droppable:
+                self.droppable_size -= len(data)
+        self.head_sent = sent
+        if self.throttled and self.size <= self.low_water:
+            self.throttled = False
+
+    # Method to remove every queued message, returns them whole so a partly written
+    # one can be sent again from its start on a new connection
+    def take(self, droppable_only=False):
+        messages = [data for data, droppable in self.chunks if droppable or not droppable_only]
+        self.clear()
+        return messages
+
+    # Method to discard everything still queued
+    def clear(self):
+        self.chunks.clear()
+        self.head_sent = 0
+        self.size = 0
+        self.droppable_size = 0
+        self.throttled = False
@@ -0,0 +1,822 @@
+# Asyncio chat server speaking the same protocol as the C++ Server
+#
+# Usage: python server.py [--host 0.0.0.0] [--port 2004] [--workers 1] [--delay 0] [--tls-cert FILE --tls-key FILE]
+#
+# One event loop serves every connection, and each room keeps its own member table,
+# so nothing is locked and an idle connection costs one small protocol object.
+# With --workers N the server forks N processes that all listen on the same port
+# with SO_REUSEPORT. The kernel spreads connections over them and every worker
+# owns its rooms, so each worker is an independent shard.
+# Clients with the mux feature may be in several rooms on one connection: they stay in
+# the lobby, and the messages of each room come in frames tagged with its channel.
+# Clients with the ping feature may send PING;token at any time and get PONG;token back.
+# Clients with the resume feature get numbered room messages. When such a client
+# drops, its seat is held for RESUME_GRACE seconds, and REJOIN_ROOM on a new
+# connection takes the seat back and replays the messages it missed.
+# A relay (relay.py) connects with the mux and relay features and brings many users
+# into the same room over one connection. Each room then has one channel on the link,
+# and a broadcast crosses it once for all the relay's users, who get it from the relay.
+# Clients with the chunks feature may stream a long chat message: TRANSFER_ROOM announces
+# it and binary chunks follow, UPLOAD_END confirms it. Members that also take chunks get each
+# chunk as it arrives and TRANSFER_END with the message's number, the others get the whole message.
+# Clients with the pages feature get the room list a page at a time in name order:
+# LIST_ROOMS;count;after answers with the rooms named after the cursor. A new connection
+# is greeted once it sent HELLO, or after GREETING_WAIT for clients that never do.
+# --delay holds every new connection for a while before the server answers it, to stand
+# in for a distant or overloaded server when testing the client's server selection.
+# With --tls-cert every connection runs TLS. The server hands out session tickets, so a
+# client reconnecting with its last session skips the full handshake, and workers forked
+# after the context was made share its ticket keys.
+# Type SHUTDOWN (or press Ctrl+C) to notify clients and stop.
+
+# Imports
+import argparse, asyncio, bisect, multiprocessing, os, resource, signal, sys
+from collections import Counter, deque, namedtuple
+from protocol import (
+    FrameDecoder,
+    ProtocolError,
+    Room,
+    RoomList,
+    RoomAdded,
+    RoomRemoved,
+    RoomUsers,
+    RoomMessage,
+    RoomPage,
+    RoomSeq,
+    Channel,
+    ChatMessage,
+    TransferStart,
+    TransferChunk,
+    TransferEnd,
+    TransferAbort,
+    UploadEnd,
+    UploadAbort,
+    encode,
+    encode_message,
+    format_room,
+    with_channel,
+)
+from transfer import MAX_TRANSFER_SIZE, MAX_TRANSFERS, IncomingTransfer
+from tls import server_context
+
+# Port the C++ server listens on
+PORT = 2004
+
+# Optional protocol features this server understands
+SUPPORTED_CAPABILITIES = frozenset(
+    {"binary", "chunks", "deflate", "deltas", "ids", "mux", "pages", "ping", "relay", "resume"})
+
+# Bytes a client may leave unread before it is dropped as too slow
+MAX_BUFFERED = 4 * 1024 * 1024
+
+# Seconds a resume client's seat is kept after its connection drops
+RESUME_GRACE = 30
+
+# Recent messages each room keeps for replay
+HISTORY = 1000
+
+# Seconds a new connection may take to send HELLO before it is greeted with the whole room list
+GREETING_WAIT = 0.25
+
+# Rooms in the first page sent to a paged client, and the most one page request may ask for
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# A room a connection is in, the username it uses there and the channel of its messages
+Membership = namedtuple("Membership", "room username channel")
+
+
+# Decoder for the client byte stream, yielding raw command strings, or RoomMessage and
+# TransferChunk records for binary chat and streamed chunks. Like the C++ FrameReader,
+# each run of legacy text counts as one command.
+class CommandDecoder(FrameDecoder):
+    def decode_legacy(self, text):
+        text = text.rstrip("\r\n")
+        return [text] if text else []
+
+    def parse(self, text):
+        return text
+
+
+# Chat room state, members are keyed by username
+class ChatRoom:
+    def __init__(self, name, password, max_users):
+        self.name = name
+        self.password = password
+        self.max_users = max_users
+        self.members = {}
+
+        # Number of the last message and the recent ones as (seq, sender, text, excluded user)
+        self.seq = 0
+        self.history = deque(maxlen=HISTORY)
+
+        # Messages being streamed into the room by transfer id
+        self.uploads = {}
+
+    # Method to get the room's record for the room list, it carries a locked flag instead of the password
+    def record(self):
+        return Room(self.name, bool(self.password), len(self.members), self.max_users)
+
+    # Method to number a chat message and send it to every member except the excluded one.
+    # Resume clients get the sequence number, and each encoding is built once. A relay
+    # gets one copy for all its users, it skips the sender itself. Members that were
+    # streamed the message by an upload only get its number.
+    def broadcast(self, sender, text, excluded=None, upload=None):
+        self.seq += 1
+        self.history.append((self.seq, sender, text, excluded))
+        messages = {False: ChatMessage(sender, text), True: ChatMessage(sender, text, self.seq)}
+        encoded = {False: {}, True: {}}
+        relays = set()
+        ended = {}
+        for name, connection in self.members.items():
+            if connection.relay:
+                if name == excluded or connection in relays:
+                    continue
+                relays.add(connection)
+            if upload is not None and upload.recipients.get(name) is connection:
+                connection.write_room(self, connection.encode(TransferEnd(upload.transfer_id, self.seq), ended))
+            elif name != excluded:
+                resume = "resume" in connection.capabilities
+                connection.write_room(self, connection.encode(messages[resume], encoded[resume]))
+
+    # Method to get the messages a returning member missed after last_seq
+    def missed(self, username, last_seq):
+        return [entry for entry in self.history if entry[0] > last_seq and entry[3] != username]
+
+
+# Chat message a member streams into a room. Each chunk is copied into the buffer
+# allocated at the start and passed straight on to the members that take chunks, which
+# were told about the stream when it started. The rest get the message once it is complete.
+class RoomUpload(IncomingTransfer):
+    def __init__(self, transfer_id, room, sender, size, source, upload_id):
+        super().__init__(transfer_id, sender, size, room.name)
+        self.room = room
+
+        # Connection streaming the message and its own id for the stream
+        self.source = source
+        self.upload_id = upload_id
+
+        # Members getting the chunks, by username
+        self.recipients = {}
+
+    # Method to pass a message about the stream to the members getting it, forgetting
+    # members that have left or whose seat moved to another connection
+    def forward(self, message):
+        encoded = {}
+        for name, connection in list(self.recipients.items()):
+            if self.room.members.get(name) is connection:
+                connection.write_room(self.room, connection.encode(message, encoded))
+            else:
+                del self.recipients[name]
+
+
+# Server state shared by every connection on this worker's event loop
+class ChatServer:
+    def __init__(self, delay=0):
+        self.rooms = {}
+
+        # Seconds each new connection waits before it is greeted and its input read
+        self.delay = delay
+
+        # Connections currently in the lobby, they receive room list updates
+        self.lobby = set()
+        self.connections = set()
+
+        # Room list text and the sorted room names, rebuilt lazily after a change
+        self.room_list_cache = None
+        self.room_names = None
+
+        # Set once the server is shutting down, seats are no longer held
+        self.stopping = False
+
+        # Id of the next streamed message, unique on this worker
+        self.next_transfer = 1
+
+    # Method to get the newline separated room list
+    def room_list(self):
+        if self.room_list_cache is None:
+            self.room_list_cache = "".join(format_room(room.record()) + "\n" for room in self.rooms.values())
+        return self.room_list_cache
+
+    # Method to get the full room list message
+    def snapshot(self):
+        return RoomList([room.record() for room in self.rooms.values()])
+
+    # Method to get up to count rooms named after the cursor, in name order
+    def page(self, after, count):
+        if self.room_names is None:
+            self.room_names = sorted(self.rooms)
+        start = bisect.bisect_right(self.room_names, after)
+        names = self.room_names[start:start + count]
+        more = start + count < len(self.room_names)
+        return RoomPage(after, [self.rooms[name].record() for name in names], more, len(self.room_names))
+
+    # Method to tell lobby clients about a room list change. Clients that agreed to
+    # deltas get the delta, everyone else and a client returning from a room get a snapshot,
+    # or the first page if they are paged. Each message is encoded once for every encoding in use.
+    # A None delta sends everyone the list.
+    def room_list_changed(self, delta, returning=None):
+        self.room_list_cache = None
+        if not isinstance(delta, RoomUsers):
+            self.room_names = None
+        deltas = {}
+
+        # Snapshot and first page with their encodings, keyed by whether the client is paged
+        lists = {}
+        for connection in self.lobby:
+            if delta is not None and connection is not returning and "deltas" in connection.capabilities:
+                connection.write(connection.encode(delta, deltas))
+                continue
+            if connection.paged not in lists:
+                lists[connection.paged] = (connection.room_list(), {})
+            room_list, encodings = lists[connection.paged]
+            connection.write(connection.encode(room_list, encodings))
+
+    # Method to create a room and record its creator as the first member
+    def create_room(self, connection, name, password, max_users, username):
+        room = self.rooms[name] = ChatRoom(name, password, max_users)
+        room.members[username] = connection
+        self.room_list_changed(RoomAdded(room.record()))
+        return room
+
+    # Method to add a user to a room and tell the other members
+    def join_room(self, connection, room, username):
+        room.members[username] = connection
+        self.room_list_changed(RoomUsers(room.name, len(room.members)))
+        room.broadcast("Server", f"{username} has joined the chatroom.", username)
+
+    # Method to remove a user from a room, deleting the room once it is empty.
+    # The user's streams into the room are cut off and the ones to the user forgotten.
+    def leave_room(self, room, username, returning=None):
+        if room.members.pop(username, None) is None:
+            return
+        for upload in list(room.uploads.values()):
+            if upload.sender == username:
+                self.abort_upload(upload)
+            else:
+                upload.recipients.pop(username, None)
+        room.broadcast("Server", f"{username} has left the chatroom.", username)
+        if room.members:
+            self.room_list_changed(RoomUsers(room.name, len(room.members)), returning)
+        else:
+            del self.rooms[room.name]
+            self.room_list_changed(RoomRemoved(room.name), returning)
+
+    # Method to start a message streamed into a room, members taking chunks are told now
+    def start_upload(self, connection, room, sender, size, upload_id):
+        upload = RoomUpload(self.next_transfer, room, sender, size, connection, upload_id)
+        self.next_transfer += 1
+        room.uploads[upload.transfer_id] = upload
+        for name, member in room.members.items():
+            if name != sender and member.streams:
+                upload.recipients[name] = member
+        upload.forward(TransferStart(upload.transfer_id, size, sender))
+        return upload
+
+    # Method to pass on a chunk of a streamed message, broadcasting the message once it is complete
+    def upload_chunk(self, upload, chunk):
+        if not upload.add(chunk.offset, chunk.data):
+            self.abort_upload(upload)
+            upload.source.write(upload.source.encode(UploadAbort(upload.upload_id)))
+            return
+        upload.forward(TransferChunk(upload.transfer_id, chunk.offset, chunk.data))
+        if upload.complete():
+            del upload.room.uploads[upload.transfer_id]
+            del upload.source.uploads[upload.upload_id]
+            upload.source.write(upload.source.encode(UploadEnd(upload.upload_id)))
+            upload.room.broadcast(upload.sender, upload.text(), upload.sender, upload)
+
+    # Method to cut off a streamed message, the members getting it drop what they have
+    def abort_upload(self, upload):
+        upload.room.uploads.pop(upload.transfer_id, None)
+        upload.source.uploads.pop(upload.upload_id, None)
+        upload.forward(TransferAbort(upload.transfer_id))
+
+    # Method to notify every client and close the connections
+    def shutdown(self):
+        self.stopping = True
+        for connection in list(self.connections):
+            connection.send("SERVER_SHUTDOWN")
+            connection.transport.close()
+
+
+# One client connection
+class ClientConnection(asyncio.Protocol):
+
+    # Optional protocol features offered to clients
+    supported = SUPPORTED_CAPABILITIES
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.decoder = CommandDecoder()
+
+        # Replies are framed once the client has sent a frame
+        self.framed = False
+        self.capabilities = frozenset()
+
+        # Set when the client agreed to compressed frames and to binary records
+        self.compress = False
+        self.binary = False
+
+        # Rooms the client is in by name, at most one without the mux feature. A relay's
+        # are keyed by room and username, and each room's channel is shared by its users.
+        self.memberships = {}
+        self.multiplexed = False
+        self.relay = False
+        self.channels = {}
+        self.room_users = Counter()
+        self.next_channel = 1
+
+        # Timer releasing the held seat after the connection dropped
+        self.away_timer = None
+
+        # Set once the client got its first room list, and the timer greeting a client that sends no HELLO
+        self.greeted = False
+        self.greeting_timer = None
+
+        # Set when the client fetches the room list in pages
+        self.paged = False
+
+        # Set when the client numbers its create and join requests and expects the number in each reply
+        self.ids = False
+
+        # Set when the client takes streamed messages in chunks, and the messages it is streaming by its id
+        self.streams = False
+        self.uploads = {}
+
+        # Handlers for each client command
+        self.handlers = {
+            "CREATE_ROOM": self.handle_create_room,
+            "JOIN_ROOM": self.handle_join_room,
+            "REJOIN_ROOM": self.handle_rejoin_room,
+            "MESSAGE_ROOM": self.handle_message_room,
+            "DISCONNECT_ROOM": self.handle_disconnect_room,
+            "DISCONNECT": self.handle_disconnect,
+            "HELLO": self.handle_hello,
+            "RESYNC": self.handle_resync,
+            "PING": self.handle_ping,
+            "LIST_ROOMS": self.handle_list_rooms,
+            "TRANSFER_ROOM": self.handle_transfer_room,
+        }
+
+    # Protocol interface: accept a new client, after the delay if there is one
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+        if self.server.delay > 0:
+            transport.pause_reading()
+            asyncio.get_running_loop().call_later(self.server.delay, self.accept)
+        else:
+            self.accept()
+
+    # Method to start reading the client's commands, it is greeted once it says HELLO
+    # or after GREETING_WAIT, so a paged client is not sent every room first
+    def accept(self):
+        if self.transport.is_closing():
+            return
+        self.transport.resume_reading()
+        self.greeting_timer = asyncio.get_running_loop().call_later(GREETING_WAIT, self.greet)
+
+    # Method to greet a new client with the room list, or its first page, and put it in the lobby
+    def greet(self):
+        if self.greeted or self.transport.is_closing():
+            return
+        self.greeted = True
+        if self.greeting_timer is not None:
+            self.greeting_timer.cancel()
+            self.greeting_timer = None
+        self.server.lobby.add(self)
+        if self.paged:
+            self.write(self.encode(self.room_list()))
+        else:
+            self.send(self.server.room_list() or "NO_ROOMS")
+
+    # Method to get the room list message for this client, the first page for a paged one
+    def room_list(self):
+        return self.server.page("", PAGE_SIZE) if self.paged else self.server.snapshot()
+
+    # Protocol interface: handle every complete command
+    def data_received(self, data):
+        try:
+            commands = self.decoder.feed(data)
+        except ProtocolError as e:
+            print("Dropping client:", e)
+            self.transport.close()
+            return
+        self.framed = self.framed or self.decoder.framed
+        for text in commands:
+
+            # A client sending anything but HELLO first gets the whole room list before it is handled
+            if not self.greeted and (not isinstance(text, str) or not text.startswith("HELLO")):
+                self.greet()
+            if isinstance(text, RoomMessage):
+                if not self.transport.is_closing():
+                    self.room_message(text.room_name, text.text, text.sender)
+                continue
+            if isinstance(text, TransferChunk):
+                upload = self.uploads.get(text.transfer_id)
+                if upload is not None:
+                    self.server.upload_chunk(upload, text)
+                continue
+            command, _, rest = text.partition(";")
+            handler = self.handlers.get(command)
+            if handler is not None and not self.transport.is_closing():
+                handler(rest)
+
+    # Protocol interface: clean up after the client is gone, a resume client keeps its seat for a while.
+    # Its streams are cut off either way, the client starts them over after reconnecting.
+    def connection_lost(self, error):
+        if self.greeting_timer is not None:
+            self.greeting_timer.cancel()
+            self.greeting_timer = None
+        for upload in list(self.uploads.values()):
+            self.server.abort_upload(upload)
+        self.server.lobby.discard(self)
+        self.server.connections.discard(self)
+        if not self.memberships:
+            return
+        if "resume" in self.capabilities and not self.server.stopping:
+            self.away_timer = asyncio.get_running_loop().call_later(RESUME_GRACE, self.release_seat)
+        else:
+            self.release_seat()
+
+    # Method to leave every room unless another connection took the seat over
+    def release_seat(self):
+        self.away_timer = None
+        memberships, self.memberships = self.memberships, {}
+        self.channels.clear()
+        self.room_users.clear()
+        for room, username, _ in memberships.values():
+            if room.members.get(username) is self:
+                self.server.leave_room(room, username)
+
+    # Method to hand this connection's seat in a room to a reconnected client,
+    # the connection is closed once it holds no seat
+    def give_up_seat(self, name, username):
+        self.drop_membership(name, username)
+        if self.memberships:
+            return
+        if self.away_timer is not None:
+            self.away_timer.cancel()
+            self.away_timer = None
+        self.transport.abort()
+
+    # Method to send one command string in the client's framing
+    def send(self, text):
+        self.write(encode(text, self.framed, self.compress))
+
+    # Method to encode a typed message for this client. When the same message goes to
+    # many clients, cache holds its encodings keyed by framing, compression and binary.
+    def encode(self, message, cache=None):
+        if cache is None:
+            return encode_message(message, self.framed, self.compress, self.binary)
+        key = (self.framed, self.compress, self.binary)
+        data = cache.get(key)
+        if data is None:
+            data = cache[key] = encode_message(message, self.framed, self.compress, self.binary)
+        return data
+
+    # Method to write encoded bytes, dropping clients that stopped reading
+    def write(self, data):
+        if self.transport.is_closing():
+            return
+        self.transport.write(data)
+        if self.transport.get_write_buffer_size() > MAX_BUFFERED:
+            print("Dropping slow client:", self.transport.get_extra_info("peername"))
+            self.transport.abort()
+
+    # Method to write an encoded message of a room, tagged with its channel on a multiplexed connection
+    def write_room(self, room, data):
+        channel = self.channels.get(room.name)
+        if channel is not None:
+            data = with_channel(data, channel)
+        self.write(data)
+
+    # Method to take the client out of the lobby and its current room before it enters
+    # another. Multiplexed clients keep their rooms and stay in the lobby.
+    def leave_current_room(self):
+        if self.multiplexed:
+            return
+        self.server.lobby.discard(self)
+        memberships, self.memberships = self.memberships, {}
+        self.room_users.clear()
+        for room, username, _ in memberships.values():
+            self.server.leave_room(room, username)
+
+    # Method to get the key of a membership, a relay may have many users in one room
+    def membership_key(self, name, username):
+        return (name, username) if self.relay else name
+
+    # Method to record that the client entered a room, a multiplexed client learns the room's channel.
+    # A relay's users share the channel their room got when the first of them entered.
+    def enter(self, room, username):
+        channel = None
+        if self.multiplexed:
+            channel = self.channels.get(room.name)
+            if channel is None:
+                channel, self.next_channel = self.next_channel, self.next_channel + 1
+                self.channels[room.name] = channel
+        self.memberships[self.membership_key(room.name, username)] = Membership(room, username, channel)
+        self.room_users[room.name] += 1
+        if channel is not None:
+            self.write(self.encode(Channel(channel, room.name)))
+
+    # Method to forget a membership, the room's channel goes with the last user in it
+    def drop_membership(self, name, username):
+        if self.memberships.pop(self.membership_key(name, username), None) is None:
+            return
+        self.room_users[name] -= 1
+        if self.room_users[name] <= 0:
+            del self.room_users[name]
+            self.channels.pop(name, None)
+
+    # Method to split a create or join request into its fields and its request id,
+    # which a client with the ids feature appends as the last field
+    def request_fields(self, rest):
+        request_id = None
+        if self.ids:
+            head, _, tail = rest.rpartition(";")
+            if tail.isdigit():
+                rest, request_id = head, tail
+        return rest.split(";"), request_id
+
+    # Method to answer a create or join request, echoing its request id
+    def reply(self, status, request_id):
+        self.send(status if request_id is None else f"{status};{request_id}")
+
+    # CREATE_ROOM;name;password;current;max;username, a malformed request is answered with BAD_REQUEST
+    # so the client's later replies stay matched to its requests
+    def handle_create_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 5:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        name, password, _, max_users, username = fields
+        try:
+            max_users = int(max_users)
+        except ValueError:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        if name in self.server.rooms:
+            self.reply("ROOM_EXISTS", request_id)
+            return
+        self.leave_current_room()
+        room = self.server.create_room(self, name, password, max_users, username)
+        self.reply("CREATE_SUCCESS", request_id)
+        self.enter(room, username)
+        self.send_room_seq(room)
+
+    # JOIN_ROOM;name;password or NO_PASSWORD;username
+    def handle_join_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 3:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        self.join(*fields, request_id)
+
+    # Method to seat the client in a room, answering its join request
+    def join(self, name, password, username, request_id):
+        room = self.server.rooms.get(name)
+        if room is None:
+            self.reply("NO_ROOM", request_id)
+            return
+        password_ok = room.password == ("" if password == "NO_PASSWORD" else password)
+        full = len(room.members) >= room.max_users
+        if password_ok and not full:
+            if username in room.members or (self.multiplexed and name in self.memberships):
+                self.reply("EXISTING_USER", request_id)
+                return
+            self.leave_current_room()
+            self.server.join_room(self, room, username)
+            self.reply("JOIN_SUCCESS", request_id)
+            self.enter(room, username)
+            self.send_room_seq(room)
+        elif full:
+            self.reply("ROOM_FULL", request_id)
+        else:
+            self.reply("INVALID_PASSWORD", request_id)
+
+    # REJOIN_ROOM;name;password or NO_PASSWORD;username;last seq, sent after a reconnect.
+    # A held seat is taken over silently and the missed messages are replayed,
+    # otherwise the user joins like JOIN_ROOM.
+    def handle_rejoin_room(self, rest):
+        fields, request_id = self.request_fields(rest)
+        if len(fields) != 4:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        name, password, username, last_seq = fields
+        try:
+            last_seq = int(last_seq)
+        except ValueError:
+            self.reply("BAD_REQUEST", request_id)
+            return
+        room = self.server.rooms.get(name)
+        if room is None:
+            self.reply("NO_ROOM", request_id)
+            return
+        if room.password != ("" if password == "NO_PASSWORD" else password):
+            self.reply("INVALID_PASSWORD", request_id)
+            return
+        previous = room.members.get(username)
+        if previous is None:
+            self.join(name, password, username, request_id)
+            return
+        if previous is not self:
+            previous.give_up_seat(name, username)
+            self.leave_current_room()
+            room.members[username] = self
+        self.reply("JOIN_SUCCESS", request_id)
+        self.enter(room, username)
+        for seq, sender, text, _ in room.missed(username, last_seq):
+            self.write_room(room, self.encode(ChatMessage(sender, text, seq)))
+        self.send_room_seq(room)
+
+    # Method to tell a resume client a room's current sequence number
+    def send_room_seq(self, room):
+        if "resume" in self.capabilities:
+            self.write_room(room, self.encode(RoomSeq(room.seq)))
+
+    # MESSAGE_ROOM;room;text;sender, the text may itself contain ';'
+    def handle_message_room(self, rest):
+        name, _, rest = rest.partition(";")
+        text, _, sender = rest.rpartition(";")
+        self.room_message(name, text, sender)
+
+    # Method to pass a chat message from the client to one of its rooms
+    def room_message(self, name, text, sender):
+        membership = self.memberships.get(self.membership_key(name, sender))
+        if membership is not None and membership.username == sender:
+            membership.room.broadcast(sender, text, sender)
+
+    # TRANSFER_ROOM;room;id;size;username, a chat message that follows in chunks. A stream
+    # the client may not start is refused with UPLOAD_ABORT, and the client sends the message plainly.
+    def handle_transfer_room(self, rest):
+        name, _, rest = rest.partition(";")
+        fields = rest.split(";", 2)
+        if len(fields) != 3:
+            return
+        upload_id, size, username = fields
+        try:
+            upload_id, size = int(upload_id), int(size)
+        except ValueError:
+            return
+        membership = self.memberships.get(self.membership_key(name, username))
+        if (membership is None or membership.username != username or not self.streams
+                or upload_id in self.uploads or not 0 < size <= MAX_TRANSFER_SIZE or len(self.uploads) >= MAX_TRANSFERS):
+            self.write(self.encode(UploadAbort(upload_id)))
+            return
+        self.uploads[upload_id] = self.server.start_upload(self, membership.room, username, size, upload_id)
+
+    # DISCONNECT_ROOM;room;username, the client goes back to the lobby.
+    # A multiplexed client never left it and only gets the room list delta.
+    def handle_disconnect_room(self, rest):
+        name, _, username = rest.partition(";")
+        room = self.server.rooms.get(name)
+        if room is not None and room.members.get(username) is self:
+            self.drop_membership(name, username)
+            self.server.lobby.add(self)
+            self.server.leave_room(room, username, None if self.multiplexed else self)
+        else:
+            self.server.lobby.add(self)
+            self.write(self.encode(self.room_list()))
+
+    # DISCONNECT, the client is leaving
+    def handle_disconnect(self, rest):
+        self.leave_current_room()
+        self.transport.close()
+
+    # HELLO;comma separated features
+    def handle_hello(self, rest):
+        self.capabilities = self.supported.intersection(filter(None, rest.split(",")))
+        self.send("HELLO;" + ",".join(sorted(self.capabilities)))
+        self.compress = self.framed and "deflate" in self.capabilities
+        self.binary = self.framed and "binary" in self.capabilities
+        self.multiplexed = self.framed and "mux" in self.capabilities
+        self.ids = self.framed and "ids" in self.capabilities
+        self.relay = self.multiplexed and "relay" in self.capabilities
+        self.paged = "pages" in self.capabilities
+        self.streams = self.binary and "chunks" in self.capabilities
+        self.greet()
+
+    # RESYNC, the client wants a full room list, or the first page again
+    def handle_resync(self, rest):
+        self.write(self.encode(self.room_list()))
+
+    # LIST_ROOMS;count;after, the next page of the room list after the last name the client has
+    def handle_list_rooms(self, rest):
+        count, _, after = rest.partition(";")
+        try:
+            count = max(1, min(int(count), MAX_PAGE_SIZE))
+        except ValueError:
+            return
+        self.write(self.encode(self.server.page(after, count)))
+
+    # PING;token, echoed straight back so the client can time the round trip
+    def handle_ping(self, rest):
+        self.send("PONG;" + rest)
+
+
+# Function to raise the open file limit so many idle clients fit in one process
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# Function to read SHUTDOWN from the console without blocking the event loop
+def watch_console(loop, stop):
+    def console_ready():
+        line = sys.stdin.readline()
+        if not line:
+            loop.remove_reader(sys.stdin)
+        elif line.strip() == "SHUTDOWN":
+            stop.set()
+        else:
+            print("Type 'SHUTDOWN' to shut down the server.")
+    try:
+        loop.add_reader(sys.stdin, console_ready)
+    except (ValueError, OSError):
+        pass
+
+
+# Coroutine running one worker until it is told to stop
+async def serve(host, port, reuse_port=False, console=True, delay=0, ssl_context=None):
+    loop = asyncio.get_running_loop()
+    state = ChatServer(delay)
+    server = await loop.create_server(lambda: ClientConnection(state), host, port, reuse_port=reuse_port, backlog=4096,
+                                      ssl=ssl_context)
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    if console:
+        watch_console(loop, stop)
+    await stop.wait()
+
+    print("Shutting down the server...")
+    server.close()
+    state.shutdown()
+    await server.wait_closed()
+
+    # Let the transports flush the shutdown message
+    await asyncio.sleep(0.1)
+
+
+# Function run by each forked worker
+def run_worker(host, port, delay, ssl_context):
+    raise_file_limit()
+    asyncio.run(serve(host, port, reuse_port=True, console=False, delay=delay, ssl_context=ssl_context))
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio chat server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=1, help="processes sharing the port with SO_REUSEPORT")
+    parser.add_argument("--delay", type=float, default=0, help="seconds to hold each new connection before answering it")
+    parser.add_argument("--tls-cert", metavar="FILE", help="serve TLS with this certificate chain (PEM)")
+    parser.add_argument("--tls-key", metavar="FILE", help="private key of the certificate, if not in the same file")
+    args = parser.parse_args()
+    if args.tls_key and not args.tls_cert:
+        parser.error("--tls-key needs --tls-cert")
+    try:
+        ssl_context = server_context(args.tls_cert, args.tls_key) if args.tls_cert else None
+    except OSError as e:
+        parser.error(f"Cannot load the TLS certificate: {e}")
+
+    print("I am a server.")
+    print("Type 'SHUTDOWN' to shut down the server.")
+    if args.workers <= 1:
+        raise_file_limit()
+        asyncio.run(serve(args.host, args.port, delay=args.delay, ssl_context=ssl_context))
+        return
+
+    # Workers take SIGINT from the terminal themselves, the parent relays SHUTDOWN and SIGTERM
+    workers = [multiprocessing.Process(target=run_worker, args=(args.host, args.port, args.delay, ssl_context)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for line in sys.stdin:
+            if line.strip() == "SHUTDOWN":
+                break
+            print("Type 'SHUTDOWN' to shut down the server.")
+        else:
+
+            # No console, run until interrupted
+            for worker in workers:
+                worker.join()
+    except KeyboardInterrupt:
+        pass
+    for worker in workers:
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGTERM)
+    for worker in workers:
+        worker.join()
+
+
+# Entry point of the program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+# Imports
+import time
+from collections import deque, namedtuple
+from protocol import (
+    FrameDecoder,
+    RoomList,
+    Reply,
+    Hello,
+    RoomAdded,
+    RoomRemoved,
+    RoomUsers,
+    RoomSeq,
+    ChatMessage,
+    ServerShutdown,
+    RoomMessage,
+    Channel,
+    ChannelMessage,
+    Pong,
+    RoomPage,
+    TransferStart,
+    TransferChunk,
+    TransferEnd,
+    TransferAbort,
+    UploadEnd,
+    ProtocolError,
+    encode,
+    encode_message,
+    create_room_command,
+    join_room_command,
+    rejoin_room_command,
+    disconnect_room_command,
+    disconnect_command,
+    hello_command,
+    resync_command,
+    ping_command,
+    list_rooms_command,
+    transfer_room_command,
+)
+from heartbeat import Heartbeat
+from transfer import MAX_TRANSFER_SIZE, MAX_TRANSFERS, TRANSFER_THRESHOLD, TransferAssembler, TransferSender
+
+
+# Optional protocol features the client asks the server for
+CAPABILITIES = frozenset({"binary", "chunks", "deflate", "deltas", "ids", "ping", "resume"})
+
+# Feature numbering create/join requests, the server echoes the number in its reply
+IDS = "ids"
+
+# Feature letting one connection be in several rooms, offered by clients that can show them
+MUX = "mux"
+
+# Feature letting the room list arrive a page at a time, offered by clients that fetch pages as they are shown
+PAGES = "pages"
+
+# Rooms asked for in each room list page
+PAGE_SIZE = 100
+
+# Seconds a create/join request may wait for its reply
+REQUEST_TIMEOUT = 5
+
+# Statuses reported for requests that never got a reply
+TIMEOUT = "TIMEOUT"
+DISCONNECTED = "DISCONNECTED"
+
+# Replies that move the session into the requested room
+SUCCESS_STATUSES = ("CREATE_SUCCESS", "JOIN_SUCCESS")
+
+# A reply matched to the request that caused it
+Response = namedtuple("Response", "request status")
+
+# A message for one of the rooms of a multiplexed connection
+RoomEvent = namedtuple("RoomEvent", "room_name message")
+
+# Messages that belong to the room they arrive for
+ROOM_MESSAGES = (ChatMessage, RoomSeq, TransferStart, TransferChunk, TransferEnd, TransferAbort)
+
+# A pong matched to its ping: the measured round trip and the smoothed one, in seconds
+RoundTrip = namedtuple("RoundTrip", "rtt srtt")
+
+
+# Error raised when a command is not valid in the current session state
+class SessionError(Exception):
+    pass
+
+
+# Create/join request waiting for its reply
+class PendingRequest:
+    def __init__(self, request_id, kind, room_name, username, deadline, password=""):
+        self.request_id = request_id
+        self.kind = kind
+        self.room_name = room_name
+        self.username = username
+        self.password = password
+        self.deadline = deadline
+
+        # Monotonic time the request was sent, for measuring its round trip
+        self.started = time.monotonic()
+
+        # Set once the request has timed out, its late reply is then discarded
+        self.expired = False
+
+        # Optional completion callback used by callback based transports
+        self.callback = None
+
+
+# Room the session is in, kept to rejoin it after a reconnect
+class JoinedRoom:
+    def __init__(self, name, username, password=""):
+        self.name = name
+        self.username = username
+        self.password = password
+
+        # Sequence number of the last room message seen, resume replays anything newer
+        self.last_seq = 0
+
+        # Channel the server tags the room's messages with on a multiplexed connection
+        self.channel = None
+
+
+# Matches replies to requests. A reply carrying a request id resolves that request,
+# so a request that timed out never takes the reply meant for a later one. The server
+# answers in the order the requests were sent, so expired requests sent before the
+# answered one get no reply any more and are dropped. A reply without an id, from a
+# server without the ids feature, resolves the oldest outstanding request.
+class RequestTracker:
+    def __init__(self):
+        self.next_id = 1
+        self.pending = deque()
+
+    # Method to register a new outstanding request, a replayed one keeps the id it was recorded with
+    def begin(self, kind, room_name, username, timeout=REQUEST_TIMEOUT, password="", request_id=None):
+        if request_id is None:
+            request_id, self.next_id = self.next_id, self.next_id + 1
+        request = PendingRequest(request_id, kind, room_name, username, time.monotonic() + timeout, password)
+        self.pending.append(request)
+        return request
+
+    # Method to match a reply to its request, None when no request is waiting for it
+    def resolve(self, request_id=None):
+        if request_id is None:
+            return self.pending.popleft() if self.pending else None
+        request = next((request for request in self.pending if request.request_id == request_id), None)
+        if request is None:
+            return None
+        kept = []
+        while self.pending[0] is not request:
+            earlier = self.pending.popleft()
+            if not earlier.expired:
+                kept.append(earlier)
+        self.pending.popleft()
+        self.pending.extendleft(reversed(kept))
+        return request
+
+    # Method to forget a request that was never sent
+    def remove(self, request):
+        self.pending.remove(request)
+
+    # Method to mark one request as timed out
+    def cancel(self, request):
+        request.expired = True
+
+    # Method to time out every request past its deadline, returns the newly expired ones
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        expired = []
+        for request in self.pending:
+            if not request.expired and request.deadline <= now:
+                request.expired = True
+                expired.append(request)
+        return expired
+
+    # Method to get the earliest deadline still being waited on
+    def next_deadline(self):
+        deadlines = [request.deadline for request in self.pending if not request.expired]
+        return min(deadlines) if deadlines else None
+
+    # Method to drop every outstanding request when the connection ends
+    def fail_all(self):
+        failed = [request for request in self.pending if not request.expired]
+        self.pending.clear()
+        return failed
+
+
+# Protocol state for one client connection, independent of how bytes are moved.
+# Transports feed received bytes in and write the bytes returned by each command.
+class ClientSession:
+    def __init__(self, framed=True, capabilities=CAPABILITIES):
+        self.framed = framed
+        self.decoder = FrameDecoder()
+
+        # Features offered to the server in HELLO
+        self.offered = frozenset(capabilities)
+
+        # Room list indexed by name, kept current from snapshots and deltas
+        self.rooms = {}
+
+        # With the pages feature the list holds the rooms up to room_cursor in name order,
+        # None once every room is loaded. room_total counts the rooms on the server.
+        self.room_cursor = None
+        self.room_total = 0
+        self.page_pending = False
+
+        # Features agreed with the server, empty until its HELLO reply arrives
+        self.capabilities = frozenset()
+
+        # Set when a delta does not match the room list and a fresh snapshot is needed
+        self.resync_needed = False
+
+        # Set once the server answered HELLO on the current connection
+        self.hello_received = False
+
+        # Set when the server announced it is shutting down
+        self.server_closed = False
+
+        # Rooms the session is in by name, and by channel on a multiplexed connection.
+        # Without the mux feature the server keeps a connection in one room at a time.
+        self.joined = {}
+        self.channels = {}
+
+        # Create/join requests awaiting a reply
+        self.requests = RequestTracker()
+
+        # Pings and the round trip estimate, running once the server agreed to answer pings
+        self.heartbeat = Heartbeat()
+
+        # Long chat messages streamed in chunks, being sent and being reassembled
+        self.uploads = TransferSender()
+        self.downloads = TransferAssembler()
+
+        # Handlers updating session state for each message type
+        self.handlers = {
+            RoomList: self.apply_snapshot,
+            RoomPage: self.apply_room_page,
+            RoomAdded: self.apply_room_added,
+            RoomRemoved: self.apply_room_removed,
+            RoomUsers: self.apply_room_users,
+            Hello: self.apply_hello,
+            ServerShutdown: self.apply_shutdown,
+            Channel: self.apply_channel,
+            UploadEnd: self.apply_upload_end,
+        }
+
+    # Method to decode received bytes, replies become Responses, room messages of a
+    # multiplexed connection become RoomEvents, pongs become RoundTrips and other pushes
+    # pass through. Room list updates past the loaded pages and stale pages are dropped.
+    def receive(self, data):
+        messages = self.decoder.feed(data)
+        for index, message in enumerate(messages):
+            if isinstance(message, Reply):
+                messages[index] = self.handle_reply(message)
+            elif isinstance(message, Pong):
+                messages[index] = self.apply_pong(message)
+            elif isinstance(message, ChannelMessage):
+                messages[index] = self.apply_channel_message(message)
+            elif isinstance(message, ROOM_MESSAGES):
+                messages[index] = self.apply_room_message(self.current_room(), message)
+            else:
+                handler = self.handlers.get(type(message))
+                if handler is not None:
+                    messages[index] = handler(message)
+        return [message for message in messages if message is not None]
+
+    # Method to start over on a new connection, keeping the rooms to rejoin
+    def reset_stream(self):
+        self.decoder = FrameDecoder()
+        self.capabilities = frozenset()
+        self.hello_received = False
+        self.resync_needed = False
+        self.page_pending = False
+        self.channels = {}
+        self.heartbeat.stop()
+        self.uploads.cancel()
+        self.downloads.clear()
+        for joined in self.joined.values():
+            joined.channel = None
+
+    # Method to track room sequence numbers, dropping messages already seen before a replay.
+    # ROOM_SEQ follows a join or replay and carries the room's current sequence number.
+    # Chunks of a streamed message become progress reports and the finished message chat.
+    def apply_room_message(self, joined, message):
+        if not isinstance(message, (ChatMessage, RoomSeq)):
+            message = self.apply_transfer(joined, message)
+            if not isinstance(message, ChatMessage):
+                return message
+        if joined is None:
+            return None if isinstance(message, RoomSeq) else message
+        if isinstance(message, RoomSeq):
+            joined.last_seq = message.seq
+            return None
+        if isinstance(message, ChatMessage) and message.seq is not None:
+            if message.seq <= joined.last_seq:
+                return None
+            joined.last_seq = message.seq
+        return message
+
+    # Method to reassemble a streamed message into the buffer allocated when it started.
+    # Returns its progress, the finished message, or None for a stream that is not running.
+    def apply_transfer(self, joined, message):
+        kind = type(message)
+        if kind is TransferStart:
+            transfer = self.downloads.start(
+                message.transfer_id, message.sender, message.size, None if joined is None else joined.name)
+            if transfer is None:
+                raise ProtocolError("Streamed message too large: %d bytes" % message.size)
+            return transfer.progress()
+        if kind is TransferChunk:
+            transfer = self.downloads.get(message.transfer_id)
+            if transfer is None:
+                return None
+            if not transfer.add(message.offset, message.data):
+                raise ProtocolError("Chunk at %d does not continue the stream" % message.offset)
+            return transfer.progress()
+        transfer = self.downloads.pop(message.transfer_id)
+        if transfer is None:
+            return None
+        if kind is TransferEnd:
+            return ChatMessage(transfer.sender, transfer.text(), message.seq)
+        return transfer.progress(failed=True)
+
+    # Method to forget a stream the server took in full. A refused one (UPLOAD_ABORT) passes
+    # on to the transport, which sends the message another way.
+    def apply_upload_end(self, message):
+        self.uploads.confirm(message.transfer_id)
+        return None
+
+    # Method to route a message tagged with a channel to its room, messages for rooms already left are dropped
+    def apply_channel_message(self, message):
+        joined = self.channels.get(message.channel)
+        if joined is None:
+            return None
+        message = self.apply_room_message(joined, message.message)
+        return None if message is None else RoomEvent(joined.name, message)
+
+    # CHANNEL follows a successful create/join on a multiplexed connection
+    def apply_channel(self, message):
+        joined = self.joined.get(message.room_name)
+        if joined is not None:
+            joined.channel = message.channel
+            self.channels[message.channel] = joined
+        return message
+
+    # Methods applying room list snapshots, pages and deltas to the room index. Each
+    # returns the message to pass on, or None for one that changes nothing loaded.
+    def apply_snapshot(self, message):
+        self.rooms = {room.name: room for room in message.rooms}
+        self.room_cursor = None
+        self.room_total = len(self.rooms)
+        self.resync_needed = False
+        return message
+
+    # A page after no cursor is the first one and replaces the list, the server sends it
+    # unasked on connect and for RESYNC. Other pages continue the list from the cursor,
+    # a page asked for before the list was replaced does not and is dropped.
+    def apply_room_page(self, message):
+        if message.after:
+            self.page_pending = False
+            if message.after != self.room_cursor:
+                return None
+        else:
+            self.rooms = {}
+            self.resync_needed = False
+        self.rooms.update((room.name, room) for room in message.rooms)
+        if not message.more:
+            self.room_cursor = None
+        elif message.rooms:
+            self.room_cursor = message.rooms[-1].name
+        self.room_total = message.total
+        return message
+
+    def apply_room_added(self, message):
+        if message.room.name not in self.rooms:
+            self.room_total += 1
+        if not self.loaded(message.room.name):
+            return None
+        self.rooms[message.room.name] = message.room
+        return message
+
+    def apply_room_removed(self, message):
+        self.room_total = max(0, self.room_total - 1)
+        if not self.loaded(message.name):
+            return None
+        if self.rooms.pop(message.name, None) is None:
+            self.resync_needed = True
+        return message
+
+    def apply_room_users(self, message):
+        if not self.loaded(message.name):
+            return None
+        room = self.rooms.get(message.name)
+        if room is None:
+            self.resync_needed = True
+        else:
+            self.rooms[message.name] = room._replace(current_users=message.current_users)
+        return message
+
+    # Method to check whether a room falls within the loaded pages of the room list
+    def loaded(self, room_name):
+        return self.room_cursor is None or room_name <= self.room_cursor
+
+    # Method to build the request for the next room list page, None when every room is
+    # loaded or a page is already on its way
+    def next_page(self, count=PAGE_SIZE):
+        if self.room_cursor is None or self.page_pending or PAGES not in self.capabilities:
+            return None
+        self.page_pending = True
+        return self.encode(list_rooms_command(self.room_cursor, count))
+
+    # Method to record the features the server agreed to
+    def apply_hello(self, message):
+        self.capabilities = message.capabilities
+        self.hello_received = True
+        return message
+
+    def apply_shutdown(self, message):
+        self.server_closed = True
+        return message
+
+    # Method to time a pong, pongs for pings given up on are dropped
+    def apply_pong(self, message):
+        if self.heartbeat.pong(message.token) is None:
+            return None
+        return RoundTrip(self.heartbeat.rtt, self.heartbeat.srtt)
+
+    # Method to encode a command for the current stream, compressed once the server agreed to it
+    def encode(self, text):
+        return encode(text, self.framed, "deflate" in self.capabilities)
+
+    # Method to build the HELLO message offering optional features
+    def hello(self, capabilities=None):
+        return encode(hello_command(self.offered if capabilities is None else capabilities), self.framed)
+
+    # Method to check whether the connection may be in several rooms at once
+    def multiplexed(self):
+        return MUX in self.capabilities
+
+    # Method to start the heartbeat once the server agreed to answer pings, returns whether it runs
+    def start_heartbeat(self):
+        if "ping" not in self.capabilities or self.heartbeat.interval <= 0:
+            return False
+        self.heartbeat.start()
+        return True
+
+    # Method to build the next ping
+    def ping(self):
+        return self.encode(ping_command(self.heartbeat.ping()))
+
+    # Method to build a request for a fresh room list snapshot
+    def resync(self):
+        self.resync_needed = False
+        return self.encode(resync_command())
+
+    # Method to match a reply to its request and enter the room on success.
+    # Transports must call abandon() for a successful reply to an expired request.
+    def handle_reply(self, reply):
+        request = self.requests.resolve(reply.request_id)
+        if request is None:
+            return None
+        if reply.status in SUCCESS_STATUSES and not request.expired:
+            self.enter_room(request)
+        elif request.kind == "REJOIN_ROOM":
+            self.forget_room(request.room_name)
+        return Response(request, reply.status)
+
+    # Method to record the room a request entered. A rejoined room keeps its sequence
+    # number, and without the mux feature entering a room leaves the previous one.
+    def enter_room(self, request):
+        joined = self.joined.get(request.room_name) if request.kind == "REJOIN_ROOM" else None
+        if not self.multiplexed():
+            self.joined.clear()
+            self.channels.clear()
+        if joined is None:
+            joined = JoinedRoom(request.room_name, request.username, request.password)
+        elif joined.channel is not None:
+            self.channels.pop(joined.channel, None)
+            joined.channel = None
+        self.joined[request.room_name] = joined
+
+    # Method to stop tracking a room. Streams for the room stop with it.
+    def forget_room(self, room_name):
+        self.uploads.cancel(room_name)
+        self.downloads.clear(room_name)
+        joined = self.joined.pop(room_name, None)
+        if joined is not None and joined.channel is not None:
+            self.channels.pop(joined.channel, None)
+
+    # Method to get a room the session is in, the only one when no name is given
+    def current_room(self, room_name=None):
+        if room_name is not None:
+            return self.joined.get(room_name)
+        if len(self.joined) == 1:
+            return next(iter(self.joined.values()))
+        return None
+
+    # Method to get a room for a command, raising SessionError when there is none
+    def require_room(self, room_name=None):
+        joined = self.current_room(room_name)
+        if joined is None:
+            raise SessionError("Not in a chatroom" if room_name is not None or not self.joined else "Name the chatroom")
+        return joined
+
+    # Method to build the leave message for a room joined after its request timed out
+    def abandon(self, request):
+        return self.encode(disconnect_room_command(request.room_name, request.username))
+
+    # Method to get the id to send with a request, None unless the server takes ids
+    def request_id(self, request):
+        return request.request_id if self.framed and IDS in self.capabilities else None
+
+    # Method to build a create room request, returns the request and the bytes to send.
+    # A name or password containing a field separator raises SessionError.
+    def create_room(self, room_name, username, password="", max_users=2, timeout=REQUEST_TIMEOUT):
+        request = self.requests.begin("CREATE_ROOM", room_name, username, timeout, password)
+        return request, self.request_command(
+            request, create_room_command, room_name, password, max_users, username, self.request_id(request))
+
+    # Method to build a join room request, returns the request and the bytes to send
+    def join_room(self, room_name, username, password="", timeout=REQUEST_TIMEOUT):
+        request = self.requests.begin("JOIN_ROOM", room_name, username, timeout, password)
+        return request, self.request_command(
+            request, join_room_command, room_name, password, username, self.request_id(request))
+
+    # Method to encode the command of a new request, forgetting the request when a field is invalid
+    def request_command(self, request, build, *fields):
+        try:
+            return self.encode(build(*fields))
+        except ValueError as e:
+            self.requests.remove(request)
+            raise SessionError(str(e))
+
+    # Method to build the request re-entering a room after a reconnect.
+    # Servers with the resume feature replay the messages missed since last_seq.
+    def rejoin_room(self, room_name=None, timeout=REQUEST_TIMEOUT):
+        joined = self.require_room(room_name)
+        request = self.requests.begin("REJOIN_ROOM", joined.name, joined.username, timeout, joined.password)
+        if "resume" in self.capabilities:
+            command = rejoin_room_command(
+                joined.name, joined.password, joined.username, joined.last_seq, self.request_id(request))
+        else:
+            command = join_room_command(joined.name, joined.password, joined.username, self.request_id(request))
+        return request, self.encode(command)
+
+    # Method to build a chat message for a room, binary once the server agreed to it
+    # so the text and username may contain ';'
+    def send_message(self, text, room_name=None):
+        joined = self.require_room(room_name)
+        return encode_message(
+            RoomMessage(joined.name, text, joined.username),
+            self.framed, "deflate" in self.capabilities, "binary" in self.capabilities)
+
+    # Method to check whether a message of size bytes is long enough to stream and the server takes streams
+    def can_stream(self, size):
+        return (self.framed and "chunks" in self.capabilities and "binary" in self.capabilities
+                and TRANSFER_THRESHOLD < size <= MAX_TRANSFER_SIZE and len(self.uploads) < MAX_TRANSFERS)
+
+    # Method to start streaming a chat message to a room, returns the transfer and the bytes
+    # announcing it. The chunks are taken with next_chunk() as the socket has room for them.
+    def start_transfer(self, text, room_name=None):
+        joined = self.require_room(room_name)
+        transfer = self.uploads.start(joined.name, joined.username, text.encode())
+        return transfer, self.encode(transfer_room_command(joined.name, transfer.transfer_id, transfer.size, joined.username))
+
+    # Method to build the next chunk of the running streams, returns the transfer and the
+    # bytes to send, or None when nothing is being streamed
+    def next_chunk(self):
+        item = self.uploads.next_chunk()
+        if item is None:
+            return None
+        transfer, chunk = item
+        return transfer, encode_message(chunk, self.framed, "deflate" in self.capabilities, True)
+
+    # Method to build a leave room message, the last room left returns the session to the lobby
+    def leave_room(self, room_name=None):
+        joined = self.require_room(room_name)
+        self.forget_room(joined.name)
+        return self.encode(disconnect_room_command(joined.name, joined.username))
+
+    # Method to build the leave messages for every room
+    def leave_all(self):
+        return b"".join(self.leave_room(room_name) for room_name in list(self.joined))
+
+    # Method to build the final disconnect message
+    def disconnect(self):
+        return self.encode(disconnect_command())
+
+    # Method to check whether the session is inside a chatroom, or inside the named one
+    def in_room(self, room_name=None):
+        return bool(self.joined) if room_name is None else room_name in self.joined
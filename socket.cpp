@@ -4,10 +4,11 @@
 #include <errno.h>
 
 #include "socket.h"
+#include "framereader.h"
 namespace Sync{
 	
 Socket::Socket(std::string const & ipAddress, unsigned int port)
-    : Blockable(),open(false)
+    : Blockable(),open(false),framed(false),compressed(false)
 {
     // First, call socket() to get a socket file descriptor
     SetFD(socket(AF_INET, SOCK_STREAM, 0));
@@ -25,7 +26,7 @@ Socket::Socket(std::string const & ipAddress, unsigned int port)
 }
 
 Socket::Socket(int sFD)
-    : Blockable(sFD)
+    : Blockable(sFD),framed(false),compressed(false)
 {
     open = true;
 }
@@ -34,6 +35,8 @@ Socket::Socket(Socket const & s)
     :Blockable(s)
 {    
     open = s.open;
+    framed = s.framed;
+    compressed = s.compressed;
 }
 
 Socket & Socket::operator=(Socket const & rhs)
@@ -42,6 +45,8 @@ Socket & Socket::operator=(Socket const & rhs)
     socketDescriptor = rhs.socketDescriptor;
     SetFD(dup(rhs.GetFD()));
     open = rhs.open;
+    framed = rhs.framed;
+    compressed = rhs.compressed;
 }
 
 Socket::~Socket(void)
@@ -64,10 +69,17 @@ int Socket::Write(ByteArray const & buffer)
 {
     if (!open)
         return -1;
-    char * raw = new char[buffer.v.size()];
-    for (int i=0;i<buffer.v.size();i++)
-        raw[i] = buffer.v[i];
-    int returnValue = write(GetFD(),raw,buffer.v.size());
+    ByteArray frame;
+    if (framed)
+        frame = compressed ? EncodeCompressedFrame(buffer) : EncodeFrame(buffer);
+    return WriteEncoded(framed ? frame : buffer);
+}
+
+int Socket::WriteEncoded(ByteArray const & data)
+{
+    if (!open)
+        return -1;
+    int returnValue = write(GetFD(),data.v.data(),data.v.size());
     if (returnValue <=0)
         open = false;
     return returnValue;
@@ -108,4 +120,24 @@ void Socket::Close(void)
     terminator.Trigger();
 
 }
+
+void Socket::SetFramed(bool f)
+{
+    framed = f;
+}
+
+bool Socket::IsFramed(void) const
+{
+    return framed;
+}
+
+void Socket::SetCompressed(bool c)
+{
+    compressed = c;
+}
+
+bool Socket::IsCompressed(void) const
+{
+    return compressed;
+}
 };
\ No newline at end of file
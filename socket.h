@@ -41,6 +41,8 @@ class Socket : public Blockable
 private:
     sockaddr_in socketDescriptor;
     bool open;
+    bool framed;
+    bool compressed;
     Event terminator;
 public:
     Socket(std::string const & ipAddress, unsigned int port);
@@ -51,8 +53,18 @@ public:
 
     int Open(void);
     int Write(ByteArray const & buffer);
+    // Writes bytes that are already encoded for this socket, such as a shared compressed frame
+    int WriteEncoded(ByteArray const & data);
     int Read(ByteArray & buffer);
     void Close(void);
+
+    // Once set, every Write is wrapped in a length-prefixed frame
+    void SetFramed(bool f);
+    bool IsFramed(void) const;
+
+    // Once set, framed writes above the threshold are compressed
+    void SetCompressed(bool c);
+    bool IsCompressed(void) const;
 };
 };
 #endif // SOCKET_H
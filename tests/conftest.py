@@ -0,0 +1,115 @@
+# Shared fixtures: the client modules on the import path and server.py stand-ins on free ports
+
+# Imports
+import os, socket, subprocess, sys, time
+import pytest
+
+# Directory holding the sources under test
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Seconds a started process may take to accept connections, and to exit once told to
+START_TIMEOUT = 10
+STOP_TIMEOUT = 10
+
+
+# Function to pick a free port
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+# Function to wait until a port accepts connections, killing the process when it never does
+def wait_for_port(process, port):
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process on port {port} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Nothing accepted connections on port {port}")
+
+
+# Function to start a server with its console on a pipe, returning the process once its port is open
+def start_process(command, port, cwd=ROOT):
+    process = subprocess.Popen(
+        command, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(process, port)
+    return process
+
+
+# Function to start one of the scripts on a port
+def start_script(script, port, *options):
+    return start_process([sys.executable, script, "--port", str(port), *options], port)
+
+
+# Function to stop a started script through its console, killing it when it hangs
+def stop_script(process):
+    try:
+        process.communicate(b"SHUTDOWN\n", timeout=STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+
+
+# Copies of one script started by a test on free ports, stopped when the test ends or before
+class Scripts:
+    def __init__(self, script, *options):
+        self.script = script
+        self.options = options
+        self.processes = {}
+
+    # Method to start a copy with extra options, returning its port
+    def start(self, *options):
+        port = free_port()
+        self.processes[port] = start_script(self.script, port, "--host", "127.0.0.1", *self.options, *options)
+        return port
+
+    # Method to stop the copy on a port through its console
+    def stop(self, port):
+        stop_script(self.processes.pop(port))
+
+    # Method to kill the copy on a port, standing in for a server that crashed
+    def kill(self, port):
+        process = self.processes.pop(port)
+        process.kill()
+        process.communicate()
+
+    # Method to stop every copy still running
+    def stop_all(self):
+        for port in list(self.processes):
+            self.stop(port)
+
+
+# Fixture starting server.py stand-ins, servers.start("--delay", "0.2") returns the port of a new one
+@pytest.fixture
+def servers():
+    scripts = Scripts("server.py")
+    yield scripts
+    scripts.stop_all()
+
+
+# Fixture starting relay.py, relays.start("--upstream", "127.0.0.1:PORT") returns the port of a new one
+@pytest.fixture
+def relays():
+    scripts = Scripts("relay.py")
+    yield scripts
+    scripts.stop_all()
+
+
+# Fixture giving the port of one plain server.py
+@pytest.fixture
+def server_port(servers):
+    return servers.start()
+
+
+# Fixture giving the port of a relay in front of one plain server.py
+@pytest.fixture
+def relay_port(server_port, relays):
+    return relays.start("--upstream", f"127.0.0.1:{server_port}")
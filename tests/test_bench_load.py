@@ -0,0 +1,30 @@
+# Smoke tests of the load generator against server.py
+
+# Imports
+import json, os, subprocess, sys
+from bench_load import percentile, summary
+
+# Directory holding bench_load.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds a short load run may take
+RUN_TIMEOUT = 60
+
+
+def test_summary_reports_percentiles_in_milliseconds():
+    stats = summary([0.004, 0.001, 0.003, 0.002])
+    assert stats == {"count": 4, "p50_ms": 2.0, "p95_ms": 4.0, "p99_ms": 4.0, "max_ms": 4.0}
+    assert percentile([], 0.5) is None and summary([])["max_ms"] is None
+
+
+def test_short_run_delivers_every_message(server_port):
+    result = subprocess.run(
+        [sys.executable, "bench_load.py", "--port", str(server_port), "--users", "6", "--rooms", "2",
+         "--rate", "50", "--churn", "1", "--duration", "1", "--label", "smoke"],
+        cwd=ROOT, capture_output=True, text=True, timeout=RUN_TIMEOUT,
+    )
+    assert result.returncode == 0, result.stderr
+    results = json.loads(result.stdout)
+    assert results["label"] == "smoke" and not results["errors"]
+    assert results["sent"] > 0 and results["connect"]["count"] == 6
+    assert results["latency"]["count"] == results["deliveries"] > 0
@@ -0,0 +1,62 @@
+# Tests of the binary codec for chat and room records
+
+# Imports
+import pytest
+from protocol import (
+    ChatMessage, FLAG_BINARY, FRAME_HEADER, FrameDecoder, ProtocolError, Room, RoomAdded, RoomList, RoomMessage,
+    RoomRemoved, RoomSeq, RoomUsers, TransferChunk, _get_varint, _put_varint, encode_message, pack_message, unpack_message,
+)
+
+# Records of every binary type, with multi-byte text and numbers past one varint byte
+RECORDS = [
+    ChatMessage("alice", "hello"),
+    ChatMessage("zoë", "naïve café ☕; and more", 0),
+    ChatMessage("bob", "", 300),
+    ChatMessage("", "sender-less"),
+    RoomList([]),
+    RoomList([Room("lobby", False, 1, 10), Room("vault", True, 200, 1000), Room("чат", False, 0, 2)]),
+    RoomAdded(Room("big room", True, 128, 16384)),
+    RoomRemoved("gone ☕"),
+    RoomUsers("lobby", 129),
+    RoomMessage("room", "text; with separators", "alice"),
+    TransferChunk(70000, 1 << 20, bytes(range(256))),
+]
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16383, 16384, 2 ** 32, 2 ** 56 - 1])
+def test_varint_round_trips(value):
+    out = bytearray()
+    _put_varint(out, value)
+    assert len(out) == max(1, (value.bit_length() + 6) // 7)
+    assert _get_varint(memoryview(bytes(out)), 0) == (value, len(out))
+
+
+@pytest.mark.parametrize("record", RECORDS, ids=lambda record: type(record).__name__)
+def test_records_round_trip(record):
+    assert unpack_message(pack_message(record)) == record
+
+
+def test_binary_frames_decode_in_a_stream():
+    data = b"".join(encode_message(record, binary=True) for record in RECORDS)
+    assert FrameDecoder().feed(data) == RECORDS
+    assert FRAME_HEADER.unpack_from(encode_message(RECORDS[0], binary=True))[1] == FLAG_BINARY
+
+
+# Messages without a binary form go out as text
+def test_text_fallback():
+    assert pack_message(RoomSeq(5)) is None
+    frame = encode_message(RoomSeq(5), binary=True)
+    assert FRAME_HEADER.unpack_from(frame)[1] == 0
+    assert FrameDecoder().feed(frame) == [RoomSeq(5)]
+
+
+@pytest.mark.parametrize("record", RECORDS[1:3] + RECORDS[5:6] + RECORDS[9:10], ids=lambda record: type(record).__name__)
+def test_truncated_records_are_refused(record):
+    payload = pack_message(record)
+    with pytest.raises(ProtocolError):
+        unpack_message(payload[:2])
+
+
+def test_unknown_record_type_is_refused():
+    with pytest.raises(ProtocolError):
+        unpack_message(b"\x7fdata")
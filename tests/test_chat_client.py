@@ -0,0 +1,70 @@
+# Tests of the headless ChatClient against server.py
+
+# Imports
+import asyncio
+import pytest
+from chat_client import ChatClient
+from protocol import ChatMessage
+
+# Seconds a message may take to arrive
+RECEIVE_TIMEOUT = 5
+
+
+# Function to connect a headless client, framed or speaking the legacy text stream
+async def connect(port, framed=True):
+    client = ChatClient("127.0.0.1", port, framed)
+    await client.connect()
+    return client
+
+
+# Function to wait for the next chat message from a sender
+async def next_message(client, sender):
+    async def receive():
+        async for message in client.events():
+            if isinstance(message, ChatMessage) and message.sender == sender:
+                return message
+    return await asyncio.wait_for(receive(), RECEIVE_TIMEOUT)
+
+
+@pytest.mark.parametrize("framed", [True, False], ids=["framed", "legacy"])
+def test_clients_chat_in_a_room(server_port, framed):
+    async def scenario():
+        alice = await connect(server_port, framed)
+        bob = await connect(server_port, framed)
+        assert await alice.create_room("room", "alice", "secret", max_users=2) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob", "wrong") == "INVALID_PASSWORD"
+        assert await bob.join_room("room", "bob", "secret") == "JOIN_SUCCESS"
+
+        await bob.send("hello; alice")
+        assert (await next_message(alice, "bob")).text == "hello; alice"
+        await alice.send("hi bob")
+        assert (await next_message(bob, "alice")).text == "hi bob"
+        for client in (alice, bob):
+            await client.close()
+    asyncio.run(scenario())
+
+
+def test_refused_requests_report_why(server_port):
+    async def scenario():
+        alice = await connect(server_port)
+        bob = await connect(server_port)
+        carol = await connect(server_port)
+        assert await alice.join_room("missing", "alice") == "NO_ROOM"
+        assert await alice.create_room("room", "alice", max_users=2) == "CREATE_SUCCESS"
+        assert await bob.create_room("room", "bob") == "ROOM_EXISTS"
+        assert await bob.join_room("room", "alice") == "EXISTING_USER"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        assert await carol.join_room("room", "carol") == "ROOM_FULL"
+        for client in (alice, bob, carol):
+            await client.close()
+    asyncio.run(scenario())
+
+
+def test_close_ends_the_event_stream(server_port):
+    async def scenario():
+        client = await connect(server_port)
+        await client.close()
+        assert [message async for message in client.events() if isinstance(message, ChatMessage)] == []
+        with pytest.raises(ConnectionError):
+            await client.create_room("late", "alice")
+    asyncio.run(scenario())
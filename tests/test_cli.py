@@ -0,0 +1,49 @@
+# Tests of the terminal client driven by piped input, against server.py
+
+# Imports
+import os, subprocess, sys
+
+# Directory holding cli.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds a scripted session may take
+SESSION_TIMEOUT = 20
+
+
+# Function to pipe a script into cli.py and return its output lines
+def run_script(port, *lines, command=("cli.py",), env=None):
+    result = subprocess.run(
+        [sys.executable, *command, "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, input="".join(line + "\n" for line in lines), capture_output=True, text=True,
+        timeout=SESSION_TIMEOUT, env=env,
+    )
+    return result.stdout.splitlines()
+
+
+def test_piped_script_waits_for_the_connection(server_port):
+    output = run_script(server_port, "/rooms", "/nick alice", "/create first 3", "/quit")
+    assert output == [
+        f"Connected to 127.0.0.1:{server_port}, 0 rooms. Type /help for commands.",
+        "No rooms, /create makes one.",
+        "Entered first as alice. /leave returns to the lobby.",
+    ]
+
+
+def test_separator_in_room_name_is_refused(server_port):
+    output = run_script(server_port, "/nick alice", "/create a;b", "/create good", "/quit")
+    assert output[1:] == [
+        "'a;b' may not contain ';' or a line break",
+        "Entered good as alice. /leave returns to the lobby.",
+    ]
+
+
+# client.py --cli must not import PyQt5, so it runs where Qt is missing
+def test_client_cli_starts_without_pyqt5(server_port, tmp_path):
+    (tmp_path / "PyQt5").mkdir()
+    (tmp_path / "PyQt5" / "__init__.py").write_text("raise ImportError('PyQt5 is not installed')\n")
+    env = dict(os.environ, PYTHONPATH=str(tmp_path))
+    output = run_script(server_port, "/nick alice", "/create first", "/quit", command=("client.py", "--cli"), env=env)
+    assert output == [
+        f"Connected to 127.0.0.1:{server_port}, 0 rooms. Type /help for commands.",
+        "Entered first as alice. /leave returns to the lobby.",
+    ]
@@ -0,0 +1,82 @@
+# Tests of per-frame deflate with the preset dictionary
+
+# Imports
+import asyncio, os, zlib
+import pytest
+import protocol
+from protocol import (
+    COMPRESS_THRESHOLD, FLAG_COMPRESSED, FRAME_HEADER, ChatMessage, FrameDecoder, ProtocolError,
+    compress_payload, decompress_payload, encode, pack_frame,
+)
+from session import CAPABILITIES
+from test_chat_client import next_message
+from test_requests import connect
+
+
+# Function to read the flags of an encoded frame
+def flags_of(frame):
+    return FRAME_HEADER.unpack_from(frame)[1]
+
+
+def test_payload_round_trips():
+    payload = ("MESSAGE;alice;" + "the quick brown fox " * 50).encode()
+    packed = compress_payload(payload)
+    assert len(packed) < len(payload) // 4
+    assert decompress_payload(packed) == payload
+
+
+def test_dictionary_shrinks_small_commands():
+    payload = b"UPDATE_DATA;lobby;;1;10\nvault;1;2;2\n" * 8
+    plain = zlib.compress(payload, 6)
+    assert len(compress_payload(payload)) < len(plain)
+
+
+def test_small_or_incompressible_payloads_stay_plain():
+    assert flags_of(pack_frame(b"x" * (COMPRESS_THRESHOLD - 1), compress=True)) == 0
+    assert flags_of(pack_frame(os.urandom(COMPRESS_THRESHOLD * 2), compress=True)) == 0
+    assert flags_of(pack_frame(b"x" * COMPRESS_THRESHOLD, compress=True)) == FLAG_COMPRESSED
+
+
+def test_decoder_inflates_compressed_frames():
+    text = "MESSAGE;alice;" + "hello " * 100
+    assert FrameDecoder().feed(encode(text, compress=True)) == [ChatMessage("alice", ("hello " * 100).strip())]
+
+
+def test_expansion_past_the_limit_is_refused():
+    with pytest.raises(ProtocolError):
+        decompress_payload(compress_payload(b"\0" * 100000), limit=1000)
+
+
+def test_truncated_and_garbled_payloads_are_refused():
+    packed = compress_payload(b"MESSAGE;alice;" + b"hello " * 100)
+    with pytest.raises(ProtocolError):
+        decompress_payload(packed[:len(packed) // 2])
+    with pytest.raises(ProtocolError):
+        decompress_payload(b"\xff" * 16)
+
+
+# Only a client that offered deflate gets compressed frames
+@pytest.mark.parametrize("offered", [True, False], ids=["deflate", "plain"])
+def test_compression_is_negotiated(server_port, monkeypatch, offered):
+    compressed = []
+    decode_payload = protocol.FrameDecoder.decode_payload
+
+    def counting(self, payload, flags):
+        if flags & FLAG_COMPRESSED:
+            compressed.append(len(payload))
+        return decode_payload(self, payload, flags)
+    monkeypatch.setattr(protocol.FrameDecoder, "decode_payload", counting)
+
+    async def scenario():
+        capabilities = CAPABILITIES if offered else CAPABILITIES - {"deflate"}
+        alice = await connect(server_port, capabilities)
+        bob = await connect(server_port, capabilities)
+        assert await alice.create_room("room", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        text = "lorem ipsum dolor sit amet " * 200
+        await bob.send(text)
+        assert (await next_message(alice, "bob")).text.strip() == text.strip()
+        assert bool(compressed) == offered
+        for client in (alice, bob):
+            await client.close()
+    asyncio.run(scenario())
@@ -0,0 +1,143 @@
+# End-to-end tests of the C++ server, built from a clean copy of its sources
+
+# Imports
+import asyncio, glob, os, shutil, subprocess
+import pytest
+import protocol
+from chat_client import ChatClient
+from conftest import ROOT, free_port, start_process, stop_script
+from protocol import ChatMessage, FLAG_COMPRESSED
+from session import CAPABILITIES
+from test_requests import create_malformed, room_list
+
+# Seconds the build may take, and a message waits to arrive
+BUILD_TIMEOUT = 300
+RECEIVE_TIMEOUT = 5
+
+
+# Fixture building the server with make in a directory holding only its sources, so
+# no object file from an earlier build is linked
+@pytest.fixture(scope="module")
+def server_binary(tmp_path_factory):
+    if shutil.which("make") is None or shutil.which("g++") is None:
+        pytest.skip("make and g++ are needed to build the C++ server")
+    build = tmp_path_factory.mktemp("cpp")
+    for source in glob.glob(os.path.join(ROOT, "*.cpp")) + glob.glob(os.path.join(ROOT, "*.h")) + [os.path.join(ROOT, "Makefile")]:
+        shutil.copy(source, build)
+    result = subprocess.run(["make"], cwd=build, capture_output=True, text=True, timeout=BUILD_TIMEOUT)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return str(build / "Server")
+
+
+# Fixture giving the port of a running C++ server
+@pytest.fixture
+def cpp_port(server_binary):
+    port = free_port()
+    process = start_process([server_binary, str(port)], port, os.path.dirname(server_binary))
+    yield port
+    stop_script(process)
+
+
+# Function to connect a headless client offering every feature and wait for the HELLO reply
+async def connect(port):
+    client = ChatClient("127.0.0.1", port)
+    client.session.offered = CAPABILITIES
+    await client.connect()
+    while not client.session.hello_received:
+        await asyncio.sleep(0.01)
+    return client
+
+
+# Function to wait for the next chat message from a sender
+async def next_message(client, sender):
+    async def receive():
+        async for message in client.events():
+            if isinstance(message, ChatMessage) and message.sender == sender:
+                return message
+    return await asyncio.wait_for(receive(), RECEIVE_TIMEOUT)
+
+
+def test_large_messages_arrive_deflated_and_intact(cpp_port, monkeypatch):
+    compressed = []
+    decode_payload = protocol.FrameDecoder.decode_payload
+
+    def counting(self, payload, flags):
+        if flags & FLAG_COMPRESSED:
+            compressed.append(len(payload))
+        return decode_payload(self, payload, flags)
+    monkeypatch.setattr(protocol.FrameDecoder, "decode_payload", counting)
+
+    async def scenario():
+        alice = await connect(cpp_port)
+        bob = await connect(cpp_port)
+        assert {"deflate", "deltas", "ids"} <= alice.session.capabilities
+        assert await alice.create_room("room", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+
+        text = "lorem ipsum dolor sit amet " * 200
+        await bob.send(text)
+        assert (await next_message(alice, "bob")).text.strip() == text.strip()
+        assert compressed
+        for client in (alice, bob):
+            await client.close()
+    asyncio.run(scenario())
+
+
+def test_requests_are_answered(cpp_port):
+    async def scenario():
+        client = await connect(cpp_port)
+        assert await create_malformed(client) == "BAD_REQUEST"
+        assert await client.create_room("good", "alice") == "CREATE_SUCCESS"
+        assert await room_list(cpp_port) == {"good": 1}
+        await client.close()
+    asyncio.run(scenario())
+
+
+def test_chat_text_keeps_its_separators(cpp_port):
+    async def scenario():
+        alice = await connect(cpp_port)
+        bob = await connect(cpp_port)
+        assert await alice.create_room("room", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        await bob.send("a;b;;c; d")
+        assert (await next_message(alice, "bob")).text == "a;b;;c; d"
+
+        # A message for a room that does not exist or names someone else is dropped
+        await bob.write(bob.session.encode("MESSAGE_ROOM;nowhere;lost;bob"))
+        await bob.write(bob.session.encode("MESSAGE_ROOM;room;forged;carol"))
+        await bob.write(bob.session.encode("MESSAGE_ROOM;room"))
+        await bob.send("still here")
+        assert (await next_message(alice, "bob")).text == "still here"
+        for client in (alice, bob):
+            await client.close()
+    asyncio.run(scenario())
+
+
+# Function to wait until the room list a new client sees matches
+async def wait_for_rooms(port, expected):
+    deadline = asyncio.get_running_loop().time() + RECEIVE_TIMEOUT
+    while (rooms := await room_list(port)) != expected:
+        assert asyncio.get_running_loop().time() < deadline, rooms
+        await asyncio.sleep(0.05)
+
+
+# A connection that drops without leaving frees its seat, so the user can join again
+def test_dropped_user_leaves_its_room(cpp_port):
+    async def scenario():
+        alice = await connect(cpp_port)
+        bob = await connect(cpp_port)
+        assert await alice.create_room("room", "alice", max_users=2) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        bob.writer.transport.abort()
+        await wait_for_rooms(cpp_port, {"room": 1})
+
+        bob = await connect(cpp_port)
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        await bob.send("back again")
+        assert (await next_message(alice, "bob")).text == "back again"
+
+        # The last user dropping takes the room with it
+        for client in (alice, bob):
+            client.writer.transport.abort()
+        await wait_for_rooms(cpp_port, {})
+    asyncio.run(scenario())
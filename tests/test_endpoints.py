@@ -0,0 +1,91 @@
+# Tests of server selection against server.py stand-ins with injected delays
+
+# Imports
+import time
+import pytest
+from PyQt5.QtCore import QCoreApplication
+from conftest import free_port
+from endpoints import Endpoint, EndpointPool, Probe, probe_endpoints
+from qt_connection import QtConnection
+
+# Seconds each stand-in holds a new connection before answering it
+DELAYS = (0.6, 0, 0.3)
+
+# Seconds a failover may take, the backoff before the probe included
+FAILOVER_TIMEOUT = 15
+
+
+# Function to get the local endpoint of a port
+def local(port):
+    return Endpoint("127.0.0.1", port)
+
+
+# Function to run the Qt event loop until a condition holds, returning whether it did
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return True
+
+
+# Fixture giving the application Qt connections need
+@pytest.fixture(scope="module")
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+# Fixture starting one stand-in per delay, returning their endpoints in the same order
+@pytest.fixture
+def delayed(servers):
+    return [local(servers.start("--delay", str(delay))) for delay in DELAYS]
+
+
+def test_probe_picks_the_fastest_server(delayed):
+    probes = probe_endpoints(delayed)
+    assert probes[0].endpoint == delayed[1]
+    assert probes[0].latency < min(DELAYS[0], DELAYS[2])
+
+
+def test_probe_ranks_every_server_by_latency(delayed):
+    probes = probe_endpoints(delayed, measure_all=True)
+    assert [probe.endpoint for probe in probes] == [delayed[1], delayed[2], delayed[0]]
+    assert all(probe.latency is not None for probe in probes)
+
+
+# Servers that failed follow the ones that answered, in configured order
+def test_probe_ranks_refused_and_silent_servers_last(servers):
+    refused = local(free_port())
+    silent = local(servers.start("--delay", "5"))
+    answering = local(servers.start("--delay", "0.2"))
+    probes = probe_endpoints([refused, silent, answering], timeout=1, measure_all=True)
+    assert [probe.endpoint for probe in probes] == [answering, refused, silent]
+    assert isinstance(probes[1].error, ConnectionRefusedError)
+    assert isinstance(probes[2].error, TimeoutError)
+
+
+def test_pool_fails_over_in_probe_order():
+    endpoints = [local(port) for port in (1, 2, 3)]
+    pool = EndpointPool(endpoints)
+    assert pool.needs_probe()
+    pool.update([Probe(endpoints[2], 0.01, None), Probe(endpoints[0], 0.02, None), Probe(endpoints[1], None, OSError())])
+    assert pool.current() == endpoints[2] and not pool.needs_probe()
+    assert pool.failed() and pool.current() == endpoints[0]
+    assert pool.failed() and pool.current() == endpoints[1]
+    assert not pool.failed() and pool.needs_probe()
+
+
+def test_connection_fails_over_when_its_server_dies(qt_app, servers):
+    fast, slow = servers.start(), servers.start("--delay", "0.2")
+    refused = free_port()
+    connection = QtConnection.connect_to_any([("127.0.0.1", port) for port in (refused, slow, fast)], timeout=2)
+    try:
+        assert wait_until(lambda: connection.online and connection.session.hello_received, FAILOVER_TIMEOUT)
+        assert connection.address == local(fast)
+
+        servers.kill(fast)
+        assert wait_until(lambda: connection.address == local(slow) and connection.online, FAILOVER_TIMEOUT)
+    finally:
+        connection.close()
@@ -0,0 +1,68 @@
+# Tests of length-prefixed frames and the legacy text stream through FrameDecoder
+
+# Imports
+import pytest
+from protocol import (
+    ChatMessage, FRAME_HEADER, FrameDecoder, ProtocolError, Reply, Room, RoomList, ServerShutdown, Unknown,
+    encode, encode_frame, parse_command,
+)
+
+# Commands of every shape the server sends, and the messages they decode to
+COMMANDS = [
+    ("MESSAGE;alice;hi there", ChatMessage("alice", "hi there")),
+    ("MESSAGE;bob;semi;colons;kept", ChatMessage("bob", "semi;colons;kept")),
+    ("JOIN_SUCCESS", Reply("JOIN_SUCCESS")),
+    ("CREATE_SUCCESS;7", Reply("CREATE_SUCCESS", 7)),
+    ("UPDATE_DATA;lobby;;1;10\nvault;1;2;2\n", RoomList([Room("lobby", False, 1, 10), Room("vault", True, 2, 2)])),
+    ("SERVER_SHUTDOWN", ServerShutdown()),
+]
+
+
+def test_frames_round_trip():
+    decoder = FrameDecoder()
+    data = b"".join(encode(text) for text, _ in COMMANDS)
+    assert decoder.feed(data) == [message for _, message in COMMANDS]
+    assert decoder.framed and decoder.pending() == 0
+
+
+def test_frames_split_at_every_byte_reassemble():
+    decoder = FrameDecoder()
+    data = b"".join(encode(text) for text, _ in COMMANDS)
+    messages = []
+    for index in range(len(data)):
+        messages += decoder.feed(data[index:index + 1])
+    assert messages == [message for _, message in COMMANDS]
+    assert decoder.pending() == 0
+
+
+def test_partial_frame_waits_for_the_rest():
+    decoder = FrameDecoder()
+    frame = encode("MESSAGE;alice;" + "x" * 100)
+    assert decoder.feed(frame[:FRAME_HEADER.size + 10]) == []
+    assert decoder.pending() == FRAME_HEADER.size + 10
+    assert decoder.feed(frame[FRAME_HEADER.size + 10:]) == [ChatMessage("alice", "x" * 100)]
+
+
+# A legacy server writes commands back to back, the decoder splits them where each command starts
+def test_merged_legacy_writes_are_split():
+    decoder = FrameDecoder()
+    data = b"".join(encode(text, framed=False) for text, _ in COMMANDS)
+    assert decoder.feed(data) == [message for _, message in COMMANDS]
+    assert not decoder.framed
+
+
+def test_legacy_text_before_a_frame():
+    decoder = FrameDecoder()
+    assert decoder.feed(b"lobby;;1;10\n" + encode("MESSAGE;alice;hi")) == [
+        RoomList([Room("lobby", False, 1, 10)]), ChatMessage("alice", "hi")]
+
+
+def test_oversized_frame_is_refused():
+    decoder = FrameDecoder(max_frame_size=16)
+    with pytest.raises(ProtocolError):
+        decoder.feed(encode_frame("x" * 17))
+
+
+def test_malformed_commands_do_not_raise():
+    assert parse_command("ROOM_USERS;lobby;many") == Unknown("ROOM_USERS;lobby;many")
+    assert parse_command("lobby;;x;10\nvault;1;2;2") == RoomList([Room("vault", True, 2, 2)])
@@ -0,0 +1,87 @@
+# Tests of the ping/pong heartbeat, its round trip estimate and dead peer detection
+
+# Imports
+import asyncio, socket
+import pytest
+from chat_client import ChatClient
+from heartbeat import Heartbeat, enable_keepalive
+from protocol import encode
+
+# Seconds between pings in the tests, and the most a test may wait for the heartbeat
+INTERVAL = 0.05
+HEARTBEAT_TIMEOUT = 5
+
+
+def test_round_trip_is_smoothed():
+    heartbeat = Heartbeat(interval=10)
+    heartbeat.start(now=0)
+    assert heartbeat.next_deadline() == 10
+    assert heartbeat.pong(heartbeat.ping(now=10), now=10.2) == pytest.approx(0.2)
+    assert (heartbeat.srtt, heartbeat.rttvar) == pytest.approx((0.2, 0.1))
+    heartbeat.pong(heartbeat.ping(now=20), now=21)
+    assert heartbeat.srtt == pytest.approx(0.2 + (1 - 0.2) / 8)
+    assert heartbeat.rttvar == pytest.approx(0.1 + (0.8 - 0.1) / 4)
+
+
+def test_missed_pings_declare_the_peer_dead():
+    heartbeat = Heartbeat(interval=1, max_missed=3)
+    heartbeat.start(now=0)
+    tokens = [heartbeat.ping(now=second) for second in (1, 2)]
+    assert not heartbeat.dead()
+
+    # A late pong proves the link works and forgets the pings sent before it
+    assert heartbeat.pong(tokens[1], now=2.5) == pytest.approx(0.5)
+    assert heartbeat.pong(tokens[0], now=2.6) is None and not heartbeat.sent
+    for second in (3, 4, 5):
+        heartbeat.ping(now=second)
+    assert heartbeat.dead()
+
+
+def test_stopped_heartbeat_has_no_deadline():
+    heartbeat = Heartbeat(interval=0)
+    heartbeat.start()
+    assert heartbeat.next_deadline() is None
+    heartbeat = Heartbeat()
+    heartbeat.start()
+    heartbeat.stop()
+    assert heartbeat.next_deadline() is None
+
+
+def test_keepalive_is_turned_on():
+    with socket.socket() as sock:
+        enable_keepalive(sock, interval=7)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 7
+
+
+def test_server_answers_pings(server_port):
+    async def scenario():
+        client = ChatClient("127.0.0.1", server_port)
+        client.session.heartbeat.interval = INTERVAL
+        await client.connect()
+        heartbeat = client.session.heartbeat
+        while heartbeat.next_token <= 3 or heartbeat.sent:
+            assert not client.closed
+            await asyncio.sleep(INTERVAL / 2)
+        assert heartbeat.srtt > 0
+        await client.close()
+    asyncio.run(asyncio.wait_for(scenario(), HEARTBEAT_TIMEOUT))
+
+
+# A server that answers HELLO and then goes silent stands in for a half-open connection
+def test_silent_server_is_dropped():
+    async def silent(reader, writer):
+        writer.write(encode("HELLO;ping") + encode("NO_ROOMS"))
+        await reader.read()
+
+    async def scenario():
+        server = await asyncio.start_server(silent, "127.0.0.1", 0)
+        client = ChatClient("127.0.0.1", server.sockets[0].getsockname()[1])
+        client.session.heartbeat.interval = INTERVAL
+        assert await client.connect() == []
+        async for _ in client.events():
+            pass
+        assert client.closed and client.session.heartbeat.dead()
+        server.close()
+    asyncio.run(asyncio.wait_for(scenario(), HEARTBEAT_TIMEOUT))
@@ -0,0 +1,52 @@
+# Tests of the coalescing inbox between the socket reader and the GUI
+
+# Imports
+import threading
+from inbox import Inbox, MIN_BATCH
+from test_endpoints import qt_app, wait_until
+
+# Seconds the event loop may take to deliver a test's messages
+DELIVER_TIMEOUT = 5
+
+
+def test_burst_is_delivered_in_order_over_several_drains(qt_app):
+    delivered = []
+    inbox = Inbox(delivered.append)
+    for index in range(MIN_BATCH * 10):
+        inbox.post(index)
+    assert inbox.depth() == MIN_BATCH * 10 and not delivered
+    inbox.drain()
+    assert delivered == list(range(MIN_BATCH))
+    assert wait_until(lambda: inbox.depth() == 0, DELIVER_TIMEOUT)
+    assert delivered == list(range(MIN_BATCH * 10))
+    assert 1 < inbox.drains < MIN_BATCH * 10
+
+
+# A burst emits a single wake signal, which the first drain answers
+def test_burst_schedules_one_drain(qt_app):
+    inbox = Inbox(lambda message: None)
+    wakes = []
+    inbox.wake.connect(lambda: wakes.append(True))
+    for index in range(100):
+        inbox.post(index)
+    assert wakes == [True]
+
+
+def test_posts_from_another_thread_are_delivered_on_the_inbox_thread(qt_app):
+    threads = []
+    inbox = Inbox(lambda message: threads.append(threading.get_ident()))
+    poster = threading.Thread(target=lambda: [inbox.post(index) for index in range(500)])
+    poster.start()
+    poster.join()
+    assert wait_until(lambda: len(threads) == 500, DELIVER_TIMEOUT)
+    assert set(threads) == {threading.get_ident()}
+
+
+def test_flush_delivers_everything_queued(qt_app):
+    delivered = []
+    inbox = Inbox(delivered.append)
+    for index in range(MIN_BATCH * 3):
+        inbox.post(index)
+    inbox.flush()
+    assert delivered == list(range(MIN_BATCH * 3))
+    assert inbox.stats()["delivered"] == MIN_BATCH * 3
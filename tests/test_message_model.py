@@ -0,0 +1,51 @@
+# Tests of the bounded, batched chat history model
+
+# Imports
+import pytest
+from message_model import ChatMessageModel, RingBuffer
+from test_endpoints import qt_app
+
+
+def test_ring_buffer_keeps_the_newest_items():
+    buffer = RingBuffer(3)
+    for item in range(5):
+        buffer.append(item)
+    assert [buffer[position] for position in range(len(buffer))] == [2, 3, 4]
+    buffer.drop_oldest(2)
+    buffer.prepend(1)
+    assert [buffer[position] for position in range(len(buffer))] == [1, 4]
+    with pytest.raises(IndexError):
+        buffer[2]
+
+
+def test_ring_buffer_refuses_prepend_when_full():
+    buffer = RingBuffer(1)
+    buffer.append("a")
+    with pytest.raises(IndexError):
+        buffer.prepend("b")
+
+
+def test_burst_is_applied_in_one_update(qt_app):
+    model = ChatMessageModel(scrollback=100)
+    inserts = []
+    model.rowsInserted.connect(lambda parent, first, last: inserts.append((first, last)))
+    for index in range(50):
+        model.append_line(f"line {index}")
+    assert model.rowCount() == 0
+    model.flush()
+    assert inserts == [(0, 49)]
+    assert model.data(model.index(49)) == "line 49"
+
+
+def test_scrollback_drops_the_oldest_lines(qt_app):
+    model = ChatMessageModel(scrollback=100)
+    removals = []
+    model.rowsRemoved.connect(lambda parent, first, last: removals.append((first, last)))
+    for batch in range(3):
+        for index in range(60):
+            model.append_line(f"line {batch * 60 + index}")
+        model.flush()
+    assert model.rowCount() == 100
+    assert model.data(model.index(0)) == "line 80"
+    assert model.data(model.index(99)) == "line 179"
+    assert removals == [(0, 19), (0, 59)]
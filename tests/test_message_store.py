@@ -0,0 +1,68 @@
+# Tests of the per-room chat history log and its scrollback in the model
+
+# Imports
+from message_model import ChatMessageModel
+from message_store import PAGE_SIZE, MessageStore
+from test_endpoints import qt_app
+
+
+def test_pages_run_from_newest_to_oldest():
+    store = MessageStore(":memory:")
+    assert store.append("room", [f"line {index}" for index in range(10)]) == 0
+    newest = store.page("room", limit=4)
+    assert newest == [(seq, f"line {seq}") for seq in range(6, 10)]
+    assert store.page("room", before=newest[0][0], limit=4) == [(seq, f"line {seq}") for seq in range(2, 6)]
+    assert store.page("room", before=2, limit=4) == [(0, "line 0"), (1, "line 1")]
+
+
+def test_rooms_keep_separate_logs():
+    store = MessageStore(":memory:")
+    store.append("first", ["a"])
+    assert store.append("second", ["b", "c"]) == 0
+    assert store.page("first") == [(0, "a")]
+    assert store.page("missing") == []
+
+
+def test_log_survives_reopening(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = MessageStore(path)
+    store.append("room", ["before"])
+    store.close()
+    store = MessageStore(path)
+    assert store.append("room", ["after"]) == 1
+    assert store.page("room") == [(0, "before"), (1, "after")]
+
+
+def test_retention_trims_the_oldest_messages():
+    store = MessageStore(":memory:", retention=5)
+    store.append("room", [str(index) for index in range(8)])
+    store.prune("room")
+    assert [text for _, text in store.page("room")] == ["3", "4", "5", "6", "7"]
+
+
+def test_model_pages_in_older_lines(qt_app):
+    store = MessageStore(":memory:")
+    store.append("room", [f"line {index}" for index in range(450)])
+    model = ChatMessageModel(store=store, room="room")
+    assert model.rowCount() == PAGE_SIZE
+    assert model.data(model.index(0)) == f"line {450 - PAGE_SIZE}"
+    assert [model.load_older() for _ in range(3)] == [PAGE_SIZE, 450 - 2 * PAGE_SIZE, 0]
+    assert model.data(model.index(0)) == "line 0" and not model.has_older
+
+
+def test_model_saves_appended_lines(qt_app):
+    store = MessageStore(":memory:")
+    store.append("room", ["old"])
+    model = ChatMessageModel(store=store, room="room")
+    model.append_line("new")
+    model.append_line("/help output", save=False)
+    model.flush()
+    assert model.rowCount() == 3
+    assert store.page("room") == [(0, "old"), (1, "new")]
+
+
+def test_loading_stops_at_the_scrollback(qt_app):
+    store = MessageStore(":memory:")
+    store.append("room", [str(index) for index in range(30)])
+    model = ChatMessageModel(scrollback=25, store=store, room="room")
+    assert model.rowCount() == 25 and model.load_older() == 0
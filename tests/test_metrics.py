@@ -0,0 +1,65 @@
+# Tests of the client metrics and their localhost endpoint
+
+# Imports
+import json, urllib.error, urllib.request
+import pytest
+from metrics import METRICS, Histogram, Metrics, MetricsServer
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram("latency", "Test latency", buckets=(0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 0.7, 20):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 0, 1]
+    assert histogram.quantile(0.5) == 1 and histogram.quantile(0.99) == float("inf")
+    assert histogram.read()["buckets"] == {"0.1": 2, "1": 2, "10": 0, "+Inf": 1}
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = Metrics()
+    metrics.histogram("latency_seconds", "Test latency", buckets=(0.1, 1)).observe(0.5)
+    metrics.counter("events_total", "Test events").inc(3)
+    lines = metrics.prometheus().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{le="1"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in lines
+    assert "# TYPE events_total counter" in lines and "events_total 3" in lines
+
+
+def test_registering_twice_reuses_the_metric():
+    metrics = Metrics()
+    assert metrics.counter("events_total", "Test events") is metrics.counter("events_total", "Again")
+    metrics.gauge("depth", "Test depth", lambda: 1)
+    metrics.gauge("depth", "Test depth", lambda: 2)
+    assert metrics.snapshot()["metrics"]["depth"] == 2
+
+
+def test_rates_count_since_the_last_update(monkeypatch):
+    clock = iter([0.0, 2.0, 4.0])
+    monkeypatch.setattr("time.monotonic", lambda: next(clock))
+    metrics = Metrics()
+    counter = metrics.counter("events_total", "Test events")
+    counter.inc(10)
+    assert metrics.update_rates() == {"events_total": 5.0}
+    assert metrics.update_rates() == {"events_total": 0.0}
+
+
+def test_summary_covers_the_client_metrics():
+    assert METRICS.summary().startswith("Metrics: in ")
+
+
+def test_endpoint_serves_both_formats():
+    metrics = Metrics()
+    metrics.counter("events_total", "Test events").inc()
+    server = MetricsServer(metrics, 0)
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        with opener.open(base + "/metrics") as response:
+            assert "events_total 1" in response.read().decode()
+        with opener.open(base + "/metrics.json") as response:
+            assert json.load(response)["metrics"]["events_total"] == 1
+        with pytest.raises(urllib.error.HTTPError):
+            opener.open(base + "/other")
+    finally:
+        server.close()
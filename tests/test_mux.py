@@ -0,0 +1,66 @@
+# Tests of several rooms multiplexed over one connection
+
+# Imports
+import asyncio
+from protocol import Channel, ChannelMessage, ChatMessage, FrameDecoder, encode, encode_message, with_channel
+from session import CAPABILITIES, MUX, ClientSession, RoomEvent
+from test_chat_client import next_message
+from test_requests import connect
+
+# Seconds a message may take to arrive
+RECEIVE_TIMEOUT = 5
+
+
+def test_channel_tag_survives_compression():
+    frame = encode("MESSAGE;alice;" + "hello " * 100, compress=True)
+    for channel in (0, 5, 300):
+        assert FrameDecoder().feed(with_channel(frame, channel)) == [
+            ChannelMessage(channel, ChatMessage("alice", ("hello " * 100).strip()))]
+
+
+def test_session_routes_channels_to_rooms():
+    session = ClientSession(capabilities=CAPABILITIES | {MUX})
+    session.capabilities = frozenset({MUX})
+    for room_name in ("first", "second"):
+        session.join_room(room_name, "alice")
+        session.receive(encode("JOIN_SUCCESS"))
+    session.receive(encode_message(Channel(1, "first")) + encode_message(Channel(2, "second")))
+    chat = encode_message(ChatMessage("bob", "hi"))
+    assert session.receive(with_channel(chat, 2) + with_channel(chat, 1) + with_channel(chat, 9)) == [
+        RoomEvent("second", ChatMessage("bob", "hi")), RoomEvent("first", ChatMessage("bob", "hi"))]
+    session.leave_room("first")
+    assert session.receive(with_channel(chat, 1)) == [] and session.in_room("second")
+
+
+# Function to wait for the next chat message of a room on a multiplexed connection
+async def next_room_message(client, room_name):
+    async def receive():
+        async for event in client.events():
+            if isinstance(event, RoomEvent) and event.room_name == room_name and isinstance(event.message, ChatMessage):
+                if event.message.sender != "Server":
+                    return event.message
+    return await asyncio.wait_for(receive(), RECEIVE_TIMEOUT)
+
+
+def test_one_connection_chats_in_two_rooms(server_port):
+    async def scenario():
+        alice = await connect(server_port, CAPABILITIES | {MUX})
+        bob = await connect(server_port, CAPABILITIES)
+        carol = await connect(server_port, CAPABILITIES)
+        assert await alice.create_room("first", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await alice.create_room("second", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await bob.join_room("first", "bob") == "JOIN_SUCCESS"
+        assert await carol.join_room("second", "carol") == "JOIN_SUCCESS"
+
+        await carol.send("to second")
+        await bob.send("to first")
+        assert (await next_room_message(alice, "second"))[:2] == ("carol", "to second")
+        assert (await next_room_message(alice, "first"))[:2] == ("bob", "to first")
+
+        # Leaving one room keeps the other
+        await alice.leave("first")
+        await alice.send("still here", "second")
+        assert (await next_message(carol, "alice")).text == "still here"
+        for client in (alice, bob, carol):
+            await client.close()
+    asyncio.run(scenario())
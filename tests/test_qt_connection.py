@@ -0,0 +1,58 @@
+# Tests of QtConnection reading and writing a socket through QSocketNotifier
+
+# Imports
+import socket
+import pytest
+from protocol import ChatMessage, FrameDecoder, encode
+from qt_connection import QtConnection
+from test_endpoints import qt_app, wait_until
+
+# Seconds the event loop may take to move the bytes of a test
+RECEIVE_TIMEOUT = 5
+
+
+# Fixture giving a connection on one end of a socket pair and the other end standing in for the server
+@pytest.fixture
+def linked(qt_app):
+    client, server = socket.socketpair()
+    connection = QtConnection(client)
+    yield connection, server
+    connection.shutdown()
+    server.close()
+
+
+# Function to collect every message a connection emits
+def collect(connection):
+    messages = []
+    connection.message_received.connect(messages.append)
+    return messages
+
+
+def test_burst_of_messages_arrives_in_order(linked):
+    connection, server = linked
+    messages = collect(connection)
+    sent = [ChatMessage("bob", f"message {index}") for index in range(2000)]
+    server.sendall(b"".join(encode(f"MESSAGE;{message.sender};{message.text}") for message in sent))
+    assert wait_until(lambda: len(messages) == len(sent), RECEIVE_TIMEOUT)
+    assert messages == sent
+
+
+def test_reply_reaches_its_callback(linked):
+    connection, server = linked
+    statuses = []
+    connection.create_room("room", "alice", callback=statuses.append)
+    server.settimeout(RECEIVE_TIMEOUT)
+    assert wait_until(lambda: not connection.outgoing, RECEIVE_TIMEOUT)
+    assert FrameDecoder().feed(server.recv(65536))[0].text.startswith("CREATE_ROOM;room;")
+    server.sendall(encode("CREATE_SUCCESS"))
+    assert wait_until(lambda: statuses == ["CREATE_SUCCESS"], RECEIVE_TIMEOUT)
+    assert connection.session.in_room("room")
+
+
+def test_closed_peer_ends_the_connection(linked):
+    connection, server = linked
+    closed = []
+    connection.connection_closed.connect(lambda: closed.append(True))
+    server.shutdown(socket.SHUT_WR)
+    assert wait_until(lambda: closed, RECEIVE_TIMEOUT)
+    assert connection.closed
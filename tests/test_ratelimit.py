@@ -0,0 +1,72 @@
+# Tests of the outbound chat rate limit and paste batching
+
+# Imports
+import pytest
+from ratelimit import ChatPacer, TokenBucket, split_message
+
+
+def test_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=2, burst=3)
+    bucket.updated = 0
+    assert [bucket.take(now=0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.next_token(now=0) == pytest.approx(0.5)
+    assert not bucket.take(now=0.4) and bucket.take(now=0.5)
+    assert bucket.take(now=100) and bucket.tokens == pytest.approx(2)
+
+
+def test_zero_rate_turns_the_limit_off():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.take(now=0) for _ in range(100))
+    assert bucket.next_token(now=5) == 5
+
+
+def test_long_text_is_split_between_lines():
+    text = "\n".join(["x" * 30] * 5)
+    pieces = split_message(text, max_bytes=70)
+    assert pieces == ["x" * 30 + "\n" + "x" * 30] * 2 + ["x" * 30]
+    assert "\n".join(pieces) == text
+
+
+def test_long_line_is_cut_at_a_character_boundary():
+    pieces = split_message("é" * 10, max_bytes=5)
+    assert pieces == ["éé", "éé", "éé", "éé", "éé"]
+    assert split_message("") == [""]
+
+
+def test_queued_messages_leave_as_one_batch_per_room():
+    pacer = ChatPacer(rate=1, burst=1)
+    pacer.bucket.updated = 0
+    for text in ("a", "b", "c"):
+        pacer.push("first", text)
+    pacer.push("second", "d")
+    pacer.push("first", "e")
+    assert pacer.release(now=0) == [("first", "a\nb\nc")]
+    assert pacer.batched == 2 and len(pacer) == 2
+    assert pacer.next_deadline(now=0) == pytest.approx(1)
+    assert pacer.release(now=1) == [("second", "d")]
+    assert pacer.release(now=2) == [("first", "e")]
+    assert pacer.next_deadline() is None
+
+
+def test_batches_respect_the_line_limit():
+    pacer = ChatPacer(burst=10, batch_lines=2)
+    for index in range(5):
+        pacer.push("room", str(index))
+    assert pacer.release() == [("room", "0\n1"), ("room", "2\n3"), ("room", "4")]
+
+
+def test_full_queue_refuses_messages():
+    pacer = ChatPacer(rate=1, burst=1, limit=2)
+    assert pacer.push("room", "a") and pacer.push("room", "b")
+    assert not pacer.push("room", "c")
+
+
+def test_drain_takes_one_room_regardless_of_the_limit():
+    pacer = ChatPacer(rate=1, burst=1)
+    pacer.bucket.tokens = 0
+    pacer.push("first", "a")
+    pacer.push("second", "b")
+    pacer.push("first", "c")
+    assert pacer.release() == []
+    assert pacer.drain("first") == [("first", "a\nc")]
+    assert pacer.pending() == 1 and pacer.pending("second") == 1
@@ -0,0 +1,68 @@
+# Tests of reconnecting with backoff and resuming the room session, against server.py
+
+# Imports
+import socket, time
+import pytest
+from backoff import Backoff
+from protocol import ChatMessage
+from qt_connection import QtConnection
+from test_endpoints import qt_app, wait_until
+
+# Seconds a connect, reply or reconnect may take
+RECEIVE_TIMEOUT = 10
+
+# Seconds the server is given to notice a dropped link before the room carries on without it
+DROP_SETTLE = 0.3
+
+
+def test_backoff_grows_and_starts_over(monkeypatch):
+    monkeypatch.setattr("random.uniform", lambda low, high: high)
+    backoff = Backoff(base=0.1, cap=1)
+    assert [backoff.next_delay() for _ in range(6)] == pytest.approx([0.1, 0.2, 0.4, 0.8, 1, 1])
+    backoff.reset()
+    assert backoff.next_delay() == pytest.approx(0.1)
+
+
+def test_backoff_is_jittered_below_its_bound():
+    delays = [Backoff(base=1).next_delay() for _ in range(100)]
+    assert all(0 <= delay <= 1 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+# Function to open a connection, enter a room and collect the chat it receives
+def enter(port, username, create=False):
+    connection = QtConnection.connect_to("127.0.0.1", port)
+    chat = []
+    connection.message_received.connect(
+        lambda message: chat.append(message.text) if isinstance(message, ChatMessage) and message.sender != "Server" else None)
+    assert wait_until(lambda: connection.session.hello_received, RECEIVE_TIMEOUT)
+    statuses = []
+    if create:
+        connection.create_room("room", username, max_users=3, callback=statuses.append)
+    else:
+        connection.join_room("room", username, callback=statuses.append)
+    assert wait_until(lambda: statuses, RECEIVE_TIMEOUT)
+    assert statuses[0] in ("CREATE_SUCCESS", "JOIN_SUCCESS")
+    return connection, chat
+
+
+def test_dropped_link_resumes_the_room_and_replays_missed_chat(qt_app, server_port):
+    alice, alice_chat = enter(server_port, "alice", create=True)
+    bob, bob_chat = enter(server_port, "bob")
+    rejoins = []
+    alice.rejoin_finished.connect(lambda room_name, status: rejoins.append((room_name, status)))
+    try:
+        # Cut alice's link, chat typed while offline waits for the rejoin
+        alice.sock.shutdown(socket.SHUT_RDWR)
+        time.sleep(DROP_SETTLE)
+        assert bob.send("while you were away")
+        assert wait_until(lambda: not alice.online, RECEIVE_TIMEOUT)
+        assert alice.send("back again")
+
+        assert wait_until(lambda: rejoins and "back again" in bob_chat, RECEIVE_TIMEOUT)
+        assert rejoins == [("room", "JOIN_SUCCESS")]
+        assert wait_until(lambda: "while you were away" in alice_chat, RECEIVE_TIMEOUT)
+        assert alice_chat.count("while you were away") == 1
+    finally:
+        alice.shutdown()
+        bob.shutdown()
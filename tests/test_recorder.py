@@ -0,0 +1,77 @@
+# Tests of wire recordings and their replay
+
+# Imports
+import gzip, json, os, subprocess, sys
+import pytest
+from bench_replay import replay_stream
+from protocol import encode
+from recorder import CONNECTED, MAGIC, RECEIVED, SENT, Record, WireRecorder, read_recording
+from test_cli import run_script
+
+# Directory holding bench_replay.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds a replay may take
+REPLAY_TIMEOUT = 60
+
+
+def test_recording_round_trips(tmp_path):
+    path = str(tmp_path / "wire.rec")
+    recorder = WireRecorder(path)
+    recorder.connected("127.0.0.1:2004")
+    recorder.sent(b"HELLO;deflate")
+    recorder.record(RECEIVED, b"\xff\x00\x00\x00\x00\x00", now=recorder.started + 1.5)
+    recorder.close()
+    assert read_recording(path) == [
+        Record(pytest.approx(0, abs=1), CONNECTED, b"127.0.0.1:2004"),
+        Record(pytest.approx(0, abs=1), SENT, b"HELLO;deflate"),
+        Record(1.5, RECEIVED, b"\xff\x00\x00\x00\x00\x00"),
+    ]
+
+
+# A recording cut off by a crash keeps its complete records
+def test_truncated_recording_keeps_complete_records(tmp_path):
+    path = str(tmp_path / "wire.rec")
+    recorder = WireRecorder(path)
+    recorder.sent(b"first")
+    recorder.sent(b"second")
+    recorder.close()
+    with gzip.open(path, "rb") as file:
+        data = file.read()
+    with gzip.open(path, "wb") as file:
+        file.write(data[:-3])
+    assert [record.data for record in read_recording(path)] == [b"first"]
+
+
+def test_other_files_are_refused(tmp_path):
+    path = str(tmp_path / "other.gz")
+    with gzip.open(path, "wb") as file:
+        file.write(b"not a recording" + MAGIC)
+    with pytest.raises(ValueError):
+        read_recording(path)
+
+
+# The partial frame a dropped connection left behind does not reach the next connection
+def test_stream_cuts_partial_frames_at_reconnects():
+    frame = encode("MESSAGE;alice;hi")
+    records = [
+        Record(0, CONNECTED, b"a"), Record(1, RECEIVED, frame + frame[:5]),
+        Record(2, CONNECTED, b"a"), Record(3, RECEIVED, frame),
+    ]
+    assert replay_stream(records) == [(1, frame), (3, frame)]
+
+
+def test_recorded_session_replays(server_port, tmp_path):
+    path = str(tmp_path / "wire.rec")
+    run_script(server_port, "/nick alice", "/create room", "hello", "/quit",
+               command=("cli.py", "--record", path))
+    kinds = [record.kind for record in read_recording(path)]
+    assert kinds[0] == CONNECTED and SENT in kinds and RECEIVED in kinds
+
+    for target in (["--target", "decoder"], ["--target", "server", "--port", str(server_port), "--settle", "0.2"]):
+        result = subprocess.run(
+            [sys.executable, "bench_replay.py", path, *target, "--speed", "max"],
+            cwd=ROOT, capture_output=True, text=True, timeout=REPLAY_TIMEOUT,
+        )
+        assert result.returncode == 0, result.stderr
+        assert json.loads(result.stdout)["parse"]["messages"] > 0
@@ -0,0 +1,90 @@
+# End-to-end tests of relay.py in front of server.py
+
+# Imports
+import asyncio
+import pytest
+from chat_client import ChatClient
+from protocol import ChatMessage
+from session import CAPABILITIES, IDS
+from test_requests import OFFERS, connect, create_malformed
+
+# Seconds to keep listening for duplicates after the expected messages arrived
+SETTLE_TIME = 0.3
+
+
+# Function to collect the chat of users into a list until the client's events end
+async def collect(client, received):
+    async for message in client.events():
+        if isinstance(message, ChatMessage) and message.sender != "Server":
+            received.append((message.sender, message.text))
+
+
+def test_room_messages_are_delivered_once(relay_port):
+    async def scenario():
+        alice = await connect(relay_port, CAPABILITIES)
+        bob = await connect(relay_port, CAPABILITIES)
+        assert await alice.create_room("room", "alice", "secret", 5) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob", "wrong") == "INVALID_PASSWORD"
+        assert await bob.join_room("room", "bob", "secret") == "JOIN_SUCCESS"
+
+        received = {"alice": [], "bob": []}
+        readers = [asyncio.ensure_future(collect(alice, received["alice"])),
+                   asyncio.ensure_future(collect(bob, received["bob"]))]
+        await alice.send("hello bob")
+        await bob.send("hello alice")
+        await bob.send("again")
+        await asyncio.sleep(SETTLE_TIME)
+        assert received == {"alice": [("bob", "hello alice"), ("bob", "again")], "bob": [("alice", "hello bob")]}
+
+        for client in (alice, bob):
+            await client.close()
+        await asyncio.gather(*readers)
+    asyncio.run(scenario())
+
+
+def test_users_of_relay_and_server_share_a_room(server_port, relay_port):
+    async def scenario():
+        direct = await connect(server_port, CAPABILITIES)
+        relayed = await connect(relay_port, CAPABILITIES)
+        assert await direct.create_room("room", "alice") == "CREATE_SUCCESS"
+        assert await relayed.join_room("room", "bob") == "JOIN_SUCCESS"
+
+        received = []
+        reader = asyncio.ensure_future(collect(relayed, received))
+        await direct.send("through the relay")
+        await asyncio.sleep(SETTLE_TIME)
+        assert received == [("alice", "through the relay")]
+
+        for client in (direct, relayed):
+            await client.close()
+        await reader
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("offer", OFFERS)
+def test_malformed_request_is_answered_by_relay(relay_port, offer):
+    async def scenario():
+        client = await connect(relay_port, OFFERS[offer])
+        assert await create_malformed(client) == "BAD_REQUEST"
+        assert await client.create_room("good", "alice") == "CREATE_SUCCESS"
+        assert client.session.in_room("good")
+        await client.close()
+    asyncio.run(scenario())
+
+
+# A reply the relay gives itself waits for the forwarded request before it, which only
+# matters to a client matching replies in order
+def test_local_reply_does_not_overtake_forwarded_request(relay_port):
+    async def scenario():
+        owner = await connect(relay_port, CAPABILITIES)
+        assert await owner.create_room("taken", "alice", max_users=5) == "CREATE_SUCCESS"
+        await asyncio.sleep(SETTLE_TIME)
+
+        client = await connect(relay_port, CAPABILITIES - {IDS})
+        joined, created = await asyncio.gather(
+            client.join_room("taken", "bob"), client.create_room("taken", "bob"))
+        assert (joined, created) == ("JOIN_SUCCESS", "ROOM_EXISTS")
+        assert client.session.in_room("taken")
+        for each in (owner, client):
+            await each.close()
+    asyncio.run(scenario())
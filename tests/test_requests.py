@@ -0,0 +1,87 @@
+# Tests matching create/join replies to their requests, against server.py
+
+# Imports
+import asyncio
+import pytest
+from chat_client import ChatClient
+from protocol import with_request_id
+from session import CAPABILITIES, IDS, ClientSession, RequestTracker, SessionError, TIMEOUT
+
+# Feature sets a client may offer: numbered requests, and replies matched in order
+OFFERS = {"ids": CAPABILITIES, "in order": CAPABILITIES - {IDS}}
+
+
+# Function to connect a headless client offering the given features
+async def connect(port, offered):
+    client = ChatClient("127.0.0.1", port)
+    client.session.offered = offered
+    await client.connect()
+    return client
+
+
+# Function to send a create request whose room name holds a separator, which the session refuses to build
+async def create_malformed(client, timeout=5):
+    session = client.session
+    request = session.requests.begin("CREATE_ROOM", "a;b", "alice", timeout)
+    data = session.encode(with_request_id("CREATE_ROOM;a;b;;1;2;alice", session.request_id(request)))
+    return await client.request(request, data)
+
+
+# Function to get the room list a newly connected client sees
+async def room_list(port):
+    observer = await connect(port, CAPABILITIES)
+    rooms = {room.name: room.current_users for room in observer.session.rooms.values()}
+    await observer.close()
+    return rooms
+
+
+def test_reply_resolves_request_by_id():
+    tracker = RequestTracker()
+    first = tracker.begin("CREATE_ROOM", "first", "alice")
+    second = tracker.begin("CREATE_ROOM", "second", "alice")
+    tracker.cancel(first)
+    assert tracker.resolve(second.request_id) is second
+    assert not tracker.pending
+    assert tracker.resolve(first.request_id) is None
+
+
+def test_reply_without_id_resolves_oldest_request():
+    tracker = RequestTracker()
+    first = tracker.begin("JOIN_ROOM", "first", "alice")
+    tracker.begin("JOIN_ROOM", "second", "alice")
+    assert tracker.resolve() is first
+
+
+def test_separator_in_field_is_refused():
+    session = ClientSession()
+    with pytest.raises(SessionError):
+        session.create_room("a;b", "alice")
+    with pytest.raises(SessionError):
+        session.join_room("room", "ali\nce", "secret")
+    assert not session.requests.pending
+
+
+@pytest.mark.parametrize("offer", OFFERS)
+def test_malformed_request_is_answered(server_port, offer):
+    async def scenario():
+        client = await connect(server_port, OFFERS[offer])
+        assert await create_malformed(client) == "BAD_REQUEST"
+        assert await client.create_room("good", "alice") == "CREATE_SUCCESS"
+        assert client.session.in_room("good")
+        await client.close()
+        assert await room_list(server_port) == {}
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("offer", OFFERS)
+def test_timed_out_request_does_not_take_next_reply(server_port, offer):
+    async def scenario():
+        client = await connect(server_port, OFFERS[offer])
+        assert await client.create_room("late", "alice", timeout=0) == TIMEOUT
+        assert await client.create_room("good", "alice") == "CREATE_SUCCESS"
+        assert client.session.in_room("good") and not client.session.in_room("late")
+
+        # The room entered after the timeout was left again, the user sits in the room it asked for last
+        assert await room_list(server_port) == {"good": 1}
+        await client.close()
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+# Tests of room list snapshots and deltas kept in the client session
+
+# Imports
+import asyncio, time
+from protocol import Room, RoomAdded, RoomList, RoomRemoved, RoomUsers, encode_message
+from session import CAPABILITIES, ClientSession
+from test_requests import connect
+
+# Seconds a delta may take to reach an observer
+RECEIVE_TIMEOUT = 5
+
+
+# Function to feed typed messages to a session as the server would send them
+def receive(session, *messages):
+    return session.receive(b"".join(encode_message(message) for message in messages))
+
+
+def test_deltas_update_the_room_index():
+    session = ClientSession()
+    receive(session, RoomList([Room("lobby", False, 1, 10)]))
+    receive(session, RoomAdded(Room("vault", True, 1, 2)), RoomUsers("lobby", 4), RoomRemoved("vault"))
+    assert session.rooms == {"lobby": Room("lobby", False, 4, 10)}
+    assert not session.resync_needed
+
+
+def test_delta_for_an_unknown_room_asks_for_a_snapshot():
+    session = ClientSession()
+    receive(session, RoomList([]))
+    receive(session, RoomUsers("ghost", 1))
+    assert session.resync_needed
+    receive(session, RoomList([Room("ghost", False, 1, 2)]))
+    assert not session.resync_needed and "ghost" in session.rooms
+
+
+# Function to wait until the rooms an observer sees match
+async def rooms_become(observer, expected):
+    deadline = time.monotonic() + RECEIVE_TIMEOUT
+    while {room.name: room.current_users for room in observer.session.rooms.values()} != expected:
+        assert time.monotonic() < deadline, observer.session.rooms
+        await asyncio.sleep(0.01)
+
+
+def test_lobby_follows_rooms_through_deltas(server_port):
+    async def scenario():
+        observer = await connect(server_port, CAPABILITIES)
+        alice = await connect(server_port, CAPABILITIES)
+        bob = await connect(server_port, CAPABILITIES)
+        assert await alice.create_room("room", "alice", max_users=3) == "CREATE_SUCCESS"
+        await rooms_become(observer, {"room": 1})
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+        await rooms_become(observer, {"room": 2})
+        await bob.leave()
+        await rooms_become(observer, {"room": 1})
+        await alice.close()
+        await rooms_become(observer, {})
+        for client in (observer, bob):
+            await client.close()
+    asyncio.run(scenario())
@@ -0,0 +1,79 @@
+# Tests of the room name index and the paged room directory
+
+# Imports
+import asyncio, random, time
+from room_index import RoomIndex
+from session import CAPABILITIES, MUX, PAGE_SIZE, PAGES, ClientSession
+from test_requests import connect
+
+# Seconds a page may take to arrive
+RECEIVE_TIMEOUT = 5
+
+
+# Function to search names the slow way, as search() orders them
+def scan(names, query):
+    query = query.casefold()
+    matches = sorted((name.casefold(), name) for name in names if query in name.casefold())
+    return ([name for folded, name in matches if folded.startswith(query)]
+            + [name for folded, name in matches if not folded.startswith(query)])
+
+
+def test_prefix_matches_come_first():
+    index = RoomIndex(["Lobby", "the lobby", "Hobbies", "lobbyists", "Gaming"])
+    assert index.search("LOB") == ["Lobby", "lobbyists", "the lobby"]
+    assert index.search("bb") == ["Hobbies", "Lobby", "lobbyists", "the lobby"]
+    assert index.search("") == ["Gaming", "Hobbies", "Lobby", "lobbyists", "the lobby"]
+    assert index.search("xyz") == []
+
+
+def test_growing_query_sees_names_changed_in_between():
+    index = RoomIndex(["alpha", "alpine"])
+    assert index.search("al") == ["alpha", "alpine"]
+    index.add("alps")
+    index.remove("alpha")
+    assert index.search("alp") == ["alpine", "alps"]
+    assert "alps" in index and "alpha" not in index and len(index) == 2
+
+
+def test_search_agrees_with_a_scan():
+    rng = random.Random(7)
+    names = {"".join(rng.choice("abcAB ") for _ in range(rng.randint(1, 10))) for _ in range(500)}
+    index = RoomIndex(names)
+    for name in list(names)[:100]:
+        index.remove(name)
+        names.discard(name)
+    for _ in range(300):
+        query = "".join(rng.choice("abcAB ") for _ in range(rng.randint(0, 5)))
+        assert index.search(query) == scan(names, query), query
+        assert all(index.matches(name, query) for name in index.search(query))
+
+
+# Function to read from a server into a session until a condition holds
+async def receive_until(reader, session, condition):
+    deadline = time.monotonic() + RECEIVE_TIMEOUT
+    while not condition():
+        data = await asyncio.wait_for(reader.read(65536), max(0, deadline - time.monotonic()))
+        assert data, "The server closed the connection"
+        session.receive(data)
+
+
+def test_room_list_arrives_a_page_at_a_time(server_port):
+    async def scenario():
+        creator = await connect(server_port, CAPABILITIES | {MUX})
+        names = sorted(f"room {index:03}" for index in range(PAGE_SIZE + 50))
+        statuses = await asyncio.gather(*(creator.create_room(name, "creator") for name in names))
+        assert set(statuses) == {"CREATE_SUCCESS"}
+
+        # The first page comes unasked, the next one when the list is scrolled to its end
+        reader, writer = await asyncio.open_connection("127.0.0.1", server_port)
+        session = ClientSession(capabilities=CAPABILITIES | {PAGES})
+        writer.write(session.hello())
+        await receive_until(reader, session, lambda: session.rooms)
+        assert session.room_total == len(names) and sorted(session.rooms) == names[:PAGE_SIZE]
+        writer.write(session.next_page())
+        assert session.next_page() is None
+        await receive_until(reader, session, lambda: session.room_cursor is None)
+        assert sorted(session.rooms) == names and session.next_page() is None
+        writer.close()
+        await creator.close()
+    asyncio.run(scenario())
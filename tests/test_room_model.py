@@ -0,0 +1,38 @@
+# Tests of the lobby room list model
+
+# Imports
+from PyQt5.QtCore import QItemSelectionModel, Qt
+from protocol import Room, RoomAdded, RoomList, RoomRemoved
+from room_model import RoomListModel
+
+
+# Function to build a model listing rooms by name
+def model_with(*names):
+    model = RoomListModel()
+    model.apply(RoomList([Room(name, False, 1, 2) for name in names]))
+    return model
+
+
+# Function to get the names of a model's rooms in row order
+def names(model):
+    return [model.index(row).data(Qt.UserRole).name for row in range(model.rowCount())]
+
+
+def test_removed_room_keeps_order_and_rows():
+    model = model_with("a", "b", "c", "d")
+    model.apply(RoomRemoved("b"))
+    assert names(model) == ["a", "c", "d"]
+    assert [model.row_of(name) for name in ("a", "b", "c", "d")] == [0, -1, 1, 2]
+    model.apply(RoomAdded(Room("e", True, 0, 3)))
+    assert names(model) == ["a", "c", "d", "e"] and model.row_of("e") == 3
+
+
+def test_selection_stays_on_room_when_room_above_is_removed():
+    model = model_with("a", "b", "c", "d")
+    selection = QItemSelectionModel(model)
+    selection.setCurrentIndex(model.index(3), QItemSelectionModel.ClearAndSelect)
+    model.apply(RoomRemoved("a"))
+    assert selection.currentIndex().data(Qt.UserRole).name == "d"
+    model.apply(RoomRemoved("c"))
+    assert selection.currentIndex().data(Qt.UserRole).name == "d"
+    assert [index.data(Qt.UserRole).name for index in selection.selectedIndexes()] == ["d"]
@@ -0,0 +1,78 @@
+# Tests of the bounded, coalescing send queue
+
+# Imports
+from send_queue import DROP_OLDEST, SendQueue
+
+
+# Function to drain a queue as a socket accepting at most chunk bytes per send() would
+def drain(queue, chunk):
+    sent = bytearray()
+    while queue:
+        data = bytes(queue.next_write())[:chunk]
+        queue.advance(len(data))
+        sent += data
+    return bytes(sent)
+
+
+def test_small_messages_coalesce_into_one_write():
+    queue = SendQueue()
+    for index in range(10):
+        queue.push(b"message %d;" % index)
+    assert queue.next_write() == b"".join(b"message %d;" % index for index in range(10))
+    queue.advance(len(queue.next_write()))
+    assert not queue and queue.writes == 1 and queue.messages_written == 10
+
+
+def test_write_stops_at_the_size_limit():
+    queue = SendQueue()
+    for _ in range(3):
+        queue.push(b"x" * 40)
+    assert len(queue.next_write(max_bytes=100)) == 80
+
+
+def test_partial_writes_resume_where_they_stopped():
+    queue = SendQueue()
+    messages = [bytes([65 + index]) * (index * 37 + 5) for index in range(8)]
+    for data in messages:
+        queue.push(data)
+    assert drain(queue, 13) == b"".join(messages)
+    assert queue.messages_written == len(messages)
+
+
+def test_backpressure_follows_the_water_marks():
+    queue = SendQueue(high_water=100, low_water=40)
+    queue.push(b"x" * 60)
+    assert not queue.throttled
+    queue.push(b"x" * 60)
+    assert queue.throttled
+    queue.advance(70)
+    assert queue.throttled
+    queue.advance(10)
+    assert not queue.throttled and len(queue) == 40
+
+
+def test_full_queue_drops_only_chat():
+    queue = SendQueue(limit=100)
+    assert queue.push(b"c" * 80, droppable=True)
+    assert not queue.push(b"d" * 30, droppable=True)
+    assert queue.push(b"r" * 300)
+    assert queue.dropped == 1 and len(queue) == 380
+
+
+def test_drop_oldest_keeps_the_message_on_the_wire():
+    queue = SendQueue(limit=100, policy=DROP_OLDEST)
+    queue.push(b"a" * 50, droppable=True)
+    queue.push(b"b" * 40, droppable=True)
+    queue.advance(10)
+    assert queue.push(b"c" * 50, droppable=True)
+    assert drain(queue, 1000) == b"a" * 40 + b"c" * 50
+    assert queue.dropped == 1
+
+
+def test_take_returns_whole_messages():
+    queue = SendQueue()
+    queue.push(b"request")
+    queue.push(b"chat", droppable=True)
+    queue.advance(3)
+    assert queue.take(droppable_only=True) == [b"chat"]
+    assert not queue and queue.next_write() == b""
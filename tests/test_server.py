@@ -0,0 +1,54 @@
+# Tests of the asyncio reference server
+
+# Imports
+import asyncio
+from chat_client import ChatClient
+from protocol import ServerShutdown
+from test_chat_client import next_message
+
+# Seconds the shutdown notice may take to arrive
+RECEIVE_TIMEOUT = 5
+
+
+# Function to connect a headless client with the default features
+async def connect(port):
+    client = ChatClient("127.0.0.1", port)
+    await client.connect()
+    return client
+
+
+def test_many_connections_share_one_process(server_port):
+    async def scenario():
+        clients = await asyncio.gather(*(connect(server_port) for _ in range(200)))
+        assert await clients[0].create_room("room", "user0", max_users=200) == "CREATE_SUCCESS"
+        statuses = await asyncio.gather(*(client.join_room("room", f"user{index}")
+                                          for index, client in enumerate(clients[1:], 1)))
+        assert set(statuses) == {"JOIN_SUCCESS"}
+        await clients[-1].send("hello everyone")
+        assert (await next_message(clients[0], "user199")).text == "hello everyone"
+        await asyncio.gather(*(client.close() for client in clients))
+    asyncio.run(scenario())
+
+
+def test_shutdown_is_announced(servers):
+    port = servers.start()
+
+    async def scenario():
+        client = await connect(port)
+        await asyncio.get_running_loop().run_in_executor(None, servers.stop, port)
+
+        async def receive():
+            return [message async for message in client.events() if isinstance(message, ServerShutdown)]
+        assert await asyncio.wait_for(receive(), RECEIVE_TIMEOUT) == [ServerShutdown()]
+        assert client.session.server_closed
+    asyncio.run(scenario())
+
+
+def test_workers_share_the_port(servers):
+    port = servers.start("--workers", "2")
+
+    async def scenario():
+        clients = await asyncio.gather(*(connect(port) for _ in range(20)))
+        assert all(client.session.hello_received for client in clients)
+        await asyncio.gather(*(client.close() for client in clients))
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+# Tests of TLS with session resumption against server.py, and of room passwords staying on the server
+
+# Imports
+import asyncio, shutil, ssl
+import pytest
+from bench_tls import make_certificate
+from chat_client import ChatClient
+from qt_connection import QtConnection
+from session import CAPABILITIES
+from test_endpoints import qt_app, wait_until
+from tls import TlsClient, client_context, parse_version
+
+# Seconds a connect may take
+CONNECT_TIMEOUT = 10
+
+
+# Fixture giving a self-signed certificate for localhost and its key
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("the openssl command is needed to make the test certificate")
+    return make_certificate(str(tmp_path_factory.mktemp("tls")))
+
+
+# Function to connect over TLS until the server answers HELLO, returning whether the session was resumed
+def connect_once(port, tls):
+    connection = QtConnection.connect_to("127.0.0.1", port, reconnect=False, tls=tls)
+    try:
+        assert wait_until(lambda: connection.session.hello_received, CONNECT_TIMEOUT)
+        return connection.sock.session_reused
+    finally:
+        connection.shutdown()
+
+
+def test_versions_are_parsed():
+    assert parse_version("1.3") == ssl.TLSVersion.TLSv1_3
+    with pytest.raises(ValueError):
+        parse_version("1.1")
+
+
+@pytest.mark.parametrize("version", ["1.2", "1.3"])
+def test_reconnect_resumes_the_session(qt_app, servers, certificate, version):
+    cert_file, key_file = certificate
+    port = servers.start("--tls-cert", cert_file, "--tls-key", key_file)
+    tls = TlsClient(client_context(cert_file, parse_version(version)))
+    assert [connect_once(port, tls) for _ in range(3)] == [False, True, True]
+
+
+def test_resumption_can_be_turned_off(qt_app, servers, certificate):
+    cert_file, key_file = certificate
+    port = servers.start("--tls-cert", cert_file, "--tls-key", key_file)
+    tls = TlsClient(client_context(cert_file), resume=False)
+    assert [connect_once(port, tls) for _ in range(2)] == [False, False]
+
+
+def test_unknown_certificate_is_refused(qt_app, servers, certificate):
+    cert_file, key_file = certificate
+    port = servers.start("--tls-cert", cert_file, "--tls-key", key_file)
+    connection = QtConnection.connect_to("127.0.0.1", port, reconnect=False, tls=TlsClient(client_context()))
+    try:
+        assert wait_until(lambda: connection.closed, CONNECT_TIMEOUT)
+        assert not connection.session.hello_received
+    finally:
+        connection.shutdown()
+
+
+# Room lists only say that a room is locked
+@pytest.mark.parametrize("offered", [CAPABILITIES, frozenset()], ids=["deltas", "snapshots"])
+def test_room_password_never_leaves_the_server(server_port, offered):
+    async def scenario():
+        observer = ChatClient("127.0.0.1", server_port)
+        observer.session.offered = offered
+        await observer.connect()
+        received = []
+        decoder_feed = observer.session.decoder.feed
+        observer.session.decoder.feed = lambda data: received.append(bytes(data)) or decoder_feed(data)
+
+        alice = ChatClient("127.0.0.1", server_port)
+        await alice.connect()
+        assert await alice.create_room("vault", "alice", "hunter2") == "CREATE_SUCCESS"
+        while "vault" not in observer.session.rooms:
+            await asyncio.sleep(0.01)
+        assert observer.session.rooms["vault"].locked
+        assert not any(b"hunter2" in data for data in received)
+        for client in (alice, observer):
+            await client.close()
+    asyncio.run(asyncio.wait_for(scenario(), CONNECT_TIMEOUT))
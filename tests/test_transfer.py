@@ -0,0 +1,91 @@
+# Tests of long chat messages streamed in chunks
+
+# Imports
+import asyncio
+import pytest
+from protocol import (
+    ChatMessage, ProtocolError, TransferAbort, TransferChunk, TransferEnd, TransferStart, encode_message,
+)
+from session import CAPABILITIES, ClientSession
+from test_chat_client import next_message
+from test_requests import connect
+from transfer import TransferAssembler, TransferProgress, TransferSender
+
+# Text long enough to take several chunks, with characters cut across chunk boundaries
+TEXT = "chunked ☕ text\n" * 4000
+
+
+# Function to feed typed messages to a session as the server would send them
+def receive(session, *messages):
+    return session.receive(b"".join(encode_message(message, binary=True) for message in messages))
+
+
+# Function to cut a text into the chunks of one stream
+def chunks(transfer_id, data, size):
+    return [TransferChunk(transfer_id, offset, data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+
+def test_streams_take_turns():
+    sender = TransferSender(chunk_size=4)
+    long = sender.start("room", "alice", b"a" * 12)
+    short = sender.start("room", "alice", b"b" * 4)
+    order = []
+    while (item := sender.next_chunk()) is not None:
+        order.append((item[0].transfer_id, bytes(item[1].data)))
+    assert order == [(long.transfer_id, b"aaaa"), (short.transfer_id, b"bbbb"),
+                     (long.transfer_id, b"aaaa"), (long.transfer_id, b"aaaa")]
+
+    # Streams stay until confirmed, so a refused one can be sent again
+    assert len(sender) == 2
+    sender.confirm(short.transfer_id)
+    assert sender.cancel() == [long]
+
+
+def test_chunks_reassemble_into_one_message():
+    data = TEXT.encode()
+    session = ClientSession()
+    messages = receive(session, TransferStart(7, len(data), "bob"), *chunks(7, data, 5000), TransferEnd(7, 3))
+    assert messages[0] == TransferProgress(7, "bob", 0, len(data), False, False)
+    assert messages[-2] == TransferProgress(7, "bob", len(data), len(data), False, False)
+    assert messages[-1] == ChatMessage("bob", TEXT, 3)
+    assert not session.downloads
+
+
+def test_aborted_stream_reports_failure():
+    data = TEXT.encode()
+    session = ClientSession()
+    receive(session, TransferStart(1, len(data), "bob"), chunks(1, data, 5000)[0])
+    assert receive(session, TransferAbort(1)) == [TransferProgress(1, "bob", 5000, len(data), False, True)]
+    assert receive(session, chunks(1, data, 5000)[1], TransferEnd(1, 4)) == []
+
+
+def test_chunk_out_of_order_is_refused():
+    session = ClientSession()
+    receive(session, TransferStart(1, 100, "bob"))
+    with pytest.raises(ProtocolError):
+        receive(session, TransferChunk(1, 50, b"x" * 10))
+
+
+def test_oversized_stream_is_refused():
+    assert TransferAssembler(max_size=10).start(1, "bob", 11) is None
+    with pytest.raises(ProtocolError):
+        receive(ClientSession(), TransferStart(1, 10 ** 9, "bob"))
+
+
+def test_stream_through_the_server(server_port):
+    async def scenario():
+        alice = await connect(server_port, CAPABILITIES)
+        bob = await connect(server_port, CAPABILITIES)
+        assert await alice.create_room("room", "alice", max_users=3) == "CREATE_SUCCESS"
+        assert await bob.join_room("room", "bob") == "JOIN_SUCCESS"
+
+        session = bob.session
+        assert session.can_stream(len(TEXT.encode()))
+        transfer, data = session.start_transfer(TEXT)
+        await bob.write(data)
+        while (item := session.next_chunk()) is not None:
+            await bob.write(item[1])
+        assert (await next_message(alice, "bob")).text == TEXT
+        for client in (alice, bob):
+            await client.close()
+    asyncio.run(scenario())
@@ -13,12 +13,20 @@ class Thread
 {
     friend void ThreadFunction(void * me);
 private:
-	std::thread theThread;
     int exitTimeout;
 
+    // Triggered by Start(), ThreadMain only runs once the derived object is complete
+    Sync::Event startEvent;
+
 protected:
     Sync::Event terminationEvent;
 
+    // Call at the end of the derived constructor to let ThreadMain run
+    void Start(void);
+
+private:
+	std::thread theThread;
+
 private:
     Thread(Thread const &){}
     Thread & operator=(Thread const &){return *this;}
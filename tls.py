@@ -0,0 +1,87 @@
+# TLS for the client's connection and for server.py
+#
+# A full handshake costs one or two extra round trips before the first message, on
+# every connect. The client keeps the session of its last link to each server and
+# offers it on the next connect, so a reconnect resumes it with a session ticket and
+# skips the certificate exchange and key agreement of a full handshake.
+
+# Imports
+import ssl
+
+# Oldest TLS version either side accepts
+MIN_VERSION = ssl.TLSVersion.TLSv1_2
+
+# Session tickets a TLS 1.3 server sends after each handshake
+SERVER_TICKETS = 2
+
+# Socket errors that only mean a non-blocking TLS socket has to wait for more data or room
+WOULD_BLOCK = (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+
+# Function to create the client context. The server certificate is checked against
+# ca_file, or the system's certificates without one.
+def client_context(ca_file=None, max_version=None):
+    context = ssl.create_default_context(cafile=ca_file)
+    context.minimum_version = MIN_VERSION
+    if max_version is not None:
+        context.maximum_version = max_version
+    return context
+
+
+# Function to create the server context. Its session ticket keys are made here, so
+# workers forked after it share them and resume each other's sessions.
+def server_context(cert_file, key_file=None):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = MIN_VERSION
+    context.load_cert_chain(cert_file, key_file)
+    context.num_tickets = SERVER_TICKETS
+    return context
+
+
+# Function to parse a TLS version given as 1.2 or 1.3
+def parse_version(text):
+    versions = {"1.2": ssl.TLSVersion.TLSv1_2, "1.3": ssl.TLSVersion.TLSv1_3}
+    if text not in versions:
+        raise ValueError(f"Unsupported TLS version {text!r}, expected 1.2 or 1.3")
+    return versions[text]
+
+
+# TLS settings of a client and the session of its last link to each server. Sessions
+# are kept per endpoint and handed to the next connect there, resume=False always does
+# a full handshake.
+class TlsClient:
+    def __init__(self, context, resume=True):
+        self.context = context
+        self.resume = resume
+        self.sessions = {}
+
+    # Method to wrap a connected non-blocking socket, offering the endpoint's session if there is one
+    def wrap(self, sock, endpoint):
+        session = self.sessions.get(endpoint) if self.resume else None
+        return self.context.wrap_socket(sock, server_hostname=endpoint.host, do_handshake_on_connect=False, session=session)
+
+    # Method to advance the handshake of a wrapped socket. It returns None once the
+    # handshake finished, otherwise "read" or "write", what the socket has to become next.
+    def handshake(self, sock):
+        try:
+            sock.do_handshake()
+        except ssl.SSLWantReadError:
+            return "read"
+        except ssl.SSLWantWriteError:
+            return "write"
+        return None
+
+    # Method to check whether a socket error only means waiting
+    def would_block(self, error):
+        return isinstance(error, WOULD_BLOCK)
+
+    # Method to keep the session of a link for the next connect to its server. A TLS 1.3
+    # server sends its tickets after the handshake, so this is called once data arrived.
+    def save(self, sock, endpoint):
+        session = sock.session
+        if self.resume and session is not None and session.has_ticket:
+            self.sessions[endpoint] = session
+
+    # Method to describe the link of a socket whose handshake finished
+    def describe(self, sock):
+        return f"{sock.version()}, {'resumed' if sock.session_reused else 'full handshake'}"
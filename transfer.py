@@ -0,0 +1,173 @@
+# Imports
+from collections import deque, namedtuple
+from protocol import TransferChunk
+
+# Chat messages longer than this many UTF-8 bytes are streamed in chunks when the server takes them
+TRANSFER_THRESHOLD = 4096
+
+# Bytes of text carried by each chunk
+CHUNK_SIZE = 16 * 1024
+
+# Largest message that may be streamed. It still fits one frame, so members that do not
+# take chunks get it whole.
+MAX_TRANSFER_SIZE = 512 * 1024
+
+# Streams a connection may send at once
+MAX_TRANSFERS = 8
+
+# Bytes of chunks a sender keeps queued for the socket. Other messages written meanwhile
+# wait behind at most this much, so a long paste never holds up the chat behind it.
+SEND_WINDOW = 32 * 1024
+
+# Progress of a chunked message: bytes sent or received out of size, outgoing for the
+# user's own messages, failed when the stream was cut off
+TransferProgress = namedtuple("TransferProgress", "transfer_id sender received size outgoing failed")
+
+
+# Chunked message being sent, the text is encoded once and sent from a memoryview
+class OutgoingTransfer:
+    def __init__(self, transfer_id, room_name, sender, data):
+        self.transfer_id = transfer_id
+        self.room_name = room_name
+        self.sender = sender
+        self.data = data
+        self.size = len(data)
+        self.sent = 0
+
+    # Method to cut the next chunk
+    def next_chunk(self, chunk_size=CHUNK_SIZE):
+        offset = self.sent
+        self.sent = min(self.size, offset + chunk_size)
+        return TransferChunk(self.transfer_id, offset, memoryview(self.data)[offset:self.sent])
+
+    # Method to check whether every chunk has been cut
+    def done(self):
+        return self.sent >= self.size
+
+    # Method to get the message text, to send it another way
+    def text(self):
+        return self.data.decode("utf-8", "replace")
+
+    # Method to describe how far the message got
+    def progress(self, failed=False):
+        return TransferProgress(self.transfer_id, self.sender, self.sent, self.size, True, failed)
+
+
+# Chunked messages being sent on one connection. Each call hands out one chunk and
+# the streams take turns, so a long one does not hold up a short one started after it.
+# A stream is kept until the server confirms it, so one refused after its last chunk
+# was cut can still be sent another way.
+class TransferSender:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.next_id = 1
+
+        # Streams with chunks left to cut, and every stream not confirmed yet by id
+        self.active = deque()
+        self.unconfirmed = {}
+
+    def __len__(self):
+        return len(self.unconfirmed)
+
+    # Method to start streaming the encoded text of a message
+    def start(self, room_name, sender, data):
+        transfer = OutgoingTransfer(self.next_id, room_name, sender, data)
+        self.next_id += 1
+        self.active.append(transfer)
+        self.unconfirmed[transfer.transfer_id] = transfer
+        return transfer
+
+    # Method to take the next chunk as (transfer, chunk), None when nothing is being sent
+    def next_chunk(self):
+        if not self.active:
+            return None
+        transfer = self.active.popleft()
+        chunk = transfer.next_chunk(self.chunk_size)
+        if not transfer.done():
+            self.active.append(transfer)
+        return transfer, chunk
+
+    # Method to forget a stream the server confirmed
+    def confirm(self, transfer_id):
+        self.unconfirmed.pop(transfer_id, None)
+
+    # Method to stop one stream, returns it or None if it was already confirmed
+    def cancel_id(self, transfer_id):
+        transfer = self.unconfirmed.pop(transfer_id, None)
+        if transfer is not None and transfer in self.active:
+            self.active.remove(transfer)
+        return transfer
+
+    # Method to stop the unconfirmed streams of a room, or all of them, returns them in the order they started
+    def cancel(self, room_name=None):
+        cancelled = [transfer for transfer in self.unconfirmed.values() if room_name is None or transfer.room_name == room_name]
+        for transfer in cancelled:
+            del self.unconfirmed[transfer.transfer_id]
+        self.active = deque(transfer for transfer in self.active if transfer.transfer_id in self.unconfirmed)
+        return cancelled
+
+
+# Chunked message being received. The buffer is allocated at its full size when the
+# stream starts and each chunk is copied into place, so a long message is never regrown.
+class IncomingTransfer:
+    def __init__(self, transfer_id, sender, size, room_name=None):
+        self.transfer_id = transfer_id
+        self.sender = sender
+        self.size = size
+        self.room_name = room_name
+        self.buffer = bytearray(size)
+        self.received = 0
+
+    # Method to store the next chunk, returns False for one out of order or past the end
+    def add(self, offset, data):
+        end = offset + len(data)
+        if offset != self.received or end > self.size:
+            return False
+        self.buffer[offset:end] = data
+        self.received = end
+        return True
+
+    # Method to check whether every byte has arrived
+    def complete(self):
+        return self.received == self.size
+
+    # Method to decode the finished message
+    def text(self):
+        return self.buffer.decode("utf-8", "replace")
+
+    # Method to describe how far the message got
+    def progress(self, failed=False):
+        return TransferProgress(self.transfer_id, self.sender, self.received, self.size, False, failed)
+
+
+# Chunked messages being received on one connection, keyed by transfer id
+class TransferAssembler:
+    def __init__(self, max_size=MAX_TRANSFER_SIZE):
+        self.max_size = max_size
+        self.transfers = {}
+
+    def __len__(self):
+        return len(self.transfers)
+
+    # Method to start a message, None when it is larger than allowed
+    def start(self, transfer_id, sender, size, room_name=None):
+        if not 0 < size <= self.max_size:
+            return None
+        transfer = self.transfers[transfer_id] = IncomingTransfer(transfer_id, sender, size, room_name)
+        return transfer
+
+    # Method to get a running message, None for one never started or already ended
+    def get(self, transfer_id):
+        return self.transfers.get(transfer_id)
+
+    # Method to stop tracking a message, returns it or None
+    def pop(self, transfer_id):
+        return self.transfers.pop(transfer_id, None)
+
+    # Method to drop the messages of a room, or every message
+    def clear(self, room_name=None):
+        if room_name is None:
+            self.transfers.clear()
+            return
+        for transfer_id in [key for key, transfer in self.transfers.items() if transfer.room_name == room_name]:
+            del self.transfers[transfer_id]